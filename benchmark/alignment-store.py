@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+
+"""
+Compare the size of, and time to read, DIAMOND results held in our per-line
+JSON format (plain and bzip2 compressed) and in an alignment store (see
+dark/alignment_store.py).
+"""
+
+from __future__ import print_function, division
+
+import bz2
+import os
+import shutil
+import tempfile
+from json import dumps
+from random import choice, randint, seed, uniform
+from time import time
+
+from dark.alignment_store import convertJSONToAlignmentStore
+from dark.diamond.alignments import DiamondReadsAlignments
+from dark.reads import Read, Reads
+
+PARAMS = {
+    'application': 'DIAMOND',
+    'reference': ('Buchfink et al., Fast and Sensitive Protein Alignment '
+                  'using DIAMOND, Nature Methods, 12, 59-60 (2015)'),
+    'task': 'blastx',
+    'version': 'v0.8.23',
+}
+
+
+def makeJSON(filename, count, readLength, subjects, hits):
+    """
+    Write a file of synthetic DIAMOND JSON records and make the reads they
+    are for.
+
+    @param filename: The C{str} file name to write to.
+    @param count: The C{int} number of records to write.
+    @param readLength: The C{int} length of each read.
+    @param subjects: The C{int} number of distinct subject titles.
+    @param hits: The C{int} maximum number of subjects matched by each read.
+    @return: A L{dark.reads.Reads} instance with the reads.
+    """
+    residues = 'ACDEFGHIKLMNPQRSTVWY'
+    pool = ''.join(choice(residues) for _ in range(10000))
+    titles = ['WP_%09d.1 hypothetical protein [Bacterium %d]' % (i, i % 1000)
+              for i in range(subjects)]
+    reads = Reads()
+    with open(filename, 'w') as fp:
+        fp.write(dumps(PARAMS, sort_keys=True) + '\n')
+        for i in range(count):
+            readId = 'read%d' % i
+            reads.add(Read(readId, 'A' * readLength))
+            alignments = []
+            for title in set(choice(titles) for _ in range(randint(1, hits))):
+                length = randint(10, readLength // 3)
+                queryStart = randint(1, readLength - 3 * length + 1)
+                subjectStart = randint(1, 500)
+                start = randint(0, len(pool) - length)
+                alignments.append({
+                    'hsps': [{
+                        'bits': round(uniform(20, 500), 1),
+                        'btop': str(length),
+                        'expect': 10 ** -uniform(1, 100),
+                        'frame': 1,
+                        'identicalCount': length,
+                        'positiveCount': length,
+                        'query': pool[start:start + length],
+                        'query_end': queryStart + 3 * length - 1,
+                        'query_start': queryStart,
+                        'sbjct': pool[start:start + length],
+                        'sbjct_end': subjectStart + length - 1,
+                        'sbjct_start': subjectStart,
+                    }],
+                    'length': subjectStart + length + randint(0, 500),
+                    'title': title,
+                })
+            fp.write(dumps({'alignments': alignments, 'query': readId},
+                           sort_keys=True) + '\n')
+    return reads
+
+
+def bzip2(filename):
+    """
+    Write a bzip2-compressed copy of a file.
+
+    @param filename: The C{str} name of the file to compress.
+    @return: The C{str} name of the compressed file.
+    """
+    compressed = filename + '.bz2'
+    with open(filename, 'rb') as infp, bz2.BZ2File(compressed, 'wb') as outfp:
+        shutil.copyfileobj(infp, outfp)
+    return compressed
+
+
+def timeReading(reads, filename, repeat):
+    """
+    Time reading all the HSPs in a DIAMOND results file.
+
+    @param reads: A L{dark.reads.Reads} instance with the reads.
+    @param filename: The C{str} results file name.
+    @param repeat: The C{int} number of times to read.
+    @return: A 2-tuple with the C{int} number of HSPs read and the C{float}
+        best (lowest) elapsed time.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time()
+        count = sum(1 for _ in DiamondReadsAlignments(
+            reads, filename, databaseFilename='unused').hsps())
+        elapsed = time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return count, best
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description=('Compare DIAMOND JSON and alignment store file sizes '
+                     'and reading speed.'))
+
+    parser.add_argument(
+        '--count', type=int, default=50000,
+        help='The number of synthetic reads (records).')
+
+    parser.add_argument(
+        '--readLength', type=int, default=300,
+        help='The length of each synthetic read.')
+
+    parser.add_argument(
+        '--subjects', type=int, default=5000,
+        help='The number of distinct subject titles.')
+
+    parser.add_argument(
+        '--hits', type=int, default=10,
+        help='The maximum number of subjects matched by each read.')
+
+    parser.add_argument(
+        '--repeat', type=int, default=3,
+        help='The number of times to read each file (the best is shown).')
+
+    args = parser.parse_args()
+
+    seed(0)
+    tmpdir = tempfile.mkdtemp()
+
+    try:
+        jsonFile = os.path.join(tmpdir, 'results.json')
+        reads = makeJSON(jsonFile, args.count, args.readLength,
+                         args.subjects, args.hits)
+        files = [('json', jsonFile), ('json.bz2', bzip2(jsonFile))]
+        for name, compress in ('npz', True), ('npz-raw', False):
+            filename = os.path.join(tmpdir, name + '.npz')
+            start = time()
+            convertJSONToAlignmentStore(jsonFile, filename,
+                                        compress=compress)
+            print('Converted JSON to %s in %.2f seconds.' %
+                  (name, time() - start))
+            files.append((name, filename))
+
+        print('%-9s %12s %10s %10s %12s' % ('format', 'bytes', 'HSPs',
+                                            'seconds', 'HSPs/s'))
+        for name, filename in files:
+            count, elapsed = timeReading(reads, filename, args.repeat)
+            print('%-9s %12d %10d %10.2f %12.0f' % (
+                name, os.path.getsize(filename), count, elapsed,
+                count / elapsed))
+    finally:
+        shutil.rmtree(tmpdir)
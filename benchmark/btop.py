@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+
+"""
+Measure the speed of the BTOP functions in dark/btop.py, compared to the
+way they worked before BTOP strings were split into runs with a regular
+expression (i.e., by examining each item given by parseBtop).
+
+The BTOP strings are made from synthetic amino acid alignments with a
+range of identities.
+"""
+
+from __future__ import print_function, division
+
+from random import randint, random, sample, seed
+from time import time
+
+from dark.btop import (
+    CDEL, CINS, CMATCH, btop2cigar, btopStats, countGaps, parseBtop)
+
+AA = 'ACDEFGHIKLMNPQRSTVWY'
+
+
+def makeBtop(length, identity, gapRate):
+    """
+    Make a synthetic BTOP string.
+
+    @param length: The C{int} number of alignment positions.
+    @param identity: The C{float} probability that a position is identical.
+    @param gapRate: The C{float} probability that a position is a gap.
+    @return: A C{str} BTOP string.
+    """
+    result = []
+    count = 0
+    for _ in range(length):
+        r = random()
+        if r < identity:
+            count += 1
+        else:
+            if count:
+                result.append(str(count))
+                count = 0
+            if r < identity + gapRate:
+                result.append(('-' + AA[randint(0, 19)]) if random() < 0.5
+                              else (AA[randint(0, 19)] + '-'))
+            else:
+                result.append(''.join(sample(AA, 2)))
+    if count:
+        result.append(str(count))
+    return ''.join(result)
+
+
+def previousCountGaps(btopString):
+    """
+    Count gaps as countGaps did before it used btopRuns.
+    """
+    queryGaps = subjectGaps = 0
+    for countOrMismatch in parseBtop(btopString):
+        if isinstance(countOrMismatch, tuple):
+            queryChar, subjectChar = countOrMismatch
+            queryGaps += int(queryChar == '-')
+            subjectGaps += int(subjectChar == '-')
+
+    return (queryGaps, subjectGaps)
+
+
+def previousBtop2cigar(btopString):
+    """
+    Make a (non-concise, amino acid) CIGAR string as btop2cigar did before
+    it used btopRuns.
+    """
+    result = []
+    thisLength = thisOperation = currentLength = currentOperation = None
+
+    for item in parseBtop(btopString):
+        if isinstance(item, int):
+            thisLength = item
+            thisOperation = CMATCH
+        else:
+            thisLength = 1
+            query, reference = item
+            if query == '-':
+                thisOperation = CDEL
+            elif reference == '-':
+                thisOperation = CINS
+            else:
+                thisOperation = CMATCH
+
+        if thisOperation == currentOperation:
+            currentLength += thisLength
+        else:
+            if currentOperation:
+                result.append('%d%s' % (3 * currentLength, currentOperation))
+            currentLength, currentOperation = thisLength, thisOperation
+
+    if currentOperation:
+        result.append('%d%s' % (3 * currentLength, currentOperation))
+
+    return ''.join(result)
+
+
+def timeIt(func, btopStrings, repeat):
+    """
+    Time a function.
+
+    @param func: A function of one argument, a BTOP string.
+    @param btopStrings: A C{list} of C{str} BTOP strings to call C{func} on.
+    @param repeat: The C{int} number of times to time the calls (the fastest
+        is returned).
+    @return: A 2-tuple with the C{list} of results and the C{float} elapsed
+        time.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time()
+        results = list(map(func, btopStrings))
+        elapsed = time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return results, best
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Measure the speed of BTOP parsing.')
+
+    parser.add_argument(
+        '--count', type=int, default=50000,
+        help='The number of BTOP strings to make for each identity.')
+
+    parser.add_argument(
+        '--gapRate', type=float, default=0.005,
+        help='The probability that an alignment position is a gap.')
+
+    parser.add_argument(
+        '--repeat', type=int, default=3,
+        help='The number of times to time each function.')
+
+    args = parser.parse_args()
+
+    seed(0)
+
+    print('%-8s %-22s %10s %10s %8s' % ('identity', 'function', 'previous',
+                                        'seconds', 'speedup'))
+
+    for identity in 1.0, 0.9, 0.6, 0.35:
+        btopStrings = [
+            makeBtop(randint(20, 150), identity,
+                     0.0 if identity == 1.0 else args.gapRate)
+            for _ in range(args.count)]
+
+        for name, previous, func in (
+                ('countGaps', previousCountGaps, countGaps),
+                ('btop2cigar(aa=True)', previousBtop2cigar,
+                 lambda btop: btop2cigar(btop, aa=True)),
+                ('btopStats', None, btopStats)):
+            results, elapsed = timeIt(func, btopStrings, args.repeat)
+            if previous:
+                previousResults, previousElapsed = timeIt(
+                    previous, btopStrings, args.repeat)
+                assert results == previousResults
+                print('%-8.2f %-22s %10.2f %10.2f %8.1f' % (
+                    identity, name, previousElapsed, elapsed,
+                    previousElapsed / elapsed))
+            else:
+                print('%-8.2f %-22s %10s %10.2f %8s' % (
+                    identity, name, '-', elapsed, '-'))
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+
+"""
+Measure the speed of reading DIAMOND tabular (--outfmt 6) output, both
+when grouping lines into per-query records (as convert-diamond-to-json.py
+does) and when converting lines to dictionaries (as convert-diamond-to-sam.py
+does). Each is compared to the line-by-line parsing that was done before
+input was read in blocks.
+
+Pass --diamondFile to time a real DIAMOND output file (made with --outfmt 6
+qtitle stitle bitscore evalue qframe qseq qstart qend sseq sstart send slen
+btop nident positive). Otherwise a synthetic file is made.
+"""
+
+from __future__ import print_function, division
+
+import os
+import shutil
+import tempfile
+from random import choice, randint, seed, uniform
+from time import time
+
+from dark.diamond.conversion import (
+    DIAMOND_FIELD_CONVERTER, DiamondTabularFormatReader,
+    diamondTabularFormatToDicts)
+
+# The field names of the lines written by makeTabular.
+FIELD_NAMES = ('qtitle stitle bitscore evalue qframe qseq qstart qend sseq '
+               'sstart send slen btop nident positive').split()
+
+
+def makeTabular(filename, count, hits, hspsPerSubject):
+    """
+    Write a file of synthetic DIAMOND tabular output.
+
+    @param filename: The C{str} file name to write to.
+    @param count: The C{int} number of queries to write lines for.
+    @param hits: The C{int} maximum number of subjects matched by each query.
+    @param hspsPerSubject: The C{int} maximum number of HSPs for each subject.
+    """
+    residues = 'ACDEFGHIKLMNPQRSTVWY'
+    pool = ''.join(choice(residues) for _ in range(10000))
+    with open(filename, 'w') as fp:
+        for i in range(count):
+            for j in range(randint(1, hits)):
+                subject = 'subject %d' % randint(0, 10000)
+                for k in range(randint(1, hspsPerSubject)):
+                    length = randint(10, 100)
+                    start = randint(0, len(pool) - length)
+                    sequence = pool[start:start + length]
+                    fp.write('\t'.join(map(str, (
+                        'read%d' % i, subject, round(uniform(20, 500), 1),
+                        10 ** -uniform(1, 100), choice((-3, -2, -1, 1, 2, 3)),
+                        sequence, 1, 3 * length, sequence, start + 1,
+                        start + length, start + length + randint(0, 500),
+                        length, length, length))) + '\n')
+
+
+def timeIt(func):
+    """
+    Time a function.
+
+    @param func: A function of no arguments that returns an C{int} count.
+    @return: A 2-tuple with the C{int} count and C{float} elapsed time.
+    """
+    start = time()
+    count = func()
+    return count, time() - start
+
+
+def previousRecords(filename):
+    """
+    Group lines into records as DiamondTabularFormatReader.records did
+    before input was read in blocks (reading line by line and looking for
+    repeated subjects in a list of alignments).
+    """
+    count = 0
+    with open(filename) as fp:
+        previousQtitle = None
+        subjectsSeen = set()
+        record = {}
+        for line in fp:
+            (qtitle, stitle, bitscore, evalue, qframe, qseq, qstart, qend,
+             sseq, sstart, send, slen, btop, nident,
+             positive) = line[:-1].split('\t')
+            hsp = {
+                'bits': float(bitscore),
+                'btop': btop,
+                'expect': float(evalue),
+                'frame': int(qframe),
+                'identicalCount': None if nident is None else int(nident),
+                'positiveCount': None if positive is None else int(positive),
+                'query': qseq,
+                'query_start': int(qstart),
+                'query_end': int(qend),
+                'sbjct': sseq,
+                'sbjct_start': int(sstart),
+                'sbjct_end': int(send),
+            }
+            if previousQtitle == qtitle:
+                if stitle not in subjectsSeen:
+                    subjectsSeen.add(stitle)
+                    record['alignments'].append({
+                        'hsps': [hsp],
+                        'length': int(slen),
+                        'title': stitle,
+                    })
+                else:
+                    for alignment in record['alignments']:
+                        if alignment['title'] == stitle:
+                            alignment['hsps'].append(hsp)
+                            break
+            else:
+                if previousQtitle is not None:
+                    count += 1
+                record = {
+                    'alignments': [{
+                        'hsps': [hsp],
+                        'length': int(slen),
+                        'title': stitle,
+                    }],
+                    'query': qtitle,
+                }
+                subjectsSeen = {stitle}
+                previousQtitle = qtitle
+
+        if record:
+            count += 1
+
+    return count
+
+
+def records(filename):
+    """
+    Group lines into records with DiamondTabularFormatReader.
+    """
+    return sum(1 for _ in DiamondTabularFormatReader(filename).records())
+
+
+def previousDicts(filename):
+    """
+    Convert lines to dictionaries as diamondTabularFormatToDicts did before
+    input was read in blocks (looking up a converter for every field).
+    """
+    def identity(x):
+        return x
+
+    def lineDicts():
+        convertFunc = DIAMOND_FIELD_CONVERTER.get
+        with open(filename) as fp:
+            for line in fp:
+                result = {}
+                for fieldName, value in zip(FIELD_NAMES,
+                                            line[:-1].split('\t')):
+                    result[fieldName] = convertFunc(fieldName,
+                                                    identity)(value)
+                yield result
+
+    return sum(1 for _ in lineDicts())
+
+
+def dicts(filename):
+    """
+    Convert lines to dictionaries with diamondTabularFormatToDicts.
+    """
+    return sum(1 for _ in diamondTabularFormatToDicts(filename, FIELD_NAMES))
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Measure DIAMOND tabular output reading speed.')
+
+    parser.add_argument(
+        '--diamondFile',
+        help=('An existing DIAMOND tabular output file to read instead of '
+              'making a synthetic one.'))
+
+    parser.add_argument(
+        '--count', type=int, default=20000,
+        help='The number of queries in the synthetic output.')
+
+    parser.add_argument(
+        '--hits', type=int, default=50,
+        help='The maximum number of subjects matched by each synthetic query.')
+
+    parser.add_argument(
+        '--hspsPerSubject', type=int, default=2,
+        help='The maximum number of HSPs for each synthetic subject match.')
+
+    args = parser.parse_args()
+
+    seed(0)
+    tmpdir = tempfile.mkdtemp()
+
+    try:
+        if args.diamondFile:
+            filename = args.diamondFile
+        else:
+            filename = os.path.join(tmpdir, 'diamond.tsv')
+            makeTabular(filename, args.count, args.hits, args.hspsPerSubject)
+
+        timings = (
+            ('previous-records', 'records', lambda: previousRecords(filename)),
+            ('records', 'records', lambda: records(filename)),
+            ('previous-dicts', 'lines', lambda: previousDicts(filename)),
+            ('dicts', 'lines', lambda: dicts(filename)),
+        )
+
+        print('%-18s %12s %8s %10s %12s' % ('method', 'count', 'of',
+                                            'seconds', 'per second'))
+        for name, what, func in timings:
+            count, elapsed = timeIt(func)
+            print('%-18s %12d %8s %10.2f %12.0f' % (
+                name, count, what, elapsed, count / elapsed))
+    finally:
+        shutil.rmtree(tmpdir)
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+
+"""
+Measure the speed of converting DIAMOND tabular output to SAM (as done by
+convert-diamond-to-sam.py), line by line (as was done before conversion
+was done in blocks) and in blocks with different numbers of worker
+processes. The SAM output of each method is checked against that of the
+line by line conversion.
+
+Pass --diamondFile to time a real DIAMOND output file (made with --outfmt 6
+and the fields printed by convert-diamond-to-sam.py --printFields).
+Otherwise a synthetic file (with --lines lines, made reproducibly from a
+fixed random seed) is made.
+"""
+
+from __future__ import print_function, division
+
+import os
+import shutil
+import tempfile
+from hashlib import md5
+from random import choice, randint, seed, uniform
+from time import time
+
+from dark.diamond.conversion import (
+    diamondDictToSAM, diamondTabularFormatToDicts, diamondTabularFormatToSAM)
+
+
+def makeTabular(filename, lineCount):
+    """
+    Write a file of synthetic DIAMOND tabular output with the fields in
+    C{dark.diamond.conversion.FIELDS}.
+
+    @param filename: The C{str} file name to write to.
+    @param lineCount: The C{int} number of lines to write.
+    """
+    pool = ''.join(choice('ACGT') for _ in range(10000))
+    written = query = 0
+    with open(filename, 'w') as fp:
+        while written < lineCount:
+            query += 1
+            queryLength = randint(150, 300)
+            for _ in range(min(randint(1, 25), lineCount - written)):
+                length = randint(10, queryLength // 3)
+                queryStart = randint(1, queryLength - 3 * length + 1)
+                start = randint(0, len(pool) - 3 * length)
+                # Make a BTOP string with a few substitutions and gaps.
+                btop = []
+                remaining = length
+                while remaining > 5:
+                    matches = randint(1, remaining - 1)
+                    btop.append('%d%s' % (matches, choice(('AK', '-K', 'K-'))))
+                    remaining -= matches + 1
+                btop.append(str(remaining))
+                fp.write('\t'.join(map(str, (
+                    round(uniform(20, 500), 1), ''.join(btop),
+                    choice((-3, -2, -1, 1, 2, 3)),
+                    queryStart + 3 * length - 1, '', queryLength,
+                    pool[start:start + 3 * length], 'read%d' % query,
+                    queryStart, randint(300, 1000), randint(1, 300),
+                    'subject%d description' % randint(0, 10000)))) + '\n')
+                written += 1
+
+
+def timeIt(func):
+    """
+    Time a function.
+
+    @param func: A function of no arguments that returns an C{int} count
+        and a C{str} digest.
+    @return: A 3-tuple with the C{int} count, C{str} digest, and C{float}
+        elapsed time.
+    """
+    start = time()
+    count, digest = func()
+    return count, digest, time() - start
+
+
+def lineByLine(filename):
+    """
+    Convert DIAMOND output to SAM a line at a time.
+    """
+    referenceLengths = {}
+    digest = md5()
+    count = 0
+    for match in diamondTabularFormatToDicts(filename):
+        stitle, length, samLine = diamondDictToSAM(match)
+        referenceLengths[stitle] = length
+        digest.update((samLine + '\n').encode('utf-8'))
+        count += 1
+    return count, digest.hexdigest()
+
+
+def blocks(filename, workers):
+    """
+    Convert DIAMOND output to SAM in blocks, using worker processes.
+    """
+    referenceLengths = {}
+    digest = md5()
+    count = 0
+    for samLines, blockReferenceLengths in diamondTabularFormatToSAM(
+            filename, workers=workers):
+        referenceLengths.update(blockReferenceLengths)
+        digest.update(samLines.encode('utf-8'))
+        count += samLines.count('\n')
+    return count, digest.hexdigest()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Measure DIAMOND to SAM conversion speed.')
+
+    parser.add_argument(
+        '--diamondFile',
+        help=('An existing DIAMOND tabular output file to read instead of '
+              'making a synthetic one.'))
+
+    parser.add_argument(
+        '--lines', type=int, default=10000000,
+        help='The number of lines in the synthetic DIAMOND output.')
+
+    parser.add_argument(
+        '--workers', type=int, action='append',
+        help=('A number of worker processes to time. May be repeated. '
+              'The default is 1, 2, 4, and the number of CPUs.'))
+
+    args = parser.parse_args()
+
+    seed(0)
+    tmpdir = tempfile.mkdtemp()
+
+    try:
+        if args.diamondFile:
+            filename = args.diamondFile
+        else:
+            filename = os.path.join(tmpdir, 'diamond.tsv')
+            makeTabular(filename, args.lines)
+
+        timings = [('lines', lambda: lineByLine(filename))]
+        for workers in sorted(set(
+                args.workers or (1, 2, 4, os.cpu_count() or 1))):
+            timings.append((
+                'blocks-workers=%d' % workers,
+                lambda workers=workers: blocks(filename, workers)))
+
+        print('%-18s %12s %10s %12s %6s' % ('method', 'lines', 'seconds',
+                                            'per second', 'same'))
+        expected = None
+        for name, func in timings:
+            count, digest, elapsed = timeIt(func)
+            if expected is None:
+                expected = digest
+            print('%-18s %12d %10.2f %12.0f %6s' % (
+                name, count, elapsed, count / elapsed,
+                'yes' if digest == expected else 'NO'))
+    finally:
+        shutil.rmtree(tmpdir)
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+
+"""
+Compare the speed of reading FASTA via dark.fasta.FastaReads (which uses
+the block-based dark.fasta.fastaRecords tokenizer) with reading it via
+Bio.SeqIO, for uncompressed, gzip and bz2 input.
+"""
+
+from __future__ import print_function, division
+
+import bz2
+import gzip
+import os
+import shutil
+import sys
+import tempfile
+from random import choice, seed
+from time import time
+
+from Bio import SeqIO
+
+from dark.fasta import FastaReads
+from dark.reads import DNARead
+from dark.utils import asHandle
+
+
+def makeFasta(filename, count, length, lineLength):
+    """
+    Write a file of random DNA FASTA.
+
+    @param filename: The C{str} file name to write to.
+    @param count: The C{int} number of sequences to write.
+    @param length: The C{int} length of each sequence.
+    @param lineLength: The C{int} maximum sequence line length.
+    """
+    with open(filename, 'w') as fp:
+        for i in range(count):
+            sequence = ''.join(choice('ACGT') for _ in range(length))
+            lines = [sequence[start:start + lineLength]
+                     for start in range(0, length, lineLength)]
+            fp.write('>read%d some description\n%s\n' % (i, '\n'.join(lines)))
+
+
+def compress(filename, opener, suffix):
+    """
+    Write a compressed copy of a file.
+
+    @param filename: The C{str} name of the file to compress.
+    @param opener: A function (e.g., C{gzip.open}) to open the output file.
+    @param suffix: The C{str} suffix to add to C{filename}.
+    @return: The C{str} name of the compressed file.
+    """
+    compressed = filename + suffix
+    with open(filename, 'rb') as infp:
+        with opener(compressed, 'wb') as outfp:
+            shutil.copyfileobj(infp, outfp)
+    return compressed
+
+
+def readSeqIO(filename):
+    """
+    Read FASTA using C{Bio.SeqIO}, the way C{FastaReads} used to.
+
+    @param filename: The C{str} name of the FASTA file.
+    @return: The C{int} number of reads found.
+    """
+    count = 0
+    with asHandle(filename) as fp:
+        for seq in SeqIO.parse(fp, 'fasta'):
+            DNARead(seq.description, str(seq.seq))
+            count += 1
+    return count
+
+
+def readNative(filename):
+    """
+    Read FASTA using C{FastaReads}.
+
+    @param filename: The C{str} name of the FASTA file.
+    @return: The C{int} number of reads found.
+    """
+    count = 0
+    for _ in FastaReads(filename):
+        count += 1
+    return count
+
+
+def timeIt(func, filename, repeat):
+    """
+    Time a function that reads a file.
+
+    @param func: A function that reads C{filename} and returns a read count.
+    @param filename: The C{str} file name to read.
+    @param repeat: The C{int} number of times to run C{func}.
+    @return: A 2-tuple with the C{int} number of reads and the C{float}
+        best (lowest) elapsed time.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time()
+        count = func(filename)
+        elapsed = time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return count, best
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description=('Compare reads/sec for FastaReads and Bio.SeqIO on '
+                     'plain, gzip and bz2 FASTA.'))
+
+    parser.add_argument(
+        '--count', type=int, default=100000,
+        help='The number of sequences in the synthetic FASTA.')
+
+    parser.add_argument(
+        '--length', type=int, default=150,
+        help='The length of each synthetic sequence.')
+
+    parser.add_argument(
+        '--lineLength', type=int, default=60,
+        help='The maximum length of synthetic sequence lines.')
+
+    parser.add_argument(
+        '--repeat', type=int, default=3,
+        help='The number of times to time each reader (the best is shown).')
+
+    parser.add_argument(
+        '--fastaFile',
+        help=('An existing FASTA file to use instead of making synthetic '
+              'FASTA. Compressed copies will be made in a temporary '
+              'directory.'))
+
+    args = parser.parse_args()
+
+    seed(0)
+    tmpdir = tempfile.mkdtemp()
+
+    try:
+        if args.fastaFile:
+            plain = os.path.join(tmpdir, 'reads.fasta')
+            shutil.copyfile(args.fastaFile, plain)
+        else:
+            plain = os.path.join(tmpdir, 'reads.fasta')
+            makeFasta(plain, args.count, args.length, args.lineLength)
+
+        filenames = (
+            ('plain', plain),
+            ('gzip', compress(plain, gzip.open, '.gz')),
+            ('bz2', compress(plain, bz2.BZ2File, '.bz2')),
+        )
+
+        print('%-6s %12s %12s %8s' % ('input', 'SeqIO r/s', 'native r/s',
+                                      'speedup'))
+        for name, filename in filenames:
+            count, seqIOTime = timeIt(readSeqIO, filename, args.repeat)
+            nativeCount, nativeTime = timeIt(readNative, filename,
+                                             args.repeat)
+            if count != nativeCount:
+                print('Read count mismatch for %s: SeqIO %d, native %d.' %
+                      (name, count, nativeCount), file=sys.stderr)
+                sys.exit(1)
+            print('%-6s %12.0f %12.0f %7.2fx' % (
+                name, count / seqIOTime, count / nativeTime,
+                seqIOTime / nativeTime))
+    finally:
+        shutil.rmtree(tmpdir)
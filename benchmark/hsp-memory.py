@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+
+"""
+Measure the memory used to hold many HSPs in RAM and the time taken to sort
+them and to find the best one, comparing HSPs and scores whose attributes
+are held in an instance __dict__ and whose comparisons come from
+functools.total_ordering (as dark.hsp.HSP and dark.score.HigherIsBetterScore
+were before they had __slots__) with dark.hsp.HSP and dark.hsp.LSP.
+
+Python 3 is required (for tracemalloc).
+"""
+
+from __future__ import print_function, division
+
+import gc
+import tracemalloc
+from functools import total_ordering
+from random import random, seed
+from time import time
+
+from dark.hsp import HSP, LSP
+
+
+@total_ordering
+class DictScore(object):
+    """
+    A higher-is-better score whose attribute is stored in an instance
+    __dict__.
+    """
+    def __init__(self, score):
+        self.score = score
+
+    def __lt__(self, other):
+        return self.score < other.score
+
+    def __eq__(self, other):
+        return self.score == other.score
+
+
+@total_ordering
+class DictHSP(object):
+    """
+    An HSP whose attributes are stored in an instance __dict__.
+    """
+    def __init__(self, score, readStart=None, readEnd=None,
+                 readStartInSubject=None, readEndInSubject=None,
+                 readFrame=None, subjectStart=None, subjectEnd=None,
+                 subjectFrame=None, readMatchedSequence=None,
+                 subjectMatchedSequence=None, identicalCount=None,
+                 positiveCount=None):
+        self.readStart = readStart
+        self.readEnd = readEnd
+        self.readStartInSubject = readStartInSubject
+        self.readEndInSubject = readEndInSubject
+        self.readFrame = readFrame
+        self.subjectStart = subjectStart
+        self.subjectEnd = subjectEnd
+        self.subjectFrame = subjectFrame
+        self.readMatchedSequence = readMatchedSequence
+        self.subjectMatchedSequence = subjectMatchedSequence
+        self.identicalCount = identicalCount
+        self.positiveCount = positiveCount
+        self.score = DictScore(score)
+
+    def __lt__(self, other):
+        return self.score < other.score
+
+    def __eq__(self, other):
+        return self.score == other.score
+
+
+def makeHSPs(count, hspClass):
+    """
+    Make HSPs with random scores.
+
+    @param count: The C{int} number of HSPs to make.
+    @param hspClass: The class of the HSPs to make.
+    @return: A C{list} of instances of C{hspClass}.
+    """
+    return [
+        hspClass(random() * 500.0, readStart=1, readEnd=100,
+                 readStartInSubject=5, readEndInSubject=104,
+                 readFrame=1, subjectStart=5, subjectEnd=104,
+                 identicalCount=90, positiveCount=95)
+        for _ in range(count)]
+
+
+def measure(name, hspClass, count):
+    """
+    Measure the memory held by a list of HSPs, and the time to sort them and
+    to find the best one.
+
+    @param name: The C{str} name of the representation.
+    @param hspClass: The class of the HSPs to make.
+    @param count: The C{int} number of HSPs to make.
+    @return: The C{int} number of bytes used to hold the HSPs.
+    """
+    seed(0)
+    gc.collect()
+    tracemalloc.start()
+    hsps = makeHSPs(count, hspClass)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time()
+    sorted(hsps)
+    sortTime = time() - start
+
+    start = time()
+    max(hsps)
+    maxTime = time() - start
+
+    print('%-10s %10.1f %12.1f %10.2f %10.2f' % (
+        name, current / (1 << 20), current / count, sortTime, maxTime))
+    del hsps
+    gc.collect()
+    return current
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description=('Compare the memory needed to hold HSPs in RAM, and '
+                     'the time to sort them, using dict-based and slotted '
+                     'HSP and score classes.'))
+
+    parser.add_argument(
+        '--count', type=int, default=1000000,
+        help='The number of HSPs to make.')
+
+    args = parser.parse_args()
+
+    print('%-10s %10s %12s %10s %10s' % (
+        'class', 'MiB', 'bytes/HSP', 'sort secs', 'max secs'))
+
+    dictBased = measure('dict', DictHSP, args.count)
+    slotted = measure('HSP', HSP, args.count)
+    measure('LSP', LSP, args.count)
+
+    print('Memory saving vs dict: %.1f%%.' % (
+        100.0 * (dictBased - slotted) / dictBased))
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+
+"""
+Measure the speed of reading DIAMOND JSON records: line-by-line stdlib
+decoding (as done before dark/json_records.py was added), block reading
+with each available JSON backend, and full conversion to read alignments
+with and without matched sequences.
+
+Pass --jsonFile to time a real (e.g., multi-GB bzip2 compressed) DIAMOND
+JSON file as made by convert-diamond-to-json.py. Otherwise a synthetic
+file is made.
+"""
+
+from __future__ import print_function, division
+
+import os
+import shutil
+import tempfile
+from json import dumps, loads
+from random import choice, randint, seed, uniform
+from time import time
+
+from dark.diamond.conversion import JSONRecordsReader
+from dark.json_records import JSON_BACKENDS, jsonLines, jsonLoader
+from dark.reads import Read
+from dark.utils import openFile
+
+PARAMS = {
+    'application': 'DIAMOND',
+    'task': 'blastx',
+    'version': 'v0.8.23',
+}
+
+
+def makeJSON(filename, count, readLength, hits):
+    """
+    Write a file of synthetic DIAMOND JSON records.
+
+    @param filename: The C{str} file name to write to.
+    @param count: The C{int} number of records to write.
+    @param readLength: The C{int} length of each read.
+    @param hits: The C{int} maximum number of subjects matched by each read.
+    """
+    residues = 'ACDEFGHIKLMNPQRSTVWY'
+    pool = ''.join(choice(residues) for _ in range(10000))
+    with open(filename, 'w') as fp:
+        fp.write(dumps(PARAMS, sort_keys=True) + '\n')
+        for i in range(count):
+            alignments = []
+            for j in range(randint(1, hits)):
+                length = randint(10, readLength // 3)
+                queryStart = randint(1, readLength - 3 * length + 1)
+                start = randint(0, len(pool) - length)
+                alignments.append({
+                    'hsps': [{
+                        'bits': round(uniform(20, 500), 1),
+                        'btop': str(length),
+                        'expect': 10 ** -uniform(1, 100),
+                        'frame': 1,
+                        'identicalCount': length,
+                        'positiveCount': length,
+                        'query': pool[start:start + length],
+                        'query_end': queryStart + 3 * length - 1,
+                        'query_start': queryStart,
+                        'sbjct': pool[start:start + length],
+                        'sbjct_end': length,
+                        'sbjct_start': 1,
+                    }],
+                    'length': length + randint(0, 500),
+                    'title': 'subject %d' % randint(0, 10000),
+                })
+            fp.write(dumps({'alignments': alignments, 'query': 'read%d' % i},
+                           sort_keys=True) + '\n')
+
+
+def timeIt(func):
+    """
+    Time a function.
+
+    @param func: A function of no arguments that returns an C{int} count.
+    @return: A 2-tuple with the C{int} count and C{float} elapsed time.
+    """
+    start = time()
+    count = func()
+    return count, time() - start
+
+
+def stdlibLines(filename, threads):
+    """
+    Decode records line by line with the stdlib json module.
+    """
+    with openFile(filename, threads=threads) as fp:
+        fp.readline()
+        return sum(1 for line in fp if loads(line[:-1]))
+
+
+def blockLines(filename, threads, backend):
+    """
+    Decode records from large blocks with a given JSON backend.
+    """
+    loads = jsonLoader(backend)
+    with openFile(filename, threads=threads) as fp:
+        fp.readline()
+        return sum(1 for _, line in jsonLines(fp, firstLineNumber=2)
+                   if loads(line))
+
+
+def reads(filename, threads):
+    """
+    Make reads for the records in a DIAMOND JSON file, long enough for their
+    HSPs. The reads are made as they are needed, so the whole file is not
+    held in memory.
+    """
+    loads = jsonLoader()
+    with openFile(filename, threads=threads) as fp:
+        fp.readline()
+        for _, line in jsonLines(fp, firstLineNumber=2):
+            record = loads(line)
+            length = max(hsp['query_end'] for alignment in
+                         record['alignments'] for hsp in alignment['hsps'])
+            yield Read(record['query'], 'A' * length)
+
+
+def readAlignments(filename, threads, matchedSequences):
+    """
+    Read HSPs with a DIAMOND JSONRecordsReader.
+    """
+    reader = JSONRecordsReader(filename, threads=threads,
+                               matchedSequences=matchedSequences)
+    return sum(len(alignment.hsps)
+               for readAlignments in reader.readAlignments(
+                   reads(filename, threads))
+               for alignment in readAlignments)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Measure DIAMOND JSON decoding speed.')
+
+    parser.add_argument(
+        '--jsonFile',
+        help=('An existing (possibly bzip2 compressed) DIAMOND JSON file to '
+              'read instead of making a synthetic one.'))
+
+    parser.add_argument(
+        '--count', type=int, default=50000,
+        help='The number of records in the synthetic JSON.')
+
+    parser.add_argument(
+        '--threads', type=int, default=0,
+        help='The number of threads to use to read and decompress the file.')
+
+    parser.add_argument(
+        '--noAlignments', default=False, action='store_true',
+        help=('Only time JSON decoding, not conversion to read alignments '
+              '(which also reads the file a second time, to make reads).'))
+
+    args = parser.parse_args()
+
+    seed(0)
+    tmpdir = tempfile.mkdtemp()
+
+    try:
+        if args.jsonFile:
+            filename = args.jsonFile
+        else:
+            filename = os.path.join(tmpdir, 'results.json')
+            makeJSON(filename, args.count, 300, 10)
+
+        timings = [('lines+json', 'records',
+                    lambda: stdlibLines(filename, args.threads))]
+
+        for backend in JSON_BACKENDS:
+            try:
+                jsonLoader(backend)
+            except ValueError:
+                print('JSON backend %s is not available.' % backend)
+            else:
+                timings.append((
+                    'blocks+' + backend, 'records',
+                    lambda backend=backend: blockLines(
+                        filename, args.threads, backend)))
+
+        if not args.noAlignments:
+            for matchedSequences in True, False:
+                timings.append((
+                    'alignments' + ('' if matchedSequences else '-noseq'),
+                    'HSPs',
+                    lambda matchedSequences=matchedSequences: readAlignments(
+                        filename, args.threads, matchedSequences)))
+
+        print('%-18s %12s %8s %10s %12s' % ('method', 'count', 'of',
+                                            'seconds', 'per second'))
+        for name, what, func in timings:
+            count, elapsed = timeIt(func)
+            print('%-18s %12d %8s %10.2f %12.0f' % (
+                name, count, what, elapsed, count / elapsed))
+    finally:
+        shutil.rmtree(tmpdir)
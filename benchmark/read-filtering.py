@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+"""
+Measure the per-read cost of filtering reads with dark.reads.ReadFilter (as
+filter-fasta.py does), with 1, 3, and 10 filtering options given to one
+filter, and with the same options split across several filters (i.e.,
+chained calls to Reads.filter).
+"""
+
+from __future__ import print_function, division
+
+from random import choice, seed
+from time import time
+
+from dark.reads import Read, Reads
+
+# Filtering options that (given the reads made by makeReads) do not reject
+# any reads, so the full cost of each option is paid for every read.
+OPTIONS = (
+    ('minLength', 10),
+    ('maxLength', 1000),
+    ('removeDescriptions', True),
+    ('removeGaps', True),
+    ('titleRegex', 'read'),
+    ('negativeTitleRegex', 'xxx'),
+    ('removeDuplicates', True),
+    ('removeDuplicatesById', True),
+    ('idLambda', 'lambda id: id'),
+    ('readLambda', 'lambda read: read'),
+)
+
+
+def makeReads(count, length):
+    """
+    Make reads with distinct ids and sequences.
+
+    @param count: The C{int} number of reads to make.
+    @param length: The C{int} length of each read.
+    @return: A C{list} of C{Read} instances.
+    """
+    poolSize = 10000
+    bases = ''.join(choice('ACGT') for _ in range(poolSize + length))
+    return [Read('read%d description' % i,
+                 '%d%s' % (i, bases[i % poolSize:i % poolSize + length]))
+            for i in range(count)]
+
+
+def timeFiltering(reads, optionSets, repeat):
+    """
+    Time filtering a list of reads.
+
+    @param reads: A C{list} of C{Read} instances.
+    @param optionSets: A C{list} of C{dict}s, each containing keyword
+        arguments for a call to C{Reads.filter}.
+    @param repeat: The C{int} number of times to filter.
+    @return: The C{float} best (lowest) elapsed time.
+    """
+    best = None
+    for _ in range(repeat):
+        filtered = Reads(reads)
+        for options in optionSets:
+            filtered = filtered.filter(**options)
+        start = time()
+        for _ in filtered:
+            pass
+        elapsed = time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description=('Measure the per-read overhead of read filtering with '
+                     'different numbers of filtering options.'))
+
+    parser.add_argument(
+        '--count', type=int, default=200000,
+        help='The number of reads to filter.')
+
+    parser.add_argument(
+        '--length', type=int, default=100,
+        help='The length of each read.')
+
+    parser.add_argument(
+        '--repeat', type=int, default=3,
+        help='The number of times to time each filter (the best is shown).')
+
+    args = parser.parse_args()
+
+    seed(0)
+    reads = makeReads(args.count, args.length)
+    baseline = timeFiltering(reads, [], args.repeat)
+
+    print('%-8s %-10s %12s %14s' % ('options', 'filters', 'seconds',
+                                    'ns/read extra'))
+    print('%-8d %-10s %12.3f %14s' % (0, '-', baseline, '-'))
+
+    for optionCount in 1, 3, 10:
+        options = OPTIONS[:optionCount]
+        for name, optionSets in (
+                ('one', [dict(options)]),
+                ('chained', [dict([option]) for option in options])):
+            if name == 'chained' and optionCount == 1:
+                continue
+            elapsed = timeFiltering(reads, optionSets, args.repeat)
+            print('%-8d %-10s %12.3f %14.0f' % (
+                optionCount, name, elapsed,
+                1e9 * (elapsed - baseline) / args.count))
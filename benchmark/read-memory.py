@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+
+"""
+Measure the memory used to hold many reads in RAM, comparing reads whose
+attributes are held in an instance __dict__ (as dark.reads.Read instances
+were before they had __slots__), dark.reads.Read instances (which have
+__slots__), and a bytes-backed dark.reads.ReadsInRAM.
+
+Python 3 is required (for tracemalloc).
+"""
+
+from __future__ import print_function, division
+
+import gc
+import tracemalloc
+from random import choice, seed
+from time import time
+
+from dark.reads import Read, ReadsInRAM
+
+
+class DictRead(object):
+    """
+    A read whose attributes are stored in an instance __dict__.
+    """
+    def __init__(self, id, sequence, quality=None):
+        self.id = id
+        self.sequence = sequence
+        self.quality = quality
+
+
+def makeReads(count, length, withQuality, readClass):
+    """
+    Make reads with distinct id, sequence, and quality strings.
+
+    @param count: The C{int} number of reads to make.
+    @param length: The C{int} length of each read.
+    @param withQuality: If C{True} give each read a quality string.
+    @param readClass: The class of the reads to make.
+    @return: A generator that yields instances of C{readClass}.
+    """
+    # Take each sequence and quality from a random offset in a longer
+    # string, so each read gets new (unshared) strings without needing
+    # to generate many random sequences.
+    poolSize = 100000
+    bases = ''.join(choice('ACGT') for _ in range(poolSize + length))
+    qualities = ''.join(choice('!#%&+5?AFI') for _ in range(poolSize + length))
+    for i in range(count):
+        offset = i % poolSize
+        sequence = bases[offset:offset + length]
+        quality = qualities[offset:offset + length] if withQuality else None
+        yield readClass('read%d' % i, sequence, quality)
+
+
+def measure(name, build, count):
+    """
+    Measure the memory held by a collection of reads.
+
+    @param name: The C{str} name of the representation.
+    @param build: A function that returns the collection of reads.
+    @param count: The C{int} number of reads in the collection.
+    """
+    gc.collect()
+    tracemalloc.start()
+    start = time()
+    reads = build()
+    elapsed = time() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(reads) == count
+    print('%-14s %10.1f %10.1f %12.1f %9.1f' % (
+        name, current / (1 << 20), peak / (1 << 20), current / count,
+        elapsed))
+    del reads
+    gc.collect()
+    return current
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description=('Compare the memory needed to hold reads in RAM using '
+                     'dict-based, slotted, and bytes-backed storage.'))
+
+    parser.add_argument(
+        '--count', type=int, default=10000000,
+        help='The number of reads to hold in memory.')
+
+    parser.add_argument(
+        '--length', type=int, default=150,
+        help='The length of each read.')
+
+    parser.add_argument(
+        '--noQuality', default=False, action='store_true',
+        help='If specified, reads will not have quality strings.')
+
+    args = parser.parse_args()
+
+    seed(0)
+    count, length = args.count, args.length
+    withQuality = not args.noQuality
+
+    print('%-14s %10s %10s %12s %9s' % (
+        'storage', 'MiB', 'peak MiB', 'bytes/read', 'seconds'))
+
+    dictBased = measure(
+        'dict', lambda: list(makeReads(count, length, withQuality, DictRead)),
+        count)
+
+    slotted = measure(
+        'slots', lambda: list(makeReads(count, length, withQuality, Read)),
+        count)
+
+    bytesBacked = measure(
+        'bytes-backed',
+        lambda: ReadsInRAM(makeReads(count, length, withQuality, Read),
+                           bytesBacked=True),
+        count)
+
+    print('Saving vs dict: slots %.1f%%, bytes-backed %.1f%%.' % (
+        100.0 * (dictBased - slotted) / dictBased,
+        100.0 * (dictBased - bytesBacked) / dictBased))
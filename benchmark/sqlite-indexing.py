@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+"""
+Measure the speed (in FASTA headers per second) of building a
+dark.fasta.SqliteIndex (as make-fasta-database.py does) from plain and
+BGZF-compressed FASTA.
+"""
+
+from __future__ import print_function, division
+
+import os
+import shutil
+import tempfile
+from random import choice, randint, seed, shuffle
+from time import time
+
+from Bio import bgzf
+
+from dark.fasta import SqliteIndex
+
+
+def makeFasta(filename, count, length, lineLength):
+    """
+    Write a file of random protein FASTA, with NCBI-like headers. As in
+    real databases, the ids are not in sorted order.
+
+    @param filename: The C{str} file name to write to.
+    @param count: The C{int} number of sequences to write.
+    @param length: The C{int} maximum length of each sequence.
+    @param lineLength: The C{int} maximum sequence line length.
+    """
+    residues = 'ACDEFGHIKLMNPQRSTVWY'
+    # Sequences are slices of one long random string, so making them is
+    # fast.
+    pool = ''.join(choice(residues) for _ in range(length * 10))
+    ids = list(range(count))
+    shuffle(ids)
+    with open(filename, 'w') as fp:
+        for i in ids:
+            start = randint(0, length * 9)
+            sequence = pool[start:start + randint(1, length)]
+            lines = [sequence[start:start + lineLength]
+                     for start in range(0, len(sequence), lineLength)]
+            fp.write('>WP_%09d.1 hypothetical protein [Bacterium %d]\n%s\n' %
+                     (i, i % 1000, '\n'.join(lines)))
+
+
+def bgzip(filename):
+    """
+    Write a BGZF-compressed copy of a file.
+
+    @param filename: The C{str} name of the file to compress.
+    @return: The C{str} name of the compressed file.
+    """
+    compressed = filename + '.gz'
+    with open(filename, 'rb') as infp:
+        writer = bgzf.BgzfWriter(compressed, 'wb')
+        shutil.copyfileobj(infp, writer)
+        writer.close()
+    return compressed
+
+
+def timeIndexing(filename, dbFilename, repeat):
+    """
+    Time adding a FASTA file to a new SqliteIndex database.
+
+    @param filename: The C{str} FASTA file name.
+    @param dbFilename: The C{str} name of the database file to make.
+    @param repeat: The C{int} number of times to index.
+    @return: A 2-tuple with the C{int} number of headers indexed and the
+        C{float} best (lowest) elapsed time.
+    """
+    best = None
+    for _ in range(repeat):
+        if os.path.exists(dbFilename):
+            os.unlink(dbFilename)
+        start = time()
+        index = SqliteIndex(dbFilename)
+        count = index.addFile(filename)
+        index.close()
+        elapsed = time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return count, best
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description=('Measure headers/sec when building an SqliteIndex from '
+                     'plain and BGZF FASTA.'))
+
+    parser.add_argument(
+        '--count', type=int, default=200000,
+        help='The number of sequences in the synthetic FASTA.')
+
+    parser.add_argument(
+        '--length', type=int, default=400,
+        help='The maximum length of each synthetic sequence.')
+
+    parser.add_argument(
+        '--lineLength', type=int, default=80,
+        help='The maximum length of synthetic sequence lines.')
+
+    parser.add_argument(
+        '--repeat', type=int, default=3,
+        help='The number of times to index each file (the best is shown).')
+
+    parser.add_argument(
+        '--fastaFile',
+        help=('An existing (uncompressed) FASTA file to use instead of '
+              'making synthetic FASTA. A BGZF copy will be made in a '
+              'temporary directory.'))
+
+    args = parser.parse_args()
+
+    seed(0)
+    tmpdir = tempfile.mkdtemp()
+
+    try:
+        plain = os.path.join(tmpdir, 'sequences.fasta')
+        if args.fastaFile:
+            shutil.copyfile(args.fastaFile, plain)
+        else:
+            makeFasta(plain, args.count, args.length, args.lineLength)
+
+        dbFilename = os.path.join(tmpdir, 'index.db')
+
+        print('%-6s %10s %10s %12s' % ('input', 'headers', 'seconds',
+                                       'headers/s'))
+        for name, filename in ('plain', plain), ('bgzf', bgzip(plain)):
+            count, elapsed = timeIndexing(filename, dbFilename, args.repeat)
+            print('%-6s %10d %10.2f %12.0f' % (name, count, elapsed,
+                                               count / elapsed))
+    finally:
+        shutil.rmtree(tmpdir)
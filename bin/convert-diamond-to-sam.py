@@ -9,12 +9,9 @@ import sys
 import argparse
 from os.path import basename
 from tempfile import TemporaryFile
-from functools import partial
 
 from dark import __version__ as VERSION
-from dark.btop import btop2cigar
-from dark.diamond.conversion import diamondTabularFormatToDicts, FIELDS
-from dark.reads import DNARead
+from dark.diamond.conversion import diamondTabularFormatToSAM, FIELDS
 
 parser = argparse.ArgumentParser(
     formatter_class=argparse.ArgumentDefaultsHelpFormatter,
@@ -47,6 +44,11 @@ parser.add_argument(
           'is probably only a small chance this will cause any problems '
           'downstream.'))
 
+parser.add_argument(
+    '--workers', type=int, default=1,
+    help=('The number of processes to use to convert the DIAMOND output. '
+          'The order of the SAM output is not changed.'))
+
 args = parser.parse_args()
 
 if args.printFields:
@@ -67,74 +69,13 @@ if ram:
     emit = nonHeaderLines.append
 else:
     tf = TemporaryFile(mode='w+t', encoding='utf-8')
-    emit = partial(print, file=tf)
-
-for match in diamondTabularFormatToDicts(sys.stdin):
-    qseqid = match['qseqid'].split()[0] if idOnly else match['qseqid']
-    stitle = match['stitle'].split()[0] if idOnly else match['stitle']
-
-    # The subject length is ALWAYS in amino acids in DIAMOND.
-    referenceLengths[stitle] = 3 * match['slen']
-
-    # If the query frame is less than zero, the match was with a reverse
-    # complemented translation of the query. Put the reverse compliment
-    # into the SAM output, which seems to be standard / accepted practice
-    # based on my web searches. See e.g., https://www.biostars.org/p/131891/
-    # for what Bowtie2 does and for some comments on this issue for SAM/BAM
-    # files in general.
-    if match['qframe'] > 0:
-        flag = 0
-        qseq = match['qseq']
-        qqual = match['qqual'] or '*'
-    else:
-        flag = 16
-        qseq = DNARead('id', match['qseq']).reverseComplement().sequence
-        qqual = match['qqual'][::-1] if match['qqual'] else '*'
-
-    # Make a CIGAR string, including hard-clipped bases at the start and
-    # end of the query (DIAMOND outputs a hard-clipped query sequence).
-    startClipCount = match['qstart'] - 1
-    endClipCount = match['qlen'] - match['qend']
-
-    assert startClipCount >= 0
-    assert endClipCount >= 0, (
-        'Query sequence %s has length %d but the qend value is %d' %
-        (qseq, len(match['qseq']), match['qend']))
-
-    cigar = (
-        ('%dH' % startClipCount if startClipCount else '') +
-        btop2cigar(match['btop'], concise=False, aa=True) +
-        ('%dH' % endClipCount if endClipCount else ''))
-
-    emit('\t'.join(map(str, [
-        # 1. QNAME
-        qseqid,
-        # 2. FLAG
-        flag,
-        # 3. RNAME
-        stitle,
-        # 4. POS. This needs to be a 1-based offset into the
-        # nucleotide-equivalent of the DIAMOND subject sequence (which was
-        # a protein since that is how DIAMOND operates). Because DIAMOND
-        # gives back a 1-based protein location, we adjust to 0-based,
-        # multiply by 3 to get to nucleotides, then adjust to 1-based.
-        3 * (match['sstart'] - 1) + 1,
-        # 5. MAPQ
-        mappingQuality,
-        # 6. CIGAR
-        cigar,
-        # 7. RNEXT
-        '*',
-        # 8. PNEXT
-        0,
-        # 9. TLEN
-        0,
-        # 10. SEQ
-        qseq,
-        # 11. QUAL
-        qqual,
-        # 12. Alignment score
-        'AS:i:%d' % int(match['bitscore'])])))
+    emit = tf.write
+
+for samLines, blockReferenceLengths in diamondTabularFormatToSAM(
+        sys.stdin, idOnly=idOnly, mappingQuality=mappingQuality,
+        workers=args.workers):
+    referenceLengths.update(blockReferenceLengths)
+    emit(samLines)
 
 
 progName = basename(sys.argv[0])
@@ -155,7 +96,7 @@ print('\n'.join(
 
 # Print non-header lines.
 if ram:
-    print('\n'.join(nonHeaderLines))
+    sys.stdout.write(''.join(nonHeaderLines))
 else:
     tf.seek(0)
     for line in tf:
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+
+import argparse
+import sys
+
+from dark.alignment_store import (
+    ALIGNMENT_STORE_SUFFIX, convertJSONToAlignmentStore)
+
+
+def storeFilename(jsonFilename):
+    """
+    Make an alignment store file name from a JSON file name.
+
+    @param jsonFilename: A C{str} JSON file name.
+    @return: A C{str} alignment store file name.
+    """
+    for suffix in '.json.bz2', '.json':
+        if jsonFilename.endswith(suffix):
+            return jsonFilename[:-len(suffix)] + ALIGNMENT_STORE_SUFFIX
+    return jsonFilename + ALIGNMENT_STORE_SUFFIX
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description=('Convert BLAST or DIAMOND JSON files to the (smaller '
+                     'and faster to read) alignment store format.'),
+        epilog=('Each JSON file (as made by convert-blast-xml-to-json.py or '
+                'convert-diamond-to-json.py, optionally compressed with '
+                'bzip2) is converted to a file with the same name but with '
+                'its .json or .json.bz2 suffix replaced by %s. The new files '
+                'can be used wherever the JSON files could be.' %
+                ALIGNMENT_STORE_SUFFIX))
+
+    parser.add_argument(
+        'json', metavar='JSON-file', nargs='+',
+        help='The JSON files to convert.')
+
+    parser.add_argument(
+        '--uncompressed', default=False, action='store_true',
+        help=('Do not compress the alignment store (this makes larger files '
+              'that are a little faster to read).'))
+
+    parser.add_argument(
+        '--threads', type=int, default=0,
+        help=('The number of threads to use to read and decompress each '
+              'JSON file.'))
+
+    parser.add_argument(
+        '--verbose', default=False, action='store_true',
+        help='Print the name of each file as it is converted.')
+
+    args = parser.parse_args()
+
+    for jsonFilename in args.json:
+        outputFilename = storeFilename(jsonFilename)
+        count = convertJSONToAlignmentStore(
+            jsonFilename, outputFilename, compress=not args.uncompressed,
+            threads=args.threads)
+        if args.verbose:
+            print('Converted %d records from %s to %s' %
+                  (count, jsonFilename, outputFilename), file=sys.stderr)
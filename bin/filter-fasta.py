@@ -7,7 +7,8 @@ import sys
 from dark.filter import (
     addFASTAFilteringCommandLineOptions, parseFASTAFilteringCommandLineOptions,
     addFASTAEditingCommandLineOptions, parseFASTAEditingCommandLineOptions)
-from dark.reads import addFASTACommandLineOptions, parseFASTACommandLineOptions
+from dark.reads import (
+    addFASTACommandLineOptions, parseFASTACommandLineOptions, ReadsWriter)
 
 
 if __name__ == '__main__':
@@ -34,6 +35,13 @@ if __name__ == '__main__':
               'not seen, the script exits with status 1 and an error '
               'message is printed unless --quiet was used.'))
 
+    parser.add_argument(
+        '--workers', type=int, default=1,
+        help=('The number of processes to use to filter reads. Filtering '
+              'options that do not depend on other reads (e.g., --minLength, '
+              '--titleRegex, --readLambda) are applied in parallel. The '
+              'order of the output is not changed.'))
+
     addFASTACommandLineOptions(parser)
     addFASTAFilteringCommandLineOptions(parser)
     addFASTAEditingCommandLineOptions(parser)
@@ -44,6 +52,9 @@ if __name__ == '__main__':
         args, parseFASTAFilteringCommandLineOptions(
             args, parseFASTACommandLineOptions(args)))
 
+    if args.workers > 1:
+        reads.parallel(workers=args.workers)
+
     saveAs = (
         args.saveAs or
         (args.fasta and 'fasta') or
@@ -63,11 +74,8 @@ if __name__ == '__main__':
             'You have specified --saveAs fasta-ss without using --fasta-ss '
             'to indicate that the input is PDB FASTA. Please be explicit.')
 
-    write = sys.stdout.write
-    kept = 0
-    for read in reads:
-        kept += 1
-        write(read.toString(format_=saveAs))
+    with ReadsWriter(sys.stdout, saveAs) as writer:
+        kept = writer.writeReads(reads)
 
     total = reads.unfilteredLength()
 
@@ -293,6 +293,12 @@ if __name__ == '__main__':
               'the results in the files from HTCondor does not match the '
               'order of sequences in the FASTA/Q file.'))
 
+    parser.add_argument(
+        '--workers', type=int, default=1,
+        help=('The number of processes to use to read (decompress and decode) '
+              'the JSON files, if more than one is given. The files are '
+              'still matched against the reads in the order given.'))
+
     parser.add_argument(
         '--titlesJSONFile',
         help=('Give a file name for JSON holding information about titles to '
@@ -334,7 +340,7 @@ if __name__ == '__main__':
             reads, jsonFiles, databaseFilename=args.databaseFastaFilename,
             databaseDirectory=args.databaseFastaDirectory,
             sqliteDatabaseFilename=args.sqliteDatabaseFilename,
-            sortBlastFilenames=args.sortFilenames)
+            sortBlastFilenames=args.sortFilenames, workers=args.workers)
     else:
         # Must be 'diamond' (due to parser.add_argument 'choices' argument).
         if args.showOrfs:
@@ -364,7 +370,8 @@ if __name__ == '__main__':
             reads, jsonFiles, sortFilenames=args.sortFilenames,
             databaseFilename=args.databaseFastaFilename,
             databaseDirectory=args.databaseFastaDirectory,
-            sqliteDatabaseFilename=args.sqliteDatabaseFilename)
+            sqliteDatabaseFilename=args.sqliteDatabaseFilename,
+            workers=args.workers)
 
     readsAlignments.filter(
         maxAlignmentsPerRead=args.maxAlignmentsPerRead,
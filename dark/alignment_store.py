@@ -0,0 +1,397 @@
+from json import dumps, loads
+
+import numpy as np
+from six import integer_types, string_types
+
+from dark.utils import openFile
+
+# The suffix of alignment store file names.
+ALIGNMENT_STORE_SUFFIX = '.npz'
+
+# The version of the alignment store format. Increment this if the layout of
+# the arrays changes.
+ALIGNMENT_STORE_VERSION = 1
+
+# The number of records to convert to Python values at a time when reading.
+RECORDS_BATCH_SIZE = 10000
+
+# Values of the (optional) per-HSP state array of a column.
+_PRESENT, _NONE, _ABSENT = 0, 1, 2
+
+
+def _stringsToArrays(strings):
+    """
+    Concatenate strings into a single C{uint8} array.
+
+    @param strings: A C{list} of C{str}s.
+    @return: A 2-tuple with 1) a C{numpy} C{uint8} array holding the UTF-8
+        encoding of all the strings, and 2) a C{numpy} C{int64} array of
+        length C{len(strings) + 1} giving the offset of each string in the
+        first array (followed by the length of the first array).
+    """
+    encoded = [s.encode('UTF-8') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def _arraysToStrings(data, offsets):
+    """
+    Undo L{_stringsToArrays}.
+
+    @param data: A C{numpy} C{uint8} array of UTF-8 data.
+    @param offsets: A C{list} of C{int} string offsets into C{data}.
+    @return: A C{list} of C{str}s.
+    """
+    data = data.tobytes()
+    try:
+        # If the data is ASCII, byte offsets are also character offsets so
+        # it can be decoded all at once.
+        data = data.decode('ascii')
+    except UnicodeDecodeError:
+        return [data[start:end].decode('UTF-8')
+                for start, end in zip(offsets, offsets[1:])]
+    else:
+        return [data[start:end] for start, end in zip(offsets, offsets[1:])]
+
+
+def _columnKind(values):
+    """
+    Find the kind of column needed to hold some HSP values.
+
+    @param values: A C{list} of values (C{None} values are ignored).
+    @return: One of 'int', 'float', 'str', 'ints' (for C{list}s of C{int}s
+        that all have the same length, e.g., BLAST frames), or 'json' (for
+        anything else).
+    """
+    types = set(map(type, values))
+    types.discard(type(None))
+    if not types:
+        # All values are None.
+        return 'int'
+    elif len(types) == 1:
+        # Fast path for the common cases.
+        valueType = types.pop()
+        if valueType is float:
+            return 'float'
+        elif valueType in integer_types and valueType is not bool:
+            return 'int'
+        elif valueType in string_types:
+            return 'str'
+
+    kinds = set()
+    for value in values:
+        if value is None:
+            continue
+        elif isinstance(value, bool):
+            kinds.add('json')
+        elif isinstance(value, integer_types):
+            kinds.add('int')
+        elif isinstance(value, float):
+            kinds.add('float')
+        elif isinstance(value, string_types):
+            kinds.add('str')
+        elif (isinstance(value, (list, tuple)) and
+              all(isinstance(v, integer_types) and not isinstance(v, bool)
+                  for v in value)):
+            kinds.add(('ints', len(value)))
+        else:
+            kinds.add('json')
+
+    if kinds == {'int', 'float'}:
+        return 'float'
+    elif len(kinds) == 1:
+        kind = kinds.pop()
+        return 'ints' if isinstance(kind, tuple) else kind
+    else:
+        return 'json'
+
+
+def writeAlignmentStore(filename, params, records, compress=True):
+    """
+    Write BLAST or DIAMOND records to an alignment store file.
+
+    An alignment store holds the records in columns (one C{numpy} array per
+    HSP field, and per alignment subject length), with subject titles kept
+    once each in a title table (alignments refer to them by number) and
+    matched sequences and other strings concatenated into single arrays.
+    The arrays are saved in C{numpy} C{.npz} format.
+
+    @param filename: The C{str} name of the file to write. Should end with
+        C{ALIGNMENT_STORE_SUFFIX}, so it can be recognized by
+        L{dark.blast.alignments.BlastReadsAlignments} and
+        L{dark.diamond.alignments.DiamondReadsAlignments}.
+    @param params: A C{dict} of BLAST or DIAMOND parameters (as found on the
+        first line of our JSON files).
+    @param records: An iterable of record C{dict}s, each with 'query' and
+        'alignments' keys, as found in our JSON files.
+    @param compress: If C{True}, compress the arrays.
+    @return: The C{int} number of records written.
+    """
+    queries = []
+    recordAlignments = [0]
+    titleIndex = {}
+    alignmentTitles = []
+    alignmentLengths = []
+    alignmentHsps = [0]
+    hsps = []
+
+    for record in records:
+        queries.append(record['query'])
+        for alignment in record['alignments']:
+            title = alignment['title']
+            try:
+                alignmentTitles.append(titleIndex[title])
+            except KeyError:
+                alignmentTitles.append(len(titleIndex))
+                titleIndex[title] = len(titleIndex)
+            alignmentLengths.append(alignment['length'])
+            hsps.extend(alignment['hsps'])
+            alignmentHsps.append(len(hsps))
+        recordAlignments.append(len(alignmentTitles))
+
+    titles = sorted(titleIndex, key=titleIndex.get)
+
+    arrays = {
+        'version': np.array([ALIGNMENT_STORE_VERSION], dtype=np.int64),
+        'params': np.frombuffer(
+            dumps(params, sort_keys=True).encode('UTF-8'), dtype=np.uint8),
+        'recordAlignments': np.array(recordAlignments, dtype=np.int64),
+        'alignmentTitles': np.array(alignmentTitles, dtype=np.int64),
+        'alignmentLengths': np.array(alignmentLengths, dtype=np.int64),
+        'alignmentHsps': np.array(alignmentHsps, dtype=np.int64),
+    }
+    arrays['queries'], arrays['queryOffsets'] = _stringsToArrays(queries)
+    arrays['titles'], arrays['titleOffsets'] = _stringsToArrays(titles)
+
+    # Use the smallest integer type that can hold all title numbers.
+    for dtype in np.uint8, np.uint16, np.uint32:
+        if len(titles) <= np.iinfo(dtype).max + 1:
+            arrays['alignmentTitles'] = arrays['alignmentTitles'].astype(
+                dtype)
+            break
+
+    fields = sorted(set(key for hsp in hsps for key in hsp))
+    kinds = {}
+    for field in fields:
+        values = [hsp.get(field) for hsp in hsps]
+        kind = kinds[field] = _columnKind(values)
+        state = np.array(
+            [_PRESENT if field in hsp and hsp[field] is not None else
+             (_NONE if field in hsp else _ABSENT) for hsp in hsps],
+            dtype=np.uint8)
+        if state.any():
+            arrays['hsp:%s:state' % field] = state
+        key = 'hsp:%s' % field
+        if kind == 'int':
+            arrays[key] = np.array([0 if v is None else v for v in values],
+                                   dtype=np.int64)
+        elif kind == 'float':
+            arrays[key] = np.array([0.0 if v is None else v for v in values],
+                                   dtype=np.float64)
+        elif kind == 'ints':
+            width = len(next(v for v in values if v is not None))
+            arrays[key] = np.array(
+                [[0] * width if v is None else v for v in values],
+                dtype=np.int64).reshape((len(values), width))
+        else:
+            if kind == 'json':
+                values = [dumps(v) for v in values]
+            else:
+                values = ['' if v is None else v for v in values]
+            arrays[key], arrays[key + ':offsets'] = _stringsToArrays(values)
+
+    arrays['hspFields'], arrays['hspFieldOffsets'] = _stringsToArrays(
+        ['%s:%s' % (field, kinds[field]) for field in fields])
+
+    with open(filename, 'wb') as fp:
+        if compress:
+            np.savez_compressed(fp, **arrays)
+        else:
+            np.savez(fp, **arrays)
+
+    return len(queries)
+
+
+def convertJSONToAlignmentStore(jsonFilename, storeFilename, compress=True,
+                                threads=0):
+    """
+    Convert a file of our per-line JSON BLAST or DIAMOND records to an
+    alignment store.
+
+    @param jsonFilename: The C{str} name of a (possibly bzip2 compressed)
+        JSON file, as made by C{bin/convert-blast-xml-to-json.py} or
+        C{bin/convert-diamond-to-json.py}.
+    @param storeFilename: The C{str} name of the alignment store file to
+        write.
+    @param compress: If C{True}, compress the arrays.
+    @param threads: An C{int} number of threads to use for reading and
+        decompressing C{jsonFilename} (see L{dark.utils.openFile}).
+    @raise ValueError: If C{jsonFilename} is empty or a line of it cannot be
+        converted from JSON.
+    @return: The C{int} number of records converted.
+    """
+    with openFile(jsonFilename, threads=threads) as fp:
+        line = fp.readline()
+        if not line:
+            raise ValueError('JSON file %r was empty.' % jsonFilename)
+
+        def records():
+            for lineNumber, line in enumerate(fp, start=2):
+                try:
+                    yield loads(line[:-1])
+                except ValueError as e:
+                    raise ValueError(
+                        'Could not convert line %d of %r to JSON (%s). '
+                        'Line is %r.' %
+                        (lineNumber, jsonFilename, e, line[:-1]))
+
+        try:
+            params = loads(line[:-1])
+        except ValueError as e:
+            raise ValueError(
+                'Could not convert first line of %r to JSON (%s). '
+                'Line is %r.' % (jsonFilename, e, line[:-1]))
+
+        return writeAlignmentStore(storeFilename, params, records(),
+                                   compress=compress)
+
+
+class AlignmentStore(object):
+    """
+    Read BLAST or DIAMOND records from a file made by
+    L{writeAlignmentStore}.
+
+    @param filename: The C{str} name of an alignment store file.
+    @raise ValueError: If C{filename} is not an alignment store, or was made
+        by an incompatible version.
+    @ivar params: A C{dict} of BLAST or DIAMOND parameters.
+    """
+    def __init__(self, filename):
+        self._filename = filename
+        try:
+            with np.load(filename, allow_pickle=False) as npz:
+                arrays = dict((key, npz[key]) for key in npz.files)
+        except (IOError, OSError, ValueError) as e:
+            raise ValueError(
+                'Could not read alignment store %r (%s).' % (filename, e))
+
+        try:
+            version = int(arrays['version'][0])
+        except KeyError:
+            raise ValueError('File %r is not an alignment store.' % filename)
+
+        if version != ALIGNMENT_STORE_VERSION:
+            raise ValueError(
+                'Alignment store %r has format version %d (expected %d).' %
+                (filename, version, ALIGNMENT_STORE_VERSION))
+
+        self._arrays = arrays
+        self.params = loads(arrays['params'].tobytes().decode('UTF-8'))
+        self._fields = []
+        for spec in _arraysToStrings(arrays['hspFields'],
+                                     arrays['hspFieldOffsets'].tolist()):
+            field, kind = spec.rsplit(':', 1)
+            self._fields.append((field, kind))
+
+    def __len__(self):
+        return len(self._arrays['recordAlignments']) - 1
+
+    def records(self, skipHspFields=()):
+        """
+        Yield the records in the store.
+
+        @param skipHspFields: An iterable of C{str} HSP field names (e.g.,
+            'query' and 'sbjct') that are not needed. These are not decoded
+            and will not be present in the HSP C{dict}s.
+        @return: A generator that yields record C{dict}s, each with 'query'
+            and 'alignments' keys, as found in our JSON files.
+        """
+        skipHspFields = set(skipHspFields)
+        arrays = self._arrays
+        titles = _arraysToStrings(arrays['titles'],
+                                  arrays['titleOffsets'].tolist())
+        queries = arrays['queries'].tobytes()
+        queryOffsets = arrays['queryOffsets'].tolist()
+        recordAlignments = arrays['recordAlignments']
+        alignmentHsps = arrays['alignmentHsps']
+        nRecords = len(self)
+
+        for first in range(0, nRecords, RECORDS_BATCH_SIZE):
+            last = min(first + RECORDS_BATCH_SIZE, nRecords)
+            a0, a1 = int(recordAlignments[first]), int(recordAlignments[last])
+            h0, h1 = int(alignmentHsps[a0]), int(alignmentHsps[a1])
+            hsps = self._hsps(h0, h1, skipHspFields)
+            alignmentTitles = arrays['alignmentTitles'][a0:a1].tolist()
+            alignmentLengths = arrays['alignmentLengths'][a0:a1].tolist()
+            hspOffsets = alignmentHsps[a0:a1 + 1].tolist()
+            alignmentOffsets = recordAlignments[first:last + 1].tolist()
+
+            for index in range(last - first):
+                alignments = []
+                for a in range(alignmentOffsets[index] - a0,
+                               alignmentOffsets[index + 1] - a0):
+                    alignments.append({
+                        'hsps': hsps[hspOffsets[a] - h0:
+                                     hspOffsets[a + 1] - h0],
+                        'length': alignmentLengths[a],
+                        'title': titles[alignmentTitles[a]],
+                    })
+                recordIndex = first + index
+                yield {
+                    'alignments': alignments,
+                    'query': queries[
+                        queryOffsets[recordIndex]:
+                        queryOffsets[recordIndex + 1]].decode('UTF-8'),
+                }
+
+    def _hsps(self, start, end, skipFields):
+        """
+        Make HSP C{dict}s.
+
+        @param start: The C{int} index of the first HSP to make.
+        @param end: The C{int} index just beyond the last HSP to make.
+        @param skipFields: A C{set} of C{str} HSP field names to leave out.
+        @return: A C{list} of HSP C{dict}s.
+        """
+        arrays = self._arrays
+        fields = []
+        columns = []
+        states = []
+
+        for field, kind in self._fields:
+            if field in skipFields:
+                continue
+            key = 'hsp:%s' % field
+            if kind in ('str', 'json'):
+                offsets = arrays[key + ':offsets'][start:end + 1].tolist()
+                values = _arraysToStrings(
+                    arrays[key][offsets[0]:offsets[-1]],
+                    [offset - offsets[0] for offset in offsets])
+                if kind == 'json':
+                    values = list(map(loads, values))
+            else:
+                values = arrays[key][start:end].tolist()
+
+            stateKey = key + ':state'
+            if stateKey in arrays:
+                states.append(
+                    (field, values, arrays[stateKey][start:end].tolist()))
+            else:
+                fields.append(field)
+                columns.append(values)
+
+        if columns:
+            hsps = [dict(zip(fields, row)) for row in zip(*columns)]
+        else:
+            hsps = [{} for _ in range(end - start)]
+
+        # Fields that are None or absent in some HSPs.
+        for field, values, state in states:
+            for hsp, value, state in zip(hsps, values, state):
+                if state == _PRESENT:
+                    hsp[field] = value
+                elif state == _NONE:
+                    hsp[field] = None
+
+        return hsps
@@ -1,7 +1,9 @@
 import re
+from collections import deque
 
 from dark.taxonomy import LineageFetcher
 from dark.filter import TitleFilter
+from dark.reads import _forkContext
 from dark.score import HigherIsBetterScore
 
 
@@ -21,6 +23,192 @@ def bestAlignment(readAlignments):
     return max(readAlignments, key=lambda alignment: alignment.hsps[0])
 
 
+def recordReaders(filenames, getReader, firstReader=None, workers=None,
+                  ordered=True):
+    """
+    Get record readers (e.g., a BLAST or DIAMOND C{JSONRecordsReader}) for a
+    list of result files.
+
+    If C{workers} is greater than one (and there is more than one file),
+    each file is read (i.e., decompressed and decoded) in a worker process
+    by calling the reader's C{prefetch} method, and the reader is then sent
+    back to this process. At most C{2 * workers} files are held in memory at
+    once.
+
+    @param filenames: A C{list} of C{str} result file names.
+    @param getReader: A function that takes a C{str} file name and returns a
+        record reader for it.
+    @param firstReader: A record reader that has already been made for the
+        first file, or C{None}. It is only used when files are not read in
+        parallel (otherwise its C{close} method is called, because the first
+        file is read again by a worker).
+    @param workers: The C{int} number of worker processes to use, or C{None}
+        to read the files one after another in this process. Parallel
+        reading needs processes to be started with C{fork}. If that is not
+        available, the files are read in this process.
+    @param ordered: If C{True}, readers are yielded in the order of
+        C{filenames} regardless of the order in which the workers finish.
+        Otherwise, when files are read in parallel, each reader is yielded
+        as soon as possible (this can be used when reads are looked up by id
+        rather than being matched to records in order).
+    @return: A generator that yields record readers.
+    """
+    context = _forkContext()
+
+    if (workers is None or workers < 2 or len(filenames) < 2 or
+            context is None):
+        for index, filename in enumerate(filenames):
+            if index == 0 and firstReader is not None:
+                yield firstReader
+            else:
+                yield getReader(filename)
+        return
+
+    if firstReader is not None:
+        firstReader.close()
+
+    maxPending = 2 * workers
+    pending = deque()
+    pool = context.Pool(workers, initializer=_initReaderWorker,
+                        initargs=(getReader,))
+
+    def finished():
+        """
+        Find a pending result that can be yielded.
+
+        @return: The C{int} index in C{pending} of a finished result that can
+            be yielded now, or C{None} if there is none.
+        """
+        for index, result in enumerate(pending):
+            if result.ready():
+                return index
+            elif ordered:
+                break
+
+    try:
+        for filename in filenames:
+            pending.append(pool.apply_async(_prefetchReader, (filename,)))
+            while pending:
+                index = finished()
+                if index is None:
+                    if len(pending) > maxPending:
+                        # Wait for the oldest result.
+                        index = 0
+                    else:
+                        break
+                result = pending[index]
+                del pending[index]
+                yield result.get()
+
+        while pending:
+            index = finished() or 0
+            result = pending[index]
+            del pending[index]
+            yield result.get()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def readIdIndex(reads):
+    """
+    Make an in-memory index of reads, so they can be looked up by id (see
+    L{readAlignmentsByReadId}).
+
+    Reads are indexed by the first word of their ids, because some tools
+    (e.g., DIAMOND and bwa mem) truncate read ids at the first space in
+    their output.
+
+    @param reads: An iterable of reads.
+    @raise ValueError: If two reads have the same first word in their ids.
+    @return: A C{dict} mapping C{str} read ids to reads.
+    """
+    index = {}
+    for read in reads:
+        readId = read.id.split(None, 1)[0] if read.id else read.id
+        if readId in index:
+            raise ValueError('Read id %r occurs more than once.' % readId)
+        index[readId] = read
+    return index
+
+
+def lookupRead(readIndex, readId):
+    """
+    Look up a read by id.
+
+    @param readIndex: An object that returns a read given its id via
+        C{__getitem__}, raising C{KeyError} if the id is not known. E.g., a
+        C{dict} made by L{readIdIndex}, a L{dark.fasta.FastaMmapReads}, or a
+        L{dark.fasta.SqliteIndex}.
+    @param readId: The C{str} id of the read. If the id is not found and it
+        contains whitespace, the first word of the id is also tried.
+    @raise KeyError: If the read cannot be found.
+    @return: The read.
+    """
+    try:
+        return readIndex[readId]
+    except KeyError:
+        fields = readId.split(None, 1)
+        if len(fields) == 2:
+            return readIndex[fields[0]]
+        raise
+
+
+def readAlignmentsByReadId(readers, readIndex, reads=None):
+    """
+    Get read alignments from record readers, looking up the read for each
+    record by id, and then get empty read alignments for the reads that
+    were not found in any record.
+
+    @param readers: An iterable of record readers (e.g., from
+        L{recordReaders}), each with a C{readAlignmentsByReadId} method.
+        The readers can be given in any order.
+    @param readIndex: An object that gives reads by id (see L{lookupRead}).
+    @param reads: An iterable of all the reads, or C{None}. If not C{None},
+        once all records have been read, an empty C{ReadAlignments} is
+        yielded for each read that was not found in any record.
+    @return: A generator that yields C{ReadAlignments} instances.
+    """
+    seen = set()
+
+    for reader in readers:
+        for readAlignments in reader.readAlignmentsByReadId(readIndex):
+            seen.add(readAlignments.read.id)
+            yield readAlignments
+
+    if reads is not None:
+        for read in reads:
+            if not (read.id in seen or
+                    (read.id and read.id.split(None, 1)[0] in seen)):
+                yield ReadAlignments(read, [])
+
+
+# The function used by a worker process to make a record reader (see
+# recordReaders). It is set when the worker starts.
+_workerGetReader = None
+
+
+def _initReaderWorker(getReader):
+    """
+    Initialize a worker process that reads result files.
+
+    @param getReader: A function that takes a C{str} file name and returns a
+        record reader for it.
+    """
+    global _workerGetReader
+    _workerGetReader = getReader
+
+
+def _prefetchReader(filename):
+    """
+    Make a record reader for a result file and read all its records.
+
+    @param filename: A C{str} result file name.
+    @return: A record reader whose records have been prefetched.
+    """
+    return _workerGetReader(filename).prefetch()
+
+
 class Alignment(object):
     """
     Hold information about a read alignment.
@@ -372,6 +560,16 @@ class ReadsAlignments(object):
         raise NotImplementedError('getSubjectSequence must be implemented by '
                                   'a subclass')
 
+    def prefetchSubjectSequences(self, titles):
+        """
+        Prepare for calls to C{getSubjectSequence} for many titles.
+
+        Subclasses that look up subjects in an on-disk index can override this
+        to fetch all the subjects at once. This implementation does nothing.
+
+        @param titles: An iterable of C{str} sequence titles.
+        """
+
     def hsps(self):
         """
         Provide access to all HSPs for all alignments of all reads.
@@ -1,12 +1,17 @@
 from random import uniform
 from math import log10
+from functools import partial
 import copy
 
 from dark.score import HigherIsBetterScore
-from dark.alignments import ReadsAlignments, ReadsAlignmentsParams
-from dark.blast.conversion import JSONRecordsReader
+from dark.alignments import (
+    ReadsAlignments, ReadsAlignmentsParams, readAlignmentsByReadId,
+    recordReaders)
+from dark.alignment_store import ALIGNMENT_STORE_SUFFIX
+from dark.blast.conversion import (
+    JSONRecordsReader, AlignmentStoreRecordsReader)
 from dark.blast.params import checkCompatibleParams
-from dark.fasta import FastaReads, SqliteIndex
+from dark.fasta import FastaReads, SqliteIndex, fastaIndex
 from dark.reads import AARead, DNARead
 from dark.utils import numericallySortFilenames
 
@@ -24,10 +29,14 @@ class BlastReadsAlignments(ReadsAlignments):
         C{str} file names containing BLAST output. Files can either be XML
         (-outfmt 5) BLAST output file or our smaller (possibly bzip2
         compressed) converted JSON equivalent produced by
-        C{bin/convert-blast-xml-to-json.py} from a BLAST XML file.
+        C{bin/convert-blast-xml-to-json.py} from a BLAST XML file, or an
+        alignment store (with a name ending in C{.npz}) made from that JSON
+        by C{bin/convert-json-to-alignment-store.py}.
     @param databaseFilename: A C{str} holding the name of the FASTA file used
         to make the BLAST database. Cannot be used with
-        C{sqliteDatabaseFilename}.
+        C{sqliteDatabaseFilename}. Subjects are looked up in an index made
+        (or reused) next to this file the first time a subject is needed
+        (see L{dark.fasta.fastaIndex}).
     @param databaseDirectory: The directory where the FASTA file
         used to make the BLAST database can be found. This argument is only
         useful when sqliteDatabaseFilename is specified.
@@ -44,6 +53,27 @@ class BlastReadsAlignments(ReadsAlignments):
         by our HTCondor jobs.
     @param randomizeZeroEValues: If C{True}, e-values that are zero will be set
         to a random (very good) value.
+    @param threads: An C{int} number of threads to use for reading and
+        decompressing each result file (see L{dark.utils.openFile}).
+    @param subjectsInMemory: If C{True} (and C{databaseFilename} is given),
+        read all of C{databaseFilename} into memory the first time a subject
+        is needed, instead of using an on-disk index.
+    @param matchedSequences: If C{False}, the matched read and subject
+        sequences are not kept in HSPs. Use this to save memory and time
+        when only scores and offsets are needed (e.g., for title counts or
+        for filtering titles).
+    @param workers: If not C{None}, the C{int} number of worker processes to
+        use to read (decompress and decode) the BLAST result files in
+        parallel, when there is more than one. The records are still paired
+        with C{reads} in this process, in file order unless C{readIndex} is
+        given (see L{dark.alignments.recordReaders}).
+    @param readIndex: If not C{None}, an object that gives reads by id (e.g.,
+        a L{dark.fasta.FastaMmapReads}, or a C{dict} made by
+        L{dark.alignments.readIdIndex}). The read for each BLAST record is
+        then looked up by id, so C{reads} need not be in the order of the
+        records (and records from several files can be read in any order).
+        C{reads} is only iterated after all records have been read, to find
+        reads that had no record.
     @raises ValueError: if a file type is not recognized, if the number of
         reads does not match the number of records found in the BLAST result
         files, or if BLAST parameters in all files do not match.
@@ -52,7 +82,9 @@ class BlastReadsAlignments(ReadsAlignments):
     def __init__(self, reads, blastFilenames, databaseFilename=None,
                  databaseDirectory=None, sqliteDatabaseFilename=None,
                  scoreClass=HigherIsBetterScore,
-                 sortBlastFilenames=True, randomizeZeroEValues=True):
+                 sortBlastFilenames=True, randomizeZeroEValues=True,
+                 threads=0, subjectsInMemory=False, matchedSequences=True,
+                 workers=None, readIndex=None):
         if type(blastFilenames) == str:
             blastFilenames = [blastFilenames]
         if sortBlastFilenames:
@@ -63,7 +95,13 @@ class BlastReadsAlignments(ReadsAlignments):
         self._sqliteDatabaseFilename = sqliteDatabaseFilename
         self._databaseDirectory = databaseDirectory
         self._subjectTitleToSubject = None
+        self._prefetchedSubjects = {}
         self.randomizeZeroEValues = randomizeZeroEValues
+        self._threads = threads
+        self._subjectsInMemory = subjectsInMemory
+        self._matchedSequences = matchedSequences
+        self._workers = workers
+        self._readIndex = readIndex
 
         # Prepare application parameters in order to initialize self.
         self._reader = self._getReader(self.blastFilenames[0], scoreClass)
@@ -82,13 +120,20 @@ class BlastReadsAlignments(ReadsAlignments):
 
     def _getReader(self, filename, scoreClass):
         """
-        Obtain a JSON record reader for BLAST records.
+        Obtain a record reader for BLAST records.
 
-        @param filename: The C{str} file name holding the JSON.
+        @param filename: The C{str} file name holding the JSON or alignment
+            store (see L{dark.alignment_store}).
         @param scoreClass: A class to hold and compare scores (see scores.py).
         """
         if filename.endswith('.json') or filename.endswith('.json.bz2'):
-            return JSONRecordsReader(filename, scoreClass)
+            return JSONRecordsReader(
+                filename, scoreClass, threads=self._threads,
+                matchedSequences=self._matchedSequences)
+        elif filename.endswith(ALIGNMENT_STORE_SUFFIX):
+            return AlignmentStoreRecordsReader(
+                filename, scoreClass,
+                matchedSequences=self._matchedSequences)
         else:
             raise ValueError(
                 'Unknown BLAST record file suffix for file %r.' % filename)
@@ -100,6 +145,10 @@ class BlastReadsAlignments(ReadsAlignments):
         For each file except the first, check that the BLAST parameters are
         compatible with those found (above, in __init__) in the first file.
 
+        If a read index was given, records are read from the files in any
+        order, the read for each is looked up by id, and then an empty
+        C{ReadAlignments} is yielded for each read that had no record.
+
         @return: A generator that yields C{ReadAlignments} instances.
         """
         # Note that self._reader is already initialized (in __init__) for
@@ -107,26 +156,22 @@ class BlastReadsAlignments(ReadsAlignments):
         # makes testing easier, since open() is then only called once for
         # each input file.
 
+        readers = self._checkedReaders(recordReaders(
+            self.blastFilenames,
+            partial(self._getReader, scoreClass=self.scoreClass),
+            firstReader=self._reader, workers=self._workers,
+            ordered=self._readIndex is None))
+
+        if self._readIndex is not None:
+            for readAlignments in readAlignmentsByReadId(
+                    readers, self._readIndex, self.reads):
+                yield readAlignments
+            return
+
         count = 0
-        reader = self._reader
         reads = iter(self.reads)
-        first = True
-
-        for blastFilename in self.blastFilenames:
-            if first:
-                # No need to check params in the first file. We already read
-                # them in and stored them in __init__.
-                first = False
-            else:
-                reader = self._getReader(blastFilename, self.scoreClass)
-                differences = checkCompatibleParams(
-                    self.params.applicationParams, reader.params)
-                if differences:
-                    raise ValueError(
-                        'Incompatible BLAST parameters found. The parameters '
-                        'in %s differ from those originally found in %s. %s' %
-                        (blastFilename, self.blastFilenames[0], differences))
 
+        for reader in readers:
             for readAlignments in reader.readAlignments(reads):
                 count += 1
                 yield readAlignments
@@ -142,17 +187,41 @@ class BlastReadsAlignments(ReadsAlignments):
                 'records found (%d). First unknown read id is %r.' %
                 (count, read.id))
 
+    def _checkedReaders(self, readers):
+        """
+        Check that the BLAST parameters of record readers are compatible with
+        those found (in __init__) in the first file.
+
+        @param readers: An iterable of record readers.
+        @raise ValueError: If the parameters of a reader are not compatible.
+        @return: A generator that yields the readers.
+        """
+        for reader in readers:
+            # No need to check the params of the reader for the first file
+            # made in __init__.
+            if reader is not self._reader:
+                differences = checkCompatibleParams(
+                    self.params.applicationParams, reader.params)
+                if differences:
+                    raise ValueError(
+                        'Incompatible BLAST parameters found. The parameters '
+                        'in %s differ from those originally found in %s. %s' %
+                        (reader._filename, self.blastFilenames[0],
+                         differences))
+            yield reader
+
     def getSubjectSequence(self, title):
         """
         Obtain information about a subject sequence given its title.
 
         This information is cached in self._subjectTitleToSubject. It can
         be obtained from either a) an sqlite database (given via the
-        sqliteDatabaseFilename argument to __init__), b) the FASTA that was
-        originally given to BLAST (via the databaseFilename argument), or
-        c) from the BLAST database using blastdbcmd (which can be
-        unreliable - occasionally failing to find subjects that are in its
-        database).
+        sqliteDatabaseFilename argument to __init__), b) an index of the FASTA
+        that was originally given to BLAST (via the databaseFilename
+        argument), or all of that FASTA read into memory (if
+        subjectsInMemory is C{True}), or c) from the BLAST database using
+        blastdbcmd (which can be unreliable - occasionally failing to find
+        subjects that are in its database).
 
         @param title: A C{str} sequence title from a BLAST hit. Of the form
             'gi|63148399|gb|DQ011818.1| Description...'.
@@ -160,37 +229,78 @@ class BlastReadsAlignments(ReadsAlignments):
             BLAST database in use.
 
         """
+        if title in self._prefetchedSubjects:
+            return self._prefetchedSubjects[title]
+
+        lookup = self._subjectLookup()
+        if lookup is None:
+            # Fall back to blastdbcmd.  ncbidb has to be imported as below so
+            # ncbidb.getSequence can be patched by our test suite.
+            from dark import ncbidb
+            seq = ncbidb.getSequence(
+                title, self.params.applicationParams['database'])
+            return self._subjectReadClass()(seq.description, str(seq.seq))
+        else:
+            return lookup[title]
+
+    def prefetchSubjectSequences(self, titles):
+        """
+        Prepare for calls to C{getSubjectSequence} for many titles.
+
+        If an index is used to look up subjects, all the subjects are read at
+        once (replacing any previously prefetched subjects).
+
+        @param titles: An iterable of C{str} sequence titles.
+        @raise KeyError: If a title is not present in the index.
+        """
+        lookup = self._subjectLookup()
+        if lookup is not None and not isinstance(lookup, dict):
+            self._prefetchedSubjects = dict(
+                (read.id, read) for read in lookup.getMany(titles))
+
+    def _subjectReadClass(self):
+        """
+        Get the class of subject reads.
+
+        @return: C{AARead} or C{DNARead}, depending on the type of BLAST
+            database in use.
+        """
         if self.params.application in {'blastp', 'blastx'}:
-            readClass = AARead
+            return AARead
         else:
-            readClass = DNARead
+            return DNARead
+
+    def _subjectLookup(self):
+        """
+        Get the object used to look up subjects, making it if need be.
 
+        @return: An L{SqliteIndex}, a L{dark.fasta.FastaMmapReads}, or a
+            C{dict} mapping subject titles to reads, or C{None} if blastdbcmd
+            must be used to look up subjects.
+        """
         if self._subjectTitleToSubject is None:
             if self._databaseFilename is None:
-                if self._sqliteDatabaseFilename is None:
-                    # Fall back to blastdbcmd.  ncbidb has to be imported
-                    # as below so ncbidb.getSequence can be patched by our
-                    # test suite.
-                    from dark import ncbidb
-                    seq = ncbidb.getSequence(
-                        title, self.params.applicationParams['database'])
-                    return readClass(seq.description, str(seq.seq))
-                else:
+                if self._sqliteDatabaseFilename is not None:
                     # An Sqlite3 database is used to look up subjects.
                     self._subjectTitleToSubject = SqliteIndex(
                         self._sqliteDatabaseFilename,
                         fastaDirectory=self._databaseDirectory,
-                        readClass=readClass)
+                        readClass=self._subjectReadClass())
+            elif not self._subjectsInMemory:
+                # Look subjects up (lazily) in an index of the FASTA.
+                self._subjectTitleToSubject = fastaIndex(
+                    self._databaseFilename,
+                    readClass=self._subjectReadClass())
             else:
                 # Build an in-memory dict to look up subjects. This only
                 # works for small databases, obviously.
                 titles = {}
                 for read in FastaReads(self._databaseFilename,
-                                       readClass=readClass):
+                                       readClass=self._subjectReadClass()):
                     titles[read.id] = read
                 self._subjectTitleToSubject = titles
 
-        return self._subjectTitleToSubject[title]
+        return self._subjectTitleToSubject
 
     def adjustHspsForPlotting(self, titleAlignments):
         """
@@ -1,16 +1,18 @@
 from __future__ import print_function
 
-import six
-import bz2
+from functools import partial
 from json import dumps, loads
 from operator import itemgetter
 
 from Bio.Blast import NCBIXML
 from Bio.File import as_handle
 
-from dark.hsp import HSP, LSP
+from dark.hsp import HSP, LSP, normalizeLazily
 from dark.score import HigherIsBetterScore
-from dark.alignments import Alignment, ReadAlignments
+from dark.alignments import Alignment, ReadAlignments, lookupRead
+from dark.alignment_store import AlignmentStore
+from dark.json_records import jsonLines, jsonLoader
+from dark.utils import openFile
 from dark.blast.hsp import normalizeHSP
 
 
@@ -177,14 +179,28 @@ class JSONRecordsReader(object):
     @param scoreClass: A class to hold and compare scores (see scores.py).
         Default is C{HigherIsBetterScore}, for comparing bit scores. If you
         are using e-values, pass LowerIsBetterScore instead.
+    @param threads: An C{int} number of threads to use for reading and
+        decompressing C{filename} (see L{dark.utils.openFile}).
+    @param matchedSequences: If C{False}, the matched read and subject
+        sequences are not kept in HSPs (their C{readMatchedSequence} and
+        C{subjectMatchedSequence} attributes will be C{None}). This saves
+        memory and time when only scores and offsets are needed.
+    @param jsonBackend: The C{str} name of the JSON decoder to use (see
+        L{dark.json_records.JSON_BACKENDS}), or C{None} to use the fastest
+        one available.
     """
 
     # Note that self._fp is opened in self.__init__, accessed in
     # self._params and in self.records, and closed in self.close.
 
-    def __init__(self, filename, scoreClass=HigherIsBetterScore):
+    def __init__(self, filename, scoreClass=HigherIsBetterScore, threads=0,
+                 matchedSequences=True, jsonBackend=None):
         self._filename = filename
         self._scoreClass = scoreClass
+        self._threads = threads
+        self._matchedSequences = matchedSequences
+        self._loads = jsonLoader(jsonBackend)
+        self._prefetchedRecords = None
         if scoreClass is HigherIsBetterScore:
             self._hspClass = HSP
         else:
@@ -203,13 +219,7 @@ class JSONRecordsReader(object):
             if the input file is empty, or if the JSON does not contain an
             'application' key.
         """
-        if filename.endswith('.bz2'):
-            if six.PY3:
-                self._fp = bz2.open(filename, mode='rt', encoding='UTF-8')
-            else:
-                self._fp = bz2.BZ2File(filename)
-        else:
-            self._fp = open(filename)
+        self._fp = openFile(filename, threads=self._threads)
 
         line = self._fp.readline()
         if not line:
@@ -250,6 +260,8 @@ class JSONRecordsReader(object):
 
         alignments = []
         getScore = itemgetter('bits' if self._hspClass is HSP else 'expect')
+        matchedSequences = self._matchedSequences
+        readLength = len(read)
 
         for blastAlignment in blastDict['alignments']:
             alignment = Alignment(blastAlignment['length'],
@@ -257,20 +269,14 @@ class JSONRecordsReader(object):
             alignments.append(alignment)
             for blastHsp in blastAlignment['hsps']:
                 score = getScore(blastHsp)
-                normalized = normalizeHSP(blastHsp, len(read),
-                                          self.application)
                 hsp = self._hspClass(
                     score,
-                    readStart=normalized['readStart'],
-                    readEnd=normalized['readEnd'],
-                    readStartInSubject=normalized['readStartInSubject'],
-                    readEndInSubject=normalized['readEndInSubject'],
                     readFrame=blastHsp['frame'][0],
-                    subjectStart=normalized['subjectStart'],
-                    subjectEnd=normalized['subjectEnd'],
                     subjectFrame=blastHsp['frame'][1],
-                    readMatchedSequence=blastHsp['query'],
-                    subjectMatchedSequence=blastHsp['sbjct'],
+                    readMatchedSequence=(
+                        blastHsp['query'] if matchedSequences else None),
+                    subjectMatchedSequence=(
+                        blastHsp['sbjct'] if matchedSequences else None),
                     # Use blastHsp.get on identicalCount and positiveCount
                     # because they were added in version 2.0.3 and will not
                     # be present in any of our JSON output generated before
@@ -278,7 +284,23 @@ class JSONRecordsReader(object):
                     # but that's much better than no longer being able to
                     # read all that data.
                     identicalCount=blastHsp.get('identicalCount'),
-                    positiveCount=blastHsp.get('positiveCount'))
+                    positiveCount=blastHsp.get('positiveCount'),
+                    # Offsets are normalized only if they are looked at.
+                    # Only the values normalizeHSP needs are kept (not
+                    # blastHsp, which holds the matched sequences).
+                    normalize=partial(
+                        normalizeLazily, read.id, alignment.subjectTitle,
+                        normalizeHSP,
+                        {
+                            'frame': blastHsp['frame'],
+                            'query_start': blastHsp['query_start'],
+                            'query_end': blastHsp['query_end'],
+                            'sbjct_start': blastHsp['sbjct_start'],
+                            'sbjct_end': blastHsp['sbjct_end'],
+                        },
+                        readLength, self.application,
+                        readGaps=blastHsp['query'].count('-'),
+                        hitGaps=blastHsp['sbjct'].count('-')))
 
                 alignment.addHsp(hsp)
 
@@ -296,31 +318,175 @@ class JSONRecordsReader(object):
         @return: A generator that yields C{dark.alignments.ReadAlignments}
             instances.
         """
+        reads = iter(reads)
+
+        for recordNumber, record in enumerate(self._takeRecords(), start=1):
+            try:
+                read = next(reads)
+            except StopIteration:
+                raise ValueError(
+                    'Read generator failed to yield read number %d during '
+                    'parsing of BLAST file %r.' %
+                    (recordNumber, self._filename))
+            else:
+                alignments = self._dictToAlignments(record, read)
+                yield ReadAlignments(read, alignments)
+
+    def readAlignmentsByReadId(self, readIndex):
+        """
+        Read lines of JSON from self._filename, convert them to read alignments
+        and yield them, looking up the read for each record by its id.
+
+        Unlike C{readAlignments}, this does not need the reads to be in the
+        order of the records, and does not yield anything for reads that
+        have no record.
+
+        @param readIndex: An object that gives reads by id (see
+            L{dark.alignments.lookupRead}). Note that records hold read ids as
+            they were given by BLAST, so (e.g.) an C{SqliteIndex} of full
+            FASTA ids cannot find reads whose ids were truncated.
+        @raise ValueError: If any of the lines in the file cannot be converted
+            to JSON, or if the read for a record cannot be found.
+        @return: A generator that yields C{dark.alignments.ReadAlignments}
+            instances.
+        """
+        for recordNumber, record in enumerate(self._takeRecords(), start=1):
+            try:
+                read = lookupRead(readIndex, record['query'])
+            except KeyError:
+                raise ValueError(
+                    'Read index has no read with id %r as found in record '
+                    'number %d during parsing of BLAST output file %r.' %
+                    (record['query'], recordNumber, self._filename))
+            else:
+                alignments = self._dictToAlignments(record, read)
+                yield ReadAlignments(read, alignments)
+
+    def _takeRecords(self):
+        """
+        Get the records to convert to read alignments.
+
+        @return: An iterable of record C{dict}s. These are the records read
+            by C{prefetch}, if it has been called (they are then forgotten),
+            or else those read from the file.
+        """
+        if self._prefetchedRecords is None:
+            return self._records()
+        else:
+            records, self._prefetchedRecords = self._prefetchedRecords, None
+            return records
+
+    def prefetch(self):
+        """
+        Read all the records from the file into memory, and close the file.
+
+        The records are used by the next call to C{readAlignments}. This
+        allows the (slow) decompression and JSON decoding to be done in a
+        worker process, after which the reader can be pickled and sent back
+        to the process that pairs its records with reads.
+
+        @raise ValueError: If any of the lines in the file cannot be converted
+            to JSON.
+        @return: C{self}.
+        """
+        self._prefetchedRecords = list(self._records())
+        return self
+
+    def close(self):
+        """
+        Close the input file, if it is open. It will be opened again if
+        records are read.
+        """
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+    def _records(self):
+        """
+        Read lines of JSON from self._filename and convert them to records.
+
+        @raise ValueError: If any of the lines in the file cannot be converted
+            to JSON.
+        @return: A generator that yields record C{dict}s.
+        """
         if self._fp is None:
             self._open(self._filename)
 
-        reads = iter(reads)
+        loads = self._loads
 
         try:
-            for lineNumber, line in enumerate(self._fp, start=2):
+            for lineNumber, line in jsonLines(self._fp, firstLineNumber=2):
                 try:
-                    record = loads(line[:-1])
+                    record = loads(line)
                 except ValueError as e:
                     raise ValueError(
                         'Could not convert line %d of %r to JSON (%s). '
-                        'Line is %r.' %
-                        (lineNumber, self._filename, e, line[:-1]))
+                        'Line is %r.' % (lineNumber, self._filename, e, line))
                 else:
-                    try:
-                        read = next(reads)
-                    except StopIteration:
-                        raise ValueError(
-                            'Read generator failed to yield read number %d '
-                            'during parsing of BLAST file %r.' %
-                            (lineNumber - 1, self._filename))
-                    else:
-                        alignments = self._dictToAlignments(record, read)
-                        yield ReadAlignments(read, alignments)
+                    yield record
         finally:
             self._fp.close()
             self._fp = None
+
+
+class AlignmentStoreRecordsReader(JSONRecordsReader):
+    """
+    Provide a method that yields BLAST records from an alignment store file
+    (see L{dark.alignment_store}). Store, check, and make accessible the
+    global BLAST parameters.
+
+    @param filename: A C{str} alignment store filename containing BLAST
+        records.
+    @param scoreClass: A class to hold and compare scores (see scores.py).
+        Default is C{HigherIsBetterScore}, for comparing bit scores. If you
+        are using e-values, pass LowerIsBetterScore instead.
+    @param threads: Ignored (the alignment store is read all at once).
+    @param matchedSequences: If C{False}, the matched read and subject
+        sequences are not kept in HSPs. They are still read from the store,
+        because their gaps are needed to normalize HSP offsets.
+    @param jsonBackend: Ignored.
+    """
+    def _open(self, filename):
+        """
+        Open the alignment store.
+
+        @param filename: A C{str} alignment store filename.
+        @raise ValueError: If C{filename} is not a valid alignment store or
+            its parameters do not contain an 'application' key.
+        """
+        self._store = AlignmentStore(filename)
+        self.params = self._store.params
+        if 'application' not in self.params:
+            raise ValueError(
+                'Alignment store %r has no BLAST global parameters.' %
+                filename)
+
+    def prefetch(self):
+        """
+        Read all the records from the alignment store into memory.
+
+        The store itself is then dropped, so its columns are not pickled
+        along with the reader.
+
+        @return: C{self}.
+        """
+        JSONRecordsReader.prefetch(self)
+        self._store = None
+        return self
+
+    def close(self):
+        """
+        Drop the alignment store. It will be read again if records are read.
+        """
+        self._store = None
+
+    def _records(self):
+        """
+        Get the records in the alignment store.
+
+        @return: A generator that yields record C{dict}s.
+        """
+        if self._store is None:
+            self._open(self._filename)
+
+        return self._store.records()
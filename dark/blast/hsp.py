@@ -1,10 +1,12 @@
 def printHSP(hsp, indent=''):
     for attr in ['bits', 'expect', 'frame', 'query_end', 'query_start',
                  'sbjct', 'query', 'sbjct_end', 'sbjct_start']:
-        print('%s%s: %s' % (indent, attr, hsp[attr]))
+        if attr in hsp:
+            print('%s%s: %s' % (indent, attr, hsp[attr]))
 
 
-def normalizeHSP(hsp, readLen, blastApplication):
+def normalizeHSP(hsp, readLen, blastApplication, readGaps=None,
+                 hitGaps=None):
     """
     Examine an HSP and return information about where the query and subject
     match begins and ends.  Return a dict with keys that allow the query to
@@ -35,6 +37,10 @@ def normalizeHSP(hsp, readLen, blastApplication):
     @param readLen: the length of the read sequence.
     @param blastApplication: The C{str} command line program that was
         run (e.g., 'blastn', 'blastx').
+    @param readGaps: The C{int} number of gaps in the read (query) match, or
+        C{None} to count the '-' characters in C{hsp['query']}.
+    @param hitGaps: The C{int} number of gaps in the hit (subject) match, or
+        C{None} to count the '-' characters in C{hsp['sbjct']}.
 
     """
 
@@ -129,8 +135,10 @@ def normalizeHSP(hsp, readLen, blastApplication):
     # of the read.  This should be cleaned up. See ../diamond/hsp.py for
     # something cleaner.
 
-    hitGaps = hsp['sbjct'].count('-')
-    readGaps = hsp['query'].count('-')
+    if hitGaps is None:
+        hitGaps = hsp['sbjct'].count('-')
+    if readGaps is None:
+        readGaps = hsp['query'].count('-')
 
     # Sanity check that the length of the matches in the hit and read
     # are identical, taking into account gaps in either (indicated by '-'
@@ -1,6 +1,31 @@
+from __future__ import division
+
+import re
+
 # From https://samtools.github.io/hts-specs/SAMv1.pdf
 CINS, CDEL, CMATCH, CEQUAL, CDIFF = 'IDM=X'
 
+# A BTOP string is a sequence of match counts and (query, subject) letter
+# pairs, in which the letters of a pair differ. _BTOP_SEGMENT splits a BTOP
+# string into segments that are either a maximal run of counts and
+# mismatch pairs (all of which are CIGAR matches, in the non-concise
+# sense), or a single gap pair. findall gives a (run, letter, queryGap)
+# 3-tuple of strings for each segment, where 'run' is empty for a gap pair
+# and 'queryGap' is '-' for a gap in the query ('letter' is only used to
+# reject pairs of identical letters). Invalid parts of a string are not
+# matched, so the segments of an invalid string do not cover all of it.
+#
+# Only ASCII letters are matched. parseBtop uses str.isdigit to tell counts
+# from letters, and that accepts some non-ASCII characters (e.g., Arabic-
+# Indic digits), so strings with non-ASCII characters are left to parseBtop
+# (see _btopSegments).
+_LETTER = r'[^-0-9\u0080-\U0010ffff]'
+_BTOP_SEGMENT = re.compile(
+    r'((?:[0-9]+|(%(letter)s)(?!\2)%(letter)s)+)|(-)%(letter)s|%(letter)s-' %
+    {'letter': _LETTER})
+
+_DIGITS = re.compile('[0-9]+')
+
 
 def parseBtop(btopString):
     """
@@ -53,6 +78,103 @@ def parseBtop(btopString):
             'no corresponding subject letter' % (btopString, queryLetter))
 
 
+def _btopSegments(btopString):
+    """
+    Split a BTOP string into match runs and gap pairs.
+
+    @param btopString: A C{str} BTOP sequence.
+    @raise ValueError: If C{btopString} is not valid BTOP.
+    @return: A C{list} of (run, letter, queryGap) 3-tuples of C{str}s, as
+        described above for C{_BTOP_SEGMENT}.
+    """
+    segments = _BTOP_SEGMENT.findall(btopString)
+
+    covered = 0
+    for run, _, _ in segments:
+        covered += len(run) or 2
+
+    if covered != len(btopString):
+        # The string is either invalid (in which case parseBtop will raise
+        # a ValueError) or has non-ASCII characters. Make a segment for
+        # each item given by parseBtop.
+        segments = []
+        append = segments.append
+        for item in parseBtop(btopString):
+            if isinstance(item, int):
+                append((str(item), '', ''))
+            else:
+                query, subject = item
+                if query == '-':
+                    append(('', '', '-'))
+                elif subject == '-':
+                    append(('', '', ''))
+                else:
+                    append((query + subject, '', ''))
+
+    return segments
+
+
+def _runCounts(run):
+    """
+    Count the matches and mismatches in a BTOP match run.
+
+    @param run: A C{str} run of counts (in ASCII digits) and mismatch pairs
+        from a valid BTOP string.
+    @return: A 2-tuple of C{int}s, the number of (matches, mismatches).
+    """
+    digits = _DIGITS.findall(run)
+    # Each mismatch pair has two letters, and everything else is a digit.
+    return sum(map(int, digits)), (len(run) - len(''.join(digits))) // 2
+
+
+def btopRuns(btopString):
+    """
+    Get the run lengths of the (non-concise) CIGAR operations in a BTOP
+    string.
+
+    Runs of counts and mismatches are found with a regular expression, so
+    this is much faster than examining the items given by L{parseBtop}.
+
+    @param btopString: A C{str} BTOP sequence.
+    @raise ValueError: If L{parseBtop} finds an error in the BTOP string
+        C{btopString}.
+    @return: A C{list} of (length, operation) 2-tuples, where the C{int}
+        length is a number of positions and the operation is C{CMATCH} (for
+        identical or mismatched positions), C{CINS} (for gaps in the
+        subject), or C{CDEL} (for gaps in the query). Adjacent runs have
+        different operations.
+    """
+    result = []
+    append = result.append
+    currentLength = currentOperation = None
+
+    for run, _, queryGap in _btopSegments(btopString):
+        if run:
+            matches, mismatches = _runCounts(run)
+            thisLength, thisOperation = matches + mismatches, CMATCH
+        elif queryGap:
+            # The query has a gap. That means that in matching the query
+            # to the reference a deletion is needed in the reference.
+            thisLength, thisOperation = 1, CDEL
+        else:
+            # The reference has a gap. That means that in matching the
+            # query to the reference an insertion is needed in the
+            # reference.
+            thisLength, thisOperation = 1, CINS
+
+        if thisOperation == currentOperation:
+            currentLength += thisLength
+        else:
+            if currentOperation:
+                append((currentLength, currentOperation))
+            currentLength, currentOperation = thisLength, thisOperation
+
+    if currentOperation:
+        append((currentLength, currentOperation))
+
+    return result
+
+
 def countGaps(btopString):
     """
     Count the query and subject gaps in a BTOP string.
@@ -64,15 +186,74 @@ def countGaps(btopString):
         found in C{btopString}.
     """
     queryGaps = subjectGaps = 0
-    for countOrMismatch in parseBtop(btopString):
-        if isinstance(countOrMismatch, tuple):
-            queryChar, subjectChar = countOrMismatch
-            queryGaps += int(queryChar == '-')
-            subjectGaps += int(subjectChar == '-')
+    for run, _, queryGap in _btopSegments(btopString):
+        if not run:
+            if queryGap:
+                queryGaps += 1
+            else:
+                subjectGaps += 1
 
     return (queryGaps, subjectGaps)
 
 
+def btopStats(btopString):
+    """
+    Compute identity and gap statistics for a BTOP string, in one pass.
+
+    @param btopString: A C{str} BTOP sequence.
+    @raise ValueError: If L{parseBtop} finds an error in the BTOP string
+        C{btopString}.
+    @return: A C{dict} with the following keys:
+            identicalCount: The C{int} number of identical positions.
+            mismatchCount: The C{int} number of mismatched (non-gap)
+                positions.
+            queryGaps: The C{int} number of gaps in the query.
+            subjectGaps: The C{int} number of gaps in the subject.
+            queryGapOpens: The C{int} number of runs of gaps in the query.
+            subjectGapOpens: The C{int} number of runs of gaps in the
+                subject.
+            length: The C{int} length of the alignment (i.e., the sum of the
+                identical, mismatch, and gap counts).
+            identity: The C{float} fraction of the alignment length that is
+                identical (or 0.0 if the alignment is empty).
+    """
+    identicalCount = mismatchCount = queryGaps = subjectGaps = 0
+    queryGapOpens = subjectGapOpens = 0
+    # The kind of the previous segment: 'q' for a query gap, 's' for a
+    # subject gap, or None for a match run.
+    previous = None
+
+    for run, _, queryGap in _btopSegments(btopString):
+        if run:
+            matches, mismatches = _runCounts(run)
+            identicalCount += matches
+            mismatchCount += mismatches
+            previous = None
+        elif queryGap:
+            queryGaps += 1
+            if previous != 'q':
+                queryGapOpens += 1
+                previous = 'q'
+        else:
+            subjectGaps += 1
+            if previous != 's':
+                subjectGapOpens += 1
+                previous = 's'
+
+    length = identicalCount + mismatchCount + queryGaps + subjectGaps
+
+    return {
+        'identicalCount': identicalCount,
+        'mismatchCount': mismatchCount,
+        'queryGaps': queryGaps,
+        'subjectGaps': subjectGaps,
+        'queryGapOpens': queryGapOpens,
+        'subjectGapOpens': subjectGapOpens,
+        'length': length,
+        'identity': identicalCount / length if length else 0.0,
+    }
+
+
 def btop2cigar(btopString, concise=False, aa=False):
     """
     Convert a BTOP string to a CIGAR string.
@@ -94,13 +275,26 @@ def btop2cigar(btopString, concise=False, aa=False):
     if aa and concise:
         raise ValueError('aa and concise cannot both be True')
 
+    multiplier = 3 if aa else 1
+
+    if btopString.isdigit():
+        # All matches, which is common enough to be worth checking for.
+        return '%d%s' % (multiplier * int(btopString),
+                         CEQUAL if concise else CMATCH)
+
+    if not concise:
+        # Matches and mismatches are both CMATCH, so the runs can be found
+        # without looking at each count and letter pair.
+        return ''.join('%d%s' % (multiplier * length, operation)
+                       for length, operation in btopRuns(btopString))
+
     result = []
     thisLength = thisOperation = currentLength = currentOperation = None
 
     for item in parseBtop(btopString):
         if isinstance(item, int):
             thisLength = item
-            thisOperation = CEQUAL if concise else CMATCH
+            thisOperation = CEQUAL
         else:
             thisLength = 1
             query, reference = item
@@ -118,16 +312,13 @@ def btop2cigar(btopString, concise=False, aa=False):
             else:
                 # A substitution was needed.
                 assert query != reference
-                thisOperation = CDIFF if concise else CMATCH
+                thisOperation = CDIFF
 
         if thisOperation == currentOperation:
             currentLength += thisLength
         else:
             if currentOperation:
-                result.append(
-                    '%d%s' %
-                    ((3 * currentLength) if aa else currentLength,
-                     currentOperation))
+                result.append('%d%s' % (currentLength, currentOperation))
             currentLength, currentOperation = thisLength, thisOperation
 
     # We reached the end of the BTOP string. If there was an operation
@@ -135,8 +326,6 @@ def btop2cigar(btopString, concise=False, aa=False):
     # case where btopString was empty.
     assert currentOperation or btopString == ''
     if currentOperation:
-        result.append(
-            '%d%s' %
-            ((3 * currentLength) if aa else currentLength, currentOperation))
+        result.append('%d%s' % (currentLength, currentOperation))
 
     return ''.join(result)
@@ -0,0 +1,236 @@
+from hashlib import md5
+from math import ceil, log
+import sqlite3
+import struct
+
+from Bio.Data.IUPACData import ambiguous_dna_complement
+
+
+def _makeComplementTable():
+    """
+    Make a DNA complement table that handles upper and lower case bases.
+
+    @return: A 256 character string that can be used as a translation table
+        by the C{translate} method of a Python string.
+    """
+    table = list(map(chr, range(256)))
+    for base, complement in ambiguous_dna_complement.items():
+        table[ord(base)] = complement
+        table[ord(base.lower())] = complement.lower()
+    return ''.join(table)
+
+
+_COMPLEMENT_TABLE = _makeComplementTable()
+
+# The default number of distinct strings a DuplicateTracker that uses a
+# database expects to see (this sets the size of its Bloom filter).
+DEFAULT_EXPECTED_COUNT = 10000000
+
+
+class BloomFilter(object):
+    """
+    A Bloom filter (a probabilistic set) of MD5 digests.
+
+    Membership tests can give false positives (at approximately the rate
+    given by C{falsePositiveRate} if no more than C{expectedCount} digests
+    are added) but never false negatives.
+
+    @param expectedCount: The C{int} number of digests expected to be added.
+    @param falsePositiveRate: The C{float} desired false positive rate.
+    """
+    def __init__(self, expectedCount, falsePositiveRate=0.01):
+        expectedCount = max(1, expectedCount)
+        self._size = max(64, int(ceil(
+            -expectedCount * log(falsePositiveRate) / (log(2) ** 2))))
+        self._hashCount = max(1, int(round(
+            self._size / expectedCount * log(2))))
+        self._bits = bytearray((self._size + 7) // 8)
+
+    def _positions(self, digest):
+        """
+        Get the bit positions for a digest, using double hashing.
+
+        @param digest: A 16-byte MD5 digest.
+        @return: A generator that yields C{int} bit positions.
+        """
+        h1, h2 = struct.unpack('<QQ', digest)
+        size = self._size
+        for i in range(self._hashCount):
+            yield (h1 + i * h2) % size
+
+    def add(self, digest):
+        """
+        Add a digest.
+
+        @param digest: A 16-byte MD5 digest.
+        """
+        bits = self._bits
+        for position in self._positions(digest):
+            bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, digest):
+        bits = self._bits
+        for position in self._positions(digest):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+
+class DuplicateTracker(object):
+    """
+    Keep track of strings (e.g., read sequences or ids) that have been seen,
+    in order to detect duplicates.
+
+    By default, seen strings are kept in a C{set}, so memory use grows with
+    the total length of all distinct strings. If C{useMD5} is C{True}, only
+    a fixed-size (16-byte) MD5 digest of each string is kept. If a
+    C{databaseFilename} is given, digests are instead written to an SQLite
+    database on disk and an in-memory Bloom filter is used so that the
+    database only needs to be consulted (to confirm the string really was
+    seen) for possible duplicates. The database connection is closed by
+    C{close}, which also writes any digests that are still in memory. If
+    the tracker is used again after that, the database is reopened.
+
+    @param useMD5: If C{True}, keep MD5 digests of strings instead of the
+        strings themselves.
+    @param ignoreCase: If C{True}, strings that differ only in case are
+        considered duplicates.
+    @param reverseComplement: If C{True}, strings (which must be DNA
+        sequences) are considered duplicates of their reverse complements.
+    @param databaseFilename: If not C{None}, the C{str} name of an SQLite
+        database file in which to keep digests. Any existing table of seen
+        digests in the file is removed. Implies C{useMD5}.
+    @param expectedCount: The C{int} number of distinct strings expected.
+        Only used (to size the Bloom filter) if C{databaseFilename} is given.
+    @param batchSize: The C{int} number of new digests to keep in memory
+        before writing them to the database.
+    @param tableName: The C{str} name of the database table to use. This
+        allows more than one C{DuplicateTracker} to use the same database.
+    """
+    def __init__(self, useMD5=False, ignoreCase=False, reverseComplement=False,
+                 databaseFilename=None, expectedCount=DEFAULT_EXPECTED_COUNT,
+                 batchSize=10000, tableName='seen'):
+        self._useMD5 = useMD5 or databaseFilename is not None
+        self._ignoreCase = ignoreCase
+        self._reverseComplement = reverseComplement
+        self._seen = set()
+        self._databaseFilename = databaseFilename
+
+        if databaseFilename is None:
+            self._connection = self._bloomFilter = None
+        else:
+            self._connection = sqlite3.connect(databaseFilename)
+            self._connection.executescript('''
+                DROP TABLE IF EXISTS %(table)s;
+                CREATE TABLE %(table)s (digest BLOB PRIMARY KEY) WITHOUT ROWID;
+            ''' % {'table': tableName})
+            self._tableName = tableName
+            self._bloomFilter = BloomFilter(expectedCount)
+            self._batchSize = batchSize
+
+    def key(self, string):
+        """
+        Get the key under which a string is recorded.
+
+        @param string: A C{str}.
+        @return: The C{str} (possibly case-converted or reverse complemented)
+            or C{bytes} (MD5 digest) key for C{string}.
+        """
+        if self._ignoreCase:
+            string = string.upper()
+        if self._reverseComplement:
+            string = min(string, string.translate(_COMPLEMENT_TABLE)[::-1])
+        if self._useMD5:
+            return md5(string.encode('UTF-8')).digest()
+        else:
+            return string
+
+    def seen(self, string):
+        """
+        Check if a string has been seen before, and record it if not.
+
+        @param string: A C{str}.
+        @return: C{True} if C{string} (or its equivalent, see C{ignoreCase}
+            and C{reverseComplement}) was seen before, else C{False}.
+        """
+        key = self.key(string)
+
+        if key in self._seen:
+            return True
+
+        if self._databaseFilename is None:
+            self._seen.add(key)
+            return False
+
+        if self._inDatabase(key):
+            return True
+
+        self._bloomFilter.add(key)
+        self._seen.add(key)
+        if len(self._seen) >= self._batchSize:
+            self._flush()
+        return False
+
+    def __contains__(self, string):
+        """
+        Check if a string has been seen before, without recording it.
+
+        @param string: A C{str}.
+        @return: C{True} if C{string} (or its equivalent, see C{ignoreCase}
+            and C{reverseComplement}) was seen before, else C{False}.
+        """
+        key = self.key(string)
+        return key in self._seen or (self._databaseFilename is not None and
+                                     self._inDatabase(key))
+
+    def _connect(self):
+        """
+        Get the database connection, reopening the database if C{close}
+        has been called.
+
+        @return: An C{sqlite3} connection.
+        """
+        if self._connection is None:
+            self._connection = sqlite3.connect(self._databaseFilename)
+        return self._connection
+
+    def _inDatabase(self, key):
+        """
+        Check if a (disk-backed) digest that is not in the current batch is
+        in the database. The database is only consulted if the Bloom filter
+        says the digest might be there.
+
+        @param key: A C{bytes} MD5 digest.
+        @return: C{True} if C{key} is in the database, else C{False}.
+        """
+        return key in self._bloomFilter and self._connect().execute(
+            'SELECT 1 FROM %s WHERE digest = ?' % self._tableName,
+            (key,)).fetchone() is not None
+
+    def _flush(self):
+        """
+        Write the current batch of digests to the database.
+        """
+        connection = self._connect()
+        connection.executemany(
+            'INSERT INTO %s (digest) VALUES (?)' % self._tableName,
+            ((key,) for key in self._seen))
+        connection.commit()
+        self._seen = set()
+
+    def close(self):
+        """
+        Write any digests still in memory to the database (if any) and close
+        it.
+        """
+        if self._connection is not None:
+            self._flush()
+            self._connection.close()
+            self._connection = None
+
+    def __len__(self):
+        if self._databaseFilename is None:
+            return len(self._seen)
+        else:
+            return len(self._seen) + self._connect().execute(
+                'SELECT COUNT(*) FROM %s' % self._tableName).fetchone()[0]
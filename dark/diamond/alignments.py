@@ -1,11 +1,15 @@
 from random import uniform
 from math import log10
+from functools import partial
 import copy
 
 from dark.alignments import (
-    ReadsAlignments, ReadAlignments, ReadsAlignmentsParams)
-from dark.diamond.conversion import JSONRecordsReader
-from dark.fasta import FastaReads, SqliteIndex
+    ReadsAlignments, ReadAlignments, ReadsAlignmentsParams,
+    readAlignmentsByReadId, recordReaders)
+from dark.alignment_store import ALIGNMENT_STORE_SUFFIX
+from dark.diamond.conversion import (
+    JSONRecordsReader, AlignmentStoreRecordsReader)
+from dark.fasta import FastaReads, SqliteIndex, fastaIndex
 from dark.reads import AAReadWithX
 from dark.score import HigherIsBetterScore
 from dark.utils import numericallySortFilenames
@@ -23,10 +27,14 @@ class DiamondReadsAlignments(ReadsAlignments):
     @param filenames: Either a single C{str} filename or a C{list} of C{str}
         file names containing our (possibly bzip2 compressed) per-line JSON
         produced by C{bin/convert-diamond-to-json.py} from DIAMOND tabular
-        (outfmt 6) output.
+        (outfmt 6) output, or alignment stores (with names ending in
+        C{.npz}) made from that JSON by
+        C{bin/convert-json-to-alignment-store.py}.
     @param databaseFilename: A C{str} holding the name of the FASTA file used
         to make the DIAMOND database. Cannot be used with
-        C{sqliteDatabaseFilename}.
+        C{sqliteDatabaseFilename}. Subjects are looked up in an index made
+        (or reused) next to this file the first time a subject is needed
+        (see L{dark.fasta.fastaIndex}).
     @param databaseDirectory: The directory where the FASTA file
         used to make the DIAMOND database can be found. This argument is only
         useful when sqliteDatabaseFilename is specified.
@@ -43,6 +51,27 @@ class DiamondReadsAlignments(ReadsAlignments):
         by our HTCondor jobs.
     @param randomizeZeroEValues: If C{True}, e-values that are zero will be set
         to a random (very good) value.
+    @param threads: An C{int} number of threads to use for reading and
+        decompressing each result file (see L{dark.utils.openFile}).
+    @param subjectsInMemory: If C{True} (and C{databaseFilename} is given),
+        read all of C{databaseFilename} into memory the first time a subject
+        is needed, instead of using an on-disk index.
+    @param matchedSequences: If C{False}, the matched read and subject
+        sequences are not kept in HSPs. Use this to save memory and time
+        when only scores and offsets are needed (e.g., for title counts or
+        for filtering titles).
+    @param workers: If not C{None}, the C{int} number of worker processes to
+        use to read (decompress and decode) the DIAMOND result files in
+        parallel, when there is more than one. The records are still paired
+        with C{reads} in this process, in file order unless C{readIndex} is
+        given (see L{dark.alignments.recordReaders}).
+    @param readIndex: If not C{None}, an object that gives reads by id (e.g.,
+        a L{dark.fasta.FastaMmapReads}, or a C{dict} made by
+        L{dark.alignments.readIdIndex}). The read for each DIAMOND record is
+        then looked up by id, so C{reads} need not be in the order of the
+        records (and records from several files can be read in any order).
+        C{reads} is only iterated after all records have been read, to find
+        reads that had no record.
     @raises ValueError: if a file type is not recognized, or if the number of
         reads does not match the number of records found in the DIAMOND result
         files, or if neither (or both) of databaseFilename and
@@ -52,7 +81,9 @@ class DiamondReadsAlignments(ReadsAlignments):
     def __init__(self, reads, filenames, databaseFilename=None,
                  databaseDirectory=None, sqliteDatabaseFilename=None,
                  scoreClass=HigherIsBetterScore, sortFilenames=False,
-                 randomizeZeroEValues=True):
+                 randomizeZeroEValues=True, threads=0,
+                 subjectsInMemory=False, matchedSequences=True,
+                 workers=None, readIndex=None):
         if type(filenames) == str:
             filenames = [filenames]
         if sortFilenames:
@@ -64,7 +95,13 @@ class DiamondReadsAlignments(ReadsAlignments):
         self._sqliteDatabaseFilename = sqliteDatabaseFilename
         self._databaseDirectory = databaseDirectory
         self._subjectTitleToSubject = None
+        self._prefetchedSubjects = {}
         self.randomizeZeroEValues = randomizeZeroEValues
+        self._threads = threads
+        self._subjectsInMemory = subjectsInMemory
+        self._matchedSequences = matchedSequences
+        self._workers = workers
+        self._readIndex = readIndex
 
         # Prepare diamondTask parameters in order to initialize self.
         self._reader = self._getReader(self.filenames[0], scoreClass)
@@ -83,13 +120,20 @@ class DiamondReadsAlignments(ReadsAlignments):
 
     def _getReader(self, filename, scoreClass):
         """
-        Obtain a JSON record reader for DIAMOND records.
+        Obtain a record reader for DIAMOND records.
 
-        @param filename: The C{str} file name holding the JSON.
+        @param filename: The C{str} file name holding the JSON or alignment
+            store (see L{dark.alignment_store}).
         @param scoreClass: A class to hold and compare scores (see scores.py).
         """
         if filename.endswith('.json') or filename.endswith('.json.bz2'):
-            return JSONRecordsReader(filename, scoreClass)
+            return JSONRecordsReader(
+                filename, scoreClass, threads=self._threads,
+                matchedSequences=self._matchedSequences)
+        elif filename.endswith(ALIGNMENT_STORE_SUFFIX):
+            return AlignmentStoreRecordsReader(
+                filename, scoreClass,
+                matchedSequences=self._matchedSequences)
         else:
             raise ValueError(
                 'Unknown DIAMOND record file suffix for file %r.' % filename)
@@ -98,6 +142,10 @@ class DiamondReadsAlignments(ReadsAlignments):
         """
         Extract DIAMOND records and yield C{ReadAlignments} instances.
 
+        If a read index was given, records are read from the files in any
+        order, the read for each is looked up by id, and then an empty
+        C{ReadAlignments} is yielded for each read that had no record.
+
         @return: A generator that yields C{ReadAlignments} instances.
         """
         # Note that self._reader is already initialized (in __init__) for
@@ -105,17 +153,21 @@ class DiamondReadsAlignments(ReadsAlignments):
         # makes testing easier, since open() is then only called once for
         # each input file.
 
-        reads = iter(self.reads)
-        first = True
+        readers = recordReaders(
+            self.filenames,
+            partial(self._getReader, scoreClass=self.scoreClass),
+            firstReader=self._reader, workers=self._workers,
+            ordered=self._readIndex is None)
 
-        for filename in self.filenames:
-            if first:
-                # The first file has already been opened, in __init__.
-                first = False
-                reader = self._reader
-            else:
-                reader = self._getReader(filename, self.scoreClass)
+        if self._readIndex is not None:
+            for readAlignments in readAlignmentsByReadId(
+                    readers, self._readIndex, self.reads):
+                yield readAlignments
+            return
 
+        reads = iter(self.reads)
+
+        for reader in readers:
             for readAlignments in reader.readAlignments(reads):
                 yield readAlignments
 
@@ -132,6 +184,33 @@ class DiamondReadsAlignments(ReadsAlignments):
             database.
         @return: An C{AAReadWithX} instance.
         """
+        if title in self._prefetchedSubjects:
+            return self._prefetchedSubjects[title]
+
+        return self._subjectLookup()[title]
+
+    def prefetchSubjectSequences(self, titles):
+        """
+        Prepare for calls to C{getSubjectSequence} for many titles.
+
+        If an index is used to look up subjects, all the subjects are read at
+        once (replacing any previously prefetched subjects).
+
+        @param titles: An iterable of C{str} sequence titles.
+        @raise KeyError: If a title is not present in the DIAMOND database.
+        """
+        lookup = self._subjectLookup()
+        if not isinstance(lookup, dict):
+            self._prefetchedSubjects = dict(
+                (read.id, read) for read in lookup.getMany(titles))
+
+    def _subjectLookup(self):
+        """
+        Get the object used to look up subjects, making it if need be.
+
+        @return: An L{SqliteIndex}, a L{dark.fasta.FastaMmapReads}, or a
+            C{dict} mapping subject titles to C{AAReadWithX} instances.
+        """
         if self._subjectTitleToSubject is None:
             if self._databaseFilename is None:
                 # An Sqlite3 database is used to look up subjects.
@@ -139,6 +218,10 @@ class DiamondReadsAlignments(ReadsAlignments):
                     self._sqliteDatabaseFilename,
                     fastaDirectory=self._databaseDirectory,
                     readClass=AAReadWithX)
+            elif not self._subjectsInMemory:
+                # Look subjects up (lazily) in an index of the FASTA.
+                self._subjectTitleToSubject = fastaIndex(
+                    self._databaseFilename, readClass=AAReadWithX)
             else:
                 # Build a dict to look up subjects.
                 titles = {}
@@ -147,7 +230,7 @@ class DiamondReadsAlignments(ReadsAlignments):
                     titles[read.id] = read
                 self._subjectTitleToSubject = titles
 
-        return self._subjectTitleToSubject[title]
+        return self._subjectTitleToSubject
 
     def adjustHspsForPlotting(self, titleAlignments):
         """
@@ -1,16 +1,21 @@
 from __future__ import print_function
 
 import six
-import bz2
+from functools import partial
 from json import dumps, loads
 from operator import itemgetter
-from collections import Counter
+from collections import Counter, deque
 
 from Bio.File import as_handle
 
-from dark.hsp import HSP, LSP
+from dark.hsp import HSP, LSP, normalizeLazily
 from dark.score import HigherIsBetterScore
-from dark.alignments import Alignment, ReadAlignments
+from dark.alignments import Alignment, ReadAlignments, lookupRead
+from dark.btop import btop2cigar
+from dark.alignment_store import AlignmentStore
+from dark.json_records import jsonLines, jsonLoader
+from dark.reads import DNARead, _forkContext
+from dark.utils import lineAlignedBlocks, openFile
 from dark.diamond.hsp import normalizeHSP
 
 # The following are the fields (in the order they are expected on the
@@ -20,6 +25,10 @@ from dark.diamond.hsp import normalizeHSP
 FIELDS = ('bitscore btop qframe qend qqual qlen qseq qseqid qstart slen '
           'sstart stitle')
 
+# The number of characters to ask for in each read() when reading DIAMOND
+# tabular output.
+DIAMOND_TABULAR_BLOCK_SIZE = 1 << 20
+
 # The keys in the following are DIAMOND format 6 field names. The values
 # are one-argument functions that take a string and return an appropriately
 # converted field value.
@@ -52,7 +61,83 @@ DIAMOND_FIELD_CONVERTER = {
 }
 
 
-def diamondTabularFormatToDicts(filename, fieldNames=None):
+def _tabularLineBlocks(fp, blockSize=DIAMOND_TABULAR_BLOCK_SIZE):
+    """
+    Read DIAMOND tabular output a large block at a time.
+
+    @param fp: An open file handle, reading C{str}.
+    @param blockSize: The C{int} number of characters to read at a time.
+    @return: A generator that yields non-empty C{list}s of C{str} lines
+        (without their trailing newlines).
+    """
+    for block in lineAlignedBlocks(fp, blockSize):
+        lines = block.split('\n')
+        if lines[-1] == '':
+            lines.pop()
+        if lines:
+            yield lines
+
+
+def _checkFieldNames(fieldNames):
+    """
+    Check DIAMOND field names and find the converters for their values.
+
+    @param fieldNames: A C{list} or C{tuple} of C{str} DIAMOND field names,
+        or C{None} to use the default (C{FIELDS}).
+    @raise ValueError: If C{fieldNames} is empty or contains duplicates.
+    @return: A 2-tuple with the C{list} or C{tuple} of field names and a
+        C{list} of (fieldName, converter) 2-tuples for the fields whose values
+        must be converted (fields with no converter are left as strings).
+    """
+    fieldNames = fieldNames or FIELDS.split()
+    if not fieldNames:
+        raise ValueError('fieldNames cannot be empty.')
+
+    c = Counter(fieldNames)
+    if c.most_common(1)[0][1] > 1:
+        raise ValueError(
+            'fieldNames contains duplicated names: %s.' %
+            (', '.join(sorted(x[0] for x in c.most_common() if x[1] > 1))))
+
+    return fieldNames, [(fieldName, DIAMOND_FIELD_CONVERTER[fieldName])
+                        for fieldName in fieldNames
+                        if fieldName in DIAMOND_FIELD_CONVERTER]
+
+
+def _linesToDicts(lines, fieldNames, converters, firstLineNumber,
+                  inputName):
+    """
+    Convert DIAMOND tabular output lines to dictionaries.
+
+    @param lines: An iterable of C{str} lines (without trailing newlines).
+    @param fieldNames: A C{list} or C{tuple} of C{str} DIAMOND field names.
+    @param converters: A C{list} of (fieldName, converter) 2-tuples, as
+        returned by C{_checkFieldNames}.
+    @param firstLineNumber: The C{int} number of the first line in C{lines}.
+    @param inputName: The C{str} name of the input, for error messages.
+    @raise ValueError: If a line does not have the expected number of
+        TAB-separated fields (i.e., len(fieldNames)).
+    @return: A generator that yields C{dict}s with keys that are the DIAMOND
+        field names and values as converted by C{converters}.
+    """
+    nFields = len(fieldNames)
+    for count, line in enumerate(lines, start=firstLineNumber):
+        values = line.split('\t')
+        if len(values) != nFields:
+            raise ValueError(
+                'Line %d of %s had %d field values (expected %d). '
+                'To provide input for this function, DIAMOND must be '
+                'called with "--outfmt 6 %s" (without the quotes). '
+                'The offending input line was %r.' %
+                (count, inputName, len(values), nFields, FIELDS, line))
+        result = dict(zip(fieldNames, values))
+        for fieldName, convert in converters:
+            result[fieldName] = convert(result[fieldName])
+        yield result
+
+
+def diamondTabularFormatToDicts(filename, fieldNames=None,
+                                blockSize=DIAMOND_TABULAR_BLOCK_SIZE):
     """
     Read DIAMOND tabular (--outfmt 6) output and convert lines to dictionaries.
 
@@ -60,47 +145,212 @@ def diamondTabularFormatToDicts(filename, fieldNames=None):
     @param fieldNames: A C{list} or C{tuple} of C{str} DIAMOND field names.
         Run 'diamond -help' to see the full list. If C{None}, a default set of
         fields will be used, as compatible with convert-diamond-to-sam.py
+    @param blockSize: The C{int} number of characters to read at a time.
     @raise ValueError: If a line of C{filename} does not have the expected
         number of TAB-separated fields (i.e., len(fieldNames)). Or if
         C{fieldNames} is empty or contains duplicates.
     @return: A generator that yields C{dict}s with keys that are the DIAMOND
         field names and values as converted by DIAMOND_FIELD_CONVERTER.
     """
-    fieldNames = fieldNames or FIELDS.split()
-    nFields = len(fieldNames)
-    if not nFields:
-        raise ValueError('fieldNames cannot be empty.')
+    # Look up the converters once, rather than for every field of every
+    # line.
+    fieldNames, converters = _checkFieldNames(fieldNames)
+    inputName = (filename if isinstance(filename, six.string_types)
+                 else 'input')
+
+    lineNumber = 1
+    with as_handle(filename) as fp:
+        for lines in _tabularLineBlocks(fp, blockSize):
+            for result in _linesToDicts(lines, fieldNames, converters,
+                                        lineNumber, inputName):
+                yield result
+            lineNumber += len(lines)
 
-    c = Counter(fieldNames)
-    if c.most_common(1)[0][1] > 1:
-        raise ValueError(
-            'fieldNames contains duplicated names: %s.' %
-            (', '.join(sorted(x[0] for x in c.most_common() if x[1] > 1))))
 
-    def identity(x):
-        return x
+def diamondDictToSAM(match, idOnly=True, mappingQuality=255):
+    """
+    Make a SAM alignment line from a DIAMOND match.
+
+    See https://samtools.github.io/hts-specs/SAMv1.pdf for the SAM file
+    format specification.
+
+    @param match: A C{dict} with the fields in C{FIELDS}, as made by
+        C{diamondTabularFormatToDicts}.
+    @param idOnly: If C{True}, discard text after the first space in query
+        and subject sequence ids.
+    @param mappingQuality: The C{int} mapping quality to use for MAPQ (field
+        5). The default (255) indicates that mapping quality information is
+        not available.
+    @return: A 3-tuple with the C{str} reference (subject) name, the C{int}
+        reference length (in nucleotides), and the C{str} SAM line (without a
+        trailing newline).
+    """
+    qseqid = match['qseqid'].split()[0] if idOnly else match['qseqid']
+    stitle = match['stitle'].split()[0] if idOnly else match['stitle']
+
+    # If the query frame is less than zero, the match was with a reverse
+    # complemented translation of the query. Put the reverse compliment
+    # into the SAM output, which seems to be standard / accepted practice
+    # based on my web searches. See e.g., https://www.biostars.org/p/131891/
+    # for what Bowtie2 does and for some comments on this issue for SAM/BAM
+    # files in general.
+    if match['qframe'] > 0:
+        flag = 0
+        qseq = match['qseq']
+        qqual = match['qqual'] or '*'
+    else:
+        flag = 16
+        qseq = DNARead('id', match['qseq']).reverseComplement().sequence
+        qqual = match['qqual'][::-1] if match['qqual'] else '*'
+
+    # Make a CIGAR string, including hard-clipped bases at the start and
+    # end of the query (DIAMOND outputs a hard-clipped query sequence).
+    startClipCount = match['qstart'] - 1
+    endClipCount = match['qlen'] - match['qend']
+
+    assert startClipCount >= 0
+    assert endClipCount >= 0, (
+        'Query sequence %s has length %d but the qend value is %d' %
+        (qseq, len(match['qseq']), match['qend']))
+
+    cigar = (
+        ('%dH' % startClipCount if startClipCount else '') +
+        btop2cigar(match['btop'], concise=False, aa=True) +
+        ('%dH' % endClipCount if endClipCount else ''))
+
+    # The subject length is ALWAYS in amino acids in DIAMOND.
+    return stitle, 3 * match['slen'], '\t'.join(map(str, [
+        # 1. QNAME
+        qseqid,
+        # 2. FLAG
+        flag,
+        # 3. RNAME
+        stitle,
+        # 4. POS. This needs to be a 1-based offset into the
+        # nucleotide-equivalent of the DIAMOND subject sequence (which was
+        # a protein since that is how DIAMOND operates). Because DIAMOND
+        # gives back a 1-based protein location, we adjust to 0-based,
+        # multiply by 3 to get to nucleotides, then adjust to 1-based.
+        3 * (match['sstart'] - 1) + 1,
+        # 5. MAPQ
+        mappingQuality,
+        # 6. CIGAR
+        cigar,
+        # 7. RNEXT
+        '*',
+        # 8. PNEXT
+        0,
+        # 9. TLEN
+        0,
+        # 10. SEQ
+        qseq,
+        # 11. QUAL
+        qqual,
+        # 12. Alignment score
+        'AS:i:%d' % int(match['bitscore'])]))
+
+
+def _samBlock(block, firstLineNumber, inputName, idOnly, mappingQuality):
+    """
+    Convert a block of DIAMOND tabular output lines to SAM.
+
+    This is run in worker processes by C{diamondTabularFormatToSAM}, so it
+    is given (and returns) a single C{str} rather than many small strings,
+    to keep pickling cheap.
+
+    @param block: A C{str} of DIAMOND tabular output lines (with the fields
+        in C{FIELDS}), ending in a newline (unless it is the end of the
+        input).
+    @param firstLineNumber: The C{int} number of the first line in C{block}.
+    @param inputName: The C{str} name of the input, for error messages.
+    @param idOnly: If C{True}, discard text after the first space in query
+        and subject sequence ids.
+    @param mappingQuality: The C{int} mapping quality to use for MAPQ.
+    @return: A 2-tuple with a C{str} of SAM lines (each ending in a newline)
+        and a C{dict} mapping reference names to their C{int} lengths.
+    """
+    fieldNames, converters = _checkFieldNames(None)
+    lines = block.split('\n')
+    if lines[-1] == '':
+        lines.pop()
+    referenceLengths = {}
+    samLines = []
+    append = samLines.append
+    for match in _linesToDicts(lines, fieldNames, converters,
+                               firstLineNumber, inputName):
+        stitle, length, samLine = diamondDictToSAM(match, idOnly,
+                                                   mappingQuality)
+        referenceLengths[stitle] = length
+        append(samLine)
+    append('')
+    return '\n'.join(samLines), referenceLengths
+
+
+def diamondTabularFormatToSAM(filename, idOnly=True, mappingQuality=255,
+                              workers=None,
+                              blockSize=DIAMOND_TABULAR_BLOCK_SIZE):
+    """
+    Convert DIAMOND tabular (--outfmt 6) output to SAM alignment lines.
+
+    Each line of DIAMOND output is converted separately, so the input is
+    simply read in large blocks of whole lines. If C{workers} is greater
+    than one (and C{fork} is available), the blocks are converted in a pool
+    of worker processes, but are still yielded in input order.
+
+    @param filename: Either a C{str} file name or an open file pointer. The
+        DIAMOND output must have the fields in C{FIELDS}.
+    @param idOnly: If C{True}, discard text after the first space in query
+        and subject sequence ids.
+    @param mappingQuality: The C{int} mapping quality to use for MAPQ (field
+        5). The default (255) indicates that mapping quality information is
+        not available.
+    @param workers: If not C{None}, the C{int} number of worker processes to
+        use to do the conversion.
+    @param blockSize: The C{int} number of characters to read at a time.
+    @raise ValueError: If a line of C{filename} does not have the fields in
+        C{FIELDS}.
+    @return: A generator that yields 2-tuples, each with a C{str} of SAM
+        lines (each ending in a newline) and a C{dict} mapping the
+        reference names in those lines to their C{int} lengths.
+    """
+    inputName = (filename if isinstance(filename, six.string_types)
+                 else 'input')
 
-    convertFunc = DIAMOND_FIELD_CONVERTER.get
+    def blocks(fp):
+        lineNumber = 1
+        for block in lineAlignedBlocks(fp, blockSize):
+            yield block, lineNumber
+            lineNumber += block.count('\n')
+
+    context = _forkContext() if workers and workers > 1 else None
 
     with as_handle(filename) as fp:
-        for count, line in enumerate(fp, start=1):
-            result = {}
-            line = line[:-1]
-            values = line.split('\t')
-            if len(values) != nFields:
-                raise ValueError(
-                    'Line %d of %s had %d field values (expected %d). '
-                    'To provide input for this function, DIAMOND must be '
-                    'called with "--outfmt 6 %s" (without the quotes). '
-                    'The offending input line was %r.' %
-                    (count,
-                     (filename if isinstance(filename, six.string_types)
-                      else 'input'),
-                     len(values), nFields, FIELDS, line))
-            for fieldName, value in zip(fieldNames, values):
-                value = convertFunc(fieldName, identity)(value)
-                result[fieldName] = value
-            yield result
+        if context is None:
+            for block, lineNumber in blocks(fp):
+                yield _samBlock(block, lineNumber, inputName, idOnly,
+                                mappingQuality)
+            return
+
+        # Limit the number of blocks in flight, so memory use is bounded
+        # no matter how much input there is.
+        maxPending = 2 * workers
+        pending = deque()
+        pool = context.Pool(workers)
+
+        try:
+            for block, lineNumber in blocks(fp):
+                pending.append(pool.apply_async(
+                    _samBlock, (block, lineNumber, inputName, idOnly,
+                                mappingQuality)))
+                while len(pending) > maxPending or (
+                        pending and pending[0].ready()):
+                    yield pending.popleft().get()
+
+            while pending:
+                yield pending.popleft().get()
+        finally:
+            pool.terminate()
+            pool.join()
 
 
 class DiamondTabularFormatReader(object):
@@ -114,10 +364,12 @@ class DiamondTabularFormatReader(object):
 
     @param filename: A C{str} filename or an open file pointer, containing
         DIAMOND tabular records.
+    @param blockSize: The C{int} number of characters to read at a time.
     """
 
-    def __init__(self, filename):
+    def __init__(self, filename, blockSize=DIAMOND_TABULAR_BLOCK_SIZE):
         self._filename = filename
+        self._blockSize = blockSize
         self.application = 'DIAMOND'
         self.params = {
             'application': self.application,
@@ -135,96 +387,93 @@ class DiamondTabularFormatReader(object):
         DIAMOND results into Python dictionaries that will then be stored in
         our JSON format.
 
+        DIAMOND writes all the lines for a query consecutively, so lines are
+        grouped into a record until the query title changes.
+
+        @raise ValueError: If a line does not have 13 or 15 TAB-separated
+            fields.
         @return: A generator that produces C{dict}s containing 'alignments' and
             'query' C{str} keys.
         """
+        previousQtitle = None
+        record = None
+        # Map subject titles to the alignments of the current record, so
+        # the alignment for a repeated subject can be found directly.
+        alignmentsByTitle = {}
+
         with as_handle(self._filename) as fp:
-            previousQtitle = None
-            subjectsSeen = {}
-            record = {}
-            for line in fp:
-                line = line[:-1]
-                try:
-                    (qtitle, stitle, bitscore, evalue, qframe, qseq,
-                     qstart, qend, sseq, sstart, send, slen, btop, nident,
-                     positive) = line.split('\t')
-                except ValueError as e:
-                    # We may not be able to find 'nident' and 'positives'
-                    # because they were added in version 2.0.3 and will not
-                    # be present in any of our JSON output generated before
-                    # that. So those values will be None when reading
-                    # DIAMOND output without those fields, but that's much
-                    # better than no longer being able to read that data.
-                    if six.PY2:
-                        error = 'need more than 13 values to unpack'
-                    else:
-                        error = (
-                            'not enough values to unpack (expected 15, '
-                            'got 13)')
-                    if str(e) == error:
-                        (qtitle, stitle, bitscore, evalue, qframe,
-                         qseq, qstart, qend, sseq, sstart, send, slen,
-                         btop) = line.split('\t')
+            for lines in _tabularLineBlocks(fp, self._blockSize):
+                for line in lines:
+                    fields = line.split('\t')
+                    nFields = len(fields)
+                    if nFields == 15:
+                        (qtitle, stitle, bitscore, evalue, qframe, qseq,
+                         qstart, qend, sseq, sstart, send, slen, btop,
+                         nident, positive) = fields
+                        nident = int(nident)
+                        positive = int(positive)
+                    elif nFields == 13:
+                        # We may not be able to find 'nident' and
+                        # 'positives' because they were added in version
+                        # 2.0.3 and will not be present in any of our JSON
+                        # output generated before that. So those values
+                        # will be None when reading DIAMOND output without
+                        # those fields, but that's much better than no
+                        # longer being able to read that data.
+                        (qtitle, stitle, bitscore, evalue, qframe, qseq,
+                         qstart, qend, sseq, sstart, send, slen,
+                         btop) = fields
                         nident = positive = None
                     else:
-                        raise
-                hsp = {
-                    'bits': float(bitscore),
-                    'btop': btop,
-                    'expect': float(evalue),
-                    'frame': int(qframe),
-                    'identicalCount': None if nident is None else int(nident),
-                    'positiveCount': (
-                        None if positive is None else int(positive)),
-                    'query': qseq,
-                    'query_start': int(qstart),
-                    'query_end': int(qend),
-                    'sbjct': sseq,
-                    'sbjct_start': int(sstart),
-                    'sbjct_end': int(send),
-                }
-                if previousQtitle == qtitle:
-                    # We have already started accumulating alignments for this
-                    # query.
-                    if stitle not in subjectsSeen:
-                        # We have not seen this subject before, so this is a
-                        # new alignment.
-                        subjectsSeen.add(stitle)
+                        raise ValueError(
+                            'DIAMOND tabular output line %r has %d fields '
+                            '(expected 13 or 15).' % (line, nFields))
+
+                    hsp = {
+                        'bits': float(bitscore),
+                        'btop': btop,
+                        'expect': float(evalue),
+                        'frame': int(qframe),
+                        'identicalCount': nident,
+                        'positiveCount': positive,
+                        'query': qseq,
+                        'query_start': int(qstart),
+                        'query_end': int(qend),
+                        'sbjct': sseq,
+                        'sbjct_start': int(sstart),
+                        'sbjct_end': int(send),
+                    }
+
+                    if qtitle != previousQtitle:
+                        # All alignments for the previous query id (if any)
+                        # have been seen.
+                        if record is not None:
+                            yield record
+                        record = {
+                            'alignments': [],
+                            'query': qtitle,
+                        }
+                        alignmentsByTitle = {}
+                        previousQtitle = qtitle
+
+                    try:
+                        # We have already seen this subject, so this is
+                        # another HSP in an already existing alignment.
+                        alignmentsByTitle[stitle]['hsps'].append(hsp)
+                    except KeyError:
+                        # We have not seen this subject before, so this is
+                        # a new alignment.
                         alignment = {
                             'hsps': [hsp],
                             'length': int(slen),
                             'title': stitle,
                         }
+                        alignmentsByTitle[stitle] = alignment
                         record['alignments'].append(alignment)
-                    else:
-                        # We have already seen this subject, so this is another
-                        # HSP in an already existing alignment.
-                        for alignment in record['alignments']:
-                            if alignment['title'] == stitle:
-                                alignment['hsps'].append(hsp)
-                                break
-                else:
-                    # All alignments for the previous query id (if any)
-                    # have been seen.
-                    if previousQtitle is not None:
-                        yield record
-
-                    # Start building up the new record.
-                    record = {}
-                    subjectsSeen = {stitle}
-                    alignment = {
-                        'hsps': [hsp],
-                        'length': int(slen),
-                        'title': stitle,
-                    }
-                    record['alignments'] = [alignment]
-                    record['query'] = qtitle
 
-                    previousQtitle = qtitle
-
-            # Yield the last record, if any.
-            if record:
-                yield record
+        # Yield the last record, if any.
+        if record is not None:
+            yield record
 
     def saveAsJSON(self, fp, writeBytes=False):
         """
@@ -258,10 +507,24 @@ class JSONRecordsReader(object):
     @param scoreClass: A class to hold and compare scores (see scores.py).
         Default is C{HigherIsBetterScore}, for comparing bit scores. If you
         are using e-values, pass LowerIsBetterScore instead.
+    @param threads: An C{int} number of threads to use for reading and
+        decompressing C{filename} (see L{dark.utils.openFile}).
+    @param matchedSequences: If C{False}, the matched read and subject
+        sequences are not kept in HSPs (their C{readMatchedSequence} and
+        C{subjectMatchedSequence} attributes will be C{None}). This saves
+        memory and time when only scores and offsets are needed.
+    @param jsonBackend: The C{str} name of the JSON decoder to use (see
+        L{dark.json_records.JSON_BACKENDS}), or C{None} to use the fastest
+        one available.
     """
-    def __init__(self, filename, scoreClass=HigherIsBetterScore):
+    def __init__(self, filename, scoreClass=HigherIsBetterScore, threads=0,
+                 matchedSequences=True, jsonBackend=None):
         self._filename = filename
         self._scoreClass = scoreClass
+        self._threads = threads
+        self._matchedSequences = matchedSequences
+        self._loads = jsonLoader(jsonBackend)
+        self._prefetchedRecords = None
         if scoreClass is HigherIsBetterScore:
             self._hspClass = HSP
         else:
@@ -280,13 +543,7 @@ class JSONRecordsReader(object):
             if the input file is empty, or if the JSON does not contain an
             'application' key.
         """
-        if filename.endswith('.bz2'):
-            if six.PY3:
-                self._fp = bz2.open(filename, mode='rt', encoding='UTF-8')
-            else:
-                self._fp = bz2.BZ2File(filename)
-        else:
-            self._fp = open(filename)
+        self._fp = openFile(filename, threads=self._threads)
 
         line = self._fp.readline()
         if not line:
@@ -311,6 +568,8 @@ class JSONRecordsReader(object):
         """
         alignments = []
         getScore = itemgetter('bits' if self._hspClass is HSP else 'expect')
+        matchedSequences = self._matchedSequences
+        readLength = len(read)
 
         for diamondAlignment in diamondDict['alignments']:
             alignment = Alignment(diamondAlignment['length'],
@@ -318,19 +577,13 @@ class JSONRecordsReader(object):
             alignments.append(alignment)
             for diamondHsp in diamondAlignment['hsps']:
                 score = getScore(diamondHsp)
-                normalized = normalizeHSP(diamondHsp, len(read),
-                                          self.diamondTask)
                 hsp = self._hspClass(
                     score,
-                    readStart=normalized['readStart'],
-                    readEnd=normalized['readEnd'],
-                    readStartInSubject=normalized['readStartInSubject'],
-                    readEndInSubject=normalized['readEndInSubject'],
                     readFrame=diamondHsp['frame'],
-                    subjectStart=normalized['subjectStart'],
-                    subjectEnd=normalized['subjectEnd'],
-                    readMatchedSequence=diamondHsp['query'],
-                    subjectMatchedSequence=diamondHsp['sbjct'],
+                    readMatchedSequence=(
+                        diamondHsp['query'] if matchedSequences else None),
+                    subjectMatchedSequence=(
+                        diamondHsp['sbjct'] if matchedSequences else None),
                     # Use blastHsp.get on identicalCount and positiveCount
                     # because they were added in version 2.0.3 and will not
                     # be present in any of our JSON output generated before
@@ -338,7 +591,22 @@ class JSONRecordsReader(object):
                     # but that's much better than no longer being able to
                     # read all that data.
                     identicalCount=diamondHsp.get('identicalCount'),
-                    positiveCount=diamondHsp.get('positiveCount'))
+                    positiveCount=diamondHsp.get('positiveCount'),
+                    # Offsets are normalized only if they are looked at.
+                    # Only the values normalizeHSP needs are kept (not
+                    # diamondHsp, which holds the matched sequences).
+                    normalize=partial(
+                        normalizeLazily, read.id, alignment.subjectTitle,
+                        normalizeHSP,
+                        {
+                            'btop': diamondHsp['btop'],
+                            'frame': diamondHsp['frame'],
+                            'query_start': diamondHsp['query_start'],
+                            'query_end': diamondHsp['query_end'],
+                            'sbjct_start': diamondHsp['sbjct_start'],
+                            'sbjct_end': diamondHsp['sbjct_end'],
+                        },
+                        readLength, self.diamondTask))
 
                 alignment.addHsp(hsp)
 
@@ -356,53 +624,191 @@ class JSONRecordsReader(object):
         @return: A generator that yields C{dark.alignments.ReadAlignments}
             instances.
         """
+        reads = iter(reads)
+
+        for recordNumber, record in enumerate(self._takeRecords(), start=1):
+            recordTitle = record['query']
+            while True:
+                # Iterate through the input reads until we find the one that
+                # matches this DIAMOND record.
+                try:
+                    read = next(reads)
+                except StopIteration:
+                    raise ValueError(
+                        'Read generator failed to yield a read with id '
+                        '\'%s\' as found in record number %d during parsing '
+                        'of DIAMOND output file %r.' %
+                        (recordTitle, recordNumber, self._filename))
+                else:
+                    # Look for an exact read id / subject title match. If
+                    # that doesn't work, allow for the case where the JSON
+                    # record has a truncated query (i.e., read) id. This
+                    # covers the situation where a tool we use (e.g., bwa
+                    # mem) unconditionally does this truncation in the
+                    # output it writes.
+                    if (read.id == recordTitle or
+                            read.id.split()[0] == recordTitle):
+                        alignments = self._dictToAlignments(record, read)
+                        yield ReadAlignments(read, alignments)
+                        break
+                    else:
+                        # This is an input read that had no DIAMOND matches.
+                        # So it does not appear in the DIAMOND's output.
+                        # Yield an empty ReadAlignments for it.
+                        yield ReadAlignments(read, [])
+
+    def readAlignmentsByReadId(self, readIndex):
+        """
+        Read lines of JSON from self._filename, convert them to read alignments
+        and yield them, looking up the read for each record by its id.
+
+        Unlike C{readAlignments}, this does not need the reads to be in the
+        order of the records, and does not yield anything for reads that
+        have no record.
+
+        @param readIndex: An object that gives reads by id (see
+            L{dark.alignments.lookupRead}). Note that records hold read ids as
+            they were given by DIAMOND, so (e.g.) an C{SqliteIndex} of full
+            FASTA ids cannot find reads whose ids were truncated.
+        @raise ValueError: If any of the lines in the file cannot be converted
+            to JSON, or if the read for a record cannot be found.
+        @return: A generator that yields C{dark.alignments.ReadAlignments}
+            instances.
+        """
+        for recordNumber, record in enumerate(self._takeRecords(), start=1):
+            try:
+                read = lookupRead(readIndex, record['query'])
+            except KeyError:
+                raise ValueError(
+                    'Read index has no read with id %r as found in record '
+                    'number %d during parsing of DIAMOND output file %r.' %
+                    (record['query'], recordNumber, self._filename))
+            else:
+                alignments = self._dictToAlignments(record, read)
+                yield ReadAlignments(read, alignments)
+
+    def _takeRecords(self):
+        """
+        Get the records to convert to read alignments.
+
+        @return: An iterable of record C{dict}s. These are the records read
+            by C{prefetch}, if it has been called (they are then forgotten),
+            or else those read from the file.
+        """
+        if self._prefetchedRecords is None:
+            return self._records()
+        else:
+            records, self._prefetchedRecords = self._prefetchedRecords, None
+            return records
+
+    def prefetch(self):
+        """
+        Read all the records from the file into memory, and close the file.
+
+        The records are used by the next call to C{readAlignments}. This
+        allows the (slow) decompression and JSON decoding to be done in a
+        worker process, after which the reader can be pickled and sent back
+        to the process that pairs its records with reads.
+
+        @raise ValueError: If any of the lines in the file cannot be converted
+            to JSON.
+        @return: C{self}.
+        """
+        self._prefetchedRecords = list(self._records())
+        return self
+
+    def close(self):
+        """
+        Close the input file, if it is open. It will be opened again if
+        records are read.
+        """
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+    def _records(self):
+        """
+        Read lines of JSON from self._filename and convert them to records.
+
+        @raise ValueError: If any of the lines in the file cannot be converted
+            to JSON.
+        @return: A generator that yields record C{dict}s.
+        """
         if self._fp is None:
             self._open(self._filename)
 
-        reads = iter(reads)
+        loads = self._loads
 
         try:
-            for lineNumber, line in enumerate(self._fp, start=2):
+            for lineNumber, line in jsonLines(self._fp, firstLineNumber=2):
                 try:
-                    record = loads(line[:-1])
+                    record = loads(line)
                 except ValueError as e:
                     raise ValueError(
                         'Could not convert line %d of %r to JSON (%s). '
-                        'Line is %r.' %
-                        (lineNumber, self._filename, e, line[:-1]))
+                        'Line is %r.' % (lineNumber, self._filename, e, line))
                 else:
-                    recordTitle = record['query']
-                    while True:
-                        # Iterate through the input reads until we find the
-                        # one that matches this DIAMOND record.
-                        try:
-                            read = next(reads)
-                        except StopIteration:
-                            raise ValueError(
-                                'Read generator failed to yield a read '
-                                'with id \'%s\' as found in record number %d '
-                                'during parsing of DIAMOND output file %r.' %
-                                (recordTitle, lineNumber - 1, self._filename))
-                        else:
-                            # Look for an exact read id / subject title match.
-                            # If that doesn't work, allow for the case where
-                            # the JSON record has a truncated query (i.e.,
-                            # read) id. This covers the situation where a tool
-                            # we use (e.g., bwa mem) unconditionally does this
-                            # truncation in the output it writes.
-                            if (read.id == recordTitle or
-                                    read.id.split()[0] == recordTitle):
-                                alignments = self._dictToAlignments(record,
-                                                                    read)
-                                yield ReadAlignments(read, alignments)
-                                break
-                            else:
-                                # This is an input read that had no DIAMOND
-                                # matches. So it does not appear in the
-                                # DIAMOND's output. Yield an empty
-                                # ReadAlignments for it.
-                                yield ReadAlignments(read, [])
-
+                    yield record
         finally:
             self._fp.close()
             self._fp = None
+
+
+class AlignmentStoreRecordsReader(JSONRecordsReader):
+    """
+    Provide a method that yields DIAMOND records from an alignment store file
+    (see L{dark.alignment_store}). Store and make accessible the DIAMOND
+    parameters.
+
+    @param filename: A C{str} alignment store filename containing DIAMOND
+        records.
+    @param scoreClass: A class to hold and compare scores (see scores.py).
+        Default is C{HigherIsBetterScore}, for comparing bit scores. If you
+        are using e-values, pass LowerIsBetterScore instead.
+    @param threads: Ignored (the alignment store is read all at once).
+    @param matchedSequences: If C{False}, the matched read and subject
+        sequences are not read from the store and are not kept in HSPs.
+    @param jsonBackend: Ignored.
+    """
+    def _open(self, filename):
+        """
+        Open the alignment store.
+
+        @param filename: A C{str} alignment store filename.
+        @raise ValueError: If C{filename} is not a valid alignment store.
+        """
+        self._store = AlignmentStore(filename)
+        self.params = self._store.params
+
+    def prefetch(self):
+        """
+        Read all the records from the alignment store into memory.
+
+        The store itself is then dropped, so its columns are not pickled
+        along with the reader.
+
+        @return: C{self}.
+        """
+        JSONRecordsReader.prefetch(self)
+        self._store = None
+        return self
+
+    def close(self):
+        """
+        Drop the alignment store. It will be read again if records are read.
+        """
+        self._store = None
+
+    def _records(self):
+        """
+        Get the records in the alignment store.
+
+        @return: A generator that yields record C{dict}s.
+        """
+        if self._store is None:
+            self._open(self._filename)
+
+        if self._matchedSequences:
+            return self._store.records()
+        else:
+            return self._store.records(skipHspFields=('query', 'sbjct'))
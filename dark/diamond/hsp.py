@@ -21,7 +21,8 @@ def _debugPrint(hsp, queryLen, localDict, msg=''):
     print('  Original HSP:', file=sys.stderr)
     for attr in ['bits', 'btop', 'expect', 'frame', 'query_end', 'query_start',
                  'sbjct', 'query', 'sbjct_end', 'sbjct_start']:
-        print('    %s: %r' % (attr, hsp[attr]), file=sys.stderr)
+        if attr in hsp:
+            print('    %s: %r' % (attr, hsp[attr]), file=sys.stderr)
 
     print('  Local variables:', file=sys.stderr)
     for var in sorted(localDict):
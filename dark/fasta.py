@@ -1,33 +1,319 @@
 from six import PY3
 from hashlib import md5
+from contextlib import contextmanager
+import mmap
 import sqlite3
 import os
+from collections import OrderedDict
 
 from Bio import SeqIO, bgzf
 from pyfaidx import Fasta
 
+from dark.dedup import DuplicateTracker
 from dark.reads import Reads, DNARead
-from dark.utils import asHandle
+from dark.utils import iterHandles, lineAlignedBlocks, iterBGZFBlocks
+
+# The number of characters to ask for in each read() when tokenizing FASTA.
+FASTA_BLOCK_SIZE = 1 << 20
+
+# The default maximum number of FASTA files an SqliteIndex keeps open.
+DEFAULT_MAX_OPEN_FILES = 16
+
+# The default maximum total length of the sequences an SqliteIndex caches.
+DEFAULT_SEQUENCE_CACHE_SIZE = 1 << 24
+
+# The maximum number of parameters in an SQL statement. This is the default
+# limit for SQLite versions before 3.32.0.
+SQLITE_MAX_VARIABLES = 999
+
+
+def _makeFastaRecord(pieces):
+    """
+    Convert the text of a FASTA record into an (id, sequence) pair.
+
+    @param pieces: A C{list} of C{str}s that together contain the text of a
+        FASTA record, starting just after its leading '>'.
+    @return: A 2-tuple of C{str}s: the record description (with trailing
+        whitespace removed) and its sequence (with all whitespace removed).
+    """
+    text = pieces[0] if len(pieces) == 1 else ''.join(pieces)
+    header, _, sequence = text.partition('\n')
+    return header.rstrip(), ''.join(sequence.split())
+
+
+def fastaRecords(fp, blockSize=FASTA_BLOCK_SIZE):
+    """
+    Tokenize FASTA from an open file handle, without the overhead of making
+    a C{Bio.SeqRecord} for each record.
+
+    Input is read in large blocks and record boundaries are found by
+    splitting whole blocks at once. Any text preceding the first record is
+    ignored, as is done by C{Bio.SeqIO}.
+
+    @param fp: An open file handle containing FASTA.
+    @param blockSize: The C{int} number of characters to read at a time.
+    @return: A generator that yields (id, sequence) C{str} 2-tuples.
+    """
+    # The pieces of the record currently being assembled, or None if we
+    # have not yet seen the start of the first record.
+    current = None
+
+    for block in lineAlignedBlocks(fp, blockSize):
+        # Each block starts at the beginning of a line, so prepending a
+        # newline lets us find a record that starts at the very beginning.
+        parts = ('\n' + block).split('\n>')
+        if current is not None:
+            current.append(parts[0])
+        for part in parts[1:]:
+            if current is not None:
+                yield _makeFastaRecord(current)
+            current = [part]
+
+    if current is not None:
+        yield _makeFastaRecord(current)
+
+
+class _SequenceExtent(object):
+    """
+    Accumulate the size of the sequence part of a FASTA record, given the
+    pieces of input it occupies.
+
+    @param newline: The C{str} or C{bytes} newline character of the input.
+    @param carriageReturn: The C{str} or C{bytes} carriage return character
+        of the input.
+    """
+    def __init__(self, newline='\n', carriageReturn='\r'):
+        self._newline = newline
+        self._carriageReturn = carriageReturn
+        self._extent = self._lineEnds = 0
+        self._lineLength = None
+
+    def add(self, data, start, end):
+        """
+        Add a piece of the sequence.
+
+        @param data: A C{str} or C{bytes} block of input.
+        @param start: The C{int} offset in C{data} where the piece starts.
+        @param end: The C{int} offset in C{data} where the piece ends.
+        """
+        if self._lineLength is None:
+            newline = data.find(self._newline, start, end)
+            if newline != -1:
+                # The end of the first sequence line.
+                self._lineLength = (
+                    self._extent + newline - start -
+                    self._lineEnds - data.count(self._carriageReturn,
+                                                start, newline))
+
+        self._extent += end - start
+        self._lineEnds += (data.count(self._newline, start, end) +
+                           data.count(self._carriageReturn, start, end))
+
+    def result(self):
+        """
+        Get the size of the sequence.
+
+        @return: A 3-tuple with the C{int} sequence length, the C{int} length
+            of its first line (as in a samtools C{.fai} index, this is the
+            line length of all lines but the last, if the lines are all the
+            same length), and the C{int} number of characters (including
+            line endings) of input the sequence occupies.
+        """
+        length = self._extent - self._lineEnds
+        lineLength = length if self._lineLength is None else self._lineLength
+        return length, lineLength, self._extent
+
+
+def _fastaRecordExtents(fp, blockSize=FASTA_BLOCK_SIZE):
+    """
+    Find the ids of the FASTA records in a file, and the offsets and sizes
+    of their sequences.
+
+    Input is read in large blocks in which headers are found with C{find},
+    so the cost of a file is (roughly) proportional to its number of records
+    rather than to its number of lines.
+
+    @param fp: An open file handle containing FASTA.
+    @param blockSize: The C{int} number of characters to read at a time.
+    @return: A generator that yields (id, offset, length, lineLength, extent)
+        5-tuples, with the C{str} id of each record, the C{int} offset (in
+        characters read from C{fp}) of the line following its header, and
+        the three C{int}s described in L{_SequenceExtent.result}.
+    """
+    offset = 0
+    # The id and offset of the record whose sequence is being read (or
+    # None), and the extent of its sequence so far.
+    record = extent = None
+    for block in lineAlignedBlocks(fp, blockSize):
+        find = block.find
+        # The start of the part of the block not yet assigned to a record.
+        position = 0
+        # Find the index of the '>' starting the first header (or -1 if
+        # there is none). Blocks start at the beginning of a line.
+        if block[0] == '>':
+            start = 0
+        else:
+            start = find('\n>')
+            if start != -1:
+                start += 1
+        while start != -1:
+            if record is not None:
+                extent.add(block, position, start)
+                yield record + extent.result()
+            end = find('\n', start)
+            if end == -1:
+                # A header with no newline, at the end of the input.
+                end = len(block) - 1
+            record = (block[start + 1:end + 1].rstrip(' \t\n\r'),
+                      offset + end + 1)
+            extent = _SequenceExtent()
+            position = end + 1
+            start = find('\n>', end)
+            if start != -1:
+                start += 1
+        if record is not None:
+            extent.add(block, position, len(block))
+        offset += len(block)
+
+    if record is not None:
+        yield record + extent.result()
+
+
+def _bgzfHeaderId(pieces):
+    """
+    Get a sequence id from the pieces of a FASTA header line.
+
+    @param pieces: A C{list} of C{bytes} that together contain a header
+        line, starting with its leading '>' and without its newline.
+    @return: The C{str} sequence id.
+    """
+    return b''.join(pieces)[1:].decode('UTF-8').rstrip(' \t\n\r')
+
+
+def _bgzfFastaRecordExtents(fp):
+    """
+    Find the ids of the FASTA records in a BGZF file, the virtual offsets
+    (as used by C{Bio.bgzf}) at which their sequences start, and the sizes
+    of their sequences.
+
+    The decompressed data of each BGZF block is searched for headers with
+    C{find}. A header may be split across blocks.
+
+    @param fp: An open binary file containing BGZF-compressed FASTA.
+    @raise ValueError: If the data is not in BGZF format.
+    @return: A generator that yields (id, offset, length, lineLength, extent)
+        5-tuples, with the C{str} id of each record, the C{int} virtual
+        offset of the line following its header, and the three C{int}s
+        described in L{_SequenceExtent.result}.
+    """
+    # The pieces of a header that started in an earlier block but has not
+    # yet ended, or None.
+    header = None
+    # The id and offset of the record whose sequence is being read, or None.
+    record = None
+    atLineStart = True
+    # The offset of the end of the last block with data.
+    dataEnd = 0
+
+    def idAndOffset(pieces, end):
+        # Make a virtual offset in the way Bio.bgzf does: the end of a block
+        # is given as the start of the following one.
+        if end == len(data):
+            offset = blockEnd << 16
+        else:
+            offset = (blockStart << 16) | end
+        return _bgzfHeaderId(pieces), offset
+
+    for blockStart, blockEnd, data in iterBGZFBlocks(fp):
+        if not data:
+            continue
+        dataEnd = blockEnd
+        find = data.find
+        # The start of the part of the block not yet assigned to a record.
+        position = 0
+
+        # Find the index of the '>' starting the first header that starts
+        # in this block (or -1 if there is none).
+        if header is not None:
+            end = find(b'\n')
+            if end == -1:
+                header.append(data)
+                continue
+            header.append(data[:end])
+            record = idAndOffset(header, end + 1)
+            extent = _SequenceExtent(b'\n', b'\r')
+            header = None
+            position = end + 1
+            start = find(b'\n>', end)
+            if start != -1:
+                start += 1
+        elif atLineStart and data[:1] == b'>':
+            start = 0
+        else:
+            start = find(b'\n>')
+            if start != -1:
+                start += 1
+
+        while start != -1:
+            if record is not None:
+                extent.add(data, position, start)
+                yield record + extent.result()
+                record = None
+            end = find(b'\n', start)
+            if end == -1:
+                header = [data[start:]]
+                break
+            record = idAndOffset([data[start:end]], end + 1)
+            extent = _SequenceExtent(b'\n', b'\r')
+            position = end + 1
+            start = find(b'\n>', end)
+            if start != -1:
+                start += 1
+
+        if record is not None:
+            extent.add(data, position, len(data))
+
+        atLineStart = data[-1:] == b'\n'
+
+    if header is not None:
+        # A header with no newline, at the end of the input.
+        yield _bgzfHeaderId(header), dataEnd << 16, 0, 0, 0
+    elif record is not None:
+        yield record + extent.result()
 
 
 def fastaToList(fastaFilename):
     return list(SeqIO.parse(fastaFilename, 'fasta'))
 
 
-def dedupFasta(reads):
+def dedupFasta(reads, ignoreCase=False, reverseComplement=False,
+               databaseFilename=None):
     """
     Remove sequence duplicates (based on sequence) from FASTA.
 
+    MD5 digests of sequences are used to detect duplicates, via
+    L{dark.dedup.DuplicateTracker} (as is done by C{ReadFilter} when given
+    C{removeDuplicates} and C{removeDuplicatesUseMD5}).
+
     @param reads: a C{dark.reads.Reads} instance.
+    @param ignoreCase: If C{True}, sequences that differ only in case are
+        considered duplicates.
+    @param reverseComplement: If C{True}, a (DNA) sequence is considered a
+        duplicate of its reverse complement.
+    @param databaseFilename: If not C{None}, the C{str} name of an SQLite
+        database file in which to keep sequence digests.
     @return: a generator of C{dark.reads.Read} instances with no duplicates.
     """
-    seen = set()
-    add = seen.add
-    for read in reads:
-        hash_ = md5(read.sequence.encode('UTF-8')).digest()
-        if hash_ not in seen:
-            add(hash_)
-            yield read
+    tracker = DuplicateTracker(useMD5=True, ignoreCase=ignoreCase,
+                               reverseComplement=reverseComplement,
+                               databaseFilename=databaseFilename)
+    seen = tracker.seen
+    try:
+        for read in reads:
+            if not seen(read.sequence):
+                yield read
+    finally:
+        tracker.close()
 
 
 def dePrefixAndSuffixFasta(sequences):
@@ -91,10 +377,15 @@ class FastaReads(Reads):
     @param readClass: The class of read that should be yielded by iter.
     @param upperCase: If C{True}, read sequences will be converted to upper
         case.
+    @param threads: An C{int} number of threads to use for reading and
+        decompressing files (see L{dark.utils.openFile}). If non-zero, each
+        file after the first is opened (and starts being read in the
+        background) while the previous one is being processed.
     """
-    def __init__(self, _files, readClass=DNARead, upperCase=False):
+    def __init__(self, _files, readClass=DNARead, upperCase=False, threads=0):
         self._files = _files if isinstance(_files, (list, tuple)) else [_files]
         self._readClass = readClass
+        self._threads = threads
         # TODO: It would be better if upperCase were an argument that could
         # be passed to Reads.__init__ and that could do the uppercasing in
         # its add method (as opposed to using it below in our iter method).
@@ -113,22 +404,16 @@ class FastaReads(Reads):
         Iterate over the sequences in the files in self.files_, yielding each
         as an instance of the desired read class.
         """
-        count = 0
-        for _file in self._files:
-            with asHandle(_file) as fp:
-                # Duplicate some code here so as not to test
-                # self._upperCase in the loop.
-                if self._upperCase:
-                    for seq in SeqIO.parse(fp, 'fasta'):
-                        read = self._readClass(seq.description,
-                                               str(seq.seq.upper()))
-                        yield read
-                        count += 1
-                else:
-                    for seq in SeqIO.parse(fp, 'fasta'):
-                        read = self._readClass(seq.description, str(seq.seq))
-                        yield read
-                        count += 1
+        readClass = self._readClass
+        for _, fp in iterHandles(self._files, threads=self._threads):
+            # Duplicate some code here so as not to test
+            # self._upperCase in the loop.
+            if self._upperCase:
+                for id_, sequence in fastaRecords(fp):
+                    yield readClass(id_, sequence.upper())
+            else:
+                for id_, sequence in fastaRecords(fp):
+                    yield readClass(id_, sequence)
 
 
 class FastaFaiReads(Reads):
@@ -180,6 +465,342 @@ class FastaFaiReads(Reads):
     def __getitem__(self, id_):
         return self._readClass(str(id_), str(self._fasta[id_]))
 
+    def getMany(self, ids):
+        """
+        Get many reads, given their ids.
+
+        All ids are checked before any sequence is read. The sequences are
+        then read in the order of their offsets in the FASTA file.
+
+        @param ids: An iterable of C{str} sequence ids.
+        @raise KeyError: If any id is not a known sequence.
+        @return: A generator that yields reads of our read class, in the
+            order they are found in the FASTA file (not in the order of
+            C{ids}). Each read is yielded once, even if its id is repeated
+            in C{ids}.
+        """
+        index = self._fasta.faidx.index
+        ids = set(map(str, ids))
+        for id_ in ids:
+            if id_ not in index:
+                raise KeyError('Unknown sequence: %r' % id_)
+
+        return self._readIds(sorted(ids, key=lambda id_: index[id_].offset))
+
+    def _readIds(self, ids):
+        """
+        Read sequences.
+
+        @param ids: An iterable of C{str} sequence ids.
+        @return: A generator that yields reads of our read class.
+        """
+        fasta = self._fasta
+        readClass = self._readClass
+        for id_ in ids:
+            yield readClass(id_, str(fasta[id_]))
+
+
+def _faiEntries(data, filename):
+    """
+    Make samtools C{.fai} index entries for FASTA data.
+
+    @param data: A C{bytes}-like object (e.g., an C{mmap}) holding the FASTA.
+    @param filename: The C{str} name of the FASTA file (used in errors).
+    @raise ValueError: If the lines of a sequence (apart from its last line)
+        are not all the same length.
+    @return: A generator that yields (name, length, offset, lineBases,
+        lineWidth) 5-tuples, as found in the columns of a C{.fai} file.
+    """
+    size = len(data)
+    start = 0 if data[:1] == b'>' else data.find(b'\n>')
+    if start > 0:
+        start += 1
+    while start != -1:
+        headerEnd = data.find(b'\n', start)
+        if headerEnd == -1:
+            headerEnd = size
+        header = bytes(data[start + 1:headerEnd]).split(None, 1)
+        name = header[0].decode('UTF-8') if header else ''
+        offset = min(headerEnd + 1, size)
+        start = data.find(b'\n>', headerEnd)
+        if start == -1:
+            body = bytes(data[offset:])
+        else:
+            start += 1
+            body = bytes(data[offset:start])
+
+        # A final line with no line ending is treated as though it had a
+        # line ending of the same width as the other lines.
+        firstNewline = body.find(b'\n')
+        if firstNewline == -1:
+            lineBases = len(body.rstrip(b'\r'))
+            lineWidth = lineBases + 1
+        else:
+            lineBases = len(body[:firstNewline].rstrip(b'\r'))
+            lineWidth = firstNewline + 1
+
+        body = body.rstrip(b'\r\n')
+        length = len(body) - body.count(b'\n') - body.count(b'\r')
+
+        if length:
+            if lineBases:
+                # Check that all line endings but the last are where they
+                # would be if all lines but the last are the same length.
+                lineCount = -(-length // lineBases)
+                uniform = (
+                    len(body) == length + (lineCount - 1) * (
+                        lineWidth - lineBases) and
+                    body[lineWidth - 1::lineWidth][:lineCount - 1] ==
+                    b'\n' * (lineCount - 1))
+            else:
+                # The first line is empty.
+                uniform = False
+            if not uniform:
+                raise ValueError(
+                    'Sequence %r in FASTA file %r has lines of different '
+                    'lengths.' % (name, filename))
+        else:
+            lineBases = lineWidth = 0
+
+        yield name, length, offset, lineBases, lineWidth
+
+
+class FastaMmapReads(Reads):
+    """
+    Subclass of L{dark.reads.Reads} that provides dictionary-like access to
+    FASTA reads using a samtools-compatible C{.fai} index and a memory-mapped
+    FASTA file.
+
+    This can be used instead of L{FastaFaiReads} (it does not need pyfaidx).
+    Sequences, or parts of them, are extracted with one slice of the mapped
+    file, using the line lengths in the index to find where they are.
+
+    As in a C{.fai} file, sequence names are the part of the FASTA header
+    before any whitespace. Reads can be looked up by name or by full header
+    (e.g., a BLAST or DIAMOND subject title).
+
+    @param filename: The C{str} name of a file containing uncompressed FASTA.
+        The lines of each sequence (apart from its last line) must all be the
+        same length. If there is no up-to-date C{.fai} index file (with the
+        name of the FASTA file plus ".fai"), one is made (and is written to
+        disk, if possible).
+    @param readClass: The class of read that should be yielded by iter.
+    @param upperCase: If C{True}, read sequences will be converted to upper
+        case.
+    @raise ValueError: If C{filename} is compressed, the lines of a sequence
+        are not all the same length, or a sequence name occurs more than
+        once. The file is closed before the error is raised.
+    """
+    def __init__(self, filename, readClass=DNARead, upperCase=False):
+        self._filename = filename
+        self._readClass = readClass
+        self._upperCase = upperCase
+        self._fp = open(filename, 'rb')
+        if self._fp.read(2) == b'\x1f\x8b':
+            self._fp.close()
+            raise ValueError(
+                'Compressed FASTA file %r cannot be memory mapped.' % filename)
+
+        if os.fstat(self._fp.fileno()).st_size:
+            self._data = mmap.mmap(self._fp.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+        else:
+            # An empty file cannot be mapped.
+            self._data = b''
+
+        try:
+            self._index = self._loadIndex()
+        except Exception:
+            self.close()
+            raise
+
+        if PY3:
+            super().__init__()
+        else:
+            Reads.__init__(self)
+
+    def _loadIndex(self):
+        """
+        Read the C{.fai} index, or make it if there is no up-to-date index.
+
+        @return: An C{OrderedDict} mapping C{str} sequence names to
+            (length, offset, lineBases, lineWidth) 4-tuples of C{int}s.
+        """
+        faiFilename = self._filename + '.fai'
+        index = OrderedDict()
+
+        try:
+            current = (os.path.getmtime(faiFilename) >=
+                       os.path.getmtime(self._filename))
+        except OSError:
+            current = False
+
+        if current:
+            with open(faiFilename) as fp:
+                for line in fp:
+                    fields = line.rstrip('\r\n').split('\t')
+                    index[fields[0]] = tuple(map(int, fields[1:5]))
+        else:
+            for entry in _faiEntries(self._data, self._filename):
+                if entry[0] in index:
+                    raise ValueError(
+                        'Sequence %r occurs more than once in FASTA file '
+                        '%r.' % (entry[0], self._filename))
+                index[entry[0]] = entry[1:]
+            try:
+                with open(faiFilename, 'w') as fp:
+                    for name, values in index.items():
+                        fp.write('%s\t%d\t%d\t%d\t%d\n' % ((name,) + values))
+            except (IOError, OSError):
+                # The index can't be saved (e.g., the directory is not
+                # writable). It has been made, so we can carry on.
+                pass
+
+        return index
+
+    def _entry(self, id_):
+        """
+        Get the index entry for a sequence.
+
+        @param id_: A C{str} sequence name or full FASTA header (without the
+            leading '>').
+        @raise KeyError: If C{id_} is not a known sequence.
+        @return: A (length, offset, lineBases, lineWidth) 4-tuple of C{int}s.
+        """
+        try:
+            return self._index[id_]
+        except KeyError:
+            pass
+
+        fields = id_.split(None, 1)
+        if len(fields) == 2 and fields[0] in self._index:
+            # Check that id_ is the full header of the sequence.
+            entry = self._index[fields[0]]
+            offset = entry[1]
+            data = self._data
+            headerStart = data.rfind(b'\n', 0, offset - 1) + 1
+            header = bytes(data[headerStart + 1:offset]).decode('UTF-8')
+            if header.rstrip() == id_.rstrip():
+                return entry
+
+        raise KeyError('Unknown sequence: %r' % id_)
+
+    def fetch(self, id_, start=0, end=None, asBytes=False):
+        """
+        Get (part of) a sequence.
+
+        @param id_: A C{str} sequence name or full FASTA header (without the
+            leading '>').
+        @param start: The C{int} (zero-based) offset of the start of the part
+            of the sequence to get.
+        @param end: The C{int} offset just beyond the end of the part of the
+            sequence to get, or C{None} to get all of the sequence after
+            C{start}. As with Python slices, C{start} and C{end} are
+            adjusted to lie within the sequence.
+        @param asBytes: If C{True}, return the sequence as a C{bytes}-like
+            object and do not apply C{upperCase}. If the requested part of
+            the sequence is all on one line, this will be a C{memoryview} of
+            the mapped file, so no copy of the sequence is made. Note that
+            C{close} cannot be called while such a C{memoryview} exists.
+        @raise KeyError: If C{id_} is not a known sequence.
+        @return: A C{str} sequence or, if C{asBytes} is C{True}, a
+            C{memoryview} or C{bytes} sequence.
+        """
+        length, offset, lineBases, lineWidth = self._entry(id_)
+        start, end, _ = slice(start, end).indices(length)
+
+        if start >= end:
+            data = b''
+        else:
+            last = end - 1
+            startOffset = (offset + (start // lineBases) * lineWidth +
+                           start % lineBases)
+            endOffset = (offset + (last // lineBases) * lineWidth +
+                         last % lineBases + 1)
+            if start // lineBases == last // lineBases:
+                data = memoryview(self._data)[startOffset:endOffset]
+            else:
+                data = self._data[startOffset:endOffset].translate(
+                    None, b'\r\n')
+
+        if asBytes:
+            return data
+        else:
+            sequence = bytes(data).decode('UTF-8')
+            return sequence.upper() if self._upperCase else sequence
+
+    def getLength(self, id_):
+        """
+        Get the length of a sequence, without reading it.
+
+        @param id_: A C{str} sequence name or full FASTA header (without the
+            leading '>').
+        @raise KeyError: If C{id_} is not a known sequence.
+        @return: The C{int} length of the sequence.
+        """
+        return self._entry(id_)[0]
+
+    def iter(self):
+        """
+        Iterate over the sequences in the FASTA file, yielding each as an
+        instance of the desired read class.
+        """
+        readClass = self._readClass
+        for id_ in self._index:
+            yield readClass(id_, self.fetch(id_))
+
+    def __getitem__(self, id_):
+        id_ = str(id_)
+        return self._readClass(id_, self.fetch(id_))
+
+    def __contains__(self, id_):
+        try:
+            self._entry(str(id_))
+        except KeyError:
+            return False
+        else:
+            return True
+
+    def getMany(self, ids):
+        """
+        Get many reads, given their ids.
+
+        All ids are checked before any sequence is read. The sequences are
+        then read in the order of their offsets in the FASTA file.
+
+        @param ids: An iterable of C{str} sequence names or full FASTA
+            headers.
+        @raise KeyError: If any id is not a known sequence.
+        @return: A generator that yields reads of our read class, in the
+            order they are found in the FASTA file (not in the order of
+            C{ids}). Each read is yielded once, even if its id is repeated
+            in C{ids}.
+        """
+        offsets = dict((id_, self._entry(id_)[1])
+                       for id_ in set(map(str, ids)))
+        return self._readIds(sorted(offsets, key=offsets.get))
+
+    def _readIds(self, ids):
+        """
+        Read sequences.
+
+        @param ids: An iterable of C{str} sequence ids.
+        @return: A generator that yields reads of our read class.
+        """
+        readClass = self._readClass
+        for id_ in ids:
+            yield readClass(id_, self.fetch(id_))
+
+    def close(self):
+        """
+        Close the mapped FASTA file.
+        """
+        if self._fp is not None:
+            if self._data:
+                self._data.close()
+            self._fp.close()
+            self._fp = None
+
 
 def combineReads(filename, sequences, readClass=DNARead,
                  upperCase=False, idPrefix='command-line-read-'):
@@ -228,8 +849,19 @@ def combineReads(filename, sequences, readClass=DNARead,
 
 class SqliteIndex(object):
     """
-    Create an Sqlite3 database holding FASTA sequence ids, file names, and
-    offsets for fast random dictionary-like access.
+    Create an Sqlite3 database holding FASTA sequence ids, file names,
+    offsets, and sequence lengths for fast random dictionary-like access.
+
+    For each sequence, the database holds (as in a samtools C{.fai} index)
+    the sequence length, the length of its first line, and the number of
+    characters of FASTA (including line endings) it occupies, so a sequence
+    can be read with a single C{read} and its length can be found without
+    reading the FASTA at all. Databases made by earlier versions, which do
+    not hold these values, can still be used.
+
+    FASTA files that sequences are read from are kept open (up to
+    C{maxOpenFiles} of them, closing the least recently used when need be)
+    until C{close} is called, and recently read sequences are cached.
 
     @param dbFilename: A C{str} file name containing an sqlite3 database. If
         the file does not exist it will be created. The special string
@@ -239,10 +871,25 @@ class SqliteIndex(object):
         can be found. If provided, this directory is only used by __getitem__,
         which will combine it with the basename of the files given to
         C{addFile} to locate the FASTA.
+    @param maxOpenFiles: The C{int} maximum number of FASTA files to keep
+        open.
+    @param cacheSize: The C{int} maximum total length of the sequences to
+        keep in a cache of recently read sequences. Use 0 for no cache.
     """
-    def __init__(self, dbFilename, readClass=DNARead, fastaDirectory=None):
+    def __init__(self, dbFilename, readClass=DNARead, fastaDirectory=None,
+                 maxOpenFiles=DEFAULT_MAX_OPEN_FILES,
+                 cacheSize=DEFAULT_SEQUENCE_CACHE_SIZE):
         self._readClass = readClass
         self._fastaDirectory = fastaDirectory
+        self._maxOpenFiles = max(1, maxOpenFiles)
+        self._cacheSize = cacheSize
+        # Open FASTA files and cached sequences, both in least to most
+        # recently used order.
+        self._openFiles = OrderedDict()
+        self._cache = OrderedDict()
+        self._cachedLength = 0
+        # A dict of file names, keyed by file number (made when needed).
+        self._filenames = None
         creating = dbFilename == ':memory:' or not os.path.exists(dbFilename)
         self._connection = sqlite3.connect(dbFilename)
         if creating:
@@ -257,10 +904,18 @@ class SqliteIndex(object):
                 CREATE TABLE sequences (
                     id VARCHAR UNIQUE PRIMARY KEY,
                     fileNumber INTEGER,
-                    offset INTEGER
+                    offset INTEGER,
+                    length INTEGER,
+                    lineLength INTEGER,
+                    extent INTEGER
                 );
             ''')
             self._connection.commit()
+            self._hasExtents = True
+        else:
+            columns = set(row[1] for row in self._connection.execute(
+                'PRAGMA table_info(sequences)'))
+            self._hasExtents = 'extent' in columns
 
     def _getFilename(self, fileNumber):
         """
@@ -270,13 +925,10 @@ class SqliteIndex(object):
         @return: A C{str} file name or C{None} if a file with that number
             has not been added.
         """
-        cur = self._connection.cursor()
-        cur.execute('SELECT name FROM files WHERE id = ?', (fileNumber,))
-        row = cur.fetchone()
-        if row is None:
-            return None
-        else:
-            return row[0]
+        if self._filenames is None:
+            self._filenames = dict(self._connection.execute(
+                'SELECT id, name FROM files'))
+        return self._filenames.get(fileNumber)
 
     def _getFileNumber(self, filename):
         """
@@ -313,6 +965,8 @@ class SqliteIndex(object):
         else:
             fileNumber = cur.lastrowid
             self._connection.commit()
+            if self._filenames is not None:
+                self._filenames[fileNumber] = filename
             return fileNumber
 
     def addFile(self, filename):
@@ -343,13 +997,41 @@ class SqliteIndex(object):
             useBgzf = False
 
         fileNumber = self._addFilename(filename)
+
+        if useBgzf:
+            fp = open(filename, 'rb')
+            records = _bgzfFastaRecordExtents(fp)
+        else:
+            fp = open(filename)
+            records = _fastaRecordExtents(fp)
+
         connection = self._connection
-        count = 0
-        try:
+
+        if not self._hasExtents:
+            # A database made by an earlier version. Add the new columns
+            # (which will be NULL for previously added sequences).
             with connection:
-                if useBgzf:
+                for column in 'length', 'lineLength', 'extent':
+                    connection.execute(
+                        'ALTER TABLE sequences ADD COLUMN %s INTEGER' %
+                        column)
+            self._hasExtents = True
+
+        with fp, self._bulkLoad():
+            # Sequence ids and offsets are first put into a temporary table
+            # that has no index, and then copied (sorted by id) into the
+            # sequences table. Inserting in id order is much faster than
+            # updating the id index in file order.
+            connection.execute(
+                'CREATE TEMP TABLE newSequences (id VARCHAR, offset INTEGER, '
+                'length INTEGER, lineLength INTEGER, extent INTEGER)')
+            try:
+                with connection:
                     try:
-                        fp = bgzf.open(filename, 'rb')
+                        count = connection.executemany(
+                            'INSERT INTO newSequences(id, offset, length, '
+                            'lineLength, extent) VALUES (?, ?, ?, ?, ?)',
+                            records).rowcount
                     except ValueError as e:
                         if str(e).find('BGZF') > -1:
                             raise ValueError(
@@ -358,50 +1040,85 @@ class SqliteIndex(object):
                                 '(instead of gzip) to compresss your FASTA.')
                         else:
                             raise
-                    else:
-                        try:
-                            for line in fp:
-                                if line[0] == '>':
-                                    count += 1
-                                    id_ = line[1:].rstrip(' \t\n\r')
-                                    connection.execute(
-                                        'INSERT INTO sequences(id, '
-                                        'fileNumber, offset) VALUES (?, ?, ?)',
-                                        (id_, fileNumber, fp.tell()))
-                        finally:
-                            fp.close()
-                else:
-                    with open(filename) as fp:
-                        offset = 0
-                        for line in fp:
-                            offset += len(line)
-                            if line[0] == '>':
-                                count += 1
-                                id_ = line[1:].rstrip(' \t\n\r')
-                                connection.execute(
-                                    'INSERT INTO sequences(id, fileNumber, '
-                                    'offset) VALUES (?, ?, ?)',
-                                    (id_, fileNumber, offset))
-        except sqlite3.IntegrityError as e:
-            if str(e).find('UNIQUE constraint failed') > -1:
-                original = self._find(id_)
-                if original is None:
-                    # The id must have appeared twice in the current file,
-                    # because we could not look it up in the database
-                    # (i.e., it was INSERTed but not committed).
-                    raise ValueError(
-                        "FASTA sequence id '%s' found twice in file '%s'." %
-                        (id_, filename))
-                else:
-                    origFilename, _ = original
-                    raise ValueError(
-                        "FASTA sequence id '%s', found in file '%s', was "
-                        "previously added from file '%s'." %
-                        (id_, filename, origFilename))
-            else:
-                raise
+                    try:
+                        connection.execute(
+                            'INSERT INTO sequences(id, fileNumber, offset, '
+                            'length, lineLength, extent) '
+                            'SELECT id, ?, offset, length, lineLength, '
+                            'extent FROM newSequences ORDER BY id',
+                            (fileNumber,))
+                    except sqlite3.IntegrityError as e:
+                        if str(e).find('UNIQUE constraint failed') > -1:
+                            self._raiseDuplicateIdError(filename)
+                        raise
+            finally:
+                connection.execute('DROP TABLE newSequences')
+
+        return count
+
+    @contextmanager
+    def _bulkLoad(self):
+        """
+        Make a context in which the database is tuned for adding many rows.
+
+        Writes are not synced to disk and the rollback journal is kept in
+        memory. If the process is interrupted, the database may be left
+        corrupt, which is acceptable when building an index (which can
+        simply be rebuilt). The previous settings are restored on exit.
+
+        @return: A generator that can be turned into a context manager via
+            L{contextlib.contextmanager}.
+        """
+        connection = self._connection
+        synchronous = connection.execute('PRAGMA synchronous').fetchone()[0]
+        journalMode = connection.execute('PRAGMA journal_mode').fetchone()[0]
+        connection.execute('PRAGMA synchronous = OFF')
+        connection.execute('PRAGMA journal_mode = MEMORY')
+        try:
+            yield
+        finally:
+            connection.execute('PRAGMA journal_mode = %s' % journalMode)
+            connection.execute('PRAGMA synchronous = %d' % synchronous)
+
+    def _raiseDuplicateIdError(self, filename):
+        """
+        Raise a C{ValueError} for the first sequence id in the file being
+        added (i.e., in the temporary newSequences table) that is a
+        duplicate. That is the id that would have caused an error if the
+        sequences had been added one at a time, in file order.
+
+        @param filename: The C{str} name of the file being added.
+        @raise ValueError: Always.
+        """
+        connection = self._connection
+        connection.execute(
+            'CREATE INDEX temp.newSequencesIndex ON newSequences(id)')
+
+        # The first sequence in the file whose id was seen earlier in the
+        # file.
+        sameFile = connection.execute(
+            'SELECT n.rowid, n.id FROM newSequences n WHERE EXISTS ('
+            'SELECT 1 FROM newSequences m WHERE m.id = n.id AND '
+            'm.rowid < n.rowid) ORDER BY n.rowid LIMIT 1').fetchone()
+
+        # The first sequence in the file whose id is in an earlier file.
+        earlierFile = connection.execute(
+            'SELECT n.rowid, n.id FROM newSequences n WHERE EXISTS ('
+            'SELECT 1 FROM sequences s WHERE s.id = n.id) '
+            'ORDER BY n.rowid LIMIT 1').fetchone()
+
+        if earlierFile is None or (sameFile is not None and
+                                   sameFile[0] < earlierFile[0]):
+            raise ValueError(
+                "FASTA sequence id '%s' found twice in file '%s'." %
+                (sameFile[1], filename))
         else:
-            return count
+            id_ = earlierFile[1]
+            origFilename, _ = self._find(id_)
+            raise ValueError(
+                "FASTA sequence id '%s', found in file '%s', was "
+                "previously added from file '%s'." %
+                (id_, filename, origFilename))
 
     def _find(self, id_):
         """
@@ -420,6 +1137,128 @@ class SqliteIndex(object):
         else:
             return self._getFilename(row[0]), row[1]
 
+    def _fastaFilename(self, filename):
+        """
+        Get the name of the file a sequence should be read from.
+
+        @param filename: The C{str} name of a file given to C{addFile}.
+        @return: The C{str} name of the file to read. If a FASTA directory
+            was provided, this is in that directory.
+        """
+        if self._fastaDirectory:
+            return os.path.join(self._fastaDirectory,
+                                os.path.basename(filename))
+        else:
+            return filename
+
+    @staticmethod
+    def _openFasta(filename):
+        """
+        Open a FASTA file for reading sequences.
+
+        @param filename: The C{str} name of the file.
+        @return: An open text file handle, which will read decompressed data
+            if C{filename} ends in '.gz' or '.bgz'.
+        """
+        endswith = filename.lower().endswith
+        if endswith('.bgz') or endswith('.gz'):
+            return bgzf.open(filename, 'rt')
+        else:
+            return open(filename)
+
+    @staticmethod
+    def _readSequence(fp, offset, extent):
+        """
+        Read a sequence from a FASTA file.
+
+        @param fp: An open text file handle, from C{_openFasta}.
+        @param offset: The C{int} offset of the sequence in the file.
+        @param extent: The C{int} number of characters the sequence occupies,
+            or C{None} if this is not known.
+        @return: The C{str} sequence.
+        """
+        fp.seek(offset)
+        if extent is None:
+            # The sequence was indexed by an earlier version, so its lines
+            # must be read until the next header (or EOF).
+            lines = []
+            while True:
+                line = fp.readline()
+                if not line or line[0] == '>':
+                    break
+                lines.append(line.rstrip('\n\r'))
+            return ''.join(lines)
+        else:
+            return fp.read(extent).replace('\n', '').replace('\r', '')
+
+    def _fastaFile(self, fileNumber):
+        """
+        Get an open FASTA file.
+
+        @param fileNumber: The C{int} number of the file.
+        @return: An open text file handle, from C{_openFasta}.
+        """
+        openFiles = self._openFiles
+        try:
+            # Remove and re-add, to make this the most recently used file.
+            fp = openFiles.pop(fileNumber)
+        except KeyError:
+            if len(openFiles) >= self._maxOpenFiles:
+                openFiles.popitem(last=False)[1].close()
+            fp = self._openFasta(
+                self._fastaFilename(self._getFilename(fileNumber)))
+        openFiles[fileNumber] = fp
+        return fp
+
+    def _cached(self, id_):
+        """
+        Get a sequence from the cache.
+
+        @param id_: A C{str} sequence id.
+        @return: The C{str} sequence or C{None} if it is not cached.
+        """
+        try:
+            sequence = self._cache.pop(id_)
+        except KeyError:
+            return None
+        self._cache[id_] = sequence
+        return sequence
+
+    def _addToCache(self, id_, sequence):
+        """
+        Add a sequence to the cache, removing the least recently used
+        sequences if need be to keep within the cache size.
+
+        @param id_: A C{str} sequence id.
+        @param sequence: The C{str} sequence.
+        """
+        length = len(sequence)
+        if length > self._cacheSize:
+            return
+        cache = self._cache
+        self._cachedLength += length
+        while self._cachedLength > self._cacheSize:
+            self._cachedLength -= len(cache.popitem(last=False)[1])
+        cache[id_] = sequence
+
+    def _sequence(self, id_, fileNumber, offset, extent):
+        """
+        Get a sequence, from the cache or from its FASTA file.
+
+        @param id_: A C{str} sequence id.
+        @param fileNumber: The C{int} number of the file the sequence is in.
+        @param offset: The C{int} offset of the sequence in the file.
+        @param extent: The C{int} number of characters the sequence occupies,
+            or C{None} if this is not known.
+        @return: The C{str} sequence.
+        """
+        sequence = self._cached(id_)
+        if sequence is None:
+            sequence = self._readSequence(self._fastaFile(fileNumber), offset,
+                                          extent)
+            self._addToCache(id_, sequence)
+        return sequence
+
     def __getitem__(self, id_):
         """
         Return a read, given its id.
@@ -428,39 +1267,151 @@ class SqliteIndex(object):
         @raise KeyError: If C{id_} is not a known sequence.
         @return: A read of our read class.
         """
-        location = self._find(id_)
-        if location is None:
-            raise KeyError('Unknown sequence: %r' % id_)
-        else:
-            filename, offset = location
-            # If a FASTA directory was provided, look for the FASTA files
-            # there, otherwise use the filename that was given to addFile.
-            if self._fastaDirectory:
-                filename = os.path.join(self._fastaDirectory,
-                                        os.path.basename(filename))
-
-            endswith = filename.lower().endswith
-            if endswith('.bgz') or endswith('.gz'):
-                opener = bgzf.open
-            else:
-                opener = open
-
-            sequence = ''
-            with opener(filename) as fp:
-                fp.seek(offset)
-                while True:
-                    line = fp.readline()
-                    if not line:
-                        # EOF
-                        break
-                    elif line[0] == '>':
-                        # We found the next sequence identifier.
-                        break
-                    else:
-                        sequence += line.rstrip('\n\r')
-
-            return self._readClass(id_, sequence)
+        sequence = self._cached(id_)
+        if sequence is None:
+            row = self._connection.execute(
+                'SELECT fileNumber, offset, %s FROM sequences WHERE id = ?' %
+                ('extent' if self._hasExtents else 'NULL'),
+                (id_,)).fetchone()
+            if row is None:
+                raise KeyError('Unknown sequence: %r' % id_)
+            sequence = self._sequence(id_, *row)
+
+        return self._readClass(id_, sequence)
+
+    def getMany(self, ids):
+        """
+        Get many reads, given their ids.
+
+        The locations of all sequences are found before any are read. The
+        sequences are then read in file and offset order.
+
+        @param ids: An iterable of C{str} sequence ids.
+        @raise KeyError: If any id is not a known sequence.
+        @return: A generator that yields reads of our read class, in the
+            order they are found in the FASTA files (not in the order of
+            C{ids}). Each read is yielded once, even if its id is repeated
+            in C{ids}.
+        """
+        ids = list(set(ids))
+        locations = []
+        for start in range(0, len(ids), SQLITE_MAX_VARIABLES):
+            chunk = ids[start:start + SQLITE_MAX_VARIABLES]
+            locations.extend(self._connection.execute(
+                'SELECT fileNumber, offset, %s, id FROM sequences '
+                'WHERE id IN (%s)' %
+                ('extent' if self._hasExtents else 'NULL',
+                 ', '.join('?' * len(chunk))), chunk))
+
+        if len(locations) != len(ids):
+            missing = set(ids).difference(
+                location[3] for location in locations)
+            raise KeyError('Unknown sequence: %r' % sorted(missing)[0])
+
+        locations.sort()
+        return self._readLocations(locations)
+
+    def _readLocations(self, locations):
+        """
+        Read sequences.
+
+        @param locations: An iterable of (fileNumber, offset, extent, id)
+            4-tuples.
+        @return: A generator that yields reads of our read class.
+        """
+        readClass = self._readClass
+        for fileNumber, offset, extent, id_ in locations:
+            yield readClass(id_,
+                            self._sequence(id_, fileNumber, offset, extent))
+
+    def getLength(self, id_):
+        """
+        Get the length of a sequence, without reading it (unless the sequence
+        was indexed by an earlier version that did not store lengths).
+
+        @param id_: A C{str} sequence id.
+        @raise KeyError: If C{id_} is not a known sequence.
+        @return: The C{int} length of the sequence.
+        """
+        if self._hasExtents:
+            row = self._connection.execute(
+                'SELECT length FROM sequences WHERE id = ?',
+                (id_,)).fetchone()
+            if row is None:
+                raise KeyError('Unknown sequence: %r' % id_)
+            if row[0] is not None:
+                return row[0]
+
+        return len(self[id_])
 
     def close(self):
+        """
+        Close the database and any open FASTA files.
+        """
+        for fp in self._openFiles.values():
+            fp.close()
+        self._openFiles.clear()
+        self._cache.clear()
+        self._cachedLength = 0
         self._connection.close()
         self._connection = None
+
+
+def fastaIndex(filename, readClass=DNARead):
+    """
+    Get an on-disk index for looking up the reads in a FASTA file by id,
+    making the index if there is no up-to-date one.
+
+    An uncompressed FASTA file whose sequences all have lines of the same
+    length is memory mapped and indexed with a samtools C{.fai} file (see
+    L{FastaMmapReads}). Other FASTA (e.g., BGZF compressed, or with lines of
+    different lengths) is indexed with an L{SqliteIndex} in a file with the
+    name of the FASTA file plus ".sqlite". In both cases the index is kept
+    next to the FASTA file so it can be used again, or (if that directory is
+    not writable) is only kept in memory.
+
+    @param filename: The C{str} name of a FASTA file.
+    @param readClass: The class of read that should be returned by lookups.
+    @raise ValueError: If C{filename} cannot be indexed (e.g., it is
+        compressed in a format other than BGZF, or a sequence id occurs more
+        than once).
+    @return: A L{FastaMmapReads} or L{SqliteIndex} instance.
+    """
+    try:
+        return FastaMmapReads(filename, readClass=readClass)
+    except ValueError:
+        pass
+
+    dbFilename = filename + '.sqlite'
+    try:
+        current = os.path.getmtime(dbFilename) >= os.path.getmtime(filename)
+    except OSError:
+        current = False
+
+    if current:
+        return SqliteIndex(dbFilename, readClass=readClass)
+
+    # Build the database under a temporary name, so an interrupted build
+    # does not leave a database that would later be taken to be complete.
+    tmpFilename = dbFilename + '.tmp'
+    try:
+        for name in dbFilename, tmpFilename:
+            if os.path.exists(name):
+                os.unlink(name)
+        index = SqliteIndex(tmpFilename, readClass=readClass)
+    except (OSError, sqlite3.Error):
+        # The directory is not writable.
+        index = SqliteIndex(':memory:', readClass=readClass)
+        index.addFile(filename)
+        return index
+
+    try:
+        index.addFile(filename)
+    except Exception:
+        index.close()
+        os.unlink(tmpFilename)
+        raise
+    index.close()
+    os.rename(tmpFilename, dbFilename)
+
+    return SqliteIndex(dbFilename, readClass=readClass)
@@ -1,6 +1,6 @@
 from six import PY3
-from Bio import SeqIO
 
+from dark.fasta import fastaRecords
 from dark.reads import Reads, SSAARead
 from dark.utils import asHandle
 
@@ -17,7 +17,7 @@ class SSFastaReads(Reads):
     downloaded from http://www.rcsb.org/pdb/files/ss.txt on 11/11/2015
 
     IMPORTANT NOTE: the ss.txt file contains spaces in the structure
-    records.  SeqIO.parse will silently collapse these to nothing, which
+    records. Our FASTA parser will silently collapse these to nothing, which
     will result in unequal length sequence and structure strings. So you
     will need to replace the spaces in that file with something else, like
     '-', to make sure the structure information has the correct length and
@@ -52,35 +52,30 @@ class SSFastaReads(Reads):
         upperCase = self._upperCase
         for _file in self._files:
             with asHandle(_file) as fp:
-                records = SeqIO.parse(fp, 'fasta')
+                records = fastaRecords(fp)
                 while True:
                     try:
-                        record = next(records)
+                        id_, sequence = next(records)
                     except StopIteration:
                         break
 
                     try:
-                        structureRecord = next(records)
+                        structureId, structure = next(records)
                     except StopIteration:
                         raise ValueError('Structure file %r has an odd number '
                                          'of records.' % _file)
 
-                    if len(structureRecord) != len(record):
+                    if len(structure) != len(sequence):
                         raise ValueError(
                             'Sequence %r length (%d) is not equal to '
                             'structure %r length (%d) in input file %r.' % (
-                                record.description, len(record),
-                                structureRecord.description,
-                                len(structureRecord), _file))
+                                id_, len(sequence), structureId,
+                                len(structure), _file))
 
                     if upperCase:
-                        read = self._readClass(
-                            record.description,
-                            str(record.seq.upper()),
-                            str(structureRecord.seq.upper()))
+                        read = self._readClass(id_, sequence.upper(),
+                                               structure.upper())
                     else:
-                        read = self._readClass(record.description,
-                                               str(record.seq),
-                                               str(structureRecord.seq))
+                        read = self._readClass(id_, sequence, structure)
 
                     yield read
@@ -1,9 +1,144 @@
 from six import PY3
-
-from Bio.SeqIO.QualityIO import FastqGeneralIterator
+from operator import methodcaller
 
 from dark.reads import Reads, DNARead
-from dark.utils import asHandle
+from dark.utils import iterHandles, lineAlignedBlocks
+
+# The number of characters to ask for in each read() when parsing FASTQ.
+FASTQ_BLOCK_SIZE = 1 << 20
+
+_startsWithAt = methodcaller('startswith', '@')
+_startsWithPlus = methodcaller('startswith', '+')
+
+
+def _fastqLines(fp, blockSize):
+    """
+    Read FASTQ from an open file handle in large blocks and yield lists of
+    lines that each contain a whole number of 4-line records.
+
+    @param fp: An open file handle containing FASTQ.
+    @param blockSize: The C{int} number of characters to read at a time.
+    @raise ValueError: If the input does not contain a multiple of four
+        (non-blank) lines.
+    @return: A generator that yields C{list}s of C{str} lines, with line
+        endings removed. The length of each list is a multiple of four.
+        Blank lines at the end of the input are not yielded.
+    """
+    leftover = []
+    for block in lineAlignedBlocks(fp, blockSize):
+        if '\r' in block:
+            block = block.replace('\r', '')
+        lines = block.split('\n')
+        # A block ends with a newline unless it is the final one, so
+        # there is (usually) an empty string at the end of the split.
+        if lines[-1] == '':
+            lines.pop()
+        if leftover:
+            lines = leftover + lines
+        # Hold back blank lines at the end of the block, as they may be at
+        # the end of the input (if not, they will be found to be invalid
+        # once later lines are added to them).
+        end = len(lines)
+        while end and not lines[end - 1].strip():
+            end -= 1
+        end -= end % 4
+        leftover = lines[end:]
+        del lines[end:]
+        if lines:
+            yield lines
+
+    # Blank lines at the very end of the input are ignored, unless they
+    # complete the final record (whose sequence and quality may be empty).
+    # The leftover lines always start at the beginning of a record.
+    end = len(leftover)
+    while end and not leftover[end - 1].strip():
+        end -= 1
+    recordsEnd = end + (-end % 4)
+
+    if recordsEnd > len(leftover):
+        raise ValueError(
+            'FASTQ input ended with an incomplete record (%d line%s): %r.' % (
+                end, '' if end == 1 else 's', leftover[0]))
+
+    if end:
+        yield leftover[:recordsEnd]
+
+
+def _checkFastqRecords(headers, sequences, pluses, qualities):
+    """
+    Check the structure of a batch of FASTQ records.
+
+    All checks are made on the batch as a whole. Only if a check fails is
+    the batch examined record by record to produce an error message.
+
+    @param headers: A C{list} of C{str} record header lines.
+    @param sequences: A C{list} of C{str} record sequence lines.
+    @param pluses: A C{list} of C{str} record '+' lines.
+    @param qualities: A C{list} of C{str} record quality lines.
+    @raise ValueError: If any record is invalid.
+    """
+    if (all(map(_startsWithAt, headers)) and
+            all(map(_startsWithPlus, pluses)) and
+            list(map(len, sequences)) == list(map(len, qualities))):
+        return
+
+    for header, sequence, plus, quality in zip(headers, sequences, pluses,
+                                               qualities):
+        if not header.startswith('@'):
+            raise ValueError(
+                'FASTQ record header line %r does not start with @.' % header)
+        if not plus.startswith('+'):
+            raise ValueError(
+                'Third line of FASTQ record %r does not start with +.' %
+                header[1:])
+        if len(sequence) != len(quality):
+            raise ValueError(
+                'FASTQ record %r has sequence length (%d) != quality length '
+                '(%d).' % (header[1:], len(sequence), len(quality)))
+
+
+def fastqRecords(fp, blockSize=FASTQ_BLOCK_SIZE):
+    """
+    Parse 4-line FASTQ records from an open file handle.
+
+    Input is read in large blocks, each of which is split into lines and
+    checked for valid record structure in one go. Note that multi-line
+    (wrapped) FASTQ sequences are not supported.
+
+    @param fp: An open file handle containing FASTQ.
+    @param blockSize: The C{int} number of characters to read at a time.
+    @raise ValueError: If the input contains an invalid record.
+    @return: A generator that yields (id, sequence, quality) C{str}
+        3-tuples.
+    """
+    for lines in _fastqLines(fp, blockSize):
+        headers = lines[0::4]
+        sequences = lines[1::4]
+        qualities = lines[3::4]
+        _checkFastqRecords(headers, sequences, lines[2::4], qualities)
+        # Line endings have already been removed, so only ids need to be
+        # stripped (of trailing spaces and tabs, as Bio.SeqIO does).
+        ids = [header[1:].rstrip() for header in headers]
+        for record in zip(ids, sequences, qualities):
+            yield record
+
+
+def fastqSequenceLengths(fp, blockSize=FASTQ_BLOCK_SIZE):
+    """
+    Find the lengths of the sequences in FASTQ input, without making read
+    instances or stripping ids. The input is checked in the same way (and
+    trailing blank lines are ignored) as by C{fastqRecords}.
+
+    @param fp: An open file handle containing FASTQ.
+    @param blockSize: The C{int} number of characters to read at a time.
+    @raise ValueError: If the input contains an invalid record.
+    @return: A generator that yields C{int} sequence lengths.
+    """
+    for lines in _fastqLines(fp, blockSize):
+        sequences = lines[1::4]
+        _checkFastqRecords(lines[0::4], sequences, lines[2::4], lines[3::4])
+        for length in map(len, sequences):
+            yield length
 
 
 class FastqReads(Reads):
@@ -12,12 +147,17 @@ class FastqReads(Reads):
 
     @param _files: Either a single C{str} file name or file handle, or a
         C{list} of C{str} file names and/or file handles. Each file or file
-        handle must contain sequences in FASTQ format.
+        handle must contain sequences in (4-line per record) FASTQ format.
     @param readClass: The class of read that should be yielded by iter.
+    @param threads: An C{int} number of threads to use for reading and
+        decompressing files (see L{dark.utils.openFile}). If non-zero, each
+        file after the first is opened (and starts being read in the
+        background) while the previous one is being processed.
     """
-    def __init__(self, _files, readClass=DNARead):
+    def __init__(self, _files, readClass=DNARead, threads=0):
         self._files = _files if isinstance(_files, (list, tuple)) else [_files]
         self.readClass = readClass
+        self._threads = threads
         if PY3:
             super().__init__()
         else:
@@ -28,11 +168,7 @@ class FastqReads(Reads):
         Iterate over the sequences in the files in self.files_, yielding each
         as an instance of the desired read class.
         """
-        for _file in self._files:
-            with asHandle(_file) as fp:
-                # Use FastqGeneralIterator because it provides access to
-                # the unconverted quality string (i.e., it doesn't try to
-                # figure out the numeric quality values, which we don't
-                # care about at this point).
-                for sequenceId, sequence, quality in FastqGeneralIterator(fp):
-                    yield self.readClass(sequenceId, sequence, quality)
+        readClass = self.readClass
+        for _, fp in iterHandles(self._files, threads=self._threads):
+            for sequenceId, sequence, quality in fastqRecords(fp):
+                yield readClass(sequenceId, sequence, quality)
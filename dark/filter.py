@@ -241,6 +241,38 @@ def addFASTAFilteringCommandLineOptions(parser):
         help=('Duplicate reads will be removed, based only on '
               'read id. The first occurrence is kept.'))
 
+    parser.add_argument(
+        '--removeDuplicatesUseMD5', action='store_true', default=False,
+        help=('Use MD5 digests of sequences (and/or ids) to detect duplicates '
+              'when using --removeDuplicates (and/or --removeDuplicatesById). '
+              'This uses far less memory than keeping the full sequences.'))
+
+    parser.add_argument(
+        '--removeDuplicatesIgnoreCase', action='store_true', default=False,
+        help=('When using --removeDuplicates, consider sequences that differ '
+              'only in case to be duplicates.'))
+
+    parser.add_argument(
+        '--removeDuplicatesReverseComplement', action='store_true',
+        default=False,
+        help=('When using --removeDuplicates, consider a (DNA) sequence to be '
+              'a duplicate of its reverse complement.'))
+
+    parser.add_argument(
+        '--removeDuplicatesDatabase', metavar='FILENAME',
+        help=('The name of an SQLite database file in which to keep MD5 '
+              'digests of seen sequences (and/or ids) when using '
+              '--removeDuplicates (and/or --removeDuplicatesById), to bound '
+              'memory use for very large inputs. Any existing duplicate '
+              'tracking tables in the file will be overwritten.'))
+
+    parser.add_argument(
+        '--removeDuplicatesExpectedCount', type=int, metavar='N',
+        help=('When using --removeDuplicatesDatabase, the number of distinct '
+              'sequences (and/or ids) expected. This sets the size of the '
+              'in-memory filter used to avoid database lookups. If not '
+              'given, --trueLength is used if it is given, else 10000000.'))
+
     # See the docstring for dark.reads.Reads.filter for more detail on
     # randomSubset.
     parser.add_argument(
@@ -296,6 +328,12 @@ def parseFASTAFilteringCommandLineOptions(args, reads):
         keepSequences=keepSequences, removeSequences=removeSequences,
         head=args.head, removeDuplicates=args.removeDuplicates,
         removeDuplicatesById=args.removeDuplicatesById,
+        removeDuplicatesUseMD5=args.removeDuplicatesUseMD5,
+        removeDuplicatesIgnoreCase=args.removeDuplicatesIgnoreCase,
+        removeDuplicatesReverseComplement=(
+            args.removeDuplicatesReverseComplement),
+        removeDuplicatesDatabase=args.removeDuplicatesDatabase,
+        removeDuplicatesExpectedCount=args.removeDuplicatesExpectedCount,
         randomSubset=args.randomSubset, trueLength=args.trueLength,
         sampleFraction=args.sampleFraction,
         sequenceNumbersFile=args.sequenceNumbersFile)
@@ -674,6 +674,11 @@ def alignmentPanelHTML(titlesAlignments, sortOn='maxScore',
 
     htmlWriter = AlignmentPanelHTMLWriter(outputDir, titlesAlignments)
 
+    if showOrfs:
+        # Each graph needs its subject sequence. Reading them all at once is
+        # much faster than reading them one by one.
+        titlesAlignments.readsAlignments.prefetchSubjectSequences(titles)
+
     for i, title in enumerate(titles):
         # titleAlignments = titlesAlignments[title]
 
@@ -1,9 +1,37 @@
-from functools import total_ordering
+import six
 
 from dark.score import HigherIsBetterScore, LowerIsBetterScore
 
 
-@total_ordering
+class HSPNormalizationError(Exception):
+    "The offsets of a lazily normalized HSP/LSP could not be computed."
+
+
+def normalizeLazily(readId, subjectTitle, normalizeHSP, *args, **kwargs):
+    """
+    Call a C{normalizeHSP} function for a lazily normalized HSP/LSP (see the
+    C{normalize} argument of L{_Base}), reporting the read and subject
+    if it fails. Pass this to C{functools.partial} to make the
+    C{normalize} function.
+
+    @param readId: The C{str} id of the read.
+    @param subjectTitle: The C{str} title of the subject.
+    @param normalizeHSP: The C{normalizeHSP} function to call (from
+        C{dark/blast/hsp.py} or C{dark/diamond/hsp.py}).
+    @param args: Positional arguments for C{normalizeHSP}.
+    @param kwargs: Keyword arguments for C{normalizeHSP}.
+    @raise HSPNormalizationError: If C{normalizeHSP} raises.
+    @return: The C{dict} returned by C{normalizeHSP}.
+    """
+    try:
+        return normalizeHSP(*args, **kwargs)
+    except Exception as e:
+        six.raise_from(HSPNormalizationError(
+            'Could not normalize HSP offsets for read %r matching subject '
+            '%r: %s: %s' % (readId, subjectTitle, e.__class__.__name__, e)),
+            e)
+
+
 class _Base(object):
     """
     Holds information about a matching region from a read alignment.
@@ -62,30 +90,102 @@ class _Base(object):
         and query had a positive score in the scoring matrix used during
         matching (this is probably only different from the C{identicalCount}
         when matching amino acids (i.e., not nucleotides).
+    @param normalize: If not C{None}, a function of no arguments that returns
+        a C{dict} with C{readStart}, C{readEnd}, C{readStartInSubject},
+        C{readEndInSubject}, C{subjectStart}, and C{subjectEnd} keys (e.g., a
+        call to C{normalizeHSP} in C{dark/blast/hsp.py} or
+        C{dark/diamond/hsp.py}). It is called the first time any of those
+        attributes is accessed, and the values passed for them here are
+        ignored. This allows readers to avoid the cost of normalizing HSPs
+        that are filtered out before their offsets are ever looked at. Note
+        that this means an error in normalizing is raised when an offset is
+        first accessed, not when the instance is made. Use
+        C{normalizeLazily} to have the error give the read id and subject
+        title.
+
+    There may be a very large number of instances, so __slots__ is used to
+    save memory, and subclasses define their comparison methods directly
+    on the numeric score to make sorting faster.
     """
+    __slots__ = (
+        'readStart', 'readEnd', 'readStartInSubject', 'readEndInSubject',
+        'readFrame', 'subjectStart', 'subjectEnd', 'subjectFrame',
+        'readMatchedSequence', 'subjectMatchedSequence', 'identicalCount',
+        'positiveCount', 'score', '_normalize')
+
+    # The attributes whose values may be computed lazily.
+    NORMALIZED_ATTRIBUTES = frozenset((
+        'readStart', 'readEnd', 'readStartInSubject', 'readEndInSubject',
+        'subjectStart', 'subjectEnd'))
+
     def __init__(self, readStart=None, readEnd=None, readStartInSubject=None,
                  readEndInSubject=None, readFrame=None, subjectStart=None,
                  subjectEnd=None, subjectFrame=None, readMatchedSequence=None,
                  subjectMatchedSequence=None, identicalCount=None,
-                 positiveCount=None):
-        self.readStart = readStart
-        self.readEnd = readEnd
-        self.readStartInSubject = readStartInSubject
-        self.readEndInSubject = readEndInSubject
+                 positiveCount=None, normalize=None):
+        if normalize is None:
+            self.readStart = readStart
+            self.readEnd = readEnd
+            self.readStartInSubject = readStartInSubject
+            self.readEndInSubject = readEndInSubject
+            self.subjectStart = subjectStart
+            self.subjectEnd = subjectEnd
+        else:
+            self._normalize = normalize
         self.readFrame = readFrame
-        self.subjectStart = subjectStart
-        self.subjectEnd = subjectEnd
         self.subjectFrame = subjectFrame
         self.readMatchedSequence = readMatchedSequence
         self.subjectMatchedSequence = subjectMatchedSequence
         self.identicalCount = identicalCount
         self.positiveCount = positiveCount
 
-    def __lt__(self, other):
-        return self.score < other.score
+    def __getattr__(self, name):
+        """
+        Compute the normalized offsets of a lazy instance when one of them is
+        first asked for.
+
+        Note that this is only called when normal attribute lookup fails, so
+        it costs nothing once the offsets have been set.
+
+        @param name: The C{str} name of the attribute being looked up.
+        @raise AttributeError: If C{name} is not a lazily computed attribute.
+        @raise HSPNormalizationError: If the normalize function raises
+            C{AttributeError} (which would otherwise be taken to mean that
+            C{name} is not an attribute).
+        @return: The value of the C{name} attribute.
+        """
+        # Note that looking up self._normalize when it is not set (in a
+        # non-lazy instance, or one whose offsets have already been
+        # computed) calls this method again, which then raises
+        # AttributeError because '_normalize' is not a lazy attribute.
+        if name in self.NORMALIZED_ATTRIBUTES:
+            try:
+                normalize = self._normalize
+            except AttributeError:
+                normalize = None
+        else:
+            normalize = None
+
+        if normalize is None:
+            raise AttributeError('%r object has no attribute %r' %
+                                 (self.__class__.__name__, name))
+
+        try:
+            normalized = normalize()
+        except AttributeError as e:
+            six.raise_from(HSPNormalizationError(
+                'Could not normalize HSP offsets (looking up %r): '
+                'AttributeError: %s' % (name, e)), e)
+        del self._normalize
+        for attr in self.NORMALIZED_ATTRIBUTES:
+            setattr(self, attr, normalized[attr])
+        return normalized[name]
 
     def __eq__(self, other):
-        return self.score == other.score
+        return self.score.score == other.score.score
+
+    def __ne__(self, other):
+        return self.score.score != other.score.score
 
     def betterThan(self, score):
         """
@@ -126,10 +226,24 @@ class HSP(_Base):
     @param score: The numeric score of this HSP.
     """
 
+    __slots__ = ()
+
     def __init__(self, score, **kwargs):
         _Base.__init__(self, **kwargs)
         self.score = HigherIsBetterScore(score)
 
+    def __lt__(self, other):
+        return self.score.score < other.score.score
+
+    def __le__(self, other):
+        return self.score.score <= other.score.score
+
+    def __gt__(self, other):
+        return self.score.score > other.score.score
+
+    def __ge__(self, other):
+        return self.score.score >= other.score.score
+
     def toDict(self):
         """
         Get information about the HSP as a dictionary.
@@ -149,10 +263,24 @@ class LSP(_Base):
     @param score: The numeric score of this LSP.
     """
 
+    __slots__ = ()
+
     def __init__(self, score, **kwargs):
         _Base.__init__(self, **kwargs)
         self.score = LowerIsBetterScore(score)
 
+    def __lt__(self, other):
+        return self.score.score > other.score.score
+
+    def __le__(self, other):
+        return self.score.score >= other.score.score
+
+    def __gt__(self, other):
+        return self.score.score < other.score.score
+
+    def __ge__(self, other):
+        return self.score.score <= other.score.score
+
     def toDict(self):
         """
         Get information about the LSP as a dictionary.
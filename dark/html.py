@@ -3,6 +3,7 @@ from __future__ import print_function
 from IPython.display import HTML
 
 from dark.fastq import FastqReads
+from dark.reads import ReadsWriter
 
 
 def NCBISequenceLinkURL(title, default=None):
@@ -288,8 +289,9 @@ img.full-size {
         filename = '%s/%d.%s' % (self._outputDir, i, format_)
         titleAlignments = self._titlesAlignments[image['title']]
         with open(filename, 'w') as fp:
-            for titleAlignment in titleAlignments:
-                fp.write(titleAlignment.read.toString(format_))
+            with ReadsWriter(fp, format_) as writer:
+                writer.writeReads(titleAlignment.read
+                                  for titleAlignment in titleAlignments)
         return format_
 
     def _writeFeatures(self, i, image):
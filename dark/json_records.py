@@ -0,0 +1,63 @@
+from json import loads as _stdlibLoads
+
+from dark.utils import lineAlignedBlocks
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# The number of characters to ask for in each read() when reading lines of
+# JSON.
+JSON_BLOCK_SIZE = 1 << 20
+
+# The names of the JSON decoding backends we can use, fastest first. The
+# stdlib json module is always available.
+JSON_BACKENDS = ('orjson', 'json')
+
+# The backend used if none is asked for.
+DEFAULT_JSON_BACKEND = 'json' if orjson is None else 'orjson'
+
+
+def jsonLoader(backend=None):
+    """
+    Get a function to decode JSON.
+
+    @param backend: The C{str} name of a JSON backend (one of
+        C{JSON_BACKENDS}), or C{None} to use the fastest one available.
+    @raise ValueError: If C{backend} is unknown or is not installed.
+    @return: A one-argument function that takes a C{str} of JSON and returns
+        the decoded value. It raises C{ValueError} if the JSON is invalid.
+    """
+    backend = backend or DEFAULT_JSON_BACKEND
+
+    if backend == 'json':
+        return _stdlibLoads
+    elif backend == 'orjson':
+        if orjson is None:
+            raise ValueError('The orjson JSON backend is not installed.')
+        return orjson.loads
+    else:
+        raise ValueError('Unknown JSON backend %r. Known backends are: %s.' %
+                         (backend, ', '.join(JSON_BACKENDS)))
+
+
+def jsonLines(fp, firstLineNumber=1, blockSize=JSON_BLOCK_SIZE):
+    """
+    Read lines from a file of per-line JSON, reading large blocks at a time.
+
+    @param fp: An open file handle, reading C{str}.
+    @param firstLineNumber: The C{int} number of the next line in C{fp}.
+    @param blockSize: The C{int} number of characters to read at a time.
+    @return: A generator that yields (lineNumber, line) 2-tuples, where
+        C{lineNumber} is an C{int} and C{line} is a C{str} (without its
+        trailing newline).
+    """
+    lineNumber = firstLineNumber
+    for block in lineAlignedBlocks(fp, blockSize):
+        lines = block.split('\n')
+        if lines[-1] == '':
+            lines.pop()
+        for line in lines:
+            yield lineNumber, line
+            lineNumber += 1
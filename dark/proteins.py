@@ -9,10 +9,11 @@ from six.moves.urllib.parse import quote
 from textwrap import fill
 
 from dark.dimension import dimensionalIterator
-from dark.fasta import FastaReads
-from dark.fastq import FastqReads
+from dark.fasta import FastaReads, fastaRecords
+from dark.fastq import FastqReads, fastqSequenceLengths
 from dark.html import NCBISequenceLinkURL
 from dark.reads import Reads
+from dark.utils import asHandle
 
 # The following regex is deliberately greedy (using .*) to consume the
 # whole protein name before backtracking to find the last [pathogen name]
@@ -315,10 +316,24 @@ class ProteinGrouper(object):
             }
 
             if self._saveReadLengths:
-                readsClass = (FastaReads if self._format == 'fasta'
-                              else FastqReads)
-                proteins[proteinName]['readLengths'] = tuple(
-                    len(read) for read in readsClass(readsFilename))
+                proteins[proteinName]['readLengths'] = self._readLengths(
+                    readsFilename)
+
+    def _readLengths(self, filename):
+        """
+        Get the lengths of the reads in a FASTA/FASTQ file, without making
+        read instances.
+
+        @param filename: A C{str} FASTA or FASTQ file name (according to
+            C{self._format}).
+        @return: A C{tuple} of C{int} read lengths.
+        """
+        with asHandle(filename) as fp:
+            if self._format == 'fasta':
+                return tuple(len(sequence)
+                             for _, sequence in fastaRecords(fp))
+            else:
+                return tuple(fastqSequenceLengths(fp))
 
     def _computeUniqueReadCounts(self):
         """
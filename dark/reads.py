@@ -1,17 +1,22 @@
 import sys
 import six
+import multiprocessing
+from multiprocessing import cpu_count
 from os import unlink
 from functools import total_ordering
-from collections import Counter
+from collections import Counter, deque
 from hashlib import md5
 from random import uniform
 
+import numpy as np
 from Bio.Seq import translate
 from Bio.Data.IUPACData import (
     ambiguous_dna_complement, ambiguous_rna_complement)
 
 from dark.aa import AA_LETTERS, NAMES as AA_NAMES
+from dark.dedup import DEFAULT_EXPECTED_COUNT, DuplicateTracker
 from dark.filter import TitleFilter
+from dark.utils import openFileForWriting
 from dark.aa import PROPERTIES, PROPERTY_DETAILS, NONE
 
 
@@ -31,6 +36,81 @@ def _makeComplementTable(complementData):
     return ''.join(map(chr, table))
 
 
+def _asArray(string):
+    """
+    Convert a string to a C{numpy} array with one element per character.
+
+    @param string: A C{str}.
+    @return: A 2-tuple containing a C{numpy} array and the C{str} encoding
+        that was used to make it (and which can be used to decode it). The
+        array will have one byte per character unless C{string} contains
+        characters that cannot be encoded as Latin-1.
+    """
+    try:
+        return (np.frombuffer(string.encode('latin-1'), dtype=np.uint8),
+                'latin-1')
+    except UnicodeError:
+        return (np.frombuffer(string.encode('utf-32-le'), dtype=np.uint32),
+                'utf-32-le')
+
+
+def _selectIndices(string, indices):
+    """
+    Make a string from the characters at certain indices of another string.
+
+    @param string: The C{str} to select characters from.
+    @param indices: A C{numpy} C{int} array of (valid) indices into
+        C{string}.
+    @return: A C{str} with the characters of C{string} at C{indices}.
+    """
+    data, encoding = _asArray(string)
+    return data[indices].tobytes().decode(encoding)
+
+
+class _SiteIndices(object):
+    """
+    Convert a set of sequence sites to be kept or removed into an array of
+    the indices of the sites to keep, for sequences of a given length.
+
+    The index array for the most recent length is cached, so when many reads
+    of the same length (e.g., aligned sequences) are processed, the work is
+    done only once.
+
+    @param sites: A set of C{int} 0-based sites (i.e., indices) in sequences.
+        If C{None}, all sites are kept.
+    @param exclude: If C{True} the C{sites} will be excluded, not included.
+    """
+    def __init__(self, sites, exclude=False):
+        if sites is None:
+            self._sites = None
+        else:
+            self._sites = np.array(sorted(site for site in sites if site >= 0),
+                                   dtype=np.intp)
+        self._exclude = exclude
+        self._length = self._indices = None
+
+    def indices(self, length):
+        """
+        Get the indices of the sites to keep.
+
+        @param length: The C{int} length of a sequence.
+        @return: A sorted C{numpy} C{int} array of the indices to keep.
+        """
+        if length != self._length:
+            if self._sites is None:
+                indices = np.arange(length, dtype=np.intp)
+            else:
+                sites = self._sites[:np.searchsorted(self._sites, length)]
+                if self._exclude:
+                    wanted = np.ones(length, dtype=np.bool_)
+                    wanted[sites] = False
+                    indices = np.flatnonzero(wanted)
+                else:
+                    indices = sites
+            self._length, self._indices = length, indices
+        return self._indices
+
+
 @total_ordering
 class Read(object):
     """
@@ -44,6 +124,11 @@ class Read(object):
     @raise ValueError: if the length of the quality string (if any) does not
         match the length of the sequence.
     """
+    # Reads are created in very large numbers, so instances have no
+    # __dict__. Subclasses that add attributes must declare them in their
+    # own __slots__ (and subclasses that add none should set it to ()).
+    __slots__ = ('id', 'sequence', 'quality')
+
     ALPHABET = None
 
     def __init__(self, id, sequence, quality=None):
@@ -229,29 +314,29 @@ class Read(object):
         Create a new read from self, with only certain sites.
 
         @param sites: A set of C{int} 0-based sites (i.e., indices) in
-            sequences that should be kept. If C{None} (the default), all sites
-            are kept.
+            sequences that should be kept. If C{None}, all sites are kept.
         @param exclude: If C{True} the C{sites} will be excluded, not
             included.
+        @return: A new instance of the class of C{self}.
+        """
+        return self._newFromIndices(
+            _SiteIndices(sites, exclude).indices(len(self)))
+
+    def _newFromIndices(self, indices):
         """
-        if exclude:
-            sites = set(range(len(self))) - sites
+        Create a new read from self, with only the sites at certain indices.
 
-        newSequence = []
+        @param indices: A sorted C{numpy} C{int} array of (valid) indices
+            into the sequence of C{self}.
+        @return: A new instance of the class of C{self}.
+        """
         if self.quality:
-            newQuality = []
-            for index, (base, quality) in enumerate(zip(self.sequence,
-                                                        self.quality)):
-                if index in sites:
-                    newSequence.append(base)
-                    newQuality.append(quality)
-            read = self.__class__(self.id, ''.join(newSequence),
-                                  ''.join(newQuality))
+            read = self.__class__(self.id,
+                                  _selectIndices(self.sequence, indices),
+                                  _selectIndices(self.quality, indices))
         else:
-            for index, base in enumerate(self.sequence):
-                if index in sites:
-                    newSequence.append(base)
-            read = self.__class__(self.id, ''.join(newSequence))
+            read = self.__class__(self.id,
+                                  _selectIndices(self.sequence, indices))
 
         return read
 
@@ -260,6 +345,8 @@ class _NucleotideRead(Read):
     """
     Holds methods to work with nucleotide (DNA and RNA) sequences.
     """
+    __slots__ = ()
+
     def translations(self):
         """
         Yield all six translations of a nucleotide sequence.
@@ -298,6 +385,8 @@ class DNARead(_NucleotideRead):
     """
     Hold information and methods to work with DNA reads.
     """
+    __slots__ = ()
+
     ALPHABET = set('ATCG')
 
     COMPLEMENT_TABLE = _makeComplementTable(ambiguous_dna_complement)
@@ -307,6 +396,8 @@ class RNARead(_NucleotideRead):
     """
     Hold information and methods to work with RNA reads.
     """
+    __slots__ = ()
+
     ALPHABET = set('ATCGU')
 
     COMPLEMENT_TABLE = _makeComplementTable(ambiguous_rna_complement)
@@ -322,6 +413,8 @@ class AARead(Read):
     """
     Hold information and methods to work with AA reads.
     """
+    __slots__ = ()
+
     ALPHABET = set(AA_LETTERS)
 
     def checkAlphabet(self, count=10):
@@ -408,6 +501,8 @@ class AAReadWithX(AARead):
     Hold information and methods to work with AA reads with additional
     characters.
     """
+    __slots__ = ()
+
     ALPHABET = set(AA_LETTERS + ['X'])
 
 
@@ -430,6 +525,8 @@ class AAReadORF(AARead):
         was found). If C{False}, a stop codon was found in the read after this
         ORF.
     """
+    __slots__ = ('start', 'stop', 'openLeft', 'openRight')
+
     def __init__(self, originalRead, start, stop, openLeft, openRight):
         if start < 0:
             raise ValueError('start offset (%d) less than zero' % start)
@@ -510,6 +607,8 @@ class SSAARead(AARead):
     @param structure: A C{str} of structure information.
     @raise ValueError: If the sequence and structure lengths are not the same.
     """
+    __slots__ = ('structure',)
+
     def __init__(self, id, sequence, structure):
         if six.PY3:
             super().__init__(id, sequence)
@@ -591,30 +690,16 @@ class SSAARead(AARead):
         """
         return cls(d['id'], d['sequence'], d['structure'])
 
-    def newFromSites(self, sites, exclude=False):
+    def _newFromIndices(self, indices):
         """
-        Create a new read from self, with only certain sites.
+        Create a new read from self, with only the sites at certain indices.
 
-        @param sites: A set of C{int} 0-based sites (i.e., indices) in
-            sequences that should be kept. If C{None} (the default), all sites
-            are kept.
-        @param exclude: If C{True} the C{sites} will be excluded, not
-            included.
+        @param indices: A sorted C{numpy} C{int} array of (valid) indices
+            into the sequence of C{self}.
+        @return: A new instance of the class of C{self}.
         """
-        if exclude:
-            sites = set(range(len(self))) - sites
-
-        newSequence = []
-        newStructure = []
-        for index, (base, structure) in enumerate(zip(self.sequence,
-                                                      self.structure)):
-            if index in sites:
-                newSequence.append(base)
-                newStructure.append(structure)
-        read = self.__class__(self.id, ''.join(newSequence),
-                              ''.join(newStructure))
-
-        return read
+        return self.__class__(self.id, _selectIndices(self.sequence, indices),
+                              _selectIndices(self.structure, indices))
 
 
 class SSAAReadWithX(SSAARead):
@@ -622,6 +707,8 @@ class SSAAReadWithX(SSAARead):
     Hold information and methods to work with C{SSAARead}s allowing 'X'
     characters to appear in sequences.
     """
+    __slots__ = ()
+
     ALPHABET = set(AA_LETTERS + ['X'])
 
 
@@ -636,6 +723,8 @@ class TranslatedRead(AARead):
     @param reverseComplemented: A C{bool}, C{True} if the original sequence
         must be reverse complemented to obtain this AA sequence.
     """
+    __slots__ = ('frame', 'reverseComplemented')
+
     def __init__(self, originalRead, sequence, frame,
                  reverseComplemented=False):
         if frame not in (0, 1, 2):
@@ -702,6 +791,22 @@ class TranslatedRead(AARead):
         return max(len(orf) for orf in self.ORFs())
 
 
+def _stateful(stage):
+    """
+    Mark a filtering stage as stateful.
+
+    A stateful stage depends on (or changes) state that is shared between
+    reads, such as a count of the reads seen so far or a set of sequences
+    already seen. It must therefore be applied to reads one at a time and in
+    order, and cannot be run in a worker process (see L{Reads.parallel}).
+
+    @param stage: A filtering stage function.
+    @return: C{stage}, with a C{stateful} attribute set to C{True}.
+    """
+    stage.stateful = True
+    return stage
+
+
 class ReadFilter(object):
     """
     Create a function that can be used to filter a set of reads to produce a
@@ -740,6 +845,23 @@ class ReadFilter(object):
         sequence identity.
     @param removeDuplicatesById: If C{True} remove duplicated reads based
         only on read id.
+    @param removeDuplicatesUseMD5: If C{True}, only keep MD5 digests of the
+        sequences (and/or ids) seen when removing duplicates, instead of the
+        full strings. This greatly reduces memory use for long sequences.
+    @param removeDuplicatesIgnoreCase: If C{True}, sequences that differ
+        only in case are considered duplicates.
+    @param removeDuplicatesReverseComplement: If C{True}, a (DNA) sequence
+        is considered a duplicate of its reverse complement.
+    @param removeDuplicatesDatabase: If not C{None}, the C{str} name of an
+        SQLite database file in which to keep the MD5 digests of seen
+        sequences (and/or ids), to bound memory use for very large inputs.
+        See L{dark.dedup.DuplicateTracker}. The database is written and
+        closed by C{close}.
+    @param removeDuplicatesExpectedCount: The C{int} number of distinct
+        sequences (and/or ids) expected, used to size the in-memory Bloom
+        filter when C{removeDuplicatesDatabase} is given. If C{None},
+        C{trueLength} is used if it is given, else
+        C{dark.dedup.DEFAULT_EXPECTED_COUNT}.
     @param removeDescriptions: If C{True} remove the description (the part
         following the first whitespace) from read ids. The description is
         removed after applying the function specified by --idLambda (if any).
@@ -829,7 +951,12 @@ class ReadFilter(object):
                  removeDescriptions=False, modifier=None, randomSubset=None,
                  trueLength=None, sampleFraction=None,
                  sequenceNumbersFile=None, idLambda=None, readLambda=None,
-                 keepSites=None, removeSites=None):
+                 keepSites=None, removeSites=None,
+                 removeDuplicatesUseMD5=False,
+                 removeDuplicatesIgnoreCase=False,
+                 removeDuplicatesReverseComplement=False,
+                 removeDuplicatesDatabase=None,
+                 removeDuplicatesExpectedCount=None):
 
         if randomSubset is not None:
             if sampleFraction is not None:
@@ -848,6 +975,7 @@ class ReadFilter(object):
         self.removeDuplicates = removeDuplicates
         self.removeDuplicatesById = removeDuplicatesById
         self.removeDescriptions = removeDescriptions
+        self.truncateTitlesAfter = truncateTitlesAfter
         self.modifier = modifier
         self.randomSubset = randomSubset
         self.trueLength = trueLength
@@ -923,11 +1051,24 @@ class ReadFilter(object):
         else:
             self.titleFilter = None
 
+        if removeDuplicatesExpectedCount is None:
+            removeDuplicatesExpectedCount = (
+                DEFAULT_EXPECTED_COUNT if trueLength is None else trueLength)
+
         if removeDuplicates:
-            self.sequencesSeen = set()
+            self.sequenceTracker = DuplicateTracker(
+                useMD5=removeDuplicatesUseMD5,
+                ignoreCase=removeDuplicatesIgnoreCase,
+                reverseComplement=removeDuplicatesReverseComplement,
+                databaseFilename=removeDuplicatesDatabase,
+                expectedCount=removeDuplicatesExpectedCount,
+                tableName='sequences')
 
         if removeDuplicatesById:
-            self.idsSeen = set()
+            self.idTracker = DuplicateTracker(
+                useMD5=removeDuplicatesUseMD5,
+                databaseFilename=removeDuplicatesDatabase,
+                expectedCount=removeDuplicatesExpectedCount, tableName='ids')
 
         if sampleFraction is not None:
             if sampleFraction == 0.0:
@@ -942,135 +1083,295 @@ class ReadFilter(object):
         self.idLambda = eval(idLambda) if idLambda else None
         self.readLambda = eval(readLambda) if readLambda else None
 
-    def filter(self, read):
-        """
-        Check if a read passes the filter.
+        self._stages = self._compile()
 
-        @param read: A C{Read} instance.
-        @return: C{read} if C{read} passes the filter, C{False} if not.
+    def _compile(self):
         """
-        self.readIndex += 1
+        Make a list of the filtering stages needed for our options.
 
-        if self.alwaysFalse:
-            return False
+        Each stage is a function that is passed a read and returns either a
+        read (possibly a new one) or C{False} if the read is rejected. Only
+        stages for the options that were given are made, so a read does not
+        need to be tested against every possible option. Stages that keep
+        state between reads are marked with L{_stateful}.
 
-        if self.wantedSequenceNumberGeneratorExhausted:
-            return False
+        @return: A C{list} of stage functions, in the order they must be
+            applied.
+        """
+        stages = []
 
         if self.nextWantedSequenceNumber is not None:
-            if self.readIndex + 1 == self.nextWantedSequenceNumber:
-                # We want this sequence.
-                try:
-                    self.nextWantedSequenceNumber = next(
-                        self.wantedSequenceNumberGenerator)
-                except StopIteration:
-                    # The sequence number iterator ran out of sequence
-                    # numbers.  We must let the rest of the filtering
-                    # continue for the current sequence in case we
-                    # throw it out for other reasons (as we might have
-                    # done for any of the earlier wanted sequence
-                    # numbers).
-                    self.wantedSequenceNumberGeneratorExhausted = True
-            else:
-                # This sequence isn't one of the ones that's wanted.
-                return False
+            @_stateful
+            def sequenceNumbers(read):
+                if self.wantedSequenceNumberGeneratorExhausted:
+                    return False
+                if self.readIndex + 1 == self.nextWantedSequenceNumber:
+                    # We want this sequence.
+                    try:
+                        self.nextWantedSequenceNumber = next(
+                            self.wantedSequenceNumberGenerator)
+                    except StopIteration:
+                        # The sequence number iterator ran out of sequence
+                        # numbers.  We must let the rest of the filtering
+                        # continue for the current sequence in case we
+                        # throw it out for other reasons (as we might have
+                        # done for any of the earlier wanted sequence
+                        # numbers).
+                        self.wantedSequenceNumberGeneratorExhausted = True
+                    return read
+                else:
+                    # This sequence isn't one of the ones that's wanted.
+                    return False
+            stages.append(sequenceNumbers)
 
-        if (self.sampleFraction is not None and
-                uniform(0.0, 1.0) > self.sampleFraction):
-            # Note that we don't have to worry about the 0.0 or 1.0
-            # cases in the above 'if', as they have been dealt with
-            # in self.__init__.
-            return False
+        if self.sampleFraction is not None:
+            # Note that we don't have to worry about the 0.0 or 1.0 cases
+            # here, as they have been dealt with in self.__init__.
+            sampleFraction = self.sampleFraction
+
+            @_stateful
+            def sample(read):
+                return False if uniform(0.0, 1.0) > sampleFraction else read
+            stages.append(sample)
 
         if self.randomSubset is not None:
-            if self.yieldCount == self.randomSubset:
-                # The random subset has already been fully returned.
-                # There's no point in going any further through the input.
-                self.alwaysFalse = True
-                return False
-            elif uniform(0.0, 1.0) > ((self.randomSubset - self.yieldCount) /
-                                      (self.trueLength - self.readIndex)):
-                return False
+            randomSubset, trueLength = self.randomSubset, self.trueLength
+
+            @_stateful
+            def subset(read):
+                if self.yieldCount == randomSubset:
+                    # The random subset has already been fully returned.
+                    # There's no point in going any further through the
+                    # input.
+                    self.alwaysFalse = True
+                    return False
+                elif uniform(0.0, 1.0) > ((randomSubset - self.yieldCount) /
+                                          (trueLength - self.readIndex)):
+                    return False
+                return read
+            stages.append(subset)
+
+        if self.head is not None:
+            head = self.head
+
+            @_stateful
+            def headStage(read):
+                if self.readIndex == head:
+                    # We're completely done.
+                    self.alwaysFalse = True
+                    return False
+                return read
+            stages.append(headStage)
+
+        minLength, maxLength = self.minLength, self.maxLength
+        if minLength is not None and maxLength is not None:
+            def length(read):
+                return read if minLength <= len(read) <= maxLength else False
+            stages.append(length)
+        elif minLength is not None:
+            def length(read):
+                return read if len(read) >= minLength else False
+            stages.append(length)
+        elif maxLength is not None:
+            def length(read):
+                return read if len(read) <= maxLength else False
+            stages.append(length)
 
-        if self.head is not None and self.readIndex == self.head:
-            # We're completely done.
-            self.alwaysFalse = True
-            return False
+        if self.removeGaps:
+            def removeGaps(read):
+                sequence = read.sequence
+                if read.quality is None:
+                    return read.__class__(read.id, sequence.replace('-', ''))
+                elif '-' not in sequence:
+                    return read.__class__(read.id, sequence, read.quality)
+                else:
+                    indices = np.flatnonzero(_asArray(sequence)[0] !=
+                                             ord('-'))
+                    return read.__class__(
+                        read.id, sequence.replace('-', ''),
+                        _selectIndices(read.quality, indices))
+            stages.append(removeGaps)
 
-        readLen = len(read)
-        if ((self.minLength is not None and readLen < self.minLength) or
-                (self.maxLength is not None and readLen > self.maxLength)):
-            return False
+        if self.titleFilter:
+            accept, reject = self.titleFilter.accept, TitleFilter.REJECT
 
-        if self.removeGaps:
-            if read.quality is None:
-                read = read.__class__(read.id, read.sequence.replace('-', ''))
-            else:
-                newSequence = []
-                newQuality = []
-                for base, quality in zip(read.sequence, read.quality):
-                    if base != '-':
-                        newSequence.append(base)
-                        newQuality.append(quality)
-                read = read.__class__(
-                    read.id, ''.join(newSequence), ''.join(newQuality))
-
-        if (self.titleFilter and
-                self.titleFilter.accept(read.id) == TitleFilter.REJECT):
-            return False
+            def title(read):
+                return False if accept(read.id) == reject else read
 
-        if (self.keepSequences is not None and
-                self.readIndex not in self.keepSequences):
-            return False
+            # Truncated titles that have been seen are remembered by the
+            # title filter.
+            if self.truncateTitlesAfter is not None:
+                title = _stateful(title)
+            stages.append(title)
 
-        if (self.removeSequences is not None and
-                self.readIndex in self.removeSequences):
-            return False
+        if self.keepSequences is not None:
+            keepSequences = self.keepSequences
+
+            @_stateful
+            def keep(read):
+                return read if self.readIndex in keepSequences else False
+            stages.append(keep)
+
+        if self.removeSequences is not None:
+            removeSequences = self.removeSequences
+
+            @_stateful
+            def remove(read):
+                return False if self.readIndex in removeSequences else read
+            stages.append(remove)
 
         if self.removeDuplicates:
-            if read.sequence in self.sequencesSeen:
-                return False
-            self.sequencesSeen.add(read.sequence)
+            sequenceSeen = self.sequenceTracker.seen
+
+            @_stateful
+            def removeDuplicates(read):
+                return False if sequenceSeen(read.sequence) else read
+            stages.append(removeDuplicates)
 
         if self.removeDuplicatesById:
-            if read.id in self.idsSeen:
-                return False
-            self.idsSeen.add(read.id)
+            idSeen = self.idTracker.seen
+
+            @_stateful
+            def removeDuplicatesById(read):
+                return False if idSeen(read.id) else read
+            stages.append(removeDuplicatesById)
 
         if self.modifier:
-            modified = self.modifier(read)
-            if modified is None:
-                return False
-            else:
-                read = modified
+            modifier = self.modifier
+
+            def modify(read):
+                modified = modifier(read)
+                return False if modified is None else modified
+            stages.append(modify)
 
         # We have to use 'is not None' in the following tests so the empty set
         # is processed properly.
-        if self.keepSites is not None:
-            read = read.newFromSites(self.keepSites)
-        elif self.removeSites is not None:
-            read = read.newFromSites(self.removeSites, exclude=True)
+        if self.keepSites is not None or self.removeSites is not None:
+            if self.keepSites is not None:
+                siteIndices = _SiteIndices(self.keepSites)
+            else:
+                siteIndices = _SiteIndices(self.removeSites, exclude=True)
+            indices = siteIndices.indices
+
+            def sites(read):
+                return read._newFromIndices(indices(len(read)))
+            stages.append(sites)
 
         if self.idLambda:
-            newId = self.idLambda(read.id)
-            if newId is None:
-                return False
-            else:
+            idLambda = self.idLambda
+
+            def newId(read):
+                newId = idLambda(read.id)
+                if newId is None:
+                    return False
                 read.id = newId
+                return read
+            stages.append(newId)
 
         if self.readLambda:
-            newRead = self.readLambda(read)
-            if newRead is None:
-                return False
-            else:
-                read = newRead
+            readLambda = self.readLambda
+
+            def newRead(read):
+                newRead = readLambda(read)
+                return False if newRead is None else newRead
+            stages.append(newRead)
 
         if self.removeDescriptions:
-            read.id = read.id.split()[0]
+            def removeDescriptions(read):
+                read.id = read.id.split()[0]
+                return read
+            stages.append(removeDescriptions)
+
+        return stages
+
+    def stages(self):
+        """
+        Get the complete list of filtering stages, including those that keep
+        count of the reads offered to and accepted by the filter.
+
+        Calling each of these in turn (stopping if one returns C{False}) is
+        equivalent to calling C{self.filter}. This allows L{Reads} to fuse
+        several filters into one list of stages. The counting stages are
+        only included if the filter has options that need the counts (so
+        C{self.readIndex} and C{self.yieldCount} are otherwise not updated).
+
+        @return: A C{list} of stage functions.
+        """
+        if self.alwaysFalse:
+            return [lambda read: False]
+
+        if (self.nextWantedSequenceNumber is None and
+                self.randomSubset is None and self.head is None and
+                self.keepSequences is None and self.removeSequences is None):
+            return list(self._stages)
+
+        @_stateful
+        def start(read):
+            self.readIndex += 1
+            return False if self.alwaysFalse else read
+
+        @_stateful
+        def finish(read):
+            self.yieldCount += 1
+            return read
+
+        return [start] + self._stages + [finish]
+
+    def filter(self, read):
+        """
+        Check if a read passes the filter.
+
+        @param read: A C{Read} instance.
+        @return: C{read} if C{read} passes the filter, C{False} if not.
+        """
+        self.readIndex += 1
+
+        if self.alwaysFalse:
+            return False
+
+        for stage in self._stages:
+            read = stage(read)
+            if read is False:
+                return False
 
         self.yieldCount += 1
         return read
 
+    @property
+    def sequencesSeen(self):
+        """
+        Get the sequences seen when removing duplicates (only present if
+        C{removeDuplicates} was given).
+
+        @return: A L{dark.dedup.DuplicateTracker}, which supports C{in} and
+            C{len}.
+        """
+        return self.sequenceTracker
+
+    @property
+    def idsSeen(self):
+        """
+        Get the read ids seen when removing duplicates by id (only present if
+        C{removeDuplicatesById} was given).
+
+        @return: A L{dark.dedup.DuplicateTracker}, which supports C{in} and
+            C{len}.
+        """
+        return self.idTracker
+
+    def close(self):
+        """
+        Close the duplicate trackers (if any), writing any digests still in
+        memory to the C{removeDuplicatesDatabase} and closing it.
+
+        This is called by L{Reads} when it has been iterated. The trackers
+        reopen the database if the filter is used again.
+        """
+        if self.removeDuplicates:
+            self.sequenceTracker.close()
+        if self.removeDuplicatesById:
+            self.idTracker.close()
+
 
 # Provide a mapping from all read class names to read classes. This can be
 # useful in deserialization.
@@ -1117,7 +1418,53 @@ class Reads(object):
         self._initialReads = initialReads
         self._additionalReads = []
         self._filters = []
+        self._filterStages = None
         self._iterated = False
+        self._workers = None
+        self._chunkSize = None
+
+    def _fuseFilters(self):
+        """
+        Make a single list of filtering stages from our filters.
+
+        The filter functions of consecutive C{ReadFilter} instances are
+        replaced by their stages, so a read passes through all the filters in
+        one loop, without a call to the C{filter} method of each. Any other
+        filter function is used as is.
+
+        @return: A C{list} of functions that each take a read and return
+            either a read or C{False}.
+        """
+        readFilterFunc = six.get_unbound_function(ReadFilter.filter)
+        stages = []
+        for filterFunc in self._filters:
+            if getattr(filterFunc, '__func__', None) is readFilterFunc:
+                stages.extend(filterFunc.__self__.stages())
+            else:
+                stages.append(filterFunc)
+        return stages
+
+    def _splitFilterStages(self):
+        """
+        Split our filtering stages into those that can be run in worker
+        processes and those that must be run in the coordinating process.
+
+        Stages up to (but not including) the first stateful stage can be
+        applied to reads independently, in any process. The first stateful
+        stage and all stages after it are applied in order in the
+        coordinating process. Filter functions that are not made by a
+        C{ReadFilter} are not known to be free of state, so they are treated
+        as stateful.
+
+        @return: A 2-tuple of C{list}s of stage functions: those that can be
+            run in worker processes and those that must be run in the
+            coordinating process.
+        """
+        stages = self._fuseFilters()
+        for index, stage in enumerate(stages):
+            if getattr(stage, 'stateful', False) or stage in self._filters:
+                return stages[:index], stages[index:]
+        return stages, []
 
     def filterRead(self, read):
         """
@@ -1127,12 +1474,12 @@ class Reads(object):
         @return: C{False} if the read fails any of our filters, else the
             C{Read} instance returned by our list of filters.
         """
-        for filterFunc in self._filters:
-            filteredRead = filterFunc(read)
-            if filteredRead is False:
+        if self._filterStages is None:
+            self._filterStages = self._fuseFilters()
+        for stage in self._filterStages:
+            read = stage(read)
+            if read is False:
                 return False
-            else:
-                read = filteredRead
         return read
 
     def add(self, read):
@@ -1147,9 +1494,42 @@ class Reads(object):
         """
         Iterate through all the reads.
 
+        When iteration finishes (or the generator is closed), the duplicate
+        trackers of our C{ReadFilter}s are closed (see C{ReadFilter.close}).
+
         @return: A generator that yields reads. The returned read types depend
             on the kind of reads that were added to this instance.
         """
+        try:
+            for read in self._iter():
+                yield read
+        finally:
+            self._closeFilters()
+
+    def _closeFilters(self):
+        """
+        Close all our C{ReadFilter} instances.
+        """
+        readFilterFunc = six.get_unbound_function(ReadFilter.filter)
+        for filterFunc in self._filters:
+            if getattr(filterFunc, '__func__', None) is readFilterFunc:
+                filterFunc.__self__.close()
+
+    def _iter(self):
+        """
+        Iterate through all the reads, without closing our filters.
+
+        @return: A generator that yields reads.
+        """
+        if self._workers is not None and self._workers > 1:
+            workerStages, coordinatorStages = self._splitFilterStages()
+            context = _forkContext()
+            if workerStages and context is not None:
+                for read in self._parallelIter(
+                        context, workerStages, coordinatorStages):
+                    yield read
+                return
+
         # self._additionalReads is a regular list.
         for read in self._additionalReads:
             filteredRead = self.filterRead(read)
@@ -1191,6 +1571,89 @@ class Reads(object):
         self._unfilteredLength = _unfilteredLength
         self._iterated = True
 
+    def _parallelIter(self, context, workerStages, coordinatorStages):
+        """
+        Iterate through all the reads, filtering them in worker processes.
+
+        Reads are read (in this process) in chunks, which are sent to a pool
+        of worker processes to have the stateless filtering stages applied.
+        The reads that survive are then given to the stateful stages, in
+        their original order.
+
+        @param context: A C{multiprocessing} context that uses C{fork} to
+            start processes (so the stage functions, which cannot be pickled,
+            are inherited by the workers).
+        @param workerStages: A C{list} of stateless stage functions to run in
+            the worker processes.
+        @param coordinatorStages: A C{list} of stage functions to run in this
+            process.
+        @return: A generator that yields reads.
+        """
+        counts = {}
+
+        def reads():
+            for read in self._additionalReads:
+                yield read
+
+            initialReads = self._initialReads or []
+            count = 0
+            for read in initialReads:
+                count += 1
+                yield read
+            counts['initial'] = (initialReads, count)
+
+            subclassReads = self.iter()
+            count = 0
+            for read in subclassReads:
+                count += 1
+                yield read
+            counts['subclass'] = (subclassReads, count)
+
+        def chunks():
+            chunk = []
+            for read in reads():
+                chunk.append(read)
+                if len(chunk) == chunkSize:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+
+        chunkSize = self._chunkSize
+        # Limit the number of chunks in flight, so memory use is bounded
+        # no matter how many reads there are.
+        maxPending = 2 * self._workers
+        pending = deque()
+        pool = context.Pool(self._workers, initializer=_initFilterWorker,
+                            initargs=(workerStages,))
+
+        try:
+            for chunk in chunks():
+                pending.append(pool.apply_async(_filterChunk, (chunk,)))
+                while len(pending) > maxPending or (
+                        pending and pending[0].ready()):
+                    for read in _applyStages(coordinatorStages,
+                                             pending.popleft().get()):
+                        yield read
+
+            while pending:
+                for read in _applyStages(coordinatorStages,
+                                         pending.popleft().get()):
+                    yield read
+        finally:
+            pool.terminate()
+            pool.join()
+
+        _unfilteredLength = len(self._additionalReads)
+        for readsSource, count in counts['initial'], counts['subclass']:
+            if isinstance(readsSource, Reads):
+                _unfilteredLength += readsSource.unfilteredLength()
+            else:
+                _unfilteredLength += count
+
+        self._unfilteredLength = _unfilteredLength
+        self._iterated = True
+
     def unfilteredLength(self):
         """
         Return the underlying number of reads in C{self}, irrespective of any
@@ -1221,36 +1684,35 @@ class Reads(object):
         """
         return []
 
-    def save(self, filename, format_='fasta'):
+    def save(self, filename, format_='fasta', threads=0):
         """
         Write the reads to C{filename} in the requested format.
 
         @param filename: Either a C{str} file name to save into (the file will
-            be overwritten) or an open file descriptor (e.g., sys.stdout).
+            be overwritten) or an open file descriptor (e.g., sys.stdout). A
+            file name ending in '.gz', '.bgz', or '.bz2' will be compressed
+            (see L{dark.utils.openFileForWriting}).
         @param format_: A C{str} format to save as, either 'fasta', 'fastq' or
             'fasta-ss'.
+        @param threads: An C{int} number of threads to use for writing and
+            compression (see L{dark.utils.openFileForWriting}). Only used if
+            C{filename} is a C{str}.
         @raise ValueError: if C{format_} is 'fastq' and a read with no quality
             is present, or if an unknown format is requested.
         @return: An C{int} giving the number of reads in C{self}.
         """
-        format_ = format_.lower()
-        count = 0
-
-        if isinstance(filename, str):
+        if isinstance(filename, six.string_types):
             try:
-                with open(filename, 'w') as fp:
-                    for read in self:
-                        fp.write(read.toString(format_))
-                        count += 1
+                with openFileForWriting(filename, threads=threads) as fp:
+                    with ReadsWriter(fp, format_) as writer:
+                        return writer.writeReads(self)
             except ValueError:
                 unlink(filename)
                 raise
         else:
             # We have a file-like object.
-            for read in self:
-                filename.write(read.toString(format_))
-                count += 1
-        return count
+            with ReadsWriter(filename, format_) as writer:
+                return writer.writeReads(self)
 
     def filter(self, **kwargs):
         """
@@ -1261,6 +1723,34 @@ class Reads(object):
         """
         readFilter = ReadFilter(**kwargs)
         self._filters.append(readFilter.filter)
+        self._filterStages = None
+        return self
+
+    def parallel(self, workers=None, chunkSize=1000):
+        """
+        Filter reads using several processes when iterating.
+
+        Reads are still read in this process, but the filtering stages that
+        do not keep state between reads (e.g., those for C{minLength},
+        C{titleRegex}, C{readLambda}, or C{removeSites}) are applied by a
+        pool of worker processes. Stages that keep state (e.g., those for
+        C{head}, C{randomSubset}, C{removeDuplicates}, or
+        C{sequenceNumbersFile}), and all stages after them, are applied in
+        this process. The order of the reads is not changed.
+
+        Worker processes are started with C{fork}. If that is not available,
+        or if there are no stages that can be run in worker processes, reads
+        are filtered in this process as usual.
+
+        @param workers: The C{int} number of worker processes to use. If
+            C{None}, use one per CPU. A value of 1 (or less) turns parallel
+            filtering off.
+        @param chunkSize: The C{int} number of reads to send to a worker
+            process at a time.
+        @return: C{self}.
+        """
+        self._workers = cpu_count() if workers is None else workers
+        self._chunkSize = chunkSize
         return self
 
     def clearFilters(self):
@@ -1270,6 +1760,7 @@ class Reads(object):
         @return: C{self}.
         """
         self._filters = []
+        self._filterStages = None
         return self
 
     def summarizePosition(self, index):
@@ -1332,12 +1823,285 @@ class Reads(object):
         return result or set()
 
 
+def formatReads(reads, format_):
+    """
+    Format reads as a single string.
+
+    @param reads: A C{list} of C{Read} instances.
+    @param format_: A C{str} format, either 'fasta', 'fastq' or 'fasta-ss'.
+    @raise ValueError: if C{format_} is 'fastq' and a read with no quality
+        is present, or if an unknown format is requested.
+    @return: A C{str} with the concatenated formatted reads.
+    """
+    # If all the reads use Read.toString, they can be formatted here
+    # without calling it. Otherwise, the toString method of each read is
+    # used.
+    readToString = six.get_unbound_function(Read.toString)
+    if format_ in ('fasta', 'fastq') and all(
+            six.get_unbound_function(cls.toString) is readToString
+            for cls in set(map(type, reads))):
+        if format_ == 'fasta':
+            return ''.join(['>%s\n%s\n' % (read.id, read.sequence)
+                            for read in reads])
+        else:
+            for read in reads:
+                if read.quality is None:
+                    raise ValueError('Read %r has no quality information' %
+                                     read.id)
+            return ''.join(['@%s\n%s\n+%s\n%s\n' % (
+                read.id, read.sequence, read.id, read.quality)
+                for read in reads])
+    else:
+        return ''.join([read.toString(format_) for read in reads])
+
+
+class ReadsWriter(object):
+    """
+    Write reads to a file, formatting them in batches so that each batch is
+    written with a single call to the write method of the file.
+
+    Use as a context manager. On normal exit, any reads still in the current
+    batch are written. The file is not closed.
+
+    @param fp: An open file-like object to write to (e.g., sys.stdout, or a
+        file returned by L{dark.utils.openFileForWriting}).
+    @param format_: A C{str} format to write, either 'fasta', 'fastq' or
+        'fasta-ss' (case is ignored).
+    @param batchSize: The C{int} number of reads to format and write at a
+        time.
+    @raise ValueError: If an unknown format is requested.
+    """
+    def __init__(self, fp, format_='fasta', batchSize=1000):
+        format_ = format_.lower()
+        if format_ not in ('fasta', 'fastq', 'fasta-ss'):
+            raise ValueError("Format must be either 'fasta', 'fastq' or "
+                             "'fasta-ss'.")
+        self._fp = fp
+        self._format = format_
+        self._batchSize = batchSize
+        self._batch = []
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        if excType is None:
+            self.flush()
+
+    def flush(self):
+        """
+        Format and write the current batch of reads.
+        """
+        if self._batch:
+            batch, self._batch = self._batch, []
+            self._fp.write(formatReads(batch, self._format))
+
+    def write(self, read):
+        """
+        Write a read.
+
+        @param read: A C{Read} instance.
+        """
+        batch = self._batch
+        batch.append(read)
+        self.count += 1
+        if len(batch) == self._batchSize:
+            self.flush()
+
+    def writeReads(self, reads):
+        """
+        Write reads.
+
+        @param reads: An iterable of C{Read} instances.
+        @return: The C{int} number of reads written.
+        """
+        count = self.count
+        for read in reads:
+            self.write(read)
+        return self.count - count
+
+
+def _forkContext():
+    """
+    Get a C{multiprocessing} context that starts processes with C{fork}.
+
+    @return: A C{multiprocessing} context, or C{None} if C{fork} is not
+        available.
+    """
+    try:
+        return multiprocessing.get_context('fork')
+    except AttributeError:
+        # Python 2 has no contexts, and always forks (on POSIX).
+        return None if sys.platform == 'win32' else multiprocessing
+    except ValueError:
+        return None
+
+
+# The stateless filtering stages used by a worker process (see
+# Reads._parallelIter).
+_workerStages = None
+
+
+def _initFilterWorker(stages):
+    """
+    Initialize a worker process that filters reads.
+
+    @param stages: A C{list} of stateless filtering stage functions.
+    """
+    global _workerStages
+    _workerStages = stages
+
+
+def _applyStages(stages, reads):
+    """
+    Apply filtering stages to reads.
+
+    @param stages: A C{list} of filtering stage functions.
+    @param reads: An iterable of C{Read} instances.
+    @return: A generator that yields the reads that pass all stages.
+    """
+    for read in reads:
+        for stage in stages:
+            read = stage(read)
+            if read is False:
+                break
+        else:
+            yield read
+
+
+def _filterChunk(reads):
+    """
+    Apply the stateless filtering stages to a chunk of reads, in a worker
+    process.
+
+    @param reads: A C{list} of C{Read} instances.
+    @return: A C{list} of the reads that pass the stages.
+    """
+    return list(_applyStages(_workerStages, reads))
+
+
+class _PackedReads(object):
+    """
+    A compact C{list}-like store of reads, used by L{ReadsInRAM} when it is
+    asked to be bytes-backed.
+
+    Reads whose class has the same constructor as L{Read} and no attributes
+    other than those of L{Read} (e.g., C{Read}, C{DNARead}, C{AARead}) are
+    stored as a single C{bytes} object holding their id, sequence, and
+    (optional) quality, separated by NUL bytes. This uses far less memory
+    than a read instance and its two or three strings. Any other read (e.g.,
+    an C{SSAARead}, which has a structure string, or a read with an extra
+    slot or a C{__dict__}) is stored as is.
+
+    Because packed reads are re-created when they are accessed, a read
+    obtained from this store is a copy. Changing it does not change the
+    stored read (use assignment via C{__setitem__} to do that).
+    """
+    # A cache of whether the instances of a read class can be packed.
+    _packableClasses = {}
+
+    def __init__(self):
+        self._classes = []
+        self._data = []
+
+    @classmethod
+    def _packableClass(cls, readClass):
+        """
+        Can instances of a read class be packed?
+
+        @param readClass: A C{Read} (or C{Read} subclass) class.
+        @return: C{True} if C{readClass} has the constructor of L{Read} and
+            its instances can only have the attributes of L{Read}.
+        """
+        try:
+            return cls._packableClasses[readClass]
+        except KeyError:
+            packable = readClass.__init__ is Read.__init__
+            if packable:
+                for klass in readClass.__mro__:
+                    if klass is Read:
+                        break
+                    # A class without __slots__ gives its instances a
+                    # __dict__, and non-empty __slots__ add attributes.
+                    if klass.__dict__.get('__slots__', None) != ():
+                        packable = False
+                        break
+            cls._packableClasses[readClass] = packable
+            return packable
+
+    @classmethod
+    def _pack(cls, read):
+        """
+        Pack a read, if possible.
+
+        @param read: A C{Read} (or C{Read} subclass) instance.
+        @return: A 2-tuple containing the class of the read and a C{bytes}
+            object if the read could be packed, else C{None} and the read.
+        """
+        readClass = type(read)
+        id_, sequence, quality = read.id, read.sequence, read.quality
+        if (not cls._packableClass(readClass) or
+                hasattr(read, '__dict__') or '\0' in id_ or
+                '\0' in sequence or (quality and '\0' in quality)):
+            return None, read
+        if quality is None:
+            packed = id_ + '\0' + sequence
+        else:
+            packed = id_ + '\0' + sequence + '\0' + quality
+        return readClass, packed.encode('UTF-8')
+
+    @staticmethod
+    def _unpack(readClass, data):
+        """
+        Unpack a read.
+
+        @param readClass: The class of the read, or C{None} if C{data} is an
+            unpacked read instance.
+        @param data: Either a C{bytes} object (as made by C{_pack}) or a read.
+        @return: A C{Read} (or C{Read} subclass) instance.
+        """
+        if readClass is None:
+            return data
+        return readClass(*data.decode('UTF-8').split('\0'))
+
+    def __len__(self):
+        return len(self._data)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return list(map(self._unpack, self._classes[item],
+                            self._data[item]))
+        return self._unpack(self._classes[item], self._data[item])
+
+    def __setitem__(self, item, value):
+        self._classes[item], self._data[item] = self._pack(value)
+
+    def __iter__(self):
+        return six.moves.map(self._unpack, self._classes, self._data)
+
+    def append(self, read):
+        """
+        Add a read.
+
+        @param read: A C{Read} (or C{Read} subclass) instance.
+        """
+        readClass, data = self._pack(read)
+        self._classes.append(readClass)
+        self._data.append(data)
+
+
 class ReadsInRAM(Reads):
     """
     Maintain a collection of sequence reads in RAM.
 
     @param initialReads: If not C{None}, an iterable of C{Read} (or a C{Read}
         subclass) instances.
+    @param bytesBacked: If C{True}, store reads in a compact packed form
+        (see L{_PackedReads}) instead of as read instances. This greatly
+        reduces memory use for large numbers of reads, at the cost of making
+        a new read instance each time a read is accessed. Note that reads
+        obtained from a bytes-backed instance are therefore copies.
     """
 
     # This class provides some C{list} like methods (len and indexing) but
@@ -1346,12 +2110,15 @@ class ReadsInRAM(Reads):
     # inheritance. If you want a real list, you can just call C{list} on a
     # C{Reads} or C{ReadsInRAM} instance.
 
-    def __init__(self, initialReads=None):
+    def __init__(self, initialReads=None, bytesBacked=False):
         if six.PY3:
             super().__init__(initialReads)
         else:
             Reads.__init__(self, initialReads)
 
+        if bytesBacked:
+            self._additionalReads = _PackedReads()
+
         # Read all initial reads into memory.
         if initialReads:
             for read in initialReads:
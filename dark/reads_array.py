@@ -0,0 +1,398 @@
+from collections import Counter
+
+import numpy as np
+from six import PY3
+
+from dark.reads import Read, Reads
+from dark.utils import openFileForWriting
+
+# File name suffixes for which openFileForWriting compresses its output.
+_COMPRESSED_SUFFIXES = ('.gz', '.bgz', '.bz2')
+
+
+def _ranges(starts, ends):
+    """
+    Make an index that concatenates a number of ranges.
+
+    @param starts: A C{numpy} C{int} array of range start offsets.
+    @param ends: A C{numpy} C{int} array of (Python-style) range end offsets.
+    @return: A 2-tuple with 1) a C{numpy} C{int} array containing the
+        concatenated values of all the ranges, and 2) a C{numpy} C{int}
+        array giving the offset in the first array at which each range
+        starts.
+    """
+    lengths = ends - starts
+    resultStarts = np.cumsum(lengths) - lengths
+    total = int(lengths.sum()) if len(lengths) else 0
+    return (np.repeat(starts - resultStarts, lengths) +
+            np.arange(total, dtype=np.int64), resultStarts)
+
+
+def _concatenate(data, starts, ends):
+    """
+    Concatenate a number of ranges of an array.
+
+    @param data: A C{numpy} array.
+    @param starts: A C{numpy} C{int} array of range start offsets.
+    @param ends: A C{numpy} C{int} array of (Python-style) range end offsets.
+    @return: A C{numpy} array with the concatenated ranges of C{data}. If the
+        ranges are already contiguous in C{data}, this will be a view.
+    """
+    if len(starts) == 0:
+        return data[:0]
+    elif np.array_equal(starts[1:], ends[:-1]):
+        return data[starts[0]:ends[-1]]
+    else:
+        return data[_ranges(starts, ends)[0]]
+
+
+class ReadsArray(Reads):
+    """
+    Hold reads in RAM in columnar form, using C{numpy} arrays.
+
+    All read ids are concatenated (as UTF-8) into one C{uint8} array, as are
+    all sequences and all quality strings, with arrays of start and end
+    offsets giving the extent of each read in them. This uses much less
+    memory than holding a Python object per read, and allows whole-collection
+    operations (C{summarizePosition}, C{sitesMatching}, length filtering and
+    C{save}) to be done with C{numpy} instead of a Python loop over reads.
+
+    Iterating a C{ReadsArray} yields ordinary read instances, so it can be
+    used anywhere a L{dark.reads.Reads} instance can. If filters are added
+    (via C{filter}) or reads are added (via C{add}), the vectorized methods
+    fall back to the (per-read) L{dark.reads.Reads} implementations, so
+    results are always the same as they would be for any C{Reads} instance.
+
+    @param initialReads: If not C{None}, an iterable of C{Read} (or C{Read}
+        subclass) instances, e.g., a L{dark.reads.Reads} instance. Only the
+        id, sequence, and quality of each read are stored. Sequences and
+        quality strings must be ASCII.
+    @param readClass: The class of the reads to yield when iterating. This
+        must accept the same arguments as C{Read}. If C{None}, the class of
+        the first read in C{initialReads} (or C{Read}, if there are none)
+        will be used and all the initial reads must be of that class.
+    @raise ValueError: If C{readClass} cannot be made from an id, sequence,
+        and quality, or if C{readClass} is C{None} and the initial reads are
+        not all of the same class.
+    """
+    def __init__(self, initialReads=None, readClass=None):
+        if PY3:
+            super().__init__()
+        else:
+            Reads.__init__(self)
+
+        ids, sequences, qualities = [], [], []
+        wantedClass = readClass
+        for read in initialReads or []:
+            if readClass is None:
+                readClass = read.__class__
+            elif wantedClass is None and read.__class__ is not readClass:
+                raise ValueError(
+                    'ReadsArray reads must all have the same class (found '
+                    '%s and %s). Pass a readClass to convert them.' %
+                    (readClass.__name__, read.__class__.__name__))
+            ids.append(read.id.encode('UTF-8'))
+            sequences.append(read.sequence)
+            qualities.append(read.quality)
+
+        readClass = readClass or Read
+        if readClass.__init__ is not Read.__init__:
+            raise ValueError('Cannot store reads of class %s in a ReadsArray.'
+                             % readClass.__name__)
+        self._readClass = readClass
+
+        count = len(ids)
+        self._ids = np.frombuffer(b''.join(ids), dtype=np.uint8)
+        idLengths = np.fromiter(map(len, ids), np.int64, count)
+        self._idEnds = np.cumsum(idLengths)
+        self._idStarts = self._idEnds - idLengths
+
+        self._sequences = np.frombuffer(''.join(sequences).encode('ascii'),
+                                        dtype=np.uint8)
+        lengths = np.fromiter(map(len, sequences), np.int64, count)
+        self._ends = np.cumsum(lengths)
+        self._starts = self._ends - lengths
+
+        hasQuality = np.fromiter(
+            (quality is not None for quality in qualities), np.bool_, count)
+        if hasQuality.any():
+            self._hasQuality = hasQuality
+            self._qualities = np.frombuffer(
+                ''.join('\0' * len(sequence) if quality is None else quality
+                        for sequence, quality in zip(sequences, qualities))
+                .encode('ascii'), dtype=np.uint8)
+        else:
+            self._hasQuality = self._qualities = None
+
+    def _subset(self, item):
+        """
+        Make a new instance that holds a subset of our reads, sharing our
+        id, sequence, and quality arrays (i.e., without copying them).
+
+        @param item: A C{slice}, or a C{numpy} index or boolean mask array,
+            selecting the reads to keep.
+        @return: A new C{ReadsArray} instance.
+        """
+        new = self.__class__.__new__(self.__class__)
+        Reads.__init__(new)
+        new._readClass = self._readClass
+        new._ids = self._ids
+        new._sequences = self._sequences
+        new._qualities = self._qualities
+        new._idStarts = self._idStarts[item]
+        new._idEnds = self._idEnds[item]
+        new._starts = self._starts[item]
+        new._ends = self._ends[item]
+        new._hasQuality = (None if self._hasQuality is None else
+                           self._hasQuality[item])
+        return new
+
+    def _vectorizable(self):
+        """
+        Can a vectorized method be used to produce a result?
+
+        @return: C{True} if there are no filters and no added reads.
+        """
+        return not (self._filters or self._additionalReads)
+
+    def __len__(self):
+        return len(self._starts) + len(self._additionalReads)
+
+    def __getitem__(self, item):
+        """
+        Get a read, or a (zero-copy) subset of the reads in the array.
+
+        @param item: An C{int} index, or a C{slice} (or C{numpy} index or
+            boolean mask array) selecting reads from the array.
+        @return: A read if C{item} is an C{int}, else a new C{ReadsArray}.
+        """
+        if isinstance(item, (int, np.integer)):
+            start, end = self._starts[item], self._ends[item]
+            if self._hasQuality is not None and self._hasQuality[item]:
+                quality = self._qualities[start:end].tobytes().decode('ascii')
+            else:
+                quality = None
+            return self._readClass(
+                self._ids[self._idStarts[item]:self._idEnds[item]].tobytes()
+                .decode('UTF-8'),
+                self._sequences[start:end].tobytes().decode('ascii'),
+                quality)
+        else:
+            return self._subset(item)
+
+    def iter(self):
+        """
+        Make a read instance for each read in the array.
+
+        @return: A generator that yields read instances.
+        """
+        if not len(self._starts):
+            return
+
+        readClass = self._readClass
+        # Decode the part of the sequence and quality arrays used by our
+        # reads just once. Offsets into the resulting strings are the same
+        # as into the arrays because they are ASCII.
+        low, high = int(self._starts.min()), int(self._ends.max())
+        sequences = self._sequences[low:high].tobytes().decode('ascii')
+        starts = (self._starts - low).tolist()
+        ends = (self._ends - low).tolist()
+        if self._hasQuality is None:
+            qualityFlags = [False] * len(starts)
+        else:
+            qualities = self._qualities[low:high].tobytes().decode('ascii')
+            qualityFlags = self._hasQuality.tolist()
+
+        # Ids are UTF-8, so must be decoded one at a time.
+        idLow = int(self._idStarts.min())
+        ids = self._ids[idLow:int(self._idEnds.max())].tobytes()
+        idStarts = (self._idStarts - idLow).tolist()
+        idEnds = (self._idEnds - idLow).tolist()
+
+        for idStart, idEnd, start, end, hasQuality in zip(
+                idStarts, idEnds, starts, ends, qualityFlags):
+            yield readClass(ids[idStart:idEnd].decode('UTF-8'),
+                            sequences[start:end],
+                            qualities[start:end] if hasQuality else None)
+
+    def lengths(self):
+        """
+        Get the lengths of the reads in the array.
+
+        @return: A C{numpy} C{int} array of read lengths.
+        """
+        return self._ends - self._starts
+
+    def filterByLength(self, minLength=None, maxLength=None):
+        """
+        Select reads by length (with the same meaning as the C{minLength} and
+        C{maxLength} arguments of L{dark.reads.ReadFilter}).
+
+        The reads in the returned instance share the underlying arrays of
+        C{self}. Filters and added reads of C{self} are not considered.
+
+        @param minLength: The minimum acceptable length, or C{None}.
+        @param maxLength: The maximum acceptable length, or C{None}.
+        @return: A new C{ReadsArray} holding the wanted reads.
+        """
+        lengths = self.lengths()
+        wanted = np.ones(len(lengths), dtype=np.bool_)
+        if minLength is not None:
+            wanted &= lengths >= minLength
+        if maxLength is not None:
+            wanted &= lengths <= maxLength
+        return self._subset(wanted)
+
+    def summarizePosition(self, index):
+        """
+        Compute residue counts at a specific sequence index.
+
+        @param index: an C{int} index into the sequence.
+        @return: A C{dict} with the count of too-short (excluded) sequences,
+            and a Counter instance giving the residue counts.
+        """
+        if not self._vectorizable():
+            return Reads.summarizePosition(self, index)
+
+        lengths = self.lengths()
+        if index >= 0:
+            present = lengths > index
+            offsets = self._starts[present] + index
+        else:
+            present = lengths >= -index
+            offsets = self._ends[present] + index
+
+        counts = np.bincount(self._sequences[offsets], minlength=256)
+
+        return {
+            'excludedCount': int(len(lengths) - present.sum()),
+            'countAtPosition': Counter(
+                dict((chr(code), int(counts[code]))
+                     for code in np.flatnonzero(counts))),
+        }
+
+    def sitesMatching(self, targets, matchCase, any_):
+        """
+        Find sites (i.e., sequence indices) that match a given set of target
+        sequence bases.
+
+        @param targets: A C{set} of sequence bases to look for.
+        @param matchCase: If C{True}, case will be considered in matching.
+        @param any_: If C{True}, return sites that match in any read. Else
+            return sites that match in all reads.
+        @return: A C{set} of 0-based sites that indicate where the target
+            bases occur in our reads.
+        """
+        if not self._vectorizable():
+            return Reads.sitesMatching(self, targets, matchCase, any_)
+
+        count = len(self._starts)
+        if count == 0:
+            return set()
+
+        # Make a table that says which byte values are targets.
+        if not matchCase:
+            targets = set(map(str.lower, targets))
+        isTarget = np.zeros(256, dtype=np.bool_)
+        for code in range(128):
+            base = chr(code)
+            if (base if matchCase else base.lower()) in targets:
+                isTarget[code] = True
+
+        index, resultStarts = _ranges(self._starts, self._ends)
+        matches = isTarget[self._sequences[index]]
+        sites = (np.arange(len(index), dtype=np.int64) -
+                 np.repeat(resultStarts, self.lengths()))[matches]
+
+        if any_:
+            return set(np.unique(sites).tolist())
+        else:
+            # A site matches in all reads if it matches as many times as
+            # there are reads (a read can only match once at each site).
+            matchCounts = np.bincount(sites)
+            return set(np.flatnonzero(matchCounts == count).tolist())
+
+    def save(self, filename, format_='fasta', threads=0):
+        """
+        Write the reads to C{filename} in the requested format.
+
+        @param filename: Either a C{str} file name to save into (the file will
+            be overwritten) or an open file descriptor (e.g., sys.stdout). A
+            file name ending in '.gz', '.bgz', or '.bz2' will be compressed
+            (see L{dark.utils.openFileForWriting}).
+        @param format_: A C{str} format to save as, either 'fasta' or 'fastq'.
+        @param threads: An C{int} number of threads to use for writing and
+            compression (see L{dark.utils.openFileForWriting}). Only used if
+            C{filename} is a C{str}.
+        @raise ValueError: if C{format_} is 'fastq' and a read with no quality
+            is present, or if an unknown format is requested.
+        @return: An C{int} giving the number of reads in C{self}.
+        """
+        if not self._vectorizable():
+            return Reads.save(self, filename, format_, threads=threads)
+
+        format_ = format_.lower()
+        ids = (self._ids, self._idStarts, self._idEnds)
+        sequences = (self._sequences, self._starts, self._ends)
+
+        if format_ == 'fasta':
+            fields = (b'>', ids, b'\n', sequences, b'\n')
+        elif format_ == 'fastq':
+            if len(self._starts) == 0:
+                # There are no reads, so there are no qualities to write.
+                qualities = sequences
+            elif self._hasQuality is None or not self._hasQuality.all():
+                index = (0 if self._hasQuality is None else
+                         int(np.argmin(self._hasQuality)))
+                raise ValueError('Read %r has no quality information' %
+                                 self[index].id)
+            else:
+                qualities = (self._qualities, self._starts, self._ends)
+            fields = (b'@', ids, b'\n', sequences, b'\n', b'+', ids, b'\n',
+                      qualities, b'\n')
+        else:
+            raise ValueError("Format must be either 'fasta', 'fastq' or "
+                             "'fasta-ss'.")
+
+        # Single-character fields are put directly into place, as are short
+        # fields (e.g., ids) via an index of their output offsets. The bytes
+        # of a long field (for all records at once) are put into place using
+        # a mask of the output bytes that belong to it, which is much faster
+        # than using an index when most of the output must be written.
+        count = len(self._starts)
+        fieldLengths = np.empty((count, len(fields)), dtype=np.int64)
+        for fieldNumber, field in enumerate(fields):
+            fieldLengths[:, fieldNumber] = (
+                1 if isinstance(field, bytes) else field[2] - field[1])
+        fieldLengths = fieldLengths.ravel()
+        fieldStarts = (np.cumsum(fieldLengths) - fieldLengths).reshape(
+            (count, len(fields)))
+
+        output = np.empty(int(fieldLengths.sum()), dtype=np.uint8)
+        for fieldNumber, field in enumerate(fields):
+            starts = fieldStarts[:, fieldNumber]
+            if isinstance(field, bytes):
+                output[starts] = ord(field)
+            else:
+                data = _concatenate(*field)
+                if len(data) * 8 < len(output):
+                    ends = starts + (field[2] - field[1])
+                    output[_ranges(starts, ends)[0]] = data
+                else:
+                    isField = np.zeros(len(fields), dtype=np.bool_)
+                    isField[fieldNumber] = True
+                    output[np.repeat(np.tile(isField, count),
+                                     fieldLengths)] = data
+
+        if isinstance(filename, str):
+            if threads or filename.endswith(_COMPRESSED_SUFFIXES):
+                with openFileForWriting(filename, threads=threads) as fp:
+                    fp.write(output.tobytes().decode('UTF-8'))
+            else:
+                with open(filename, 'wb') as fp:
+                    fp.write(output.data)
+        else:
+            # We have a file-like object.
+            filename.write(output.tobytes().decode('UTF-8'))
+
+        return len(self._starts)
@@ -23,6 +23,15 @@ class InvalidSAM(Exception):
     "SAM/BAM file has unexpected/invalid content."
 
 
+class _AlignedRead(Read):
+    """
+    A L{dark.reads.Read} that also holds the C{pysam.AlignedSegment} it was
+    made from, in its C{alignment} attribute. Reads have C{__slots__}, so
+    this attribute cannot be added to a plain C{Read} instance.
+    """
+    __slots__ = ('alignment',)
+
+
 # From https://samtools.github.io/hts-specs/SAMv1.pdf
 _CONSUMES_QUERY = {CMATCH, CINS, CSOFT_CLIP, CEQUAL, CDIFF}
 _CONSUMES_REFERENCE = {CMATCH, CDEL, CREF_SKIP, CEQUAL, CDIFF}
@@ -645,9 +654,10 @@ class PaddedSAM(object):
                              alignedQuality +
                              unknownQualityChar * padRightLength)
 
-            read = Read(queryId, paddedSequence, paddedQuality)
-
             if addAlignment:
+                read = _AlignedRead(queryId, paddedSequence, paddedQuality)
                 read.alignment = alignment
+            else:
+                read = Read(queryId, paddedSequence, paddedQuality)
 
             yield read
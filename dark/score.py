@@ -1,23 +1,38 @@
-from functools import total_ordering
-
-
-@total_ordering
 class HigherIsBetterScore(object):
     """
     Provide comparison functions for scores where numerically higher values
     are considered better.
 
+    There may be a very large number of these (one per HSP), so the class
+    uses __slots__ to save memory and defines all its comparison methods
+    directly (rather than via functools.total_ordering) to make sorting
+    faster.
+
     @param score: The numeric score of this HSP.
     """
+    __slots__ = ('score',)
+
     def __init__(self, score):
         self.score = score
 
     def __lt__(self, other):
         return self.score < other.score
 
+    def __le__(self, other):
+        return self.score <= other.score
+
+    def __gt__(self, other):
+        return self.score > other.score
+
+    def __ge__(self, other):
+        return self.score >= other.score
+
     def __eq__(self, other):
         return self.score == other.score
 
+    def __ne__(self, other):
+        return self.score != other.score
+
     def betterThan(self, score):
         """
         Compare this score with another score.
@@ -28,23 +43,39 @@ class HigherIsBetterScore(object):
         return self.score > score
 
 
-@total_ordering
 class LowerIsBetterScore(object):
     """
     Provide comparison functions for scores where numerically lower values
     are considered better.
 
+    As with L{HigherIsBetterScore}, the class uses __slots__ and defines all
+    its comparison methods directly.
+
     @param score: The numeric score of this LSP.
     """
+    __slots__ = ('score',)
+
     def __init__(self, score):
         self.score = score
 
     def __lt__(self, other):
         return self.score > other.score
 
+    def __le__(self, other):
+        return self.score >= other.score
+
+    def __gt__(self, other):
+        return self.score < other.score
+
+    def __ge__(self, other):
+        return self.score <= other.score
+
     def __eq__(self, other):
         return self.score == other.score
 
+    def __ne__(self, other):
+        return self.score != other.score
+
     def betterThan(self, score):
         """
         Compare this score with another score.
@@ -1,12 +1,19 @@
 from __future__ import division
 
+import io
 import string
 import six
 import bz2
 import gzip
+import struct
+import zlib
+from collections import deque
 from os.path import basename
 from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
 from re import compile
+from threading import Thread
+from six.moves.queue import Queue, Empty
 import numpy as np
 
 
@@ -102,34 +109,660 @@ def median(l):
         return _median(l)
 
 
+# The number of (uncompressed) bytes a background decompression thread reads
+# at a time, and the maximum number of such chunks it will hold before
+# waiting for them to be consumed.
+DECOMPRESSION_CHUNK_SIZE = 1 << 20
+DECOMPRESSION_PREFETCH_CHUNKS = 8
+
+# The gzip magic number, followed by the deflate method byte and a flags
+# byte with FEXTRA set, as found at the start of every BGZF block.
+_BGZF_MAGIC = b'\x1f\x8b\x08\x04'
+
+
+class _BackgroundReader(io.RawIOBase):
+    """
+    A read-only raw binary stream whose data is read (and, in the case of a
+    compressed file, decompressed) from another binary stream by a
+    background thread, with a bounded number of chunks read ahead.
+
+    @param fp: An open binary file-like object to read from. It will be
+        closed when this reader is closed.
+    @param chunkSize: The C{int} number of bytes to read from C{fp} at a
+        time.
+    @param prefetch: The C{int} maximum number of chunks to read ahead.
+    """
+    def __init__(self, fp, chunkSize=DECOMPRESSION_CHUNK_SIZE,
+                 prefetch=DECOMPRESSION_PREFETCH_CHUNKS):
+        io.RawIOBase.__init__(self)
+        self._fp = fp
+        self._chunkSize = chunkSize
+        self._queue = Queue(maxsize=prefetch)
+        self._stopping = False
+        self._buffer = b''
+        self._offset = 0
+        self._eof = False
+        self._thread = Thread(target=self._produce)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _produce(self):
+        """
+        Read chunks from our underlying file until EOF (or until we are
+        closed), putting them onto our queue. An exception is passed through
+        the queue so it can be re-raised in the consuming thread.
+        """
+        put = self._queue.put
+        read = self._fp.read
+        chunkSize = self._chunkSize
+        try:
+            while not self._stopping:
+                chunk = read(chunkSize)
+                put(chunk)
+                if not chunk:
+                    break
+        except Exception as e:
+            put(e)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        """
+        Read bytes into a pre-allocated writable buffer.
+
+        @param b: A writable buffer (e.g., a C{bytearray} or C{memoryview}).
+        @return: The C{int} number of bytes read. Zero indicates EOF.
+        """
+        if self._offset == len(self._buffer):
+            if self._eof:
+                return 0
+            chunk = self._queue.get()
+            if isinstance(chunk, Exception):
+                self._eof = True
+                raise chunk
+            if not chunk:
+                self._eof = True
+                return 0
+            self._buffer = chunk
+            self._offset = 0
+
+        n = min(len(b), len(self._buffer) - self._offset)
+        b[:n] = self._buffer[self._offset:self._offset + n]
+        self._offset += n
+        return n
+
+    def close(self):
+        """
+        Stop the background thread and close the underlying file.
+        """
+        if not self.closed:
+            self._stopping = True
+            # Empty the queue so the background thread is not blocked on
+            # put, and wait for it to notice we are stopping.
+            while self._thread.is_alive():
+                try:
+                    self._queue.get(timeout=0.01)
+                except Empty:
+                    pass
+            self._fp.close()
+        io.RawIOBase.close(self)
+
+
+def _readBGZFBlock(fp):
+    """
+    Read the compressed data of one BGZF block, without decompressing it.
+
+    @param fp: An open binary file positioned at the start of a BGZF block.
+    @raise ValueError: If the data is not in BGZF format.
+    @return: A 2-tuple with the C{bytes} raw deflate data of the block and
+        the C{int} length of the uncompressed data, or C{None} at EOF.
+    """
+    header = fp.read(12)
+    if not header:
+        return None
+    if len(header) < 12 or header[:4] != _BGZF_MAGIC:
+        raise ValueError('Input is not in BGZF format.')
+
+    extraLength = struct.unpack('<H', header[10:12])[0]
+    extra = fp.read(extraLength)
+    blockSize = None
+    offset = 0
+    while offset + 4 <= len(extra):
+        subfieldLength = struct.unpack('<H', extra[offset + 2:offset + 4])[0]
+        if extra[offset:offset + 2] == b'BC' and subfieldLength == 2:
+            blockSize = struct.unpack(
+                '<H', extra[offset + 4:offset + 6])[0] + 1
+        offset += 4 + subfieldLength
+    if blockSize is None:
+        raise ValueError('Input is not in BGZF format (no BC subfield).')
+
+    # The rest of the block is the deflate data followed by the CRC32 and
+    # the uncompressed length (4 bytes each).
+    rest = fp.read(blockSize - 12 - extraLength)
+    return (rest[:-8], struct.unpack('<I', rest[-4:])[0])
+
+
+def _inflateBGZFBlock(block):
+    """
+    Decompress the data of one BGZF block.
+
+    @param block: A 2-tuple, as returned by C{_readBGZFBlock}.
+    @raise ValueError: If the decompressed data has the wrong length.
+    @return: The C{bytes} decompressed data.
+    """
+    data, expectedLength = block
+    result = zlib.decompress(data, -15)
+    if len(result) != expectedLength:
+        raise ValueError(
+            'BGZF block decompressed to %d bytes (expected %d).' %
+            (len(result), expectedLength))
+    return result
+
+
+def iterBGZFBlocks(fp):
+    """
+    Read and decompress the blocks of a BGZF file, keeping track of where in
+    the (compressed) file each block is found.
+
+    @param fp: An open binary file positioned at the start of a BGZF block.
+    @raise ValueError: If the data is not in BGZF format.
+    @return: A generator that yields 3-tuples, each with the C{int} offset
+        of the start of a block in C{fp}, the C{int} offset of the start of
+        the following block, and the C{bytes} decompressed data of the block.
+    """
+    blockStart = fp.tell()
+    while True:
+        block = _readBGZFBlock(fp)
+        if block is None:
+            break
+        blockEnd = fp.tell()
+        yield blockStart, blockEnd, _inflateBGZFBlock(block)
+        blockStart = blockEnd
+
+
+class _ParallelBGZFReader(io.RawIOBase):
+    """
+    A read-only raw binary stream that decompresses BGZF blocks using a pool
+    of threads. Blocks are split from the compressed input by reading their
+    headers (which give their sizes), so no decompression is needed to find
+    them.
+
+    @param fp: An open binary file containing BGZF-compressed data. It will
+        be closed when this reader is closed.
+    @param threads: The C{int} number of decompression threads to use.
+    """
+    def __init__(self, fp, threads):
+        io.RawIOBase.__init__(self)
+        self._fp = fp
+        self._pool = ThreadPool(threads)
+        # Keep a bounded number of blocks in flight, in input order.
+        self._maxPending = 4 * threads
+        self._pending = deque()
+        self._inputExhausted = False
+        self._buffer = b''
+        self._offset = 0
+
+    def _fill(self):
+        """
+        Submit blocks for decompression until we have enough in flight.
+        """
+        while (not self._inputExhausted and
+               len(self._pending) < self._maxPending):
+            block = _readBGZFBlock(self._fp)
+            if block is None:
+                self._inputExhausted = True
+            else:
+                self._pending.append(
+                    self._pool.apply_async(_inflateBGZFBlock, (block,)))
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        """
+        Read bytes into a pre-allocated writable buffer.
+
+        @param b: A writable buffer (e.g., a C{bytearray} or C{memoryview}).
+        @return: The C{int} number of bytes read. Zero indicates EOF.
+        """
+        # Note that a BGZF block may decompress to nothing (e.g., the EOF
+        # marker block), hence the loop.
+        while self._offset == len(self._buffer):
+            self._fill()
+            if not self._pending:
+                return 0
+            self._buffer = self._pending.popleft().get()
+            self._offset = 0
+
+        n = min(len(b), len(self._buffer) - self._offset)
+        b[:n] = self._buffer[self._offset:self._offset + n]
+        self._offset += n
+        return n
+
+    def close(self):
+        """
+        Stop the decompression threads and close the underlying file.
+        """
+        if not self.closed:
+            self._pool.terminate()
+            self._pool.join()
+            self._fp.close()
+        io.RawIOBase.close(self)
+
+
+def isBGZF(filename):
+    """
+    Check whether a file is compressed in BGZF format (as made by bgzip).
+
+    @param filename: A C{str} file name.
+    @return: C{True} if the file starts with a BGZF block header.
+    """
+    with open(filename, 'rb') as fp:
+        header = fp.read(18)
+    return (len(header) == 18 and header[:4] == _BGZF_MAGIC and
+            header[12:14] == b'BC')
+
+
+def openFile(filename, threads=0):
+    """
+    Open a (possibly compressed) file for reading text.
+
+    @param filename: A C{str} file name. If it ends with '.gz', '.bgz' or
+        '.bz2' the file will be decompressed.
+    @param threads: An C{int}. If zero, the file is read (and decompressed)
+        in the calling thread. Otherwise, reading and decompression are done
+        in a background thread, which reads ahead a bounded amount. If
+        greater than one and the file is in BGZF format, that number of
+        threads will be used to decompress BGZF blocks in parallel.
+    @return: An open file handle. The caller must close it.
+    """
+    isGzip = filename.endswith('.gz') or filename.endswith('.bgz')
+
+    if threads:
+        if isGzip:
+            if threads > 1 and isBGZF(filename):
+                raw = _ParallelBGZFReader(open(filename, 'rb'), threads)
+            else:
+                raw = _BackgroundReader(gzip.open(filename, 'rb'))
+        elif filename.endswith('.bz2'):
+            raw = _BackgroundReader(bz2.BZ2File(filename))
+        else:
+            raw = _BackgroundReader(open(filename, 'rb'))
+
+        fp = io.BufferedReader(raw, DECOMPRESSION_CHUNK_SIZE)
+        if six.PY3:
+            return io.TextIOWrapper(fp, encoding='UTF-8')
+        else:
+            return fp
+
+    if isGzip:
+        if six.PY3:
+            return gzip.open(filename, mode='rt', encoding='UTF-8')
+        else:
+            return gzip.GzipFile(filename)
+    elif filename.endswith('.bz2'):
+        if six.PY3:
+            return bz2.open(filename, mode='rt', encoding='UTF-8')
+        else:
+            return bz2.BZ2File(filename)
+    else:
+        return open(filename)
+
+
+# The maximum number of uncompressed bytes written to a BGZF block. This is
+# the value used by bgzip, and leaves room for the block header and for data
+# that does not compress.
+BGZF_BLOCK_SIZE = 0xff00
+
+# The zlib compression level used when writing gzip and BGZF files. This is
+# the gzip command's default (Python's gzip module defaults to 9, which is
+# much slower for little gain).
+COMPRESSION_LEVEL = 6
+
+# The empty BGZF block that marks the end of a BGZF file.
+_BGZF_EOF = (b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00'
+             b'\x1b\x00\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00')
+
+
+def _deflateBGZFBlock(data):
+    """
+    Compress data into one BGZF block.
+
+    @param data: The C{bytes} to compress. Its length must not be more than
+        C{BGZF_BLOCK_SIZE}.
+    @return: The C{bytes} BGZF block.
+    """
+    compressor = zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, -15)
+    deflated = compressor.compress(data) + compressor.flush()
+    # The header is followed by the BSIZE field: the total block size
+    # (18 header bytes, the deflate data, and an 8 byte trailer) minus one.
+    return b''.join((
+        _BGZF_MAGIC, b'\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00',
+        struct.pack('<H', len(deflated) + 25), deflated,
+        struct.pack('<II', zlib.crc32(data) & 0xffffffff, len(data))))
+
+
+class _BGZFWriter(io.RawIOBase):
+    """
+    A write-only raw binary stream that compresses data into BGZF blocks,
+    optionally using a pool of threads to compress blocks in parallel.
+
+    @param fp: An open binary file to write BGZF-compressed data to. It will
+        be closed when this writer is closed.
+    @param threads: The C{int} number of compression threads to use. If
+        zero, blocks are compressed in the calling thread.
+    """
+    def __init__(self, fp, threads=0):
+        io.RawIOBase.__init__(self)
+        self._fp = fp
+        self._buffer = bytearray()
+        if threads:
+            self._pool = ThreadPool(threads)
+            # Keep a bounded number of blocks in flight, in output order.
+            self._maxPending = 4 * threads
+            self._pending = deque()
+        else:
+            self._pool = None
+
+    def _submit(self, data):
+        """
+        Compress a block of data and (eventually) write it.
+
+        @param data: The C{bytes} to compress.
+        """
+        if self._pool is None:
+            self._fp.write(_deflateBGZFBlock(data))
+        else:
+            self._pending.append(
+                self._pool.apply_async(_deflateBGZFBlock, (data,)))
+            while len(self._pending) > self._maxPending:
+                self._fp.write(self._pending.popleft().get())
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        """
+        Write bytes.
+
+        @param b: A C{bytes}-like object.
+        @return: The C{int} number of bytes written (always all of them).
+        """
+        n = len(b)
+        buffer_ = self._buffer
+        buffer_.extend(b)
+        if len(buffer_) >= BGZF_BLOCK_SIZE:
+            offset = 0
+            while len(buffer_) - offset >= BGZF_BLOCK_SIZE:
+                self._submit(bytes(buffer_[offset:offset + BGZF_BLOCK_SIZE]))
+                offset += BGZF_BLOCK_SIZE
+            del buffer_[:offset]
+        return n
+
+    def close(self):
+        """
+        Compress and write any remaining data and the BGZF end of file
+        marker, stop the compression threads, and close the underlying file.
+        """
+        if not self.closed:
+            try:
+                if self._buffer:
+                    self._submit(bytes(self._buffer))
+                    self._buffer = bytearray()
+                if self._pool is not None:
+                    while self._pending:
+                        self._fp.write(self._pending.popleft().get())
+                self._fp.write(_BGZF_EOF)
+            finally:
+                if self._pool is not None:
+                    self._pool.terminate()
+                    self._pool.join()
+                self._fp.close()
+        io.RawIOBase.close(self)
+
+
+class _BackgroundWriter(io.RawIOBase):
+    """
+    A write-only raw binary stream whose data is written (and, in the case
+    of a compressed file, compressed) to another binary stream by a
+    background thread, with a bounded number of chunks waiting to be
+    written.
+
+    @param fp: An open binary file-like object to write to. It will be
+        closed when this writer is closed.
+    @param backlog: The C{int} maximum number of chunks waiting to be
+        written.
+    """
+    def __init__(self, fp, backlog=DECOMPRESSION_PREFETCH_CHUNKS):
+        io.RawIOBase.__init__(self)
+        self._fp = fp
+        self._queue = Queue(maxsize=backlog)
+        self._error = None
+        self._thread = Thread(target=self._consume)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _consume(self):
+        """
+        Write chunks from our queue to our underlying file until we get
+        C{None}. If a write fails, the exception is kept so it can be raised
+        in the writing thread, and further chunks are discarded.
+        """
+        get = self._queue.get
+        write = self._fp.write
+        while True:
+            chunk = get()
+            if chunk is None:
+                break
+            if self._error is None:
+                try:
+                    write(chunk)
+                except Exception as e:
+                    self._error = e
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        """
+        Write bytes.
+
+        @param b: A C{bytes}-like object.
+        @raise Exception: If an earlier write in the background thread
+            failed, its exception is raised.
+        @return: The C{int} number of bytes written (always all of them).
+        """
+        if self._error is not None:
+            raise self._error
+        # Copy the data, as the caller may re-use the buffer.
+        self._queue.put(bytes(b))
+        return len(b)
+
+    def close(self):
+        """
+        Wait for the background thread to write all data, then close the
+        underlying file.
+
+        @raise Exception: If a write in the background thread failed, its
+            exception is raised.
+        """
+        if not self.closed:
+            self._queue.put(None)
+            self._thread.join()
+            self._fp.close()
+        io.RawIOBase.close(self)
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+
+def openFileForWriting(filename, threads=0):
+    """
+    Open a (possibly compressed) file for writing text.
+
+    @param filename: A C{str} file name. If it ends with '.gz' the file will
+        be gzip compressed, if it ends with '.bgz' it will be BGZF
+        compressed (BGZF files are also valid gzip files), and if it ends
+        with '.bz2' it will be bzip2 compressed.
+    @param threads: An C{int}. If zero, the file is written (and compressed)
+        in the calling thread. Otherwise, writing and compression are done in
+        a background thread. If greater than one and the file is to be
+        compressed with gzip, it is written in BGZF format and that number
+        of threads will be used to compress BGZF blocks in parallel.
+    @return: An open file handle. The caller must close it.
+    """
+    isGzip = filename.endswith('.gz')
+
+    if threads > 1 and (isGzip or filename.endswith('.bgz')):
+        raw = _BGZFWriter(open(filename, 'wb'), threads)
+    elif threads:
+        if isGzip:
+            fp = gzip.GzipFile(filename, 'wb',
+                               compresslevel=COMPRESSION_LEVEL)
+        elif filename.endswith('.bgz'):
+            fp = _BGZFWriter(open(filename, 'wb'))
+        elif filename.endswith('.bz2'):
+            fp = bz2.BZ2File(filename, 'wb')
+        else:
+            fp = open(filename, 'wb')
+        raw = _BackgroundWriter(fp)
+    elif isGzip:
+        if six.PY3:
+            return gzip.open(filename, mode='wt', encoding='UTF-8',
+                             compresslevel=COMPRESSION_LEVEL)
+        else:
+            return gzip.GzipFile(filename, 'wb',
+                                 compresslevel=COMPRESSION_LEVEL)
+    elif filename.endswith('.bgz'):
+        raw = _BGZFWriter(open(filename, 'wb'))
+    elif filename.endswith('.bz2'):
+        if six.PY3:
+            return bz2.open(filename, mode='wt', encoding='UTF-8')
+        else:
+            return bz2.BZ2File(filename, 'wb')
+    else:
+        return open(filename, 'w')
+
+    fp = io.BufferedWriter(raw, DECOMPRESSION_CHUNK_SIZE)
+    if six.PY3:
+        return io.TextIOWrapper(fp, encoding='UTF-8')
+    else:
+        return fp
+
+
 @contextmanager
-def asHandle(fileNameOrHandle, mode='r'):
+def asHandle(fileNameOrHandle, mode='r', threads=0):
     """
     Decorator for file opening that makes it easy to open compressed files.
     Based on L{Bio.File.as_handle}.
 
     @param fileNameOrHandle: Either a C{str} or a file handle.
+    @param threads: An C{int} number of threads to use for reading and
+        decompression (see L{openFile}). Only used if C{fileNameOrHandle}
+        is a C{str}.
     @return: A generator that can be turned into a context manager via
         L{contextlib.contextmanager}.
     """
     if isinstance(fileNameOrHandle, six.string_types):
-        if fileNameOrHandle.endswith('.gz'):
-            if six.PY3:
-                yield gzip.open(fileNameOrHandle, mode='rt', encoding='UTF-8')
-            else:
-                yield gzip.GzipFile(fileNameOrHandle)
-        elif fileNameOrHandle.endswith('.bz2'):
-            if six.PY3:
-                yield bz2.open(fileNameOrHandle, mode='rt', encoding='UTF-8')
-            else:
-                yield bz2.BZ2File(fileNameOrHandle)
-        else:
-            with open(fileNameOrHandle) as fp:
-                yield fp
+        fp = openFile(fileNameOrHandle, threads=threads)
+        try:
+            yield fp
+        finally:
+            fp.close()
     else:
         yield fileNameOrHandle
 
 
+def iterHandles(fileNamesOrHandles, threads=0):
+    """
+    Open a series of files, one after another.
+
+    When C{threads} is non-zero, each file (after the first) is opened
+    while the previous one is still being used, so its reading and
+    decompression (in background threads) start early.
+
+    @param fileNamesOrHandles: An iterable of C{str} file names and/or open
+        file handles. Passed handles are not closed.
+    @param threads: An C{int} number of threads to use for reading and
+        decompression (see L{openFile}).
+    @return: A generator that yields (fileNameOrHandle, handle) 2-tuples.
+        Each handle opened here is closed when the generator moves on to
+        the next file (or is closed).
+    """
+    def _open(fileNameOrHandle):
+        if isinstance(fileNameOrHandle, six.string_types):
+            return fileNameOrHandle, openFile(fileNameOrHandle,
+                                              threads=threads), True
+        else:
+            return fileNameOrHandle, fileNameOrHandle, False
+
+    if not threads:
+        for fileNameOrHandle in fileNamesOrHandles:
+            with asHandle(fileNameOrHandle) as fp:
+                yield fileNameOrHandle, fp
+        return
+
+    fileNamesOrHandles = iter(fileNamesOrHandles)
+    try:
+        nextFile = _open(next(fileNamesOrHandles))
+    except StopIteration:
+        return
+
+    try:
+        while nextFile:
+            current, nextFile = nextFile, None
+            try:
+                # Start the next file (if any) reading in the background
+                # before handing out the current one.
+                try:
+                    nextFile = _open(next(fileNamesOrHandles))
+                except StopIteration:
+                    pass
+                yield current[0], current[1]
+            finally:
+                if current[2]:
+                    current[1].close()
+    finally:
+        if nextFile and nextFile[2]:
+            nextFile[1].close()
+
+
+def lineAlignedBlocks(fp, blockSize):
+    """
+    Read large blocks from a file handle, adjusting them so that each
+    yielded block ends at a line boundary (or at EOF).
+
+    @param fp: An open file handle.
+    @param blockSize: The C{int} number of characters to read at a time.
+    @return: A generator that yields C{str} blocks of input.
+    """
+    read = fp.read
+    # Pieces of an incomplete final line. These are kept in a list (as
+    # opposed to being repeatedly concatenated) so that very long lines
+    # (e.g., a whole genome on one line) are handled in linear time.
+    partial = []
+
+    while True:
+        block = read(blockSize)
+        if not block:
+            break
+        lastNewline = block.rfind('\n')
+        if lastNewline == -1:
+            partial.append(block)
+        else:
+            if partial:
+                partial.append(block[:lastNewline + 1])
+                yield ''.join(partial)
+            else:
+                yield block[:lastNewline + 1]
+            rest = block[lastNewline + 1:]
+            partial = [rest] if rest else []
+
+    if partial:
+        yield ''.join(partial)
+
+
 _rangeRegex = compile(r'^\s*(\d+)(?:\s*-\s*(\d+))?\s*$')
 
 
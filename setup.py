@@ -36,6 +36,7 @@ scripts = [
     'bin/convert-blast-xml-to-json.py',
     'bin/convert-diamond-to-json.py',
     'bin/convert-diamond-to-sam.py',
+    'bin/convert-json-to-alignment-store.py',
     'bin/convert-sam-to-fastq.sh',
     'bin/dark-matter-version.py',
     'bin/dna-to-aa.py',
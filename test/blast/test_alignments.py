@@ -5,6 +5,9 @@ import platform
 from six.moves import builtins
 from copy import deepcopy
 from json import dumps
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
 from unittest import TestCase
 import sqlite3
 
@@ -19,6 +22,8 @@ from Bio import SeqIO
 from ..mocking import mockOpen, File
 from .sample_data import PARAMS, RECORD0, RECORD1, RECORD2, RECORD3, RECORD4
 
+from dark.alignments import readIdIndex
+from dark.alignment_store import convertJSONToAlignmentStore
 from dark.reads import Read, Reads, DNARead
 from dark.hsp import HSP, LSP
 from dark.score import LowerIsBetterScore
@@ -403,7 +408,7 @@ class TestBlastReadsAlignments(TestCase):
         """
         The getSubjectSequence function must return the correct C{DNARead}
         instance when a FASTA database filename is given to the
-        BlastReadsAlignments constructor.
+        BlastReadsAlignments constructor and subjects are read into memory.
         """
         class SideEffect(object):
             def __init__(self, test):
@@ -417,7 +422,7 @@ class TestBlastReadsAlignments(TestCase):
                     return File([dumps(PARAMS) + '\n', dumps(RECORD0) + '\n'])
                 elif self.count == 1:
                     self.count += 1
-                    return File(['>id1 Description', 'AA\n'])
+                    return File(['>id1 Description\n', 'AA\n'])
                 else:
                     self.fail('Unexpected third call to open.')
 
@@ -427,13 +432,36 @@ class TestBlastReadsAlignments(TestCase):
             mockMethod.side_effect = sideEffect.sideEffect
             reads = Reads()
             readsAlignments = BlastReadsAlignments(
-                reads, 'file.json', databaseFilename='database.fasta')
+                reads, 'file.json', databaseFilename='database.fasta',
+                subjectsInMemory=True)
             subject = readsAlignments.getSubjectSequence('id1 Description')
             self.assertIsInstance(subject, DNARead)
             self.assertIsInstance(subject.sequence, str)
             self.assertEqual('id1 Description', subject.id)
             self.assertEqual('AA', subject.sequence)
 
+    def testGetSubjectSequenceFASTADatabaseIndex(self):
+        """
+        The getSubjectSequence function must return the correct C{DNARead}
+        instance, looked up in an index of the FASTA database, when a FASTA
+        database filename is given to the BlastReadsAlignments constructor.
+        """
+        directory = mkdtemp()
+        try:
+            jsonFilename = join(directory, 'file.json')
+            fastaFilename = join(directory, 'database.fasta')
+            with open(jsonFilename, 'w') as fp:
+                fp.write(dumps(PARAMS) + '\n' + dumps(RECORD0) + '\n')
+            with open(fastaFilename, 'w') as fp:
+                fp.write('>id1 Description\nAA\n>id2 Description\nCCC\n')
+
+            readsAlignments = BlastReadsAlignments(
+                Reads(), jsonFilename, databaseFilename=fastaFilename)
+            subject = readsAlignments.getSubjectSequence('id2 Description')
+            self.assertEqual(DNARead('id2 Description', 'CCC'), subject)
+        finally:
+            rmtree(directory)
+
     @patch('os.path.exists')
     def testGetSubjectSequenceSqliteDatabase(self, existsMock):
         """
@@ -524,6 +552,147 @@ class TestBlastReadsAlignments(TestCase):
                 self.assertEqual('id1 Description', rc.id)
                 self.assertEqual('ATCGT', rc.sequence)
 
+    def testAlignmentStore(self):
+        """
+        Reading an alignment store made from a JSON file must give the same
+        read alignments as reading the JSON.
+        """
+        directory = mkdtemp()
+        try:
+            jsonFilename = join(directory, 'file.json')
+            storeFilename = join(directory, 'file.npz')
+            with open(jsonFilename, 'w') as fp:
+                fp.write(dumps(PARAMS) + '\n')
+                for record in RECORD0, RECORD1, RECORD2, RECORD3:
+                    fp.write(dumps(record) + '\n')
+            convertJSONToAlignmentStore(jsonFilename, storeFilename)
+
+            reads = Reads()
+            for i in range(4):
+                reads.add(Read('id%d' % i, 'A' * 70))
+
+            def summary(filename):
+                result = []
+                for readAlignments in BlastReadsAlignments(reads, filename):
+                    for alignment in readAlignments:
+                        result.append((
+                            readAlignments.read.id, alignment.subjectTitle,
+                            alignment.subjectLength,
+                            [hsp.toDict() for hsp in alignment.hsps]))
+                return result
+
+            self.assertEqual(summary(jsonFilename), summary(storeFilename))
+        finally:
+            rmtree(directory)
+
+    def testParallelReading(self):
+        """
+        Reading several JSON files in worker processes must give the same
+        read alignments, in the same order, as reading them one after
+        another.
+        """
+        directory = mkdtemp()
+        try:
+            filenames = []
+            for index, record in enumerate((RECORD0, RECORD1, RECORD2)):
+                filename = join(directory, '%d.json' % index)
+                with open(filename, 'w') as fp:
+                    fp.write(dumps(PARAMS) + '\n' + dumps(record) + '\n')
+                filenames.append(filename)
+
+            reads = Reads()
+            for i in range(3):
+                reads.add(Read('id%d' % i, 'A' * 70))
+
+            def summary(workers):
+                result = []
+                for readAlignments in BlastReadsAlignments(
+                        reads, filenames, workers=workers):
+                    for alignment in readAlignments:
+                        result.append((
+                            readAlignments.read.id, alignment.subjectTitle,
+                            [hsp.toDict() for hsp in alignment.hsps]))
+                return result
+
+            self.assertEqual(summary(None), summary(3))
+        finally:
+            rmtree(directory)
+
+    def testParallelReadingClosesFirstFile(self):
+        """
+        When files are read in worker processes, the file opened (in
+        __init__) for the reader of the first file must be closed.
+        """
+        directory = mkdtemp()
+        try:
+            filenames = []
+            for index, record in enumerate((RECORD0, RECORD1)):
+                filename = join(directory, '%d.json' % index)
+                with open(filename, 'w') as fp:
+                    fp.write(dumps(PARAMS) + '\n' + dumps(record) + '\n')
+                filenames.append(filename)
+
+            reads = Reads([Read('id0', 'A' * 70), Read('id1', 'A' * 70)])
+            for threads in 0, 1:
+                readsAlignments = BlastReadsAlignments(
+                    reads, filenames, threads=threads, workers=2)
+                fp = readsAlignments._reader._fp
+                self.assertEqual(2, len(list(readsAlignments)))
+                self.assertIsNone(readsAlignments._reader._fp)
+                self.assertTrue(fp.closed)
+        finally:
+            rmtree(directory)
+
+    def testParallelReadingIncompatibleParameters(self):
+        """
+        When JSON files are read in worker processes, a C{ValueError} must
+        be raised if they have incompatible parameters.
+        """
+        directory = mkdtemp()
+        try:
+            skypeParams = deepcopy(PARAMS)
+            skypeParams['application'] = 'Skype'
+            filenames = []
+            for index, (params, record) in enumerate(
+                    ((PARAMS, RECORD0), (skypeParams, RECORD1))):
+                filename = join(directory, '%d.json' % index)
+                with open(filename, 'w') as fp:
+                    fp.write(dumps(params) + '\n' + dumps(record) + '\n')
+                filenames.append(filename)
+
+            reads = Reads()
+            reads.add(Read('id0', 'A' * 70))
+            reads.add(Read('id1', 'A' * 70))
+            readsAlignments = BlastReadsAlignments(reads, filenames,
+                                                   workers=2)
+            error = ("^Incompatible BLAST parameters found\\. The parameters "
+                     "in .*1\\.json differ from those originally found "
+                     "in .*0\\.json\\. ")
+            six.assertRaisesRegex(self, ValueError, error, list,
+                                  readsAlignments)
+        finally:
+            rmtree(directory)
+
+    def testReadIndex(self):
+        """
+        When a read index is given, reads must be looked up by id, so they
+        need not be in the order of the records, and reads with no records
+        must be yielded (with no alignments) after all records.
+        """
+        mockOpener = mockOpen(read_data=(
+            dumps(PARAMS) + '\n' + dumps(RECORD0) + '\n' +
+            dumps(RECORD2) + '\n'))
+        with patch.object(builtins, 'open', mockOpener):
+            reads = Reads([Read('id2', 'A' * 70), Read('id1', 'A' * 70),
+                           Read('id0', 'A' * 70)])
+            readsAlignments = BlastReadsAlignments(
+                reads, 'file.json', readIndex=readIdIndex(reads))
+            result = list(readsAlignments)
+            self.assertEqual(['id0', 'id2', 'id1'],
+                             [readAlignments.read.id
+                              for readAlignments in result])
+            self.assertEqual([2, 1, 0], list(map(len, result)))
+
     def testHsps(self):
         """
         The hsps function must yield the HSPs.
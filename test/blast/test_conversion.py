@@ -8,7 +8,10 @@ except ImportError:
 
 from ..mocking import mockOpen
 
-from json import dumps
+from functools import partial
+from gc import collect
+from json import dumps, loads
+from weakref import ref
 
 from dark.blast.conversion import XMLRecordsReader, JSONRecordsReader
 from dark.reads import Reads, DNARead
@@ -456,3 +459,78 @@ class TestJSONRecordsReader(TestCase):
             self.assertEqual(7, readAlignments[1][1].hsps[0].positiveCount)
             self.assertEqual(3800, readAlignments[1][2].hsps[0].identicalCount)
             self.assertEqual(7700, readAlignments[1][2].hsps[0].positiveCount)
+
+    def testMatchedSequences(self):
+        """
+        The matched read and subject sequences must be kept in HSPs by
+        default.
+        """
+        mockOpener = mockOpen(read_data=JSON)
+        with patch.object(builtins, 'open', mockOpener):
+            reader = JSONRecordsReader('file.json')
+            hsp = list(reader.readAlignments(self.READS))[0][0].hsps[0]
+            self.assertIsNotNone(hsp.readMatchedSequence)
+            self.assertIsNotNone(hsp.subjectMatchedSequence)
+
+    def testNoMatchedSequences(self):
+        """
+        If matchedSequences is C{False}, the matched read and subject
+        sequences must not be kept in HSPs, but the HSP offsets must be the
+        same as when they are kept.
+        """
+        mockOpener = mockOpen(read_data=JSON)
+        with patch.object(builtins, 'open', mockOpener):
+            reader = JSONRecordsReader('file.json')
+            expected = list(reader.readAlignments(self.READS))[0][0].hsps[0]
+
+        mockOpener = mockOpen(read_data=JSON)
+        with patch.object(builtins, 'open', mockOpener):
+            reader = JSONRecordsReader('file.json', matchedSequences=False)
+            hsp = list(reader.readAlignments(self.READS))[0][0].hsps[0]
+            self.assertIsNone(hsp.readMatchedSequence)
+            self.assertIsNone(hsp.subjectMatchedSequence)
+            self.assertEqual(expected.readStartInSubject,
+                             hsp.readStartInSubject)
+            self.assertEqual(expected.readEndInSubject, hsp.readEndInSubject)
+
+    def testStdlibJSONBackend(self):
+        """
+        The stdlib JSON backend must be able to be used.
+        """
+        mockOpener = mockOpen(read_data=JSON)
+        with patch.object(builtins, 'open', mockOpener):
+            reader = JSONRecordsReader('file.json', jsonBackend='json')
+            readAlignments = list(reader.readAlignments(self.READS))
+            self.assertEqual(4, len(readAlignments))
+
+    def testRawHSPDictsAreNotKept(self):
+        """
+        The HSPs in the alignments returned by a JSONRecordsReader must not
+        keep references to the BLAST HSP dictionaries read from the JSON
+        (which contain the matched sequences), even before their offsets
+        have been normalized.
+        """
+        class WeakDict(dict):
+            pass
+
+        hspRefs = []
+
+        def objectHook(d):
+            d = WeakDict(d)
+            if 'query_start' in d:
+                hspRefs.append(ref(d))
+            return d
+
+        mockOpener = mockOpen(read_data=JSON)
+        with patch.object(builtins, 'open', mockOpener):
+            reader = JSONRecordsReader('file.json')
+            reader._loads = partial(loads, object_hook=objectHook)
+            readAlignments = list(reader.readAlignments(self.READS))
+
+        collect()
+        self.assertTrue(hspRefs)
+        self.assertEqual([None] * len(hspRefs), [r() for r in hspRefs])
+        for readAlignment in readAlignments:
+            for alignment in readAlignment:
+                for hsp in alignment.hsps:
+                    self.assertIsInstance(hsp.subjectStart, int)
@@ -4,6 +4,10 @@ import six
 import platform
 from six.moves import builtins
 from copy import deepcopy
+from os import unlink
+from os.path import exists, join
+from shutil import rmtree
+from tempfile import mkdtemp
 from json import dumps
 from unittest import TestCase
 
@@ -15,11 +19,15 @@ except ImportError:
 from ..mocking import mockOpen, File
 from .sample_data import PARAMS, RECORD0, RECORD1, RECORD2, RECORD3, RECORD4
 
+from dark.alignments import readIdIndex
+from dark.fasta import FastaMmapReads, SqliteIndex
+from dark.alignment_store import convertJSONToAlignmentStore
 from dark.reads import Read, Reads, AAReadWithX
 from dark.hsp import HSP, LSP
 from dark.score import LowerIsBetterScore
 from dark.diamond.alignments import (
     DiamondReadsAlignments, ZERO_EVALUE_UPPER_RANDOM_INCREMENT)
+from dark.diamond.hsp import normalizeHSP
 from dark.titles import TitlesAlignments
 
 
@@ -281,7 +289,7 @@ class TestDiamondReadsAlignments(TestCase):
     def testGetSubjectSequence(self):
         """
         The getSubjectSequence function must return an AAReadWithX instance
-        with a string sequence.
+        with a string sequence when subjects are read into memory.
         """
         class SideEffect(object):
             def __init__(self, test):
@@ -295,7 +303,7 @@ class TestDiamondReadsAlignments(TestCase):
                     return File([dumps(PARAMS) + '\n', dumps(RECORD0) + '\n'])
                 elif self.count == 1:
                     self.count += 1
-                    return File(['>id1 Description', 'AA\n'])
+                    return File(['>id1 Description\n', 'AA\n'])
                 else:
                     self.fail('Unexpected third call to open.')
 
@@ -305,13 +313,290 @@ class TestDiamondReadsAlignments(TestCase):
             mockMethod.side_effect = sideEffect.sideEffect
             reads = Reads()
             readsAlignments = DiamondReadsAlignments(
-                reads, 'file.json', databaseFilename='database.fasta')
+                reads, 'file.json', databaseFilename='database.fasta',
+                subjectsInMemory=True)
             subject = readsAlignments.getSubjectSequence('id1 Description')
             self.assertIsInstance(subject, AAReadWithX)
             self.assertIsInstance(subject.sequence, str)
             self.assertEqual('id1 Description', subject.id)
             self.assertEqual('AA', subject.sequence)
 
+    def testGetSubjectSequenceFromIndex(self):
+        """
+        The getSubjectSequence function must look subjects up in an index
+        made next to the database FASTA file, and the index must be written.
+        """
+        directory = mkdtemp()
+        try:
+            jsonFilename = join(directory, 'file.json')
+            fastaFilename = join(directory, 'database.fasta')
+            with open(jsonFilename, 'w') as fp:
+                fp.write(dumps(PARAMS) + '\n' + dumps(RECORD0) + '\n')
+            with open(fastaFilename, 'w') as fp:
+                fp.write('>id1 Description\nAA\n>id2 Description\nCCC\n')
+
+            readsAlignments = DiamondReadsAlignments(
+                Reads(), jsonFilename, databaseFilename=fastaFilename)
+            subject = readsAlignments.getSubjectSequence('id2 Description')
+            self.assertEqual(AAReadWithX('id2 Description', 'CCC'), subject)
+            self.assertTrue(exists(fastaFilename + '.fai'))
+        finally:
+            rmtree(directory)
+
+    def testPrefetchSubjectSequencesFromIndex(self):
+        """
+        After prefetchSubjectSequences is called when subjects are looked up
+        in an index of the database FASTA, getSubjectSequence must return the
+        prefetched subjects.
+        """
+        directory = mkdtemp()
+        try:
+            jsonFilename = join(directory, 'file.json')
+            fastaFilename = join(directory, 'database.fasta')
+            with open(jsonFilename, 'w') as fp:
+                fp.write(dumps(PARAMS) + '\n' + dumps(RECORD0) + '\n')
+            with open(fastaFilename, 'w') as fp:
+                fp.write('>id1 Description\nAA\n>id2 Description\nCCC\n')
+
+            readsAlignments = DiamondReadsAlignments(
+                Reads(), jsonFilename, databaseFilename=fastaFilename)
+            readsAlignments.prefetchSubjectSequences(
+                ['id2 Description', 'id1 Description'])
+            readsAlignments._subjectTitleToSubject = {}
+            subject = readsAlignments.getSubjectSequence('id1 Description')
+            self.assertEqual(AAReadWithX('id1 Description', 'AA'), subject)
+        finally:
+            rmtree(directory)
+
+    def testPrefetchSubjectSequences(self):
+        """
+        After prefetchSubjectSequences is called, getSubjectSequence must
+        return the prefetched subjects without reading the subject FASTA.
+        """
+        directory = mkdtemp()
+        try:
+            jsonFilename = join(directory, 'file.json')
+            fastaFilename = join(directory, 'database.fasta')
+            dbFilename = join(directory, 'database.db')
+            with open(jsonFilename, 'w') as fp:
+                fp.write(dumps(PARAMS) + '\n' + dumps(RECORD0) + '\n')
+            with open(fastaFilename, 'w') as fp:
+                fp.write('>id1 Description\nAA\n>id2 Description\nCCC\n')
+            index = SqliteIndex(dbFilename)
+            index.addFile(fastaFilename)
+            index.close()
+
+            readsAlignments = DiamondReadsAlignments(
+                Reads(), jsonFilename, sqliteDatabaseFilename=dbFilename)
+            readsAlignments.prefetchSubjectSequences(
+                ['id2 Description', 'id1 Description'])
+            unlink(fastaFilename)
+            subject = readsAlignments.getSubjectSequence('id1 Description')
+            self.assertEqual(AAReadWithX('id1 Description', 'AA'), subject)
+            subject = readsAlignments.getSubjectSequence('id2 Description')
+            self.assertEqual(AAReadWithX('id2 Description', 'CCC'), subject)
+        finally:
+            rmtree(directory)
+
+    def testAlignmentStore(self):
+        """
+        Reading an alignment store made from a JSON file must give the same
+        read alignments as reading the JSON.
+        """
+        directory = mkdtemp()
+        try:
+            jsonFilename = join(directory, 'file.json')
+            storeFilename = join(directory, 'file.npz')
+            with open(jsonFilename, 'w') as fp:
+                fp.write(dumps(PARAMS) + '\n')
+                for record in RECORD0, RECORD1, RECORD2, RECORD3:
+                    fp.write(dumps(record) + '\n')
+            convertJSONToAlignmentStore(jsonFilename, storeFilename)
+
+            reads = Reads()
+            for i in range(4):
+                reads.add(Read('id%d' % i, 'A' * 70))
+
+            def summary(filename):
+                result = []
+                for readAlignments in DiamondReadsAlignments(reads, filename):
+                    for alignment in readAlignments:
+                        result.append((
+                            readAlignments.read.id, alignment.subjectTitle,
+                            alignment.subjectLength,
+                            [hsp.toDict() for hsp in alignment.hsps]))
+                return result
+
+            self.assertEqual(summary(jsonFilename), summary(storeFilename))
+        finally:
+            rmtree(directory)
+
+    def testParallelReading(self):
+        """
+        Reading several (numerically sorted) JSON files and an alignment
+        store in worker processes must give the same read alignments, in the
+        same order, as reading them one after another.
+        """
+        directory = mkdtemp()
+        try:
+            filenames = []
+            for name, record in (('1.json', RECORD0), ('2.json', RECORD1),
+                                 ('10.json', RECORD2)):
+                filename = join(directory, name)
+                with open(filename, 'w') as fp:
+                    fp.write(dumps(PARAMS) + '\n' + dumps(record) + '\n')
+                filenames.append(filename)
+
+            storeFilename = join(directory, '11.npz')
+            convertJSONToAlignmentStore(filenames[2], storeFilename)
+            filenames.append(storeFilename)
+
+            reads = Reads()
+            for i in (0, 1, 2, 2):
+                reads.add(Read('id%d' % i, 'A' * 70))
+
+            def summary(workers):
+                result = []
+                for readAlignments in DiamondReadsAlignments(
+                        reads, list(reversed(filenames)), sortFilenames=True,
+                        workers=workers):
+                    for alignment in readAlignments:
+                        result.append((
+                            readAlignments.read.id, alignment.subjectTitle,
+                            [hsp.toDict() for hsp in alignment.hsps]))
+                return result
+
+            expected = summary(None)
+            self.assertEqual(['id0', 'id0', 'id1', 'id1', 'id2', 'id2'],
+                             [readId for readId, _, _ in expected])
+            self.assertEqual(expected, summary(2))
+        finally:
+            rmtree(directory)
+
+    def testParallelReadingClosesFirstFile(self):
+        """
+        When files are read in worker processes, the file opened (in
+        __init__) for the reader of the first file must be closed.
+        """
+        directory = mkdtemp()
+        try:
+            filenames = []
+            for index, record in enumerate((RECORD0, RECORD1)):
+                filename = join(directory, '%d.json' % index)
+                with open(filename, 'w') as fp:
+                    fp.write(dumps(PARAMS) + '\n' + dumps(record) + '\n')
+                filenames.append(filename)
+
+            reads = Reads([Read('id0', 'A' * 70), Read('id1', 'A' * 70)])
+            for threads in 0, 1:
+                readsAlignments = DiamondReadsAlignments(
+                    reads, filenames, threads=threads, workers=2)
+                fp = readsAlignments._reader._fp
+                self.assertEqual(2, len(list(readsAlignments)))
+                self.assertIsNone(readsAlignments._reader._fp)
+                self.assertTrue(fp.closed)
+        finally:
+            rmtree(directory)
+
+    def testParallelReadingTooFewReads(self):
+        """
+        When result files are read in worker processes, the error for a read
+        generator that runs out of reads must be the same as when they are
+        read one after another.
+        """
+        directory = mkdtemp()
+        try:
+            filenames = []
+            for name, record in (('1.json', RECORD0), ('2.json', RECORD1)):
+                filename = join(directory, name)
+                with open(filename, 'w') as fp:
+                    fp.write(dumps(PARAMS) + '\n' + dumps(record) + '\n')
+                filenames.append(filename)
+
+            reads = Reads([Read('id0', 'A' * 70)])
+            readsAlignments = DiamondReadsAlignments(reads, filenames,
+                                                     workers=2)
+            error = ("^Read generator failed to yield a read with id 'id1' "
+                     "as found in record number 1 during parsing of DIAMOND "
+                     "output file '%s'\\.$" % filenames[1])
+            six.assertRaisesRegex(self, ValueError, error, list,
+                                  readsAlignments)
+        finally:
+            rmtree(directory)
+
+    def testReadIndex(self):
+        """
+        When a read index is given, reads must be looked up by id, so they
+        need not be in the order of the records, and reads with no records
+        must be yielded (with no alignments) after all records.
+        """
+        mockOpener = mockOpen(read_data=(
+            dumps(PARAMS) + '\n' + dumps(RECORD0) + '\n' +
+            dumps(RECORD2) + '\n'))
+        with patch.object(builtins, 'open', mockOpener):
+            reads = Reads([Read('id2 description', 'A' * 70),
+                           Read('id1', 'A' * 70),
+                           Read('id0', 'A' * 70)])
+            readsAlignments = DiamondReadsAlignments(
+                reads, 'file.json', readIndex=readIdIndex(reads))
+            result = list(readsAlignments)
+            self.assertEqual(['id0', 'id2 description', 'id1'],
+                             [readAlignments.read.id
+                              for readAlignments in result])
+            self.assertEqual([2, 1, 0], list(map(len, result)))
+
+    def testReadIndexUnknownRead(self):
+        """
+        When a read index is given, a ValueError must be raised if a record
+        is for a read that is not in the index.
+        """
+        mockOpener = mockOpen(read_data=(
+            dumps(PARAMS) + '\n' + dumps(RECORD0) + '\n'))
+        with patch.object(builtins, 'open', mockOpener):
+            reads = Reads([Read('id1', 'A' * 70)])
+            readsAlignments = DiamondReadsAlignments(
+                reads, 'file.json', readIndex=readIdIndex(reads))
+            error = ("^Read index has no read with id 'id0' as found in "
+                     "record number 1 during parsing of DIAMOND output file "
+                     "'file\\.json'\\.$")
+            six.assertRaisesRegex(self, ValueError, error, list,
+                                  readsAlignments)
+
+    def testReadIndexParallelFastaMmapReads(self):
+        """
+        When a FastaMmapReads read index is given and files are read in
+        parallel, records from all files must be yielded (in any order),
+        followed by the reads with no records.
+        """
+        directory = mkdtemp()
+        try:
+            fastaFilename = join(directory, 'reads.fasta')
+            with open(fastaFilename, 'w') as fp:
+                for i in 3, 2, 1, 0:
+                    fp.write('>id%d\n%s\n' % (i, 'A' * 70))
+
+            filenames = []
+            for name, record in (('1.json', RECORD2), ('2.json', RECORD0)):
+                filename = join(directory, name)
+                with open(filename, 'w') as fp:
+                    fp.write(dumps(PARAMS) + '\n' + dumps(record) + '\n')
+                filenames.append(filename)
+
+            reads = FastaMmapReads(fastaFilename, readClass=Read)
+            readsAlignments = DiamondReadsAlignments(
+                reads, filenames, workers=2, readIndex=reads)
+            result = list(readsAlignments)
+            self.assertEqual([('id0', 2), ('id2', 1)],
+                             sorted((readAlignments.read.id,
+                                     len(readAlignments))
+                                    for readAlignments in result[:2]))
+            self.assertEqual([('id3', 0), ('id1', 0)],
+                             [(readAlignments.read.id, len(readAlignments))
+                              for readAlignments in result[2:]])
+            reads.close()
+        finally:
+            rmtree(directory)
+
     def testHsps(self):
         """
         The hsps function must yield the HSPs.
@@ -964,6 +1249,28 @@ class TestDiamondReadsAlignmentsFiltering(TestCase):
             self.assertEqual('gi|887699|gb|DQ37780 Squirrelpox virus 1296/99',
                              result[0][0].subjectTitle)
 
+    def testFilteredHSPsNotNormalized(self):
+        """
+        HSPs must only be normalized when their offsets are accessed, so
+        HSPs that are filtered out are never normalized.
+        """
+        mockOpener = mockOpen(read_data=(
+            dumps(PARAMS) + '\n' + dumps(RECORD0) + '\n' +
+            dumps(RECORD1) + '\n' + dumps(RECORD2) + '\n'))
+        with patch.object(builtins, 'open', mockOpener):
+            reads = Reads()
+            reads.add(Read('id0', 'A' * 70))
+            reads.add(Read('id1', 'A' * 70))
+            reads.add(Read('id2', 'A' * 70))
+            readsAlignments = DiamondReadsAlignments(
+                reads, 'file.json', databaseFilename='database.fasta')
+            with patch('dark.diamond.conversion.normalizeHSP',
+                       wraps=normalizeHSP) as normalize:
+                result = list(readsAlignments.filter(titleRegex='squirrel'))
+                self.assertEqual(0, normalize.call_count)
+                self.assertEqual(11, result[0][0].hsps[0].readStart)
+                self.assertEqual(1, normalize.call_count)
+
     def testTitleByRegexAllAlignments(self):
         """
         Filtering with a title regex must work in the case that all alignments
@@ -12,11 +12,14 @@ except ImportError:
 
 from ..mocking import mockOpen
 
-from json import dumps
+from functools import partial
+from gc import collect
+from json import dumps, loads
+from weakref import ref
 
 from dark.diamond.conversion import (
     JSONRecordsReader, DiamondTabularFormatReader, diamondTabularFormatToDicts,
-    FIELDS)
+    diamondDictToSAM, diamondTabularFormatToSAM, FIELDS)
 from dark.reads import Reads, AARead
 
 
@@ -398,6 +401,53 @@ class TestDiamondTabularFormatReader(TestCase):
             self.assertEqual('ACC 94', acc94[0]['query'])
             self.assertEqual('IN SV', acc94[0]['alignments'][0]['title'])
 
+    def testSmallBlockSize(self):
+        """
+        The records must be the same when the input is read in blocks that
+        are smaller than a line.
+        """
+        expected = list(
+            DiamondTabularFormatReader(StringIO(DIAMOND_RECORDS)).records())
+        reader = DiamondTabularFormatReader(StringIO(DIAMOND_RECORDS),
+                                            blockSize=7)
+        self.assertEqual(expected, list(reader.records()))
+
+    def testNoFinalNewline(self):
+        """
+        The last field of the last line must be read correctly if the input
+        does not end with a newline.
+        """
+        reader = DiamondTabularFormatReader(
+            StringIO(DIAMOND_RECORDS[:-1]))
+        bhav = list(reader.records())[-1]
+        hsp = bhav['alignments'][-1]['hsps'][0]
+        self.assertEqual(11, hsp['positiveCount'])
+
+    def testRepeatedSubjectNotConsecutive(self):
+        """
+        If lines for the same subject are not consecutive, their HSPs must
+        still be put into the same alignment, in the order they were seen.
+        """
+        data = StringIO(
+            'Q\tS1\t30\t0.1\t1\tAA\t1\t2\tAA\t1\t2\t90\t2\t2\t2\n'
+            'Q\tS2\t20\t0.2\t1\tAA\t1\t2\tAA\t1\t2\t80\t2\t2\t2\n'
+            'Q\tS1\t10\t0.3\t1\tAA\t1\t2\tAA\t1\t2\t90\t2\t2\t2\n')
+        (record,) = list(DiamondTabularFormatReader(data).records())
+        self.assertEqual(['S1', 'S2'],
+                         [a['title'] for a in record['alignments']])
+        self.assertEqual([30.0, 10.0],
+                         [h['bits'] for h in record['alignments'][0]['hsps']])
+
+    def testWrongNumberOfFields(self):
+        """
+        If a line does not have 13 or 15 fields, a ValueError must be raised.
+        """
+        data = StringIO('Q\tS1\t30\n')
+        reader = DiamondTabularFormatReader(data)
+        error = ("^DIAMOND tabular output line 'Q\\\\tS1\\\\t30' has 3 "
+                 "fields \\(expected 13 or 15\\)\\.$")
+        assertRaisesRegex(self, ValueError, error, list, reader.records())
+
 
 _JSON_RECORDS = [
     {
@@ -1140,6 +1190,86 @@ class TestJSONRecordsReader(TestCase):
             alignment = list(reader.readAlignments(reads))[0]
             self.assertEqual('id1 1', alignment.read.id)
 
+    def testNoMatchedSequences(self):
+        """
+        If matchedSequences is C{False}, the matched read and subject
+        sequences must not be kept in HSPs.
+        """
+        reads = Reads([
+            AARead(
+                'id1',
+                'AGGGCTCGGATGCTGTGGGTGTTTGTGTGGAGTTGGGTGTGTTTTCGGGG'
+                'GTGGTTGAGTGGAGGGATTGCTGTTGGATTGTGTGTTTTGTTGTGGTTGCG'),
+        ])
+
+        mockOpener = mockOpen(read_data=JSON)
+        with patch.object(builtins, 'open', mockOpener):
+            reader = JSONRecordsReader('file.json', matchedSequences=False)
+            hsp = next(reader.readAlignments(reads))[0].hsps[0]
+            self.assertIsNone(hsp.readMatchedSequence)
+            self.assertIsNone(hsp.subjectMatchedSequence)
+
+    def testUnknownJSONBackend(self):
+        """
+        Passing an unknown JSON backend must raise a ValueError.
+        """
+        mockOpener = mockOpen(read_data=JSON)
+        with patch.object(builtins, 'open', mockOpener):
+            error = "^Unknown JSON backend 'xxx'\\. Known backends are: "
+            assertRaisesRegex(self, ValueError, error, JSONRecordsReader,
+                              'file.json', jsonBackend='xxx')
+
+    def testRawHSPDictsAreNotKept(self):
+        """
+        The HSPs in the alignments returned by a JSONRecordsReader must not
+        keep references to the DIAMOND HSP dictionaries read from the JSON
+        (which contain the matched sequences), even before their offsets
+        have been normalized.
+        """
+        reads = Reads([
+            AARead(
+                'id1',
+                'AGGGCTCGGATGCTGTGGGTGTTTGTGTGGAGTTGGGTGTGTTTTCGGGG'
+                'GTGGTTGAGTGGAGGGATTGCTGTTGGATTGTGTGTTTTGTTGTGGTTGCG'),
+            AARead(
+                'id2',
+                'TTTTTCTCCTGCGTAGATGAACCTACCCATGGCTTAGTAGGTCCTCTTTC'
+                'ACCACGAGTTAAACCATTAACATTATATTTTTCTATAATTATACCACTGGC'),
+            AARead(
+                'id3',
+                'ACCTCCGCCTCCCAGGTTCAAGCAATTCTCCTGCCTTAGCCTCCTGAATA'
+                'GCTGGGATTACAGGTATGCAGGAGGCTAAGGCAGGAGAATTGCTTGAACCT'),
+            AARead(
+                'id4',
+                'GAGGGTGGAGGTAACTGAGGAAGCAAAGGCTTGGAGACAGGGCCCCTCAT'
+                'AGCCAGTGAGTGCGCCATTTTCTTTGGAGCAATTGGGTGGGGAGATGGGGC'),
+        ])
+
+        class WeakDict(dict):
+            pass
+
+        hspRefs = []
+
+        def objectHook(d):
+            d = WeakDict(d)
+            if 'query_start' in d:
+                hspRefs.append(ref(d))
+            return d
+
+        mockOpener = mockOpen(read_data=JSON)
+        with patch.object(builtins, 'open', mockOpener):
+            reader = JSONRecordsReader('file.json')
+            reader._loads = partial(loads, object_hook=objectHook)
+            readAlignments = list(reader.readAlignments(reads))
+
+        collect()
+        self.assertTrue(hspRefs)
+        self.assertEqual([None] * len(hspRefs), [r() for r in hspRefs])
+        for readAlignment in readAlignments:
+            for alignment in readAlignment:
+                for hsp in alignment.hsps:
+                    self.assertIsInstance(hsp.subjectStart, int)
+
 
 class TestDiamondTabularFormatToDicts(TestCase):
     """
@@ -1193,6 +1323,19 @@ class TestDiamondTabularFormatToDicts(TestCase):
         (result,) = list(diamondTabularFormatToDicts(data, ['__blah__']))
         self.assertEqual({'__blah__': '3.5'}, result)
 
+    def testSmallBlockSize(self):
+        """
+        Lines must be read correctly when the input is read in blocks that
+        are smaller than a line, and line numbers in errors must be correct.
+        """
+        data = StringIO('1\t2\n3\t4\n5\n')
+        error = '^Line 3 of input had 1 field values \\(expected 2\\)\\. '
+        result = diamondTabularFormatToDicts(data, ['qstart', 'qend'],
+                                             blockSize=3)
+        self.assertEqual({'qstart': 1, 'qend': 2}, next(result))
+        self.assertEqual({'qstart': 3, 'qend': 4}, next(result))
+        assertRaisesRegex(self, ValueError, error, next, result)
+
     def testConversions(self):
         """
         The fields in input lines must be recognized and converted to their
@@ -1245,3 +1388,114 @@ class TestDiamondTabularFormatToDicts(TestCase):
                 'qseq': 'TGCA',
             },
             result2)
+
+
+# Lines of DIAMOND tabular output with the fields in FIELDS (bitscore btop
+# qframe qend qqual qlen qseq qseqid qstart slen sstart stitle) and the SAM
+# lines they should be converted to.
+DIAMOND_SAM_INPUT = (
+    '30.5\t4\t1\t12\t\t15\tACGTACGTACGT\tread1 desc\t1\t100\t3\t'
+    'sub1 title\n'
+    '20.9\t2\t-1\t6\tIIIIHH\t6\tAACCGG\tread2\t1\t50\t1\tsub2\n'
+    '25.1\t4\t2\t14\t\t14\tACGTACGTACGT\tread3\t3\t100\t1\t'
+    'sub1 title\n')
+
+DIAMOND_SAM_OUTPUT = (
+    'read1\t0\tsub1\t7\t255\t12M3H\t*\t0\t0\tACGTACGTACGT\t*\t'
+    'AS:i:30\n'
+    'read2\t16\tsub2\t1\t255\t6M\t*\t0\t0\tCCGGTT\tHHIIII\tAS:i:20\n'
+    'read3\t0\tsub1\t1\t255\t2H12M\t*\t0\t0\tACGTACGTACGT\t*\t'
+    'AS:i:25\n')
+
+
+class TestDiamondDictToSAM(TestCase):
+    """
+    Tests for the diamondDictToSAM function.
+    """
+    def testForward(self):
+        """
+        A match in a positive frame must be converted correctly, with the
+        end of the query hard clipped.
+        """
+        (match,) = diamondTabularFormatToDicts(
+            StringIO(DIAMOND_SAM_INPUT.split('\n')[0]))
+        self.assertEqual(
+            ('sub1', 300, DIAMOND_SAM_OUTPUT.split('\n')[0]),
+            diamondDictToSAM(match))
+
+    def testReverse(self):
+        """
+        A match in a negative frame must have its query sequence reverse
+        complemented and its quality reversed, and a flag of 16.
+        """
+        (match,) = diamondTabularFormatToDicts(
+            StringIO(DIAMOND_SAM_INPUT.split('\n')[1]))
+        self.assertEqual(
+            ('sub2', 150, DIAMOND_SAM_OUTPUT.split('\n')[1]),
+            diamondDictToSAM(match))
+
+    def testKeepDescriptionsAndMappingQuality(self):
+        """
+        If idOnly is C{False}, the query and subject titles must be kept in
+        full, and the given mapping quality must be used.
+        """
+        (match,) = diamondTabularFormatToDicts(
+            StringIO(DIAMOND_SAM_INPUT.split('\n')[0]))
+        stitle, _, samLine = diamondDictToSAM(match, idOnly=False,
+                                              mappingQuality=30)
+        self.assertEqual('sub1 title', stitle)
+        self.assertEqual(['read1 desc', '0', 'sub1 title', '7', '30'],
+                         samLine.split('\t')[:5])
+
+
+class TestDiamondTabularFormatToSAM(TestCase):
+    """
+    Tests for the diamondTabularFormatToSAM function.
+    """
+    def testEmpty(self):
+        """
+        Empty input must result in no output.
+        """
+        self.assertEqual([], list(diamondTabularFormatToSAM(StringIO())))
+
+    def testConversion(self):
+        """
+        Lines must be converted to SAM, and the reference lengths found.
+        """
+        (result,) = diamondTabularFormatToSAM(StringIO(DIAMOND_SAM_INPUT))
+        self.assertEqual(
+            (DIAMOND_SAM_OUTPUT, {'sub1': 300, 'sub2': 150}), result)
+
+    def testSmallBlockSize(self):
+        """
+        The SAM output must be the same when the input is read in many
+        small blocks.
+        """
+        results = list(diamondTabularFormatToSAM(StringIO(DIAMOND_SAM_INPUT),
+                                                 blockSize=10))
+        self.assertEqual(3, len(results))
+        self.assertEqual(DIAMOND_SAM_OUTPUT,
+                         ''.join(samLines for samLines, _ in results))
+
+    def testWorkers(self):
+        """
+        The SAM output must be in input order when blocks are converted by
+        worker processes.
+        """
+        results = list(diamondTabularFormatToSAM(
+            StringIO(DIAMOND_SAM_INPUT * 20), blockSize=10, workers=3))
+        self.assertEqual(60, len(results))
+        self.assertEqual(DIAMOND_SAM_OUTPUT * 20,
+                         ''.join(samLines for samLines, _ in results))
+
+    def testErrorLineNumber(self):
+        """
+        If a line has the wrong number of fields, the ValueError must give
+        its line number in the input, when blocks are converted by worker
+        processes.
+        """
+        data = StringIO(DIAMOND_SAM_INPUT * 3 + 'a\tb\n')
+        error = '^Line 10 of input had 2 field values \\(expected 12\\)\\. '
+        assertRaisesRegex(
+            self, ValueError, error, list,
+            diamondTabularFormatToSAM(data, blockSize=10, workers=2))
@@ -55,6 +55,22 @@ class NoStopIterationReadline(six.Iterator):
             # Ran out of data.
             return ''
 
+    def read(self, size=-1):
+        """
+        Read (at most) C{size} characters, or all remaining data if C{size}
+        is negative, consistently with calls to C{readline}.
+        """
+        if self.handle.read.return_value is not None:
+            return self.handle.read.return_value
+        remaining = ''.join(self.data[self.index:])
+        if size is None or size < 0 or size >= len(remaining):
+            self.index = len(self.data)
+            return remaining
+        else:
+            # Put back the part of the data that was not asked for.
+            self.data = self.data[:self.index] + [remaining[size:]]
+            return remaining[:size]
+
     def __next__(self):
         line = self.readline()
         if line:
@@ -83,11 +99,6 @@ def mockOpen(mock=None, read_data=''):
             return handle.readlines.return_value
         return list(_data)
 
-    def _read_side_effect(*args, **kwargs):
-        if handle.read.return_value is not None:
-            return handle.read.return_value
-        return ''.join(_data)
-
     def _readline_side_effect():
         if handle.readline.return_value is not None:
             while True:
@@ -118,7 +129,7 @@ def mockOpen(mock=None, read_data=''):
     handle.readlines.return_value = None
     handle.__iter__.return_value = noStopIterationReadline
 
-    handle.read.side_effect = _read_side_effect
+    handle.read.side_effect = noStopIterationReadline.read
     handle.readline.side_effect = noStopIterationReadline.readline
     handle.readlines.side_effect = _readlines_side_effect
 
@@ -143,8 +154,19 @@ class File(object):
     def closed(self):
         return self._closed
 
-    def read(self):
-        return ''.join(self._data)
+    def read(self, size=-1):
+        """
+        Read (at most) C{size} characters, or all remaining data if C{size}
+        is negative.
+        """
+        remaining = ''.join(self._data[self._index:])
+        if size is None or size < 0 or size >= len(remaining):
+            self._index = len(self._data)
+            return remaining
+        else:
+            # Put back the part of the data that was not asked for.
+            self._data = self._data[:self._index] + [remaining[size:]]
+            return remaining[:size]
 
     def readline(self):
         self._index += 1
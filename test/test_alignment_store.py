@@ -0,0 +1,270 @@
+import bz2
+import os
+from json import dumps
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+
+import numpy as np
+from six import assertRaisesRegex
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+from dark.alignment_store import (
+    AlignmentStore, convertJSONToAlignmentStore, writeAlignmentStore)
+
+PARAMS = {
+    'application': 'DIAMOND',
+    'task': 'blastx',
+}
+
+RECORDS = [
+    {
+        'query': 'id0',
+        'alignments': [
+            {
+                'length': 37000,
+                'title': 'title1',
+                'hsps': [
+                    {
+                        'bits': 20.5,
+                        'btop': '3A-',
+                        'expect': 1e-11,
+                        'frame': [1, -2],
+                        'identicalCount': 3,
+                        'query': 'TAC',
+                        'query_start': 36,
+                    },
+                    {
+                        'bits': 22,
+                        'btop': '',
+                        'expect': 0.0,
+                        'frame': [-1, 1],
+                        'identicalCount': None,
+                        'query': 'TACé',
+                        'query_start': 3,
+                    },
+                ],
+            },
+            {
+                'length': 38000,
+                'title': 'title2',
+                'hsps': [
+                    {
+                        'bits': 25,
+                        'btop': 'AC',
+                        'expect': 1e-10,
+                        'frame': [2, 3],
+                        'query': '',
+                        'query_start': 1,
+                    },
+                ],
+            },
+        ],
+    },
+    {
+        'query': 'id1',
+        'alignments': [],
+    },
+    {
+        'query': 'id2 with a description',
+        'alignments': [
+            {
+                'length': 37000,
+                'title': 'title1',
+                'hsps': [
+                    {
+                        'bits': 1.0,
+                        'btop': '7',
+                        'expect': 0.5,
+                        'frame': [3, 3],
+                        'identicalCount': 4,
+                        'query': 'ACGT',
+                        'query_start': 2,
+                    },
+                ],
+            },
+        ],
+    },
+]
+
+
+class TestAlignmentStore(TestCase):
+    """
+    Tests for writing and reading alignment stores.
+    """
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.filename = os.path.join(self.directory, 'file.npz')
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+    def testRoundTrip(self):
+        """
+        Records written to an alignment store must be read back unchanged.
+        """
+        self.assertEqual(
+            3, writeAlignmentStore(self.filename, PARAMS, iter(RECORDS)))
+        store = AlignmentStore(self.filename)
+        self.assertEqual(PARAMS, store.params)
+        self.assertEqual(3, len(store))
+        self.assertEqual(RECORDS, list(store.records()))
+
+    def testRoundTripUncompressed(self):
+        """
+        Records written to an uncompressed alignment store must be read back
+        unchanged.
+        """
+        writeAlignmentStore(self.filename, PARAMS, RECORDS, compress=False)
+        self.assertEqual(RECORDS,
+                         list(AlignmentStore(self.filename).records()))
+
+    def testNoRecords(self):
+        """
+        An alignment store with no records must be able to be read.
+        """
+        self.assertEqual(0, writeAlignmentStore(self.filename, PARAMS, []))
+        store = AlignmentStore(self.filename)
+        self.assertEqual(PARAMS, store.params)
+        self.assertEqual([], list(store.records()))
+
+    def testBatches(self):
+        """
+        Records must be read back unchanged when they are read in several
+        batches.
+        """
+        records = []
+        for i in range(25):
+            record = dict(RECORDS[i % 3])
+            record['query'] = 'id%d' % i
+            records.append(record)
+        writeAlignmentStore(self.filename, PARAMS, records)
+        store = AlignmentStore(self.filename)
+        with patch('dark.alignment_store.RECORDS_BATCH_SIZE', 4):
+            self.assertEqual(records, list(store.records()))
+
+    def testSkipHspFields(self):
+        """
+        HSP fields that are not wanted must not be present in HSP dicts.
+        """
+        writeAlignmentStore(self.filename, PARAMS, RECORDS)
+        store = AlignmentStore(self.filename)
+        for record in store.records(skipHspFields=('query', 'btop')):
+            for alignment in record['alignments']:
+                for hsp in alignment['hsps']:
+                    self.assertNotIn('query', hsp)
+                    self.assertNotIn('btop', hsp)
+                    self.assertIn('bits', hsp)
+
+    def testTitlesStoredOnce(self):
+        """
+        Each distinct subject title must be stored once.
+        """
+        writeAlignmentStore(self.filename, PARAMS, RECORDS)
+        with np.load(self.filename) as npz:
+            self.assertEqual(b'title1title2', npz['titles'].tobytes())
+            self.assertEqual([0, 1, 0], npz['alignmentTitles'].tolist())
+
+    def testMixedValues(self):
+        """
+        HSP values that are not all of one simple type must be read back
+        unchanged.
+        """
+        records = [{
+            'query': 'id0',
+            'alignments': [{
+                'length': 10,
+                'title': 'title',
+                'hsps': [{'x': 'a'}, {'x': 3}, {'x': [1, 2, 3]},
+                         {'x': [1]}, {'x': {'a': True}}, {'x': None}, {}],
+            }],
+        }]
+        writeAlignmentStore(self.filename, PARAMS, records)
+        self.assertEqual(records,
+                         list(AlignmentStore(self.filename).records()))
+
+    def testNotAnAlignmentStore(self):
+        """
+        Opening a file that is not an alignment store must raise ValueError.
+        """
+        with open(self.filename, 'w') as fp:
+            fp.write('hello\n')
+        error = "^Could not read alignment store '.*' \\("
+        assertRaisesRegex(self, ValueError, error, AlignmentStore,
+                          self.filename)
+
+    def testNpzWithoutVersion(self):
+        """
+        Opening a numpy .npz file that is not an alignment store must raise
+        ValueError.
+        """
+        np.savez(self.filename, x=np.array([1]))
+        error = "^File '.*' is not an alignment store\\.$"
+        assertRaisesRegex(self, ValueError, error, AlignmentStore,
+                          self.filename)
+
+    def testWrongVersion(self):
+        """
+        Opening an alignment store made with another format version must
+        raise ValueError.
+        """
+        np.savez(self.filename, version=np.array([1000]))
+        error = ("^Alignment store '.*' has format version 1000 "
+                 "\\(expected 1\\)\\.$")
+        assertRaisesRegex(self, ValueError, error, AlignmentStore,
+                          self.filename)
+
+    def testConvertJSON(self):
+        """
+        A JSON file must be converted to an alignment store.
+        """
+        jsonFilename = os.path.join(self.directory, 'file.json')
+        with open(jsonFilename, 'w') as fp:
+            fp.write(dumps(PARAMS) + '\n')
+            for record in RECORDS:
+                fp.write(dumps(record) + '\n')
+        self.assertEqual(
+            3, convertJSONToAlignmentStore(jsonFilename, self.filename))
+        store = AlignmentStore(self.filename)
+        self.assertEqual(PARAMS, store.params)
+        self.assertEqual(RECORDS, list(store.records()))
+
+    def testConvertBzip2JSON(self):
+        """
+        A bzip2 compressed JSON file must be converted to an alignment store.
+        """
+        jsonFilename = os.path.join(self.directory, 'file.json.bz2')
+        with bz2.BZ2File(jsonFilename, 'w') as fp:
+            fp.write((dumps(PARAMS) + '\n').encode('UTF-8'))
+            for record in RECORDS:
+                fp.write((dumps(record) + '\n').encode('UTF-8'))
+        convertJSONToAlignmentStore(jsonFilename, self.filename)
+        self.assertEqual(RECORDS,
+                         list(AlignmentStore(self.filename).records()))
+
+    def testConvertEmptyJSON(self):
+        """
+        Converting an empty JSON file must raise ValueError.
+        """
+        jsonFilename = os.path.join(self.directory, 'file.json')
+        open(jsonFilename, 'w').close()
+        error = "^JSON file '.*' was empty\\.$"
+        assertRaisesRegex(self, ValueError, error,
+                          convertJSONToAlignmentStore, jsonFilename,
+                          self.filename)
+
+    def testConvertBadJSON(self):
+        """
+        Converting a JSON file with an invalid line must raise ValueError.
+        """
+        jsonFilename = os.path.join(self.directory, 'file.json')
+        with open(jsonFilename, 'w') as fp:
+            fp.write(dumps(PARAMS) + '\n' + dumps(RECORDS[0]) + '\n{\n')
+        error = "^Could not convert line 3 of '.*' to JSON \\("
+        assertRaisesRegex(self, ValueError, error,
+                          convertJSONToAlignmentStore, jsonFilename,
+                          self.filename)
@@ -6,7 +6,7 @@ from dark.score import HigherIsBetterScore
 from dark.hsp import HSP, LSP
 from dark.alignments import (
     Alignment, bestAlignment, ReadAlignments, ReadsAlignmentsParams,
-    ReadsAlignments)
+    ReadsAlignments, lookupRead, readAlignmentsByReadId, readIdIndex)
 
 
 class TestAlignment(TestCase):
@@ -219,3 +219,105 @@ class TestReadsAlignments(TestCase):
         error = 'getSubjectSequence must be implemented by a subclass'
         six.assertRaisesRegex(self, NotImplementedError, error,
                               readsAlignments.getSubjectSequence, 'title')
+
+
+class TestReadIdIndex(TestCase):
+    """
+    Test the readIdIndex function.
+    """
+    def testEmpty(self):
+        """
+        An empty iterable of reads must result in an empty index.
+        """
+        self.assertEqual({}, readIdIndex([]))
+
+    def testFirstWord(self):
+        """
+        Reads must be indexed by the first word of their ids.
+        """
+        read1 = Read('id1 description', 'AC')
+        read2 = Read('id2', 'GT')
+        self.assertEqual({'id1': read1, 'id2': read2},
+                         readIdIndex([read1, read2]))
+
+    def testDuplicateId(self):
+        """
+        If two reads have the same first word in their ids, a ValueError must
+        be raised.
+        """
+        error = "^Read id 'id1' occurs more than once\\.$"
+        six.assertRaisesRegex(self, ValueError, error, readIdIndex,
+                              [Read('id1 a', 'AC'), Read('id1 b', 'GT')])
+
+
+class TestLookupRead(TestCase):
+    """
+    Test the lookupRead function.
+    """
+    def testFullId(self):
+        """
+        A read must be found by its full id.
+        """
+        read = Read('id1 description', 'AC')
+        self.assertIs(read, lookupRead({'id1 description': read},
+                                       'id1 description'))
+
+    def testFirstWord(self):
+        """
+        If a read is not found by its full id, it must be found by the first
+        word of its id.
+        """
+        read = Read('id1 description', 'AC')
+        self.assertIs(read, lookupRead({'id1': read}, 'id1 description'))
+
+    def testUnknown(self):
+        """
+        If a read cannot be found, KeyError must be raised.
+        """
+        self.assertRaises(KeyError, lookupRead, {}, 'id1')
+        self.assertRaises(KeyError, lookupRead, {}, 'id1 description')
+
+
+class TestReadAlignmentsByReadId(TestCase):
+    """
+    Test the readAlignmentsByReadId function.
+    """
+    class Reader(object):
+        """
+        A fake record reader.
+
+        @param readIds: A C{list} of C{str} read ids, one per record.
+        """
+        def __init__(self, readIds):
+            self.readIds = readIds
+
+        def readAlignmentsByReadId(self, readIndex):
+            for readId in self.readIds:
+                yield ReadAlignments(lookupRead(readIndex, readId),
+                                     [Alignment(10, 'title')])
+
+    def testReadsWithoutRecords(self):
+        """
+        After the read alignments for all records, an empty read alignments
+        must be yielded for each read that was not found in any record.
+        """
+        reads = [Read('id1 description', 'AC'), Read('id2', 'GT'),
+                 Read('id3', 'TT'), Read('id4', 'CC')]
+        readers = [self.Reader(['id3']), self.Reader(['id1'])]
+        result = list(readAlignmentsByReadId(readers, readIdIndex(reads),
+                                             reads))
+        self.assertEqual(['id3', 'id1 description', 'id2', 'id4'],
+                         [readAlignments.read.id for readAlignments in result])
+        self.assertEqual([1, 1, 0, 0],
+                         [len(readAlignments) for readAlignments in result])
+
+    def testNoReads(self):
+        """
+        If no reads are given, only the read alignments for records must be
+        yielded.
+        """
+        reads = [Read('id1', 'AC'), Read('id2', 'GT')]
+        result = list(readAlignmentsByReadId([self.Reader(['id2'])],
+                                             readIdIndex(reads)))
+        self.assertEqual(['id2'],
+                         [readAlignments.read.id for readAlignments in result])
@@ -1,7 +1,11 @@
+from __future__ import division
+
 from six import assertRaisesRegex
 from unittest import TestCase
 
-from dark.btop import countGaps, parseBtop, btop2cigar
+from dark.btop import (
+    countGaps, parseBtop, btop2cigar, btopRuns, btopStats, CDEL, CINS,
+    CMATCH)
 
 
 class TestParseBtop(TestCase):
@@ -163,6 +167,170 @@ class TestCountGaps(TestCase):
         """
         self.assertEqual((3, 2), countGaps('-GG-34-T-T39F-'))
 
+    def testInvalid(self):
+        """
+        An invalid BTOP string must result in the ValueError that parseBtop
+        would raise.
+        """
+        error = ("^BTOP string 'F36' has a query letter 'F' at offset 0 with "
+                 "no corresponding subject letter$")
+        assertRaisesRegex(self, ValueError, error, countGaps, 'F36')
+
+    def testNonASCIIDigit(self):
+        """
+        A non-ASCII digit must be treated as a count (as it is by parseBtop).
+        """
+        self.assertEqual((0, 0), countGaps('\u0663'))
+
+    def testNonASCIILetters(self):
+        """
+        Non-ASCII letters must be treated as letters.
+        """
+        self.assertEqual((1, 1), countGaps('3\xe9-2-\xe91'))
+
+
+class TestBtopRuns(TestCase):
+    """
+    Tests for the btopRuns function.
+    """
+    def testEmpty(self):
+        """
+        An empty BTOP string must result in an empty list.
+        """
+        self.assertEqual([], btopRuns(''))
+
+    def testNumberOnly(self):
+        """
+        An argument with just a number must produce a single match run.
+        """
+        self.assertEqual([(88, CMATCH)], btopRuns('88'))
+
+    def testMismatchesAreMatches(self):
+        """
+        Mismatches must be counted in the match run they are part of.
+        """
+        self.assertEqual([(9, CMATCH)], btopRuns('2GC3ATAT1'))
+
+    def testGaps(self):
+        """
+        Gaps must split match runs, and consecutive gaps of the same kind
+        must be in one run.
+        """
+        self.assertEqual(
+            [(7, CMATCH), (2, CINS), (4, CMATCH), (2, CDEL), (5, CMATCH)],
+            btopRuns('2GC3ATC-G-4-T-A5'))
+
+    def testQueryThenSubjectGap(self):
+        """
+        A query gap followed by a subject gap must give two runs.
+        """
+        self.assertEqual([(1, CDEL), (1, CINS)], btopRuns('-GG-'))
+
+    def testInvalid(self):
+        """
+        An invalid BTOP string must result in the ValueError that parseBtop
+        would raise.
+        """
+        error = ("^BTOP string '36F77' has a query letter 'F' at offset 2 "
+                 "with no corresponding subject letter$")
+        assertRaisesRegex(self, ValueError, error, btopRuns, '36F77')
+
+    def testIdenticalLetters(self):
+        """
+        A BTOP string with two identical letters in a pair must result in
+        the ValueError that parseBtop would raise.
+        """
+        error = ("^BTOP string '3AK36AA' has two consecutive identical 'A' "
+                 "letters at offset 5$")
+        assertRaisesRegex(self, ValueError, error, btopRuns, '3AK36AA')
+
+    def testConsecutiveGaps(self):
+        """
+        A BTOP string with a pair of gaps must result in the ValueError that
+        parseBtop would raise.
+        """
+        error = "^BTOP string '36--' has two consecutive gaps at offset 2$"
+        assertRaisesRegex(self, ValueError, error, btopRuns, '36--')
+
+    def testNonASCIIDigit(self):
+        """
+        A non-ASCII digit must be treated as a count (as it is by parseBtop).
+        """
+        self.assertEqual([(5, CMATCH)], btopRuns('\u0663AK1'))
+
+    def testNonASCIILetters(self):
+        """
+        Non-ASCII letters must be treated as letters.
+        """
+        self.assertEqual([(6, CMATCH), (1, CINS), (1, CMATCH)],
+                         btopRuns('3\xe9A2\xe9-1'))
+
+    def testNonASCIIInvalid(self):
+        """
+        An invalid BTOP string with a non-ASCII letter must result in the
+        ValueError that parseBtop would raise.
+        """
+        error = ("^BTOP string '3\xe9' has a trailing query letter '\xe9' "
+                 "with no corresponding subject letter$")
+        assertRaisesRegex(self, ValueError, error, btopRuns, '3\xe9')
+
+
+class TestBtopStats(TestCase):
+    """
+    Tests for the btopStats function.
+    """
+    def testEmpty(self):
+        """
+        An empty BTOP string must have all zero statistics.
+        """
+        self.assertEqual(
+            {
+                'identicalCount': 0,
+                'mismatchCount': 0,
+                'queryGaps': 0,
+                'subjectGaps': 0,
+                'queryGapOpens': 0,
+                'subjectGapOpens': 0,
+                'length': 0,
+                'identity': 0.0,
+            },
+            btopStats(''))
+
+    def testAll(self):
+        """
+        A BTOP string with matches, mismatches, and gaps must have the
+        expected statistics.
+        """
+        self.assertEqual(
+            {
+                'identicalCount': 12,
+                'mismatchCount': 4,
+                'queryGaps': 3,
+                'subjectGaps': 2,
+                'queryGapOpens': 2,
+                'subjectGapOpens': 1,
+                'length': 21,
+                'identity': 12 / 21,
+            },
+            btopStats('2GC3ATC-G-4-T-A2KLRS1-T'))
+
+    def testInvalid(self):
+        """
+        An invalid BTOP string must result in the ValueError that parseBtop
+        would raise.
+        """
+        error = ("^BTOP string 'ABC' has a trailing query letter 'C' with no "
+                 "corresponding subject letter$")
+        assertRaisesRegex(self, ValueError, error, btopStats, 'ABC')
+
+    def testNonASCIILetters(self):
+        """
+        Non-ASCII letters must be counted as mismatches.
+        """
+        stats = btopStats('3\xe9A2')
+        self.assertEqual(5, stats['identicalCount'])
+        self.assertEqual(1, stats['mismatchCount'])
+
 
 class TestBtop2CigarPrecise(TestCase):
     """
@@ -216,6 +384,36 @@ class TestBtop2CigarPrecise(TestCase):
             '21M6I12M6D15M',
             btop2cigar('2GC3ATC-G-4-T-A5', concise=False, aa=True))
 
+    def testLeadingZeroes(self):
+        """
+        A BTOP string that is a number with leading zeroes must give the
+        expected CIGAR string.
+        """
+        self.assertEqual('54M', btop2cigar('0054', concise=False))
+
+    def testInvalid(self):
+        """
+        An invalid BTOP string must result in the ValueError that parseBtop
+        would raise.
+        """
+        error = ("^BTOP string '36F' has a trailing query letter 'F' with no "
+                 "corresponding subject letter$")
+        assertRaisesRegex(self, ValueError, error, btop2cigar, '36F',
+                          concise=False)
+
+    def testNonASCIILetters(self):
+        """
+        A BTOP string with non-ASCII letters must give the expected CIGAR
+        string.
+        """
+        self.assertEqual('6M', btop2cigar('3\xe9A2', concise=False))
+
+    def testNonASCIIDigit(self):
+        """
+        A non-ASCII digit must be treated as a count (as it is by parseBtop).
+        """
+        self.assertEqual('4M', btop2cigar('\u0663AK', concise=False))
+
 
 class TestBtop2CigarConcise(TestCase):
     """
@@ -0,0 +1,197 @@
+import os
+from tempfile import mkdtemp
+from shutil import rmtree
+import sqlite3
+from unittest import TestCase
+
+from dark.dedup import BloomFilter, DuplicateTracker
+
+
+class TestBloomFilter(TestCase):
+    """
+    Test the BloomFilter class.
+    """
+    def testEmpty(self):
+        """
+        An empty Bloom filter must not contain anything.
+        """
+        self.assertNotIn(b'\x01' * 16, BloomFilter(100))
+
+    def testAdded(self):
+        """
+        A Bloom filter must contain all digests added to it.
+        """
+        bloomFilter = BloomFilter(100)
+        digests = [bytes(bytearray([i] * 16)) for i in range(100)]
+        for digest in digests:
+            bloomFilter.add(digest)
+        for digest in digests:
+            self.assertIn(digest, bloomFilter)
+
+
+class TestDuplicateTracker(TestCase):
+    """
+    Test the DuplicateTracker class.
+    """
+    def testNotSeen(self):
+        """
+        A string that has not been seen before must not be reported as seen.
+        """
+        tracker = DuplicateTracker()
+        self.assertFalse(tracker.seen('ACGT'))
+        self.assertFalse(tracker.seen('AAAA'))
+        self.assertEqual(2, len(tracker))
+
+    def testSeen(self):
+        """
+        A string that has been seen before must be reported as seen.
+        """
+        tracker = DuplicateTracker()
+        tracker.seen('ACGT')
+        self.assertTrue(tracker.seen('ACGT'))
+        self.assertEqual(1, len(tracker))
+
+    def testMD5(self):
+        """
+        If MD5 is used, duplicates must be detected and keys must be
+        16-byte digests.
+        """
+        tracker = DuplicateTracker(useMD5=True)
+        self.assertEqual(16, len(tracker.key('ACGT' * 1000)))
+        self.assertFalse(tracker.seen('ACGT'))
+        self.assertTrue(tracker.seen('ACGT'))
+        self.assertFalse(tracker.seen('ACGA'))
+
+    def testCaseMatters(self):
+        """
+        By default, strings that differ in case must not be duplicates.
+        """
+        tracker = DuplicateTracker()
+        tracker.seen('ACGT')
+        self.assertFalse(tracker.seen('acgt'))
+
+    def testIgnoreCase(self):
+        """
+        If ignoreCase is C{True}, strings that differ only in case must be
+        duplicates.
+        """
+        tracker = DuplicateTracker(ignoreCase=True)
+        tracker.seen('ACGT')
+        self.assertTrue(tracker.seen('acgT'))
+
+    def testReverseComplement(self):
+        """
+        If reverseComplement is C{True}, a sequence must be a duplicate of
+        its reverse complement.
+        """
+        tracker = DuplicateTracker(reverseComplement=True)
+        tracker.seen('AACGTG')
+        self.assertTrue(tracker.seen('CACGTT'))
+        self.assertFalse(tracker.seen('AACGTC'))
+
+    def testReverseComplementAndIgnoreCase(self):
+        """
+        If reverseComplement and ignoreCase are C{True}, a sequence must be
+        a duplicate of its reverse complement in another case.
+        """
+        tracker = DuplicateTracker(reverseComplement=True, ignoreCase=True,
+                                   useMD5=True)
+        tracker.seen('AACGTG')
+        self.assertTrue(tracker.seen('cacgtt'))
+
+
+class TestDuplicateTrackerDatabase(TestCase):
+    """
+    Test the DuplicateTracker class when it uses a database.
+    """
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.filename = os.path.join(self.directory, 'seen.db')
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+    def testDuplicates(self):
+        """
+        Duplicates must be detected, whether or not they are still in the
+        in-memory batch of digests.
+        """
+        tracker = DuplicateTracker(databaseFilename=self.filename,
+                                   batchSize=2)
+        strings = 'a b c a d b e c'.split()
+        self.assertEqual(
+            [False, False, False, True, False, True, False, True],
+            [tracker.seen(string) for string in strings])
+        self.assertEqual(5, len(tracker))
+        tracker.close()
+
+    def testSmallBloomFilter(self):
+        """
+        Duplicates must be correctly detected when the Bloom filter is too
+        small for the number of strings (so it gives many false positives).
+        """
+        tracker = DuplicateTracker(databaseFilename=self.filename,
+                                   batchSize=3, expectedCount=1)
+        for i in range(100):
+            self.assertFalse(tracker.seen(str(i)))
+        for i in range(100):
+            self.assertTrue(tracker.seen(str(i)))
+        tracker.close()
+
+    def testTwoTables(self):
+        """
+        Two trackers using the same database with different table names
+        must not interfere with one another.
+        """
+        tracker1 = DuplicateTracker(databaseFilename=self.filename,
+                                    batchSize=1, tableName='one')
+        tracker2 = DuplicateTracker(databaseFilename=self.filename,
+                                    batchSize=1, tableName='two')
+        self.assertFalse(tracker1.seen('a'))
+        self.assertFalse(tracker2.seen('a'))
+        self.assertTrue(tracker1.seen('a'))
+        self.assertTrue(tracker2.seen('a'))
+        tracker1.close()
+        tracker2.close()
+
+    def testContains(self):
+        """
+        Checking if a string is in a tracker must not record it.
+        """
+        tracker = DuplicateTracker(databaseFilename=self.filename,
+                                   batchSize=1)
+        tracker.seen('a')
+        tracker.seen('b')
+        self.assertIn('a', tracker)
+        self.assertIn('b', tracker)
+        self.assertNotIn('c', tracker)
+        self.assertFalse(tracker.seen('c'))
+        tracker.close()
+
+    def testCloseWritesDigests(self):
+        """
+        Closing a tracker must write the digests still in memory to the
+        database.
+        """
+        tracker = DuplicateTracker(databaseFilename=self.filename)
+        tracker.seen('a')
+        tracker.seen('b')
+        tracker.close()
+        connection = sqlite3.connect(self.filename)
+        try:
+            self.assertEqual(2, connection.execute(
+                'SELECT COUNT(*) FROM seen').fetchone()[0])
+        finally:
+            connection.close()
+
+    def testUseAfterClose(self):
+        """
+        A tracker must reopen its database if it is used after being closed.
+        """
+        tracker = DuplicateTracker(databaseFilename=self.filename)
+        tracker.seen('a')
+        tracker.close()
+        self.assertTrue(tracker.seen('a'))
+        self.assertFalse(tracker.seen('b'))
+        self.assertEqual(2, len(tracker))
+        tracker.close()
@@ -2,6 +2,9 @@ from six.moves import builtins
 from six import assertRaisesRegex
 from io import BytesIO
 import os
+from shutil import rmtree
+import sqlite3
+from tempfile import mkdtemp
 
 from unittest import TestCase
 from Bio import SeqIO, bgzf
@@ -16,10 +19,32 @@ from .mocking import mockOpen, File
 
 from dark.reads import Read, AARead, DNARead, RNARead, Reads
 from dark.fasta import (dedupFasta, dePrefixAndSuffixFasta, fastaSubtract,
-                        FastaReads, FastaFaiReads, combineReads, SqliteIndex)
+                        fastaRecords, FastaReads, FastaFaiReads,
+                        FastaMmapReads, combineReads, SqliteIndex,
+                        fastaIndex)
 from dark.utils import StringIO
 
 
+@contextmanager
+def recordOpenedFiles():
+    """
+    Record the files opened (via the builtin C{open}) in a context.
+
+    @return: A context manager that gives a C{list} to which the opened
+        files are appended.
+    """
+    opened = []
+    realOpen = builtins.open
+
+    def recordingOpen(*args, **kwargs):
+        fp = realOpen(*args, **kwargs)
+        opened.append(fp)
+        return fp
+
+    with patch.object(builtins, 'open', recordingOpen):
+        yield opened
+
+
 class FastaDeDup(TestCase):
     """
     Tests for de-duping FASTA sequence lists.
@@ -58,6 +83,24 @@ class FastaDeDup(TestCase):
         reads.add(Read('id2', 'GGG'))
         self.assertEqual(list(dedupFasta(reads)), [Read('id1', 'GGG')])
 
+    def testIgnoreCase(self):
+        """
+        If ignoreCase is C{True}, sequences that differ only in case must be
+        considered duplicates.
+        """
+        reads = Reads([Read('id1', 'GGG'), Read('id2', 'ggg')])
+        self.assertEqual(list(dedupFasta(reads, ignoreCase=True)),
+                         [Read('id1', 'GGG')])
+
+    def testReverseComplement(self):
+        """
+        If reverseComplement is C{True}, a sequence and its reverse
+        complement must be considered duplicates.
+        """
+        reads = Reads([Read('id1', 'GGA'), Read('id2', 'TCC')])
+        self.assertEqual(list(dedupFasta(reads, reverseComplement=True)),
+                         [Read('id1', 'GGA')])
+
 
 class Unused(TestCase):
 
@@ -256,6 +299,108 @@ class TestFastaSubtract(TestCase):
                           [StringIO(fasta1), StringIO(fasta2)])
 
 
+class TestFastaRecords(TestCase):
+    """
+    Tests for the L{dark.fasta.fastaRecords} function.
+    """
+    def testEmpty(self):
+        """
+        Empty input must result in no records.
+        """
+        self.assertEqual([], list(fastaRecords(StringIO(''))))
+
+    def testOneRecord(self):
+        """
+        A single record must be returned as an (id, sequence) tuple.
+        """
+        self.assertEqual([('id1', 'ACGT')],
+                         list(fastaRecords(StringIO('>id1\nACGT\n'))))
+
+    def testNoFinalNewline(self):
+        """
+        A record whose sequence is not followed by a newline must be read
+        correctly.
+        """
+        self.assertEqual([('id1', 'ACGT')],
+                         list(fastaRecords(StringIO('>id1\nACGT'))))
+
+    def testEmptySequence(self):
+        """
+        A record with no sequence must have an empty sequence string.
+        """
+        self.assertEqual([('id1', ''), ('id2', 'AA')],
+                         list(fastaRecords(StringIO('>id1\n>id2\nAA\n'))))
+
+    def testMultilineSequence(self):
+        """
+        Sequences spread over several lines must be joined.
+        """
+        data = '>id1 description\nAC\nGT\n\nTT\n>id2\nGG\nCC\n'
+        self.assertEqual([('id1 description', 'ACGTTT'), ('id2', 'GGCC')],
+                         list(fastaRecords(StringIO(data))))
+
+    def testLeadingTextIsIgnored(self):
+        """
+        Text before the first record must be ignored.
+        """
+        data = 'some junk\n\n>id1\nACGT\n'
+        self.assertEqual([('id1', 'ACGT')],
+                         list(fastaRecords(StringIO(data))))
+
+    def testWindowsLineEndings(self):
+        """
+        Carriage returns must be removed from ids and sequences.
+        """
+        data = '>id1 \r\nAC\r\nGT\r\n>id2\r\nTT\r\n'
+        self.assertEqual([('id1', 'ACGT'), ('id2', 'TT')],
+                         list(fastaRecords(StringIO(data))))
+
+    def testGreaterThanInsideHeader(self):
+        """
+        A '>' that is not at the start of a line must not start a record.
+        """
+        data = '>id1 a>b\nACGT\n'
+        self.assertEqual([('id1 a>b', 'ACGT')],
+                         list(fastaRecords(StringIO(data))))
+
+    def testSmallBlockSizes(self):
+        """
+        The same records must be found no matter how the input is split into
+        blocks.
+        """
+        data = ('>id1\nACGTACGTAC\nGTTT\n>id2 a long description\n'
+                'GGGGCCCCAAAATTTT\n>id3\n>id4\nA\n')
+        expected = [('id1', 'ACGTACGTACGTTT'),
+                    ('id2 a long description', 'GGGGCCCCAAAATTTT'),
+                    ('id3', ''), ('id4', 'A')]
+        for blockSize in range(1, len(data) + 2):
+            self.assertEqual(
+                expected,
+                list(fastaRecords(StringIO(data), blockSize=blockSize)))
+
+    def testLeadingBlankLineIsIgnored(self):
+        """
+        A blank line before the first record must be ignored.
+        """
+        data = '\n>id1\nACGT\n'
+        self.assertEqual([('id1', 'ACGT')],
+                         list(fastaRecords(StringIO(data), blockSize=4)))
+
+    def testSameAsBiopython(self):
+        """
+        The records found must be the same as those found by C{Bio.SeqIO}.
+        """
+        data = ('>id1 desc\nAC GT\nAAA\n\n>id2\n>id3\t\nTT\r\n'
+                '>id4\nNNNNNNNNN\nNNNNN')
+        expected = [('id1 desc', 'ACGTAAA'), ('id2', ''), ('id3', 'TT'),
+                    ('id4', 'NNNNNNNNNNNNNN')]
+        self.assertEqual(expected,
+                         [(record.description, str(record.seq))
+                          for record in SeqIO.parse(StringIO(data), 'fasta')])
+        self.assertEqual(expected, list(fastaRecords(StringIO(data),
+                                                     blockSize=4)))
+
+
 class TestFastaReads(TestCase):
     """
     Tests for the L{dark.fasta.FastaReads} class.
@@ -590,6 +735,257 @@ class TestFastaFaiReads(TestCase):
             self.assertEqual(pyfaidxIndex.getvalue(),
                              'id1\t4\t5\t4\t5\nid2\t8\t15\t8\t9\n')
 
+    def testGetMany(self):
+        """
+        The getMany method must return reads for all the requested ids, in
+        the order they are found in the FASTA file.
+        """
+        directory = mkdtemp()
+        try:
+            filename = os.path.join(directory, 'file.fasta')
+            with open(filename, 'w') as fp:
+                fp.write('>id1\nACTG\n>id2\nAACC\n>id3\nGG\n')
+            reads = FastaFaiReads(filename)
+            self.assertEqual(
+                [DNARead('id1', 'ACTG'), DNARead('id3', 'GG')],
+                list(reads.getMany(['id3', 'id1', 'id3'])))
+        finally:
+            rmtree(directory)
+
+    def testGetManyUnknownId(self):
+        """
+        The getMany method must raise KeyError if passed an unknown id.
+        """
+        directory = mkdtemp()
+        try:
+            filename = os.path.join(directory, 'file.fasta')
+            with open(filename, 'w') as fp:
+                fp.write('>id1\nACTG\n')
+            reads = FastaFaiReads(filename)
+            error = "^\"Unknown sequence: 'id2'\"$"
+            assertRaisesRegex(self, KeyError, error, reads.getMany,
+                              ['id1', 'id2'])
+        finally:
+            rmtree(directory)
+
+
+class TestFastaMmapReads(TestCase):
+    """
+    Tests for the L{dark.fasta.FastaMmapReads} class.
+    """
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.filename = os.path.join(self.directory, 'file.fasta')
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+    def makeReads(self, data, **kwargs):
+        """
+        Write FASTA to a file and make a L{FastaMmapReads} for it.
+
+        @param data: The C{str} FASTA to write.
+        @param kwargs: Keyword arguments for L{FastaMmapReads}.
+        @return: A L{FastaMmapReads} instance.
+        """
+        with open(self.filename, 'w') as fp:
+            fp.write(data)
+        return FastaMmapReads(self.filename, **kwargs)
+
+    def testEmpty(self):
+        """
+        An empty FASTA file must result in no reads.
+        """
+        reads = self.makeReads('')
+        self.assertEqual([], list(reads))
+        reads.close()
+
+    def testMissingKey(self):
+        """
+        If a non-existent sequence id is looked up, a KeyError must be raised.
+        """
+        reads = self.makeReads('>id1\nACTG\n')
+        error = "^\"Unknown sequence: 'id2'\"$"
+        assertRaisesRegex(self, KeyError, error, reads.__getitem__, 'id2')
+        self.assertFalse('id2' in reads)
+        reads.close()
+
+    def testIter(self):
+        """
+        Iterating must give all reads, in the order they are in the file.
+        """
+        reads = self.makeReads('>id1\nACTG\n>id2\nAACC\nTTGG\nA\n')
+        self.assertEqual([DNARead('id1', 'ACTG'),
+                          DNARead('id2', 'AACCTTGGA')], list(reads))
+        reads.close()
+
+    def testIndexWritten(self):
+        """
+        A samtools-compatible .fai index must be written.
+        """
+        reads = self.makeReads('>id1 desc\nACTG\n>id2\nAACC\nTTGG\nA\n')
+        reads.close()
+        with open(self.filename + '.fai') as fp:
+            self.assertEqual('id1\t4\t10\t4\t5\nid2\t9\t20\t4\t5\n',
+                             fp.read())
+
+    def testExistingIndexUsed(self):
+        """
+        An up-to-date .fai index must be used instead of indexing the file.
+        """
+        with open(self.filename, 'w') as fp:
+            fp.write('>id1\nACTG\n')
+        with open(self.filename + '.fai', 'w') as fp:
+            fp.write('xxx\t2\t7\t2\t3\n')
+        reads = FastaMmapReads(self.filename)
+        self.assertEqual([DNARead('xxx', 'TG')], list(reads))
+        reads.close()
+
+    def testNoFinalNewline(self):
+        """
+        A FASTA file whose last line has no newline must be read correctly.
+        """
+        reads = self.makeReads('>id1\nACT\nGG')
+        self.assertEqual(DNARead('id1', 'ACTGG'), reads['id1'])
+        reads.close()
+
+    def testWindowsLineEndings(self):
+        """
+        A FASTA file with \\r\\n line endings must be read correctly.
+        """
+        reads = self.makeReads('>id1\r\nACT\r\nGG\r\n')
+        self.assertEqual(DNARead('id1', 'ACTGG'), reads['id1'])
+        self.assertEqual('TG', reads.fetch('id1', 2, 4))
+        reads.close()
+
+    def testUnevenLines(self):
+        """
+        If the lines of a sequence are not all the same length (apart from
+        the last), a ValueError must be raised.
+        """
+        with open(self.filename, 'w') as fp:
+            fp.write('>id1\nACT\nGG\nTTT\n')
+        error = ("^Sequence 'id1' in FASTA file '.*' has lines of different "
+                 "lengths\\.$")
+        assertRaisesRegex(self, ValueError, error, FastaMmapReads,
+                          self.filename)
+
+    def testDuplicateId(self):
+        """
+        If a sequence name occurs twice, a ValueError must be raised.
+        """
+        with open(self.filename, 'w') as fp:
+            fp.write('>id1\nACT\n>id1 again\nGG\n')
+        error = "^Sequence 'id1' occurs more than once in FASTA file '.*'\\.$"
+        assertRaisesRegex(self, ValueError, error, FastaMmapReads,
+                          self.filename)
+
+    def testFileClosedOnError(self):
+        """
+        If the index cannot be made, the FASTA file must be closed before
+        the ValueError is raised.
+        """
+        for data in '>id1\nACT\nGG\nTTT\n', '>id1\nACT\n>id1 again\nGG\n':
+            with open(self.filename, 'w') as fp:
+                fp.write(data)
+            with recordOpenedFiles() as opened:
+                self.assertRaises(ValueError, FastaMmapReads, self.filename)
+            self.assertTrue(opened)
+            self.assertTrue(all(fp.closed for fp in opened))
+
+    def testFullHeaderLookup(self):
+        """
+        A read must be able to be looked up by its full FASTA header.
+        """
+        reads = self.makeReads('>id1 a description\nACTG\n')
+        self.assertEqual(DNARead('id1 a description', 'ACTG'),
+                         reads['id1 a description'])
+        self.assertTrue('id1 a description' in reads)
+        self.assertFalse('id1 another description' in reads)
+        reads.close()
+
+    def testFetchRegions(self):
+        """
+        The fetch method must return the requested part of a sequence, for
+        all start and end offsets.
+        """
+        sequence = 'ACGTTGCAAGCTTAG'
+        reads = self.makeReads('>id1\nACGTT\nGCAAG\nCTTAG\n')
+        for start in range(len(sequence) + 2):
+            for end in range(len(sequence) + 2):
+                self.assertEqual(sequence[start:end],
+                                 reads.fetch('id1', start, end))
+        self.assertEqual(sequence[-4:], reads.fetch('id1', -4))
+        reads.close()
+
+    def testFetchAsBytesOnOneLine(self):
+        """
+        If bytes are requested for part of a sequence on a single line, a
+        memoryview must be returned.
+        """
+        reads = self.makeReads('>id1\nACGTT\nGCAAG\n')
+        data = reads.fetch('id1', 1, 4, asBytes=True)
+        self.assertTrue(isinstance(data, memoryview))
+        self.assertEqual(b'CGT', bytes(data))
+        data.release()
+        reads.close()
+
+    def testFetchAsBytesOverLines(self):
+        """
+        If bytes are requested for part of a sequence on several lines, the
+        newlines must be removed.
+        """
+        reads = self.makeReads('>id1\nACGTT\nGCAAG\n')
+        self.assertEqual(b'TTGC', bytes(reads.fetch('id1', 3, 7,
+                                                    asBytes=True)))
+        reads.close()
+
+    def testUpperCase(self):
+        """
+        If upperCase is C{True}, sequences must be upper cased.
+        """
+        reads = self.makeReads('>id1\nacgt\n', upperCase=True)
+        self.assertEqual(DNARead('id1', 'ACGT'), reads['id1'])
+        reads.close()
+
+    def testReadClass(self):
+        """
+        Reads must be of the passed read class.
+        """
+        reads = self.makeReads('>id1\nMKL\n', readClass=AARead)
+        self.assertTrue(isinstance(reads['id1'], AARead))
+        reads.close()
+
+    def testGetLength(self):
+        """
+        The getLength method must return the length of a sequence.
+        """
+        reads = self.makeReads('>id1\nACGTT\nGC\n>id2\n\n')
+        self.assertEqual(7, reads.getLength('id1'))
+        self.assertEqual(0, reads.getLength('id2'))
+        reads.close()
+
+    def testGetMany(self):
+        """
+        The getMany method must return reads for all the requested ids, in
+        the order they are found in the FASTA file.
+        """
+        reads = self.makeReads('>id1\nACTG\n>id2\nAACC\n>id3\nGG\n')
+        self.assertEqual(
+            [DNARead('id1', 'ACTG'), DNARead('id3', 'GG')],
+            list(reads.getMany(['id3', 'id1', 'id3'])))
+        reads.close()
+
+    def testCompressed(self):
+        """
+        A compressed FASTA file must result in a ValueError.
+        """
+        filename = self.filename + '.gz'
+        with bgzf.BgzfWriter(filename) as fp:
+            fp.write(b'>id1\nACTG\n')
+        error = "^Compressed FASTA file '.*' cannot be memory mapped\\.$"
+        assertRaisesRegex(self, ValueError, error, FastaMmapReads, filename)
+
 
 class TestCombineReads(TestCase):
     """
@@ -862,6 +1258,67 @@ class TestSqliteIndex(TestCase):
                               'filename2.fasta')
             index.close()
 
+    def testAddFileDuplicateErrorIsForFirstDuplicate(self):
+        """"
+        If a FASTA file has a sequence id that was previously added from
+        another file as well as a sequence id that occurs twice in the file,
+        the ValueError must be for whichever duplicate occurs first in the
+        file.
+        """
+        files = {
+            'filename1.fasta': '>id1\nACTG\n',
+            'filename2.fasta': '>id2\nA\n>id2\nC\n>id1\nG\n',
+            'filename3.fasta': '>id1\nA\n>id3\nC\n>id3\nG\n',
+        }
+
+        with patch.object(builtins, 'open') as mockMethod:
+            mockMethod.side_effect = lambda filename, *args: StringIO(
+                files[filename])
+            index = SqliteIndex(':memory:')
+            index.addFile('filename1.fasta')
+            error = ("^FASTA sequence id 'id2' found twice in file "
+                     "'filename2\\.fasta'\\.$")
+            assertRaisesRegex(self, ValueError, error, index.addFile,
+                              'filename2.fasta')
+            error = ("^FASTA sequence id 'id1', found in file "
+                     "'filename3\\.fasta', was previously added from file "
+                     "'filename1\\.fasta'\\.$")
+            assertRaisesRegex(self, ValueError, error, index.addFile,
+                              'filename3.fasta')
+            index.close()
+
+    def testAddFileWithDuplicateSequenceAddsNothing(self):
+        """"
+        If adding a FASTA file fails because of a duplicate sequence id, none
+        of the sequences in the file must be added to the index.
+        """
+        files = {
+            'filename1.fasta': '>id1\nACTG\n',
+            'filename2.fasta': '>id2\nA\n>id1\nC\n',
+        }
+
+        with patch.object(builtins, 'open') as mockMethod:
+            mockMethod.side_effect = lambda filename, *args: StringIO(
+                files[filename])
+            index = SqliteIndex(':memory:')
+            index.addFile('filename1.fasta')
+            self.assertRaises(ValueError, index.addFile, 'filename2.fasta')
+            self.assertIsNone(index._find('id2'))
+            self.assertEqual(('filename1.fasta', 5), index._find('id1'))
+            index.close()
+
+    def testAddFileFinalHeaderWithoutNewline(self):
+        """"
+        A header at the end of a FASTA file that is not followed by a newline
+        must be indexed.
+        """
+        with patch.object(builtins, 'open') as mockMethod:
+            mockMethod.return_value = StringIO('>id1\nACTG\n>id2')
+            index = SqliteIndex(':memory:')
+            self.assertEqual(2, index.addFile('filename.fasta'))
+            self.assertEqual(('filename.fasta', 14), index._find('id2'))
+            index.close()
+
     def testAddDuplicateFile(self):
         """"
         If a filename is passed to addFile more than once, a ValueError must
@@ -1088,11 +1545,13 @@ class TestSqliteIndex(TestCase):
                 self.count = 0
 
             def sideEffect(self, filename, *args, **kwargs):
-                if self.count == 0 or self.count == 2 or self.count == 3:
+                # Each file is opened once to index it and (because files
+                # are kept open) once for all lookups.
+                if self.count == 0 or self.count == 2:
                     self.test.assertEqual('filename1.fasta', filename)
                     self.count += 1
                     return StringIO('>id1\nACTG\n>id2\nAACCTTGG\n')
-                elif self.count == 1 or self.count == 4:
+                elif self.count == 1 or self.count == 3:
                     self.test.assertEqual('filename2.fasta', filename)
                     self.count += 1
                     return StringIO('>seq3\nAAACCC\n')
@@ -1148,34 +1607,18 @@ class TestSqliteIndex(TestCase):
         expected read when the index file is in BGZF format and has a .bgz
         suffix.
         """
-        class Open(object):
-            def __init__(self, test):
-                self.test = test
-                self.count = 0
-
-            def sideEffect(self, filename, *args, **kwargs):
-                if self.count <= 1:
-                    self.test.assertEqual('filename.fasta.bgz', filename)
-                    self.count += 1
-                    writerIO = BytesIO()
-                    writer = bgzf.BgzfWriter(fileobj=writerIO)
-                    writer.write(b'>id0\nAC\n')
-                    writer.flush()
-                    fileobj = BytesIO(writerIO.getvalue())
-                    fileobj.mode = 'rb'
-                    return bgzf.BgzfReader(fileobj=fileobj)
-                else:
-                    self.test.fail(
-                        'Open called too many times. Filename: %r, Args: %r, '
-                        'Keyword args: %r.' % (filename, args, kwargs))
-
-        sideEffect = Open(self).sideEffect
-        with patch.object(bgzf, 'open') as mockMethod:
-            mockMethod.side_effect = sideEffect
+        directory = mkdtemp()
+        try:
+            filename = os.path.join(directory, 'filename.fasta.bgz')
+            writer = bgzf.BgzfWriter(filename, 'wb')
+            writer.write(b'>id0\nAC\n')
+            writer.close()
             index = SqliteIndex(':memory:')
-            index.addFile('filename.fasta.bgz')
+            self.assertEqual(1, index.addFile(filename))
             self.assertEqual(DNARead('id0', 'AC'), index['id0'])
             index.close()
+        finally:
+            rmtree(directory)
 
     def testDictLookupGzipData(self):
         """"
@@ -1185,38 +1628,358 @@ class TestSqliteIndex(TestCase):
         bgzip, including when sequences are more than 64K bytes into the input
         file.
         """
-        class Open(object):
-            def __init__(self, test):
-                self.test = test
-                self.count = 0
-
-            def sideEffect(self, filename, *args, **kwargs):
-                if self.count <= 4:
-                    self.test.assertEqual('filename.fasta.gz', filename)
-                    self.count += 1
-                    writerIO = BytesIO()
-                    writer = bgzf.BgzfWriter(fileobj=writerIO)
-                    writer.write(
-                        b'>id0\nAC\n' +
-                        b'>id1\n' + (b'A' * 70000) + b'\n' +
-                        b'>id2\r\nACTG\r\nCCCC\r\nGGG\r\n' +
-                        b'>id3\nAACCTG\n')
-                    writer.flush()
-                    fileobj = BytesIO(writerIO.getvalue())
-                    fileobj.mode = 'rb'
-                    return bgzf.BgzfReader(fileobj=fileobj)
-                else:
-                    self.test.fail(
-                        'Open called too many times. Filename: %r, Args: %r, '
-                        'Keyword args: %r.' % (filename, args, kwargs))
-
-        sideEffect = Open(self).sideEffect
-        with patch.object(bgzf, 'open') as mockMethod:
-            mockMethod.side_effect = sideEffect
+        directory = mkdtemp()
+        try:
+            filename = os.path.join(directory, 'filename.fasta.gz')
+            writer = bgzf.BgzfWriter(filename, 'wb')
+            writer.write(
+                b'>id0\nAC\n' +
+                b'>id1\n' + (b'A' * 70000) + b'\n' +
+                b'>id2\r\nACTG\r\nCCCC\r\nGGG\r\n' +
+                b'>id3\nAACCTG\n')
+            writer.close()
             index = SqliteIndex(':memory:')
-            index.addFile('filename.fasta.gz')
+            self.assertEqual(4, index.addFile(filename))
             self.assertEqual(DNARead('id0', 'AC'), index['id0'])
             self.assertEqual(DNARead('id1', 'A' * 70000), index['id1'])
             self.assertEqual(DNARead('id2', 'ACTGCCCCGGG'), index['id2'])
             self.assertEqual(DNARead('id3', 'AACCTG'), index['id3'])
             index.close()
+        finally:
+            rmtree(directory)
+
+    def testGetLength(self):
+        """"
+        The getLength method must return the length of a sequence, without
+        opening its FASTA file.
+        """
+        with patch.object(builtins, 'open') as mockMethod:
+            mockMethod.return_value = StringIO(
+                '>id1\nACTG\r\nCCCC\nGGG\n>id2\nAACCTG\n>id3\n')
+            index = SqliteIndex(':memory:')
+            index.addFile('filename.fasta')
+            self.assertEqual(1, mockMethod.call_count)
+            self.assertEqual(11, index.getLength('id1'))
+            self.assertEqual(6, index.getLength('id2'))
+            self.assertEqual(0, index.getLength('id3'))
+            self.assertEqual(1, mockMethod.call_count)
+            index.close()
+
+    def testGetLengthUnknownId(self):
+        """"
+        The getLength method must raise KeyError if passed an unknown id.
+        """
+        index = SqliteIndex(':memory:')
+        error = "^\"Unknown sequence: 'id1'\"$"
+        assertRaisesRegex(self, KeyError, error, index.getLength, 'id1')
+        index.close()
+
+    def testSequenceExtents(self):
+        """"
+        The length, first line length, and number of characters of each
+        sequence must be stored in the database.
+        """
+        with patch.object(builtins, 'open') as mockMethod:
+            mockMethod.return_value = StringIO(
+                '>id1\nACTG\r\nCCCC\nGGG\n>id2\nAACCTG')
+            index = SqliteIndex(':memory:')
+            index.addFile('filename.fasta')
+            self.assertEqual(
+                [('id1', 5, 11, 4, 15), ('id2', 25, 6, 6, 6)],
+                index._connection.execute(
+                    'SELECT id, offset, length, lineLength, extent '
+                    'FROM sequences ORDER BY id').fetchall())
+            index.close()
+
+    def testEarlierVersionDatabase(self):
+        """"
+        A database made by an earlier version (which does not store sequence
+        lengths) must be usable for lookups and for adding more files.
+        """
+        directory = mkdtemp()
+        try:
+            dbFilename = os.path.join(directory, 'index.db')
+            filename1 = os.path.join(directory, 'file1.fasta')
+            filename2 = os.path.join(directory, 'file2.fasta')
+            with open(filename1, 'w') as fp:
+                fp.write('>id1\nACTG\nCC\n>id2\nAAA\n')
+            with open(filename2, 'w') as fp:
+                fp.write('>id3\nGGG\nTT\n')
+
+            connection = sqlite3.connect(dbFilename)
+            connection.executescript('''
+                CREATE TABLE files (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name VARCHAR UNIQUE
+                );
+
+                CREATE TABLE sequences (
+                    id VARCHAR UNIQUE PRIMARY KEY,
+                    fileNumber INTEGER,
+                    offset INTEGER
+                );
+            ''')
+            connection.execute('INSERT INTO files(name) VALUES (?)',
+                               (filename1,))
+            connection.executemany(
+                'INSERT INTO sequences(id, fileNumber, offset) '
+                'VALUES (?, 1, ?)', [('id1', 5), ('id2', 18)])
+            connection.commit()
+            connection.close()
+
+            index = SqliteIndex(dbFilename)
+            self.assertEqual(DNARead('id1', 'ACTGCC'), index['id1'])
+            self.assertEqual(6, index.getLength('id1'))
+            self.assertEqual(1, index.addFile(filename2))
+            self.assertEqual(DNARead('id2', 'AAA'), index['id2'])
+            self.assertEqual(DNARead('id3', 'GGGTT'), index['id3'])
+            self.assertEqual(3, index.getLength('id2'))
+            self.assertEqual(5, index.getLength('id3'))
+            index.close()
+        finally:
+            rmtree(directory)
+
+    def testGetMany(self):
+        """"
+        The getMany method must return reads for all the requested ids, in
+        file and offset order, opening each FASTA file once.
+        """
+        directory = mkdtemp()
+        try:
+            filename1 = os.path.join(directory, 'file1.fasta')
+            filename2 = os.path.join(directory, 'file2.fasta.gz')
+            with open(filename1, 'w') as fp:
+                fp.write('>id1\nACTG\n>id2\nAACC\nTT\n>id3\nGG\n')
+            writer = bgzf.BgzfWriter(filename2, 'wb')
+            writer.write(b'>id4\nCCC\n>id5\nTTT\n')
+            writer.close()
+            index = SqliteIndex(':memory:')
+            index.addFile(filename1)
+            index.addFile(filename2)
+            with patch.object(SqliteIndex, '_openFasta',
+                              side_effect=SqliteIndex._openFasta) as mock:
+                self.assertEqual(
+                    [
+                        DNARead('id2', 'AACCTT'),
+                        DNARead('id3', 'GG'),
+                        DNARead('id4', 'CCC'),
+                        DNARead('id5', 'TTT'),
+                    ],
+                    list(index.getMany(['id5', 'id3', 'id2', 'id4', 'id3'])))
+                self.assertEqual(2, mock.call_count)
+            index.close()
+        finally:
+            rmtree(directory)
+
+    def testGetManyUnknownId(self):
+        """"
+        The getMany method must raise KeyError if passed an unknown id.
+        """
+        with patch.object(builtins, 'open') as mockMethod:
+            mockMethod.return_value = StringIO('>id1\nACTG\n')
+            index = SqliteIndex(':memory:')
+            index.addFile('filename.fasta')
+            error = "^\"Unknown sequence: 'id2'\"$"
+            assertRaisesRegex(self, KeyError, error, index.getMany,
+                              ['id1', 'id2'])
+            index.close()
+
+    def testGetManyNoIds(self):
+        """"
+        The getMany method must return nothing if passed no ids.
+        """
+        index = SqliteIndex(':memory:')
+        self.assertEqual([], list(index.getMany([])))
+        index.close()
+
+    def _makeFastaFiles(self, directory):
+        """
+        Make two FASTA files and an index of them.
+
+        @param directory: The C{str} directory to make the files in.
+        @return: A C{list} of the C{str} FASTA file names.
+        """
+        filenames = []
+        for i, data in enumerate(('>id1\nACTG\n>id2\nAACC\n',
+                                  '>id3\nGGGTT\n')):
+            filename = os.path.join(directory, 'file%d.fasta' % i)
+            with open(filename, 'w') as fp:
+                fp.write(data)
+            filenames.append(filename)
+        return filenames
+
+    def testMaxOpenFiles(self):
+        """"
+        No more than maxOpenFiles FASTA files must be kept open, and the least
+        recently used file must be the one closed.
+        """
+        directory = mkdtemp()
+        try:
+            index = SqliteIndex(':memory:', maxOpenFiles=1, cacheSize=0)
+            for filename in self._makeFastaFiles(directory):
+                index.addFile(filename)
+            with patch.object(SqliteIndex, '_openFasta',
+                              side_effect=SqliteIndex._openFasta) as mock:
+                self.assertEqual(DNARead('id1', 'ACTG'), index['id1'])
+                self.assertEqual(DNARead('id2', 'AACC'), index['id2'])
+                self.assertEqual(1, mock.call_count)
+                self.assertEqual(DNARead('id3', 'GGGTT'), index['id3'])
+                self.assertEqual(2, mock.call_count)
+                self.assertEqual(1, len(index._openFiles))
+                self.assertEqual(DNARead('id1', 'ACTG'), index['id1'])
+                self.assertEqual(3, mock.call_count)
+            index.close()
+        finally:
+            rmtree(directory)
+
+    def testCache(self):
+        """"
+        A sequence that has been read must be returned from the cache when
+        it is looked up again, by __getitem__ or getMany.
+        """
+        directory = mkdtemp()
+        try:
+            index = SqliteIndex(':memory:')
+            for filename in self._makeFastaFiles(directory):
+                index.addFile(filename)
+            with patch.object(SqliteIndex, '_readSequence',
+                              side_effect=SqliteIndex._readSequence) as mock:
+                self.assertEqual(DNARead('id1', 'ACTG'), index['id1'])
+                self.assertEqual(DNARead('id1', 'ACTG'), index['id1'])
+                self.assertEqual(1, mock.call_count)
+                self.assertEqual(
+                    [DNARead('id1', 'ACTG'), DNARead('id2', 'AACC')],
+                    list(index.getMany(['id1', 'id2'])))
+                self.assertEqual(2, mock.call_count)
+            index.close()
+        finally:
+            rmtree(directory)
+
+    def testCacheSize(self):
+        """"
+        The total length of cached sequences must not exceed the cache size,
+        the least recently used sequences must be removed from the cache
+        first, and a sequence longer than the cache size must not be cached.
+        """
+        directory = mkdtemp()
+        try:
+            index = SqliteIndex(':memory:', cacheSize=9)
+            for filename in self._makeFastaFiles(directory):
+                index.addFile(filename)
+            index['id1']
+            index['id2']
+            self.assertEqual(['id1', 'id2'], list(index._cache))
+            index['id1']
+            self.assertEqual(['id2', 'id1'], list(index._cache))
+            index['id3']
+            self.assertEqual(['id1', 'id3'], list(index._cache))
+            self.assertEqual(9, index._cachedLength)
+            index.close()
+
+            index = SqliteIndex(':memory:', cacheSize=4)
+            for filename in self._makeFastaFiles(directory):
+                index.addFile(filename)
+            index['id3']
+            index['id1']
+            self.assertEqual(['id1'], list(index._cache))
+            index.close()
+        finally:
+            rmtree(directory)
+
+    def testCloseClosesFiles(self):
+        """"
+        The close method must close all open FASTA files.
+        """
+        directory = mkdtemp()
+        try:
+            index = SqliteIndex(':memory:')
+            for filename in self._makeFastaFiles(directory):
+                index.addFile(filename)
+            index['id1']
+            index['id3']
+            files = list(index._openFiles.values())
+            self.assertEqual(2, len(files))
+            index.close()
+            self.assertTrue(all(fp.closed for fp in files))
+        finally:
+            rmtree(directory)
+
+
+class TestFastaIndex(TestCase):
+    """
+    Tests for the L{dark.fasta.fastaIndex} function.
+    """
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.filename = os.path.join(self.directory, 'file.fasta')
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+    def testRegularLines(self):
+        """
+        A FASTA file whose sequences have lines of the same length must be
+        indexed with a .fai file.
+        """
+        with open(self.filename, 'w') as fp:
+            fp.write('>id1 desc\nACGT\nAC\n')
+        index = fastaIndex(self.filename)
+        self.assertTrue(isinstance(index, FastaMmapReads))
+        self.assertTrue(os.path.exists(self.filename + '.fai'))
+        self.assertEqual(DNARead('id1 desc', 'ACGTAC'), index['id1 desc'])
+        index.close()
+
+    def testIrregularLines(self):
+        """
+        A FASTA file whose sequences have lines of different lengths must be
+        indexed with an sqlite3 database, which is saved.
+        """
+        with open(self.filename, 'w') as fp:
+            fp.write('>id1 desc\nACG\nTACGT\nA\n')
+        index = fastaIndex(self.filename, readClass=AARead)
+        self.assertTrue(isinstance(index, SqliteIndex))
+        self.assertEqual(AARead('id1 desc', 'ACGTACGTA'), index['id1 desc'])
+        index.close()
+        self.assertTrue(os.path.exists(self.filename + '.sqlite'))
+        self.assertFalse(os.path.exists(self.filename + '.sqlite.tmp'))
+
+    def testIrregularLinesNoOpenFiles(self):
+        """
+        When a FASTA file whose sequences have lines of different lengths is
+        indexed with an sqlite3 database, no files must be left open once
+        the index is closed (i.e., the file opened while trying to memory
+        map it must have been closed).
+        """
+        with open(self.filename, 'w') as fp:
+            fp.write('>id1 desc\nACG\nTACGT\nA\n')
+        with recordOpenedFiles() as opened:
+            index = fastaIndex(self.filename)
+            self.assertEqual(DNARead('id1 desc', 'ACGTACGTA'),
+                             index['id1 desc'])
+            index.close()
+        self.assertTrue(opened)
+        self.assertTrue(all(fp.closed for fp in opened))
+
+    def testExistingDatabaseReused(self):
+        """
+        An up-to-date sqlite3 database made for a FASTA file must be reused.
+        """
+        with open(self.filename, 'w') as fp:
+            fp.write('>id1\nACG\nTACGT\n')
+        fastaIndex(self.filename).close()
+        with patch.object(SqliteIndex, 'addFile') as mockMethod:
+            index = fastaIndex(self.filename)
+            self.assertEqual(DNARead('id1', 'ACGTACGT'), index['id1'])
+            index.close()
+            self.assertFalse(mockMethod.called)
+
+    def testDuplicateIds(self):
+        """
+        If a FASTA file has a repeated id, a ValueError must be raised and
+        no database must be left behind.
+        """
+        with open(self.filename, 'w') as fp:
+            fp.write('>id1\nACG\n>id1\nTT\n')
+        error = "^FASTA sequence id 'id1' found twice in file '.*'\\.$"
+        assertRaisesRegex(self, ValueError, error, fastaIndex, self.filename)
+        self.assertEqual(['file.fasta'], os.listdir(self.directory))
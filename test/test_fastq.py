@@ -1,7 +1,9 @@
+import six
 from six.moves import builtins
 
 from dark.reads import AARead, DNARead, RNARead
-from dark.fastq import FastqReads
+from dark.fastq import FastqReads, fastqRecords, fastqSequenceLengths
+from dark.utils import StringIO
 
 from unittest import TestCase
 
@@ -13,6 +15,182 @@ except ImportError:
 from .mocking import mockOpen, File
 
 
+class TestFastqRecords(TestCase):
+    """
+    Tests for the L{dark.fastq.fastqRecords} function.
+    """
+    def testEmpty(self):
+        """
+        Empty input must result in no records.
+        """
+        self.assertEqual([], list(fastqRecords(StringIO(''))))
+
+    def testOneRecord(self):
+        """
+        A single record must be returned as an (id, sequence, quality) tuple.
+        """
+        data = '@id1 desc\nACGT\n+\n!!!!\n'
+        self.assertEqual([('id1 desc', 'ACGT', '!!!!')],
+                         list(fastqRecords(StringIO(data))))
+
+    def testNoFinalNewline(self):
+        """
+        A final record without a trailing newline must be read correctly.
+        """
+        data = '@id1\nACGT\n+\n!!!!'
+        self.assertEqual([('id1', 'ACGT', '!!!!')],
+                         list(fastqRecords(StringIO(data))))
+
+    def testTrailingBlankLines(self):
+        """
+        Blank lines at the end of the input must be ignored.
+        """
+        data = '@id1\nACGT\n+\n!!!!\n\n\n'
+        self.assertEqual([('id1', 'ACGT', '!!!!')],
+                         list(fastqRecords(StringIO(data))))
+
+    def testFourTrailingBlankLines(self):
+        """
+        Blank lines at the end of the input must be ignored when there are
+        four of them (i.e., they could form a whole record), no matter how
+        the input is split into blocks.
+        """
+        data = '@id1\nACGT\n+\n!!!!\n\n\n \n\n'
+        for blockSize in range(1, len(data) + 2):
+            self.assertEqual(
+                [('id1', 'ACGT', '!!!!')],
+                list(fastqRecords(StringIO(data), blockSize=blockSize)))
+
+    def testEmptyFinalRecordAndTrailingBlankLines(self):
+        """
+        A final record with an empty sequence and quality must be read
+        correctly when blank lines follow it.
+        """
+        data = '@id1\nACGT\n+\n!!!!\n@id2\n\n+\n\n\n\n\n\n\n'
+        for blockSize in range(1, len(data) + 2):
+            self.assertEqual(
+                [('id1', 'ACGT', '!!!!'), ('id2', '', '')],
+                list(fastqRecords(StringIO(data), blockSize=blockSize)))
+
+    def testBlankLinesBeforeRecord(self):
+        """
+        Blank lines that are not at the end of the input must raise a
+        ValueError.
+        """
+        data = '@id1\nACGT\n+\n!!!!\n\n\n\n\n@id2\nAC\n+\n!!\n'
+        for blockSize in (1, 5, 100):
+            six.assertRaisesRegex(
+                self, ValueError, 'does not start with @', list,
+                fastqRecords(StringIO(data), blockSize=blockSize))
+
+    def testWindowsLineEndings(self):
+        """
+        Carriage returns must be removed.
+        """
+        data = '@id1\r\nACGT\r\n+\r\n!!!!\r\n'
+        self.assertEqual([('id1', 'ACGT', '!!!!')],
+                         list(fastqRecords(StringIO(data))))
+
+    def testQualityMayStartWithAt(self):
+        """
+        A quality string starting with '@' must not confuse the parser.
+        """
+        data = '@id1\nACGT\n+id1\n@@@@\n@id2\nAA\n+\n@!\n'
+        self.assertEqual([('id1', 'ACGT', '@@@@'), ('id2', 'AA', '@!')],
+                         list(fastqRecords(StringIO(data))))
+
+    def testSmallBlockSizes(self):
+        """
+        The same records must be found no matter how the input is split into
+        blocks.
+        """
+        data = ('@id1\nACGTACGT\n+\n!!!!!!!!\n@id2 xxx\nGG\n+\n??\n'
+                '@id3\nTTT\n+\nAAA\n')
+        expected = [('id1', 'ACGTACGT', '!!!!!!!!'), ('id2 xxx', 'GG', '??'),
+                    ('id3', 'TTT', 'AAA')]
+        for blockSize in range(1, len(data) + 2):
+            self.assertEqual(
+                expected,
+                list(fastqRecords(StringIO(data), blockSize=blockSize)))
+
+    def testIncompleteRecord(self):
+        """
+        Input that ends with an incomplete record must raise a ValueError.
+        """
+        data = '@id1\nACGT\n+\n!!!!\n@id2\nAC\n'
+        error = (r"^FASTQ input ended with an incomplete record \(2 lines\): "
+                 r"'@id2'\.$")
+        six.assertRaisesRegex(self, ValueError, error, list,
+                              fastqRecords(StringIO(data)))
+
+    def testBadHeader(self):
+        """
+        A record whose first line does not start with '@' must raise a
+        ValueError.
+        """
+        data = '@id1\nACGT\n+\n!!!!\nid2\nAC\n+\n!!\n'
+        error = r"^FASTQ record header line 'id2' does not start with @\.$"
+        six.assertRaisesRegex(self, ValueError, error, list,
+                              fastqRecords(StringIO(data)))
+
+    def testBadPlusLine(self):
+        """
+        A record whose third line does not start with '+' must raise a
+        ValueError.
+        """
+        data = '@id1\nACGT\n-\n!!!!\n'
+        error = (r"^Third line of FASTQ record 'id1' does not start "
+                 r"with \+\.$")
+        six.assertRaisesRegex(self, ValueError, error, list,
+                              fastqRecords(StringIO(data)))
+
+    def testUnequalLengths(self):
+        """
+        A record whose sequence and quality lengths differ must raise a
+        ValueError.
+        """
+        data = '@id1\nACGT\n+\n!!!\n'
+        error = (r"^FASTQ record 'id1' has sequence length \(4\) != quality "
+                 r"length \(3\)\.$")
+        six.assertRaisesRegex(self, ValueError, error, list,
+                              fastqRecords(StringIO(data)))
+
+
+class TestFastqSequenceLengths(TestCase):
+    """
+    Tests for the L{dark.fastq.fastqSequenceLengths} function.
+    """
+    def testEmpty(self):
+        """
+        Empty input must result in no lengths.
+        """
+        self.assertEqual([], list(fastqSequenceLengths(StringIO(''))))
+
+    def testLengths(self):
+        """
+        The lengths of all sequences must be returned, in order.
+        """
+        data = '@id1\nACGT\n+\n!!!!\n@id2\nAC\n+\n!!\n'
+        self.assertEqual([4, 2], list(fastqSequenceLengths(StringIO(data))))
+
+    def testTrailingBlankLines(self):
+        """
+        Blank lines at the end of the input must be ignored.
+        """
+        for blanks in range(1, 9):
+            data = '@id1\nACGT\n+\n!!!!\n' + '\n' * blanks
+            self.assertEqual([4],
+                             list(fastqSequenceLengths(StringIO(data))))
+
+    def testInvalidRecord(self):
+        """
+        An invalid record must raise a ValueError.
+        """
+        data = '@id1\nACGT\n+\n!!!\n'
+        six.assertRaisesRegex(self, ValueError, 'quality length',
+                              list, fastqSequenceLengths(StringIO(data)))
+
+
 class TestFastqReads(TestCase):
     """
     Tests for the L{dark.fastq.FastqReads} class.
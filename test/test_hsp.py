@@ -1,6 +1,9 @@
+import six
+from copy import deepcopy
+from functools import partial
 from unittest import TestCase
 
-from dark.hsp import HSP, LSP
+from dark.hsp import HSP, LSP, HSPNormalizationError, normalizeLazily
 
 
 class TestHSP(TestCase):
@@ -84,6 +87,36 @@ class TestHSP(TestCase):
             },
             hsp.toDict())
 
+    def testSorted(self):
+        """
+        Sorting HSPs must put the best last.
+        """
+        result = sorted([HSP(8), HSP(7)])
+        self.assertEqual([7, 8], [x.score.score for x in result])
+
+    def testOtherComparisons(self):
+        """
+        HSPs must compare properly with <=, >, >=, and !=.
+        """
+        self.assertTrue(HSP(7) <= HSP(8))
+        self.assertTrue(HSP(8) > HSP(7))
+        self.assertTrue(HSP(8) >= HSP(8))
+        self.assertTrue(HSP(8) != HSP(7))
+
+    def testNoDict(self):
+        """
+        HSP instances must not have a __dict__ (they use __slots__).
+        """
+        self.assertFalse(hasattr(HSP(7), '__dict__'))
+
+    def testScoreCanBeChanged(self):
+        """
+        It must be possible to change the score of an HSP.
+        """
+        hsp = HSP(7)
+        hsp.score.score = 10
+        self.assertEqual(10, hsp.score.score)
+
 
 class TestLSP(TestCase):
     """
@@ -165,3 +198,189 @@ class TestLSP(TestCase):
                 'subjectMatchedSequence': 'ccc',
             },
             lsp.toDict())
+
+    def testSorted(self):
+        """
+        Sorting LSPs must put the best last.
+        """
+        result = sorted([LSP(7), LSP(8)])
+        self.assertEqual([8, 7], [x.score.score for x in result])
+
+    def testOtherComparisons(self):
+        """
+        LSPs must compare properly with <=, >, >=, and !=.
+        """
+        self.assertTrue(LSP(8) <= LSP(7))
+        self.assertTrue(LSP(7) > LSP(8))
+        self.assertTrue(LSP(7) >= LSP(7))
+        self.assertTrue(LSP(7) != LSP(8))
+
+    def testNoDict(self):
+        """
+        LSP instances must not have a __dict__ (they use __slots__).
+        """
+        self.assertFalse(hasattr(LSP(7), '__dict__'))
+
+    def testScoreCanBeChanged(self):
+        """
+        It must be possible to change the score of an LSP.
+        """
+        hsp = LSP(7)
+        hsp.score.score = 10
+        self.assertEqual(10, hsp.score.score)
+
+
+class TestLazyNormalization(TestCase):
+    """
+    Tests of HSPs and LSPs whose offsets are computed lazily.
+    """
+    def makeNormalize(self):
+        """
+        Make a normalize function that counts its calls.
+
+        @return: A 2-tuple of the function and a C{list} whose length is the
+            number of times the function has been called.
+        """
+        calls = []
+
+        def normalize():
+            calls.append(None)
+            return {
+                'readStart': 1,
+                'readEnd': 2,
+                'readStartInSubject': 3,
+                'readEndInSubject': 4,
+                'subjectStart': 5,
+                'subjectEnd': 6,
+            }
+
+        return normalize, calls
+
+    def testNotNormalizedUnlessNeeded(self):
+        """
+        The normalize function must not be called if no offset is accessed.
+        """
+        normalize, calls = self.makeNormalize()
+        hsp = HSP(7, readFrame=8, identicalCount=9, normalize=normalize)
+        self.assertEqual(7, hsp.score.score)
+        self.assertEqual(8, hsp.readFrame)
+        self.assertEqual(9, hsp.identicalCount)
+        self.assertTrue(hsp.betterThan(5))
+        self.assertEqual([], calls)
+
+    def testOffsets(self):
+        """
+        The offsets of a lazy HSP must be those returned by the normalize
+        function, which must only be called once.
+        """
+        normalize, calls = self.makeNormalize()
+        hsp = HSP(7, normalize=normalize)
+        self.assertEqual(3, hsp.readStartInSubject)
+        self.assertEqual(1, hsp.readStart)
+        self.assertEqual(2, hsp.readEnd)
+        self.assertEqual(4, hsp.readEndInSubject)
+        self.assertEqual(5, hsp.subjectStart)
+        self.assertEqual(6, hsp.subjectEnd)
+        self.assertEqual(1, len(calls))
+
+    def testPassedOffsetsIgnored(self):
+        """
+        If a normalize function is given, offsets that are also passed must be
+        ignored.
+        """
+        normalize, _ = self.makeNormalize()
+        lsp = LSP(7, readStart=100, normalize=normalize)
+        self.assertEqual(1, lsp.readStart)
+
+    def testUnknownAttribute(self):
+        """
+        Accessing an unknown attribute of a lazy HSP must raise
+        AttributeError and must not normalize the HSP.
+        """
+        normalize, calls = self.makeNormalize()
+        hsp = HSP(7, normalize=normalize)
+        error = "^'HSP' object has no attribute 'xxx'$"
+        six.assertRaisesRegex(self, AttributeError, error, getattr, hsp,
+                              'xxx')
+        self.assertEqual([], calls)
+
+    def testNormalizeAttributeError(self):
+        """
+        If the normalize function raises AttributeError, accessing an offset
+        must raise HSPNormalizationError (not AttributeError, which would
+        indicate the attribute does not exist).
+        """
+        def normalize():
+            return None.missing
+
+        hsp = HSP(7, normalize=normalize)
+        error = (r"^Could not normalize HSP offsets \(looking up "
+                 r"'readStart'\): AttributeError: ")
+        six.assertRaisesRegex(self, HSPNormalizationError, error, getattr,
+                              hsp, 'readStart')
+
+    def testNormalizeLazilyError(self):
+        """
+        If a normalize function made with normalizeLazily fails, accessing an
+        offset must raise HSPNormalizationError giving the read id and
+        subject title.
+        """
+        def normalizeHSP(hsp, readLength):
+            raise AssertionError('Oops')
+
+        hsp = HSP(7, normalize=partial(normalizeLazily, 'id1', 'title1',
+                                       normalizeHSP, {}, 10))
+        error = (r"^Could not normalize HSP offsets for read 'id1' matching "
+                 r"subject 'title1': AssertionError: Oops$")
+        six.assertRaisesRegex(self, HSPNormalizationError, error, getattr,
+                              hsp, 'subjectEnd')
+
+    def testNormalizeLazily(self):
+        """
+        A normalize function made with normalizeLazily must pass its
+        arguments to the normalizeHSP function.
+        """
+        normalize, _ = self.makeNormalize()
+
+        def normalizeHSP(hsp, readLength, application=None):
+            self.assertEqual({}, hsp)
+            self.assertEqual(10, readLength)
+            self.assertEqual('blastn', application)
+            return normalize()
+
+        hsp = HSP(7, normalize=partial(normalizeLazily, 'id1', 'title1',
+                                       normalizeHSP, {}, 10,
+                                       application='blastn'))
+        self.assertEqual(6, hsp.subjectEnd)
+
+    def testToDict(self):
+        """
+        The toDict method of a lazy LSP must return the normalized offsets.
+        """
+        normalize, _ = self.makeNormalize()
+        lsp = LSP(0, readFrame=7, normalize=normalize)
+        self.assertEqual(
+            {
+                'score': 0,
+                'readStart': 1,
+                'readEnd': 2,
+                'readStartInSubject': 3,
+                'readEndInSubject': 4,
+                'subjectStart': 5,
+                'subjectEnd': 6,
+                'readFrame': 7,
+                'subjectFrame': None,
+                'identicalCount': None,
+                'positiveCount': None,
+                'readMatchedSequence': None,
+                'subjectMatchedSequence': None,
+            },
+            lsp.toDict())
+
+    def testDeepcopy(self):
+        """
+        A lazy HSP must be able to be deep copied.
+        """
+        normalize, _ = self.makeNormalize()
+        hsp = deepcopy(HSP(7, normalize=normalize))
+        self.assertEqual(5, hsp.subjectStart)
@@ -0,0 +1,99 @@
+from json import loads
+from unittest import TestCase, skipIf
+
+from six import assertRaisesRegex, StringIO
+
+from dark.json_records import jsonLines, jsonLoader, orjson
+
+
+class TestJSONLoader(TestCase):
+    """
+    Tests for the L{dark.json_records.jsonLoader} function.
+    """
+    def testStdlib(self):
+        """
+        Asking for the 'json' backend must give the stdlib json.loads.
+        """
+        self.assertIs(loads, jsonLoader('json'))
+
+    def testDefault(self):
+        """
+        The default backend must decode JSON.
+        """
+        self.assertEqual({'a': [1, 2.5, None, 'x']},
+                         jsonLoader()('{"a": [1, 2.5, null, "x"]}'))
+
+    def testDefaultInvalidJSON(self):
+        """
+        The default backend must raise ValueError on invalid JSON.
+        """
+        self.assertRaises(ValueError, jsonLoader(), '{')
+
+    def testUnknown(self):
+        """
+        Asking for an unknown backend must raise ValueError.
+        """
+        error = ("^Unknown JSON backend 'xxx'\\. Known backends are: "
+                 "orjson, json\\.$")
+        assertRaisesRegex(self, ValueError, error, jsonLoader, 'xxx')
+
+    @skipIf(orjson is not None, 'orjson is installed')
+    def testOrjsonNotInstalled(self):
+        """
+        Asking for orjson when it is not installed must raise ValueError.
+        """
+        error = '^The orjson JSON backend is not installed\\.$'
+        assertRaisesRegex(self, ValueError, error, jsonLoader, 'orjson')
+
+    @skipIf(orjson is None, 'orjson is not installed')
+    def testOrjson(self):
+        """
+        The orjson backend must decode JSON and raise ValueError on invalid
+        JSON.
+        """
+        loader = jsonLoader('orjson')
+        self.assertEqual({'a': 1}, loader('{"a": 1}'))
+        self.assertRaises(ValueError, loader, '{')
+
+
+class TestJSONLines(TestCase):
+    """
+    Tests for the L{dark.json_records.jsonLines} function.
+    """
+    def testEmpty(self):
+        """
+        An empty file must result in no lines.
+        """
+        self.assertEqual([], list(jsonLines(StringIO())))
+
+    def testLines(self):
+        """
+        Lines must be yielded with their numbers and without newlines.
+        """
+        self.assertEqual(
+            [(1, '{"a": 1}'), (2, ''), (3, '[3]')],
+            list(jsonLines(StringIO('{"a": 1}\n\n[3]\n'))))
+
+    def testFirstLineNumber(self):
+        """
+        Lines must be numbered starting from the given first line number.
+        """
+        self.assertEqual([(5, '1'), (6, '2')],
+                         list(jsonLines(StringIO('1\n2\n'),
+                                        firstLineNumber=5)))
+
+    def testNoFinalNewline(self):
+        """
+        A final line with no newline must be yielded complete.
+        """
+        self.assertEqual([(1, '123'), (2, '456')],
+                         list(jsonLines(StringIO('123\n456'))))
+
+    def testSmallBlocks(self):
+        """
+        Lines must be yielded correctly when they span several blocks.
+        """
+        data = '[1, 2, 3]\n{"abc": "def"}\n4\n'
+        self.assertEqual(
+            [(1, '[1, 2, 3]'), (2, '{"abc": "def"}'), (3, '4')],
+            list(jsonLines(StringIO(data), blockSize=3)))
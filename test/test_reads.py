@@ -3,7 +3,11 @@ from six.moves import builtins
 from six import StringIO
 from unittest import TestCase
 from random import seed
+import sqlite3
 from os import stat
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
 
 try:
     from unittest.mock import patch, call
@@ -15,16 +19,30 @@ from dark.aa import (
     BASIC_POSITIVE, HYDROPHOBIC, HYDROPHILIC, NEGATIVE, NONE, POLAR, SMALL,
     TINY)
 from dark.fasta import FastaReads
+from dark.fastq import FastqReads
 from dark.hsp import HSP
 from dark.reads import (
     Read, TranslatedRead, Reads, ReadsInRAM, DNARead, RNARead, AARead,
-    AAReadORF, AAReadWithX, SSAARead, SSAAReadWithX, readClassNameToClass)
+    AAReadORF, AAReadWithX, SSAARead, SSAAReadWithX, readClassNameToClass,
+    ReadFilter, ReadsWriter, formatReads)
 
 
 class TestRead(TestCase):
     """
     Test the Read class.
     """
+    def testNoInstanceDict(self):
+        """
+        Read instances (and those of subclasses that add no attributes) must
+        not have a __dict__, and so cannot be given arbitrary attributes.
+        """
+        for read in (Read('id', 'ACGT'), DNARead('id', 'ACGT'),
+                     AARead('id', 'MM'), SSAARead('id', 'MM', 'HH'),
+                     TranslatedRead(DNARead('id', 'ACGT'), 'M', 0)):
+            self.assertFalse(hasattr(read, '__dict__'))
+        self.assertRaises(AttributeError, setattr, Read('id', 'ACGT'),
+                          'xxx', 3)
+
     def testGetitemReturnsNewRead(self):
         """
         __getitem__ must return a new Read instance.
@@ -619,6 +637,22 @@ class TestRead(TestCase):
                          Read('id1', 'ATCGAT').newFromSites({100, 200},
                                                             exclude=True))
 
+    def testNewFromSitesNone(self):
+        """
+        If the sites passed to newFromSites is None, a read with the full
+        sequence and quality should be returned.
+        """
+        self.assertEqual(Read('id1', 'ATCGAT', '123456'),
+                         Read('id1', 'ATCGAT', '123456').newFromSites(None))
+
+    def testKeepSitesNonLatin1(self):
+        """
+        newFromSites must work on sequences that have characters that are
+        not Latin-1.
+        """
+        self.assertEqual(Read('id1', u'A\u2014T'),
+                         Read('id1', u'XA\u2014GT').newFromSites({1, 2, 4}))
+
 
 class TestDNARead(TestCase):
     """
@@ -2114,7 +2148,7 @@ class TestReads(TestCase):
         with patch.object(builtins, 'open', mockOpener):
             reads.save('filename')
         handle = mockOpener()
-        self.assertEqual([call('>id1\nAT\n'), call('>id2\nAC\n')],
+        self.assertEqual([call('>id1\nAT\n>id2\nAC\n')],
                          handle.write.mock_calls)
 
     def testSaveAsFASTA(self):
@@ -2130,7 +2164,7 @@ class TestReads(TestCase):
         with patch.object(builtins, 'open', mockOpener):
             reads.save('filename', 'fasta')
         handle = mockOpener()
-        self.assertEqual([call('>id1\nAT\n'), call('>id2\nAC\n')],
+        self.assertEqual([call('>id1\nAT\n>id2\nAC\n')],
                          handle.write.mock_calls)
 
     def testSaveReturnsReadCount(self):
@@ -2162,7 +2196,7 @@ class TestReads(TestCase):
         with patch.object(builtins, 'open', mockOpener):
             reads.save('filename', 'FASTA')
         handle = mockOpener()
-        self.assertEqual([call('>id1\nAT\n'), call('>id2\nAC\n')],
+        self.assertEqual([call('>id1\nAT\n>id2\nAC\n')],
                          handle.write.mock_calls)
 
     def testSaveAsFASTQ(self):
@@ -2179,7 +2213,7 @@ class TestReads(TestCase):
             reads.save('filename', 'fastq')
         handle = mockOpener()
         self.assertEqual(
-            [call('@id1\nAT\n+id1\n!!\n'), call('@id2\nAC\n+id2\n@@\n')],
+            [call('@id1\nAT\n+id1\n!!\n@id2\nAC\n+id2\n@@\n')],
             handle.write.mock_calls)
 
     def testSaveAsFASTQFailsOnReadWithNoQuality(self):
@@ -2213,6 +2247,24 @@ class TestReads(TestCase):
         reads.save(fp)
         self.assertEqual('>id1\nAT\n>id2\nAC\n', fp.getvalue())
 
+    def testSaveCompressed(self):
+        """
+        A Reads instance must be able to save to a compressed file, with and
+        without threads.
+        """
+        reads = Reads([Read('id1', 'AT', '!!'), Read('id2', 'AC', '@@')])
+        directory = mkdtemp()
+        try:
+            for suffix in '.gz', '.bgz', '.bz2':
+                for threads in 0, 2:
+                    filename = join(directory, 'reads.fastq' + suffix)
+                    self.assertEqual(
+                        2, reads.save(filename, 'fastq', threads=threads))
+                    self.assertEqual(list(reads),
+                                     list(FastqReads(filename)))
+        finally:
+            rmtree(directory)
+
     def testUnfilteredLengthBeforeIterating(self):
         """
         A Reads instance must raise RuntimeError if its unfilteredLength method
@@ -2517,6 +2569,37 @@ class TestReadsFiltering(TestCase):
         result = reads.filter(removeGaps=True)
         self.assertEqual([Read('id', 'ATCG', '2367')], list(result))
 
+    def testFilterRemoveGapsWithQualityNoGaps(self):
+        """
+        Filtering to remove gaps must return an unchanged read (with its
+        quality) if the read has no gaps.
+        """
+        reads = Reads([Read('id', 'ATCG', '1234')])
+        result = reads.filter(removeGaps=True)
+        self.assertEqual([Read('id', 'ATCG', '1234')], list(result))
+
+    def testFilterKeepSitesDifferentLengths(self):
+        """
+        Filtering with keepSites must give the right result for reads of
+        different lengths.
+        """
+        reads = Reads([Read('id1', 'ATCGAT', '123456'), Read('id2', 'TA'),
+                       Read('id3', 'ATCGATCC')])
+        result = reads.filter(keepSites={0, 3, 7})
+        self.assertEqual([Read('id1', 'AG', '14'), Read('id2', 'T'),
+                          Read('id3', 'AGC')], list(result))
+
+    def testFilterRemoveSitesDifferentLengths(self):
+        """
+        Filtering with removeSites must give the right result for reads of
+        different lengths.
+        """
+        reads = Reads([Read('id1', 'ATCGAT', '123456'), Read('id2', 'TA'),
+                       Read('id3', 'ATCGATCC')])
+        result = reads.filter(removeSites={0, 3, 7})
+        self.assertEqual([Read('id1', 'TCAT', '2356'), Read('id2', 'A'),
+                          Read('id3', 'TCATC')], list(result))
+
     def testFilterNegativeRegex(self):
         """
         Filtering must be able to filter reads based on a negative regular
@@ -2674,6 +2757,123 @@ class TestReadsFiltering(TestCase):
         result = reads.filter(removeDuplicatesById=True)
         self.assertEqual([read1], list(result))
 
+    def testFilterDuplicatesIgnoreCase(self):
+        """
+        Filtering on sequence duplicates while ignoring case must treat
+        sequences that differ only in case as duplicates.
+        """
+        reads = Reads([Read('id1', 'ATCG'), Read('id2', 'atcg'),
+                       Read('id3', 'ATCC')])
+        result = reads.filter(removeDuplicates=True,
+                              removeDuplicatesIgnoreCase=True)
+        self.assertEqual([Read('id1', 'ATCG'), Read('id3', 'ATCC')],
+                         list(result))
+
+    def testFilterDuplicatesReverseComplement(self):
+        """
+        Filtering on sequence duplicates with reverse complementing must
+        treat a sequence and its reverse complement as duplicates.
+        """
+        reads = Reads([Read('id1', 'AACG'), Read('id2', 'CGTT'),
+                       Read('id3', 'AACC')])
+        result = reads.filter(removeDuplicates=True,
+                              removeDuplicatesReverseComplement=True)
+        self.assertEqual([Read('id1', 'AACG'), Read('id3', 'AACC')],
+                         list(result))
+
+    def testFilterDuplicatesUseMD5(self):
+        """
+        Filtering on sequence and id duplicates using MD5 digests must work
+        correctly.
+        """
+        reads = Reads([Read('id1', 'ATCG'), Read('id2', 'ATCG'),
+                       Read('id1', 'ATTT'), Read('id3', 'AAAA')])
+        result = reads.filter(removeDuplicates=True,
+                              removeDuplicatesById=True,
+                              removeDuplicatesUseMD5=True)
+        self.assertEqual([Read('id1', 'ATCG'), Read('id3', 'AAAA')],
+                         list(result))
+
+    def testFilterDuplicatesDatabase(self):
+        """
+        Filtering on sequence and id duplicates using a database must work
+        correctly.
+        """
+        directory = mkdtemp()
+        try:
+            reads = Reads([Read('id1', 'ATCG'), Read('id2', 'ATCG'),
+                           Read('id1', 'ATTT'), Read('id3', 'AAAA')])
+            result = reads.filter(
+                removeDuplicates=True, removeDuplicatesById=True,
+                removeDuplicatesDatabase=join(directory, 'seen.db'))
+            self.assertEqual([Read('id1', 'ATCG'), Read('id3', 'AAAA')],
+                             list(result))
+        finally:
+            rmtree(directory)
+
+    def testFilterDuplicatesDatabaseWrittenAfterIteration(self):
+        """
+        When filtering on duplicates using a database, all digests must have
+        been written to the database (and it must be closed) once the reads
+        have been iterated.
+        """
+        directory = mkdtemp()
+        try:
+            filename = join(directory, 'seen.db')
+            reads = Reads([Read('id1', 'ATCG'), Read('id2', 'ATCG'),
+                           Read('id1', 'ATTT'), Read('id3', 'AAAA')])
+            result = reads.filter(
+                removeDuplicates=True, removeDuplicatesById=True,
+                removeDuplicatesDatabase=filename)
+            list(result)
+            readFilter = result._filters[0].__self__
+            self.assertIsNone(readFilter.sequenceTracker._connection)
+            self.assertIsNone(readFilter.idTracker._connection)
+            connection = sqlite3.connect(filename)
+            try:
+                self.assertEqual(3, connection.execute(
+                    'SELECT COUNT(*) FROM sequences').fetchone()[0])
+                self.assertEqual(2, connection.execute(
+                    'SELECT COUNT(*) FROM ids').fetchone()[0])
+            finally:
+                connection.close()
+        finally:
+            rmtree(directory)
+
+    def testFilterDuplicatesSeen(self):
+        """
+        The sequences and ids seen when filtering on duplicates must be
+        available via the sequencesSeen and idsSeen attributes of the
+        ReadFilter.
+        """
+        readFilter = ReadFilter(removeDuplicates=True,
+                                removeDuplicatesById=True)
+        readFilter.filter(Read('id1', 'ATCG'))
+        readFilter.filter(Read('id2', 'ATCG'))
+        self.assertIn('ATCG', readFilter.sequencesSeen)
+        self.assertNotIn('AAAA', readFilter.sequencesSeen)
+        self.assertEqual(1, len(readFilter.sequencesSeen))
+        self.assertIn('id1', readFilter.idsSeen)
+        self.assertNotIn('id2', readFilter.idsSeen)
+        self.assertEqual(1, len(readFilter.idsSeen))
+
+    def testFilterDuplicatesExpectedCount(self):
+        """
+        The expected number of distinct sequences given to a ReadFilter must
+        be passed to its duplicate trackers, and default to trueLength.
+        """
+        with patch('dark.reads.DuplicateTracker') as tracker:
+            ReadFilter(removeDuplicates=True, removeDuplicatesById=True,
+                       removeDuplicatesExpectedCount=50)
+            self.assertEqual(
+                [50, 50],
+                [kwargs['expectedCount']
+                 for _, kwargs in tracker.call_args_list])
+
+        with patch('dark.reads.DuplicateTracker') as tracker:
+            ReadFilter(removeDuplicates=True, trueLength=20)
+            self.assertEqual(20, tracker.call_args[1]['expectedCount'])
+
     def testFilterRemoveDescriptions(self):
         """
         Removing read id descriptions must work correctly.
@@ -3174,6 +3374,281 @@ class TestReadsFiltering(TestCase):
         (result,) = list(result)
         self.assertEqual(Read('xid1-x', 'AT'), result)
 
+    def testFilterAfterIteration(self):
+        """
+        A filter added after a Reads instance has been iterated must be
+        used when it is next iterated.
+        """
+        reads = Reads([Read('id1', 'ATCG'), Read('id2', 'AT'),
+                       Read('id3', 'ATC')])
+        reads.filter(minLength=3)
+        self.assertEqual([Read('id1', 'ATCG'), Read('id3', 'ATC')],
+                         list(reads))
+        reads.filter(maxLength=3)
+        self.assertEqual([Read('id3', 'ATC')], list(reads))
+        reads.clearFilters()
+        self.assertEqual(3, len(list(reads)))
+
+    def testChainedFiltersWithCounts(self):
+        """
+        Chained filters that depend on read counts (e.g., head and
+        keepSequences) must count the reads passed to them by the previous
+        filter.
+        """
+        reads = Reads([Read('id%d' % i, 'A' * i) for i in range(10)])
+        result = reads.filter(minLength=5).filter(
+            keepSequences={0, 2, 3}).filter(head=2)
+        self.assertEqual(['id5', 'id7'], [read.id for read in result])
+
+    def testReadFilterSubclassIsUsed(self):
+        """
+        A function that is a filter method of a ReadFilter subclass must be
+        called when filtering, not replaced by the stages of the filter.
+        """
+        class RejectAll(ReadFilter):
+            def filter(self, read):
+                return False
+
+        reads = Reads([Read('id1', 'ATCG')])
+        reads._filters.append(RejectAll().filter)
+        self.assertEqual([], list(reads))
+
+
+class TestReadFilter(TestCase):
+    """
+    Tests of the ReadFilter stages.
+    """
+    def testNoOptionsNoStages(self):
+        """
+        A ReadFilter with no options must have no stages.
+        """
+        self.assertEqual([], ReadFilter().stages())
+
+    def testOneStagePerOption(self):
+        """
+        A ReadFilter must only have stages for the options it is given.
+        """
+        self.assertEqual(1, len(ReadFilter(minLength=3,
+                                           maxLength=4).stages()))
+        self.assertEqual(2, len(ReadFilter(minLength=3,
+                                           removeGaps=True).stages()))
+
+    def testCountingStages(self):
+        """
+        A ReadFilter whose options need read counts must have stages to
+        maintain them.
+        """
+        readFilter = ReadFilter(head=2)
+        stages = readFilter.stages()
+        self.assertEqual(3, len(stages))
+        read = Read('id', 'ACGT')
+        for stage in stages:
+            read = stage(read)
+        self.assertEqual(0, readFilter.readIndex)
+        self.assertEqual(1, readFilter.yieldCount)
+
+    def testAlwaysFalse(self):
+        """
+        A ReadFilter that can accept no reads must have one stage that
+        rejects all reads.
+        """
+        stages = ReadFilter(sampleFraction=0.0).stages()
+        self.assertEqual(1, len(stages))
+        self.assertIs(False, stages[0](Read('id', 'ACGT')))
+
+    def testStagesSameAsFilter(self):
+        """
+        Passing a read through the stages of a ReadFilter must give the same
+        result as calling its filter method.
+        """
+        options = dict(minLength=2, removeGaps=True, titleRegex='^id',
+                       removeDescriptions=True)
+        readFilter = ReadFilter(**options)
+        read = Read('id1 description', 'A-C-G')
+        for stage in ReadFilter(**options).stages():
+            read = stage(read)
+        self.assertEqual(
+            readFilter.filter(Read('id1 description', 'A-C-G')), read)
+
+
+class TestReadsParallel(TestCase):
+    """
+    Tests of filtering reads in parallel.
+    """
+    READS = [Read('id%d description' % i, 'AC-GT' * (i % 7))
+             for i in range(100)]
+
+    def check(self, *optionSets):
+        """
+        Check that filtering in parallel gives the same result as filtering
+        serially.
+
+        @param optionSets: C{dict}s of keyword arguments for C{Reads.filter}.
+        """
+        serial = Reads(self.READS)
+        parallel = Reads(self.READS).parallel(workers=2, chunkSize=7)
+        for options in optionSets:
+            serial.filter(**options)
+            parallel.filter(**options)
+        expected = list(serial)
+        self.assertEqual(expected, list(parallel))
+        self.assertEqual(100, parallel.unfilteredLength())
+
+    def testNoFilters(self):
+        """
+        Reads with no filters must be returned unchanged.
+        """
+        self.check()
+
+    def testStatelessOptions(self):
+        """
+        Options that do not keep state between reads must give the same
+        result when filtered in parallel.
+        """
+        self.check(dict(minLength=5, removeGaps=True, titleRegex='[13]',
+                        removeDescriptions=True,
+                        readLambda='lambda r: Read(r.id, r.sequence[1:])'))
+
+    def testStatefulOptions(self):
+        """
+        Options that keep state between reads must give the same result when
+        filtered in parallel.
+        """
+        self.check(dict(minLength=5, removeDuplicates=True),
+                   dict(removeGaps=True, head=6))
+
+    def testAddedReads(self):
+        """
+        Reads added to a Reads instance must be filtered in parallel, before
+        the initial reads.
+        """
+        reads = Reads([Read('id1', 'ACGT')]).parallel(workers=2)
+        reads.add(Read('id2', 'AC'))
+        reads.add(Read('id3', 'ACGTT'))
+        self.assertEqual([Read('id3', 'ACGTT'), Read('id1', 'ACGT')],
+                         list(reads.filter(minLength=4)))
+        self.assertEqual(3, reads.unfilteredLength())
+
+    def testSplitStages(self):
+        """
+        Stateless stages before the first stateful stage must be run in
+        worker processes, and all others in the coordinating process.
+        """
+        reads = Reads().filter(minLength=2).filter(maxLength=10, head=3)
+        workerStages, coordinatorStages = reads._splitFilterStages()
+        self.assertEqual(1, len(workerStages))
+        # A counting start stage, the head stage, the length stage, and a
+        # counting finish stage.
+        self.assertEqual(4, len(coordinatorStages))
+
+    def testUnknownFilterFunctionIsStateful(self):
+        """
+        A filter function not made by a ReadFilter must be run in the
+        coordinating process.
+        """
+        reads = Reads()
+        reads._filters.append(lambda read: read)
+        reads.filter(minLength=2)
+        workerStages, coordinatorStages = reads._splitFilterStages()
+        self.assertEqual([], workerStages)
+        self.assertEqual(2, len(coordinatorStages))
+
+
+class TestFormatReads(TestCase):
+    """
+    Test the formatReads function.
+    """
+    def testFASTA(self):
+        """
+        Reads must be formatted as FASTA.
+        """
+        self.assertEqual(
+            '>id1\nAT\n>id2\nAC\n',
+            formatReads([Read('id1', 'AT'), DNARead('id2', 'AC')], 'fasta'))
+
+    def testFASTQ(self):
+        """
+        Reads must be formatted as FASTQ.
+        """
+        self.assertEqual(
+            '@id1\nAT\n+id1\n!!\n@id2\nAC\n+id2\n@@\n',
+            formatReads([Read('id1', 'AT', '!!'), Read('id2', 'AC', '@@')],
+                        'fastq'))
+
+    def testFASTQWithNoQuality(self):
+        """
+        Formatting a read with no quality as FASTQ must raise a ValueError.
+        """
+        error = "^Read 'id2' has no quality information$"
+        six.assertRaisesRegex(self, ValueError, error, formatReads,
+                              [Read('id1', 'AT', '!!'), Read('id2', 'AC')],
+                              'fastq')
+
+    def testFASTASS(self):
+        """
+        Reads with secondary structure must be formatted as fasta-ss using
+        their own toString method.
+        """
+        self.assertEqual(
+            '>id1\nMM\n>id1:structure\nHH\n',
+            formatReads([SSAARead('id1', 'MM', 'HH')], 'fasta-ss'))
+
+    def testUnknownFormat(self):
+        """
+        Formatting reads in an unknown format must raise a ValueError.
+        """
+        error = "^Format must be either 'fasta', 'fastq' or 'fasta-ss'\\.$"
+        six.assertRaisesRegex(self, ValueError, error, formatReads,
+                              [Read('id1', 'AT')], 'xxx')
+
+
+class TestReadsWriter(TestCase):
+    """
+    Test the ReadsWriter class.
+    """
+    def testUnknownFormat(self):
+        """
+        A ReadsWriter must raise a ValueError if asked to write an unknown
+        format.
+        """
+        error = "^Format must be either 'fasta', 'fastq' or 'fasta-ss'\\.$"
+        six.assertRaisesRegex(self, ValueError, error, ReadsWriter,
+                              StringIO(), 'xxx')
+
+    def testBatches(self):
+        """
+        A ReadsWriter must write each batch of reads with one write, and must
+        write the final partial batch on exit.
+        """
+        fp = StringIO()
+        writes = []
+
+        def write(s):
+            writes.append(s)
+            StringIO.write(fp, s)
+
+        fp.write = write
+        with ReadsWriter(fp, 'FASTA', batchSize=2) as writer:
+            self.assertEqual(3, writer.writeReads(
+                [Read('id1', 'A'), Read('id2', 'C'), Read('id3', 'G')]))
+            self.assertEqual(['>id1\nA\n>id2\nC\n'], writes)
+        self.assertEqual(['>id1\nA\n>id2\nC\n', '>id3\nG\n'], writes)
+        self.assertEqual(3, writer.count)
+
+    def testNoWriteOnException(self):
+        """
+        A ReadsWriter must not write its final partial batch if an exception
+        is raised in its context.
+        """
+        fp = StringIO()
+        try:
+            with ReadsWriter(fp) as writer:
+                writer.write(Read('id1', 'A'))
+                raise KeyError()
+        except KeyError:
+            pass
+        self.assertEqual('', fp.getvalue())
+
 
 class TestReadsInRAM(TestCase):
     """
@@ -3301,6 +3776,135 @@ class TestReadsInRAM(TestCase):
         self.assertEqual(read2, reads[0])
 
 
+class TestReadsInRAMBytesBacked(TestCase):
+    """
+    Test the ReadsInRAM class when it is bytes-backed.
+    """
+
+    def testNoReads(self):
+        """
+        A bytes-backed ReadsInRAM instance with no reads must return an empty
+        iterator and have length zero.
+        """
+        reads = ReadsInRAM(bytesBacked=True)
+        self.assertEqual([], list(reads))
+        self.assertEqual(0, len(reads))
+
+    def testAdd(self):
+        """
+        It must be possible to add reads to a bytes-backed ReadsInRAM
+        instance.
+        """
+        reads = ReadsInRAM(bytesBacked=True)
+        read = Read('id', 'ACGT')
+        reads.add(read)
+        self.assertEqual([read], list(reads))
+
+    def testReadClassesArePreserved(self):
+        """
+        Reads taken from a bytes-backed ReadsInRAM instance must have the
+        class of the reads that were added.
+        """
+        reads = ReadsInRAM([Read('id1', 'ACGT'), DNARead('id2', 'AA'),
+                            AARead('id3', 'MMM')], bytesBacked=True)
+        self.assertEqual([Read, DNARead, AARead],
+                         [read.__class__ for read in reads])
+
+    def testQualityIsPreserved(self):
+        """
+        Reads with and without quality strings must be returned unchanged
+        from a bytes-backed ReadsInRAM instance.
+        """
+        read1 = Read('id1', 'ACGT', '!!!!')
+        read2 = Read('id2', 'AC')
+        reads = ReadsInRAM([read1, read2], bytesBacked=True)
+        self.assertEqual([read1, read2], list(reads))
+        self.assertIs(None, reads[1].quality)
+
+    def testEmptySequence(self):
+        """
+        A read with an empty sequence and quality must be returned unchanged
+        from a bytes-backed ReadsInRAM instance.
+        """
+        read = Read('id1', '', '')
+        reads = ReadsInRAM([read], bytesBacked=True)
+        self.assertEqual(read, reads[0])
+        self.assertEqual('', reads[0].quality)
+
+    def testNonPackableReads(self):
+        """
+        Reads that cannot be packed (an SSAARead or a read with a NUL in its
+        id) must be stored and returned unchanged.
+        """
+        read1 = SSAARead('id1', 'AFGGCTLQ', 'HHHHHHHH')
+        read2 = Read('id\0with NUL', 'AC')
+        read3 = Read('id3', 'ACGT')
+        reads = ReadsInRAM([read1, read2, read3], bytesBacked=True)
+        self.assertEqual([read1, read2, read3], list(reads))
+        self.assertIs(read1, reads[0])
+
+    def testReadWithExtraSlotIsNotPacked(self):
+        """
+        A read whose class inherits the Read constructor but adds a slot
+        (like dark.sam._AlignedRead) must be stored unchanged, so the value
+        in its extra slot is not lost.
+        """
+        class ReadWithAlignment(Read):
+            __slots__ = ('alignment',)
+
+        read = ReadWithAlignment('id1', 'ACGT')
+        read.alignment = 'alignment'
+        reads = ReadsInRAM([read], bytesBacked=True)
+        self.assertIs(read, reads[0])
+        self.assertEqual('alignment', reads[0].alignment)
+
+    def testReadWithDictIsNotPacked(self):
+        """
+        A read whose class has no __slots__ (so its instances have a
+        __dict__) must be stored unchanged.
+        """
+        class ReadWithDict(Read):
+            pass
+
+        read = ReadWithDict('id1', 'ACGT')
+        read.extra = 3
+        reads = ReadsInRAM([read], bytesBacked=True)
+        self.assertIs(read, reads[0])
+        self.assertEqual(3, reads[0].extra)
+
+    def testIndexAndSlice(self):
+        """
+        A bytes-backed ReadsInRAM instance must support indexing and slicing.
+        """
+        read1 = Read('id1', 'ATCG')
+        read2 = Read('id2', 'ATCG')
+        read3 = Read('id3', 'ATCG')
+        reads = ReadsInRAM([read1, read2, read3], bytesBacked=True)
+        self.assertEqual(read3, reads[-1])
+        self.assertEqual([read2, read3], reads[1:])
+
+    def testSetItem(self):
+        """
+        It must be possible to set a value for a bytes-backed ReadsInRAM
+        index.
+        """
+        reads = ReadsInRAM([Read('id1', 'ATCG')], bytesBacked=True)
+        read2 = DNARead('id2', 'ATCG')
+        reads[0] = read2
+        self.assertEqual(read2, reads[0])
+        self.assertIs(DNARead, reads[0].__class__)
+
+    def testReadsAreCopies(self):
+        """
+        Changing a read obtained from a bytes-backed ReadsInRAM instance must
+        not change the stored read.
+        """
+        reads = ReadsInRAM([Read('id1', 'ATCG')], bytesBacked=True)
+        read = reads[0]
+        read.sequence = 'TTTT'
+        self.assertEqual('ATCG', reads[0].sequence)
+
+
 class TestSummarizePosition(TestCase):
     """
     Tests for the reads.summarizePosition function.
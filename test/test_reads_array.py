@@ -0,0 +1,306 @@
+from six import StringIO, assertRaisesRegex
+from unittest import TestCase
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from dark.fastq import FastqReads
+from dark.reads import Read, DNARead, AARead, SSAARead, Reads
+from dark.reads_array import ReadsArray
+
+
+class TestReadsArray(TestCase):
+    """
+    Test the ReadsArray class.
+    """
+    def testNoReads(self):
+        """
+        A ReadsArray with no reads must have length zero and iterate as an
+        empty list.
+        """
+        reads = ReadsArray()
+        self.assertEqual(0, len(reads))
+        self.assertEqual([], list(reads))
+
+    def testEmptyInput(self):
+        """
+        A ReadsArray made from an empty list must have length zero, iterate
+        as an empty list, give an empty slice, and raise IndexError when
+        indexed.
+        """
+        reads = ReadsArray([])
+        self.assertEqual(0, len(reads))
+        self.assertEqual([], list(reads))
+        self.assertEqual([], list(reads[0:0]))
+        self.assertRaises(IndexError, reads.__getitem__, 0)
+
+    def testIteration(self):
+        """
+        Iterating a ReadsArray must give the original reads.
+        """
+        reads = [Read('id1', 'ACGT', '!!!!'), Read('id2 é', 'AC', '12'),
+                 Read('id3', '', '')]
+        self.assertEqual(reads, list(ReadsArray(reads)))
+
+    def testIterationMixedQuality(self):
+        """
+        Iterating a ReadsArray must give the original reads when only some
+        reads have a quality string.
+        """
+        reads = [Read('id1', 'ACGT'), Read('id2', 'AC', '12')]
+        result = list(ReadsArray(reads))
+        self.assertEqual(reads, result)
+        self.assertIs(None, result[0].quality)
+
+    def testFromReads(self):
+        """
+        A ReadsArray must be able to be made from a Reads instance.
+        """
+        reads = Reads([Read('id1', 'ACGT'), Read('id2', 'AC')])
+        self.assertEqual([Read('id1', 'ACGT'), Read('id2', 'AC')],
+                         list(ReadsArray(reads)))
+
+    def testReadClassIsInferred(self):
+        """
+        If no read class is given, the class of the initial reads must be
+        used.
+        """
+        reads = ReadsArray([DNARead('id1', 'ACGT')])
+        self.assertIs(DNARead, list(reads)[0].__class__)
+
+    def testMixedReadClasses(self):
+        """
+        If no read class is given and the initial reads are of different
+        classes, a ValueError must be raised.
+        """
+        error = (r'^ReadsArray reads must all have the same class \(found '
+                 r'DNARead and AARead\)\. Pass a readClass to convert '
+                 r'them\.$')
+        assertRaisesRegex(self, ValueError, error, ReadsArray,
+                          [DNARead('id1', 'ACGT'), AARead('id2', 'MM')])
+
+    def testReadClassConversion(self):
+        """
+        If a read class is given, reads must be converted to it.
+        """
+        reads = ReadsArray([DNARead('id1', 'ACGT'), AARead('id2', 'MM')],
+                           readClass=AARead)
+        self.assertEqual([AARead, AARead],
+                         [read.__class__ for read in reads])
+
+    def testUnstorableReadClass(self):
+        """
+        If the read class cannot be made from an id, sequence, and quality,
+        a ValueError must be raised.
+        """
+        error = r'^Cannot store reads of class SSAARead in a ReadsArray\.$'
+        assertRaisesRegex(self, ValueError, error, ReadsArray,
+                          [SSAARead('id1', 'MM', 'HH')])
+
+    def testIndex(self):
+        """
+        Indexing a ReadsArray with an int must give a read.
+        """
+        reads = ReadsArray([Read('id1', 'ACGT', '!!!!'), Read('id2', 'AC')])
+        self.assertEqual(Read('id1', 'ACGT', '!!!!'), reads[0])
+        self.assertEqual(Read('id2', 'AC'), reads[-1])
+
+    def testSlice(self):
+        """
+        Slicing a ReadsArray must give a ReadsArray that shares its
+        sequence data with the original.
+        """
+        reads = ReadsArray([Read('id1', 'ACGT'), Read('id2', 'AC'),
+                            Read('id3', 'G')])
+        subset = reads[1:]
+        self.assertIsInstance(subset, ReadsArray)
+        self.assertIs(reads._sequences, subset._sequences)
+        self.assertEqual([Read('id2', 'AC'), Read('id3', 'G')], list(subset))
+        self.assertEqual([Read('id3', 'G'), Read('id1', 'ACGT')],
+                         list(reads[::-2]))
+
+    def testLengths(self):
+        """
+        The lengths method must return the read lengths.
+        """
+        reads = ReadsArray([Read('id1', 'ACGT'), Read('id2', 'AC')])
+        self.assertEqual([4, 2], reads.lengths().tolist())
+
+    def testFilterByLength(self):
+        """
+        The filterByLength method must keep reads whose lengths are in the
+        wanted range.
+        """
+        reads = ReadsArray([Read('id1', 'ACGT'), Read('id2', 'AC'),
+                            Read('id3', 'ACG'), Read('id4', 'A')])
+        self.assertEqual(
+            [Read('id2', 'AC'), Read('id3', 'ACG')],
+            list(reads.filterByLength(minLength=2, maxLength=3)))
+        self.assertEqual([Read('id1', 'ACGT'), Read('id3', 'ACG')],
+                         list(reads.filterByLength(minLength=3)))
+
+    def testFilter(self):
+        """
+        A ReadsArray must be able to be filtered like any Reads instance.
+        """
+        reads = ReadsArray([Read('id1', 'ACGT'), Read('id2', 'AC')])
+        self.assertEqual([Read('id1', 'ACGT')],
+                         list(reads.filter(minLength=3)))
+
+
+class TestReadsArraySummarizePosition(TestCase):
+    """
+    Test the ReadsArray summarizePosition method.
+    """
+    READS = [Read('id1', 'aaaaaa'), Read('id2', 'aata'),
+             Read('id3', 'aataaaaaa'), Read('id4', 'at')]
+
+    def testNoReads(self):
+        """
+        Must return empty counts and no exclusions if no reads are present.
+        """
+        result = ReadsArray().summarizePosition(2)
+        self.assertEqual({}, result['countAtPosition'])
+        self.assertEqual(0, result['excludedCount'])
+
+    def testSameAsReads(self):
+        """
+        The result must be the same as for a Reads instance, for positive
+        and negative indices.
+        """
+        reads = ReadsArray(self.READS)
+        for index in -7, -3, -1, 0, 1, 2, 5, 9:
+            self.assertEqual(Reads(self.READS).summarizePosition(index),
+                             reads.summarizePosition(index))
+
+    def testFiltered(self):
+        """
+        Filtered reads must not be counted.
+        """
+        reads = ReadsArray(self.READS).filter(minLength=5)
+        result = reads.summarizePosition(2)
+        self.assertEqual({'a': 1, 't': 1}, result['countAtPosition'])
+        self.assertEqual(0, result['excludedCount'])
+
+
+class TestReadsArraySitesMatching(TestCase):
+    """
+    Test the ReadsArray sitesMatching method.
+    """
+    READS = [Read('id1', 'AcGTa'), Read('id2', 'aaG-'), Read('id3', 'AAGa')]
+
+    def testNoReads(self):
+        """
+        If there are no reads, the empty set must be returned.
+        """
+        self.assertEqual(set(), ReadsArray().sitesMatching({'a'}, True, True))
+        self.assertEqual(set(),
+                         ReadsArray().sitesMatching({'a'}, True, False))
+
+    def testSameAsReads(self):
+        """
+        The result must be the same as for a Reads instance.
+        """
+        reads = ReadsArray(self.READS)
+        for targets in {'a'}, {'A'}, {'a', 'G'}, {'-'}, {'x'}:
+            for matchCase in True, False:
+                for any_ in True, False:
+                    self.assertEqual(
+                        Reads(self.READS).sitesMatching(targets, matchCase,
+                                                        any_),
+                        reads.sitesMatching(targets, matchCase, any_))
+
+    def testAddedRead(self):
+        """
+        Reads added to a ReadsArray must be considered.
+        """
+        reads = ReadsArray([Read('id1', 'AC')])
+        reads.add(Read('id2', 'CA'))
+        self.assertEqual(set(), reads.sitesMatching({'A'}, True, False))
+
+
+class TestReadsArraySave(TestCase):
+    """
+    Test the ReadsArray save method.
+    """
+    READS = [Read('id1', 'ACGT', '!!!!'), Read('id2 é', 'AC', '12'),
+             Read('id3', '', '')]
+
+    def testFASTA(self):
+        """
+        Saving as FASTA must give the same result as for a Reads instance.
+        """
+        expected = StringIO()
+        Reads(self.READS).save(expected)
+        result = StringIO()
+        self.assertEqual(3, ReadsArray(self.READS).save(result))
+        self.assertEqual(expected.getvalue(), result.getvalue())
+
+    def testFASTQ(self):
+        """
+        Saving as FASTQ must give the same result as for a Reads instance.
+        """
+        expected = StringIO()
+        Reads(self.READS).save(expected, 'fastq')
+        result = StringIO()
+        self.assertEqual(3, ReadsArray(self.READS).save(result, 'FASTQ'))
+        self.assertEqual(expected.getvalue(), result.getvalue())
+
+    def testNoReads(self):
+        """
+        Saving an empty ReadsArray must write nothing.
+        """
+        for format_ in 'fasta', 'fastq':
+            result = StringIO()
+            self.assertEqual(0, ReadsArray([]).save(result, format_))
+            self.assertEqual('', result.getvalue())
+
+    def testSubset(self):
+        """
+        Saving a subset of a ReadsArray must save only the subset.
+        """
+        result = StringIO()
+        ReadsArray(self.READS)[::2].save(result)
+        self.assertEqual('>id1\nACGT\n>id3\n\n', result.getvalue())
+
+    def testSaveToFile(self):
+        """
+        A ReadsArray must be able to save to a (possibly compressed) file,
+        with and without threads.
+        """
+        directory = mkdtemp()
+        try:
+            for suffix in '', '.gz', '.bgz', '.bz2':
+                for threads in 0, 2:
+                    filename = join(directory, 'reads.fastq' + suffix)
+                    self.assertEqual(3, ReadsArray(self.READS).save(
+                        filename, 'fastq', threads=threads))
+                    self.assertEqual(self.READS, list(FastqReads(filename)))
+        finally:
+            rmtree(directory)
+
+    def testFASTQWithNoQuality(self):
+        """
+        Saving as FASTQ must raise a ValueError if a read has no quality.
+        """
+        reads = ReadsArray([Read('id1', 'ACGT', '!!!!'), Read('id2', 'AC')])
+        error = r"^Read 'id2' has no quality information$"
+        assertRaisesRegex(self, ValueError, error, reads.save, StringIO(),
+                          'fastq')
+
+    def testUnknownFormat(self):
+        """
+        Saving in an unknown format must raise a ValueError.
+        """
+        error = r"^Format must be either 'fasta', 'fastq' or 'fasta-ss'\.$"
+        assertRaisesRegex(self, ValueError, error,
+                          ReadsArray(self.READS).save, StringIO(), 'xxx')
+
+    def testFiltered(self):
+        """
+        Saving a filtered ReadsArray must save only the wanted reads.
+        """
+        result = StringIO()
+        self.assertEqual(
+            1, ReadsArray(self.READS).filter(minLength=3).save(result))
+        self.assertEqual('>id1\nACGT\n', result.getvalue())
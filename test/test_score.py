@@ -27,6 +27,37 @@ class TestHigherIsBetterScore(TestCase):
         """
         self.assertTrue(HigherIsBetterScore(10) < HigherIsBetterScore(20))
 
+    def testNotEqual(self):
+        """
+        __ne__ must work as expected.
+        """
+        self.assertTrue(HigherIsBetterScore(10) != HigherIsBetterScore(20))
+        self.assertFalse(HigherIsBetterScore(10) != HigherIsBetterScore(10))
+
+    def testOtherComparisons(self):
+        """
+        __le__, __gt__, and __ge__ must work as expected.
+        """
+        self.assertTrue(HigherIsBetterScore(10) <= HigherIsBetterScore(20))
+        self.assertTrue(HigherIsBetterScore(10) <= HigherIsBetterScore(10))
+        self.assertTrue(HigherIsBetterScore(20) > HigherIsBetterScore(10))
+        self.assertFalse(HigherIsBetterScore(10) > HigherIsBetterScore(10))
+        self.assertTrue(HigherIsBetterScore(20) >= HigherIsBetterScore(10))
+        self.assertTrue(HigherIsBetterScore(10) >= HigherIsBetterScore(10))
+
+    def testSorted(self):
+        """
+        Sorting must put the best score last.
+        """
+        scores = sorted([HigherIsBetterScore(20), HigherIsBetterScore(10)])
+        self.assertEqual([10, 20], [score.score for score in scores])
+
+    def testNoDict(self):
+        """
+        Instances must not have a __dict__ (they use __slots__).
+        """
+        self.assertFalse(hasattr(HigherIsBetterScore(10), '__dict__'))
+
     def testBetterThan(self):
         """
         betterThan must work as expected.
@@ -58,6 +89,37 @@ class TestLowerIsBetterScore(TestCase):
         """
         self.assertTrue(LowerIsBetterScore(20) < LowerIsBetterScore(10))
 
+    def testNotEqual(self):
+        """
+        __ne__ must work as expected.
+        """
+        self.assertTrue(LowerIsBetterScore(10) != LowerIsBetterScore(20))
+        self.assertFalse(LowerIsBetterScore(10) != LowerIsBetterScore(10))
+
+    def testOtherComparisons(self):
+        """
+        __le__, __gt__, and __ge__ must work as expected.
+        """
+        self.assertTrue(LowerIsBetterScore(20) <= LowerIsBetterScore(10))
+        self.assertTrue(LowerIsBetterScore(20) <= LowerIsBetterScore(20))
+        self.assertTrue(LowerIsBetterScore(10) > LowerIsBetterScore(20))
+        self.assertFalse(LowerIsBetterScore(20) > LowerIsBetterScore(20))
+        self.assertTrue(LowerIsBetterScore(10) >= LowerIsBetterScore(20))
+        self.assertTrue(LowerIsBetterScore(20) >= LowerIsBetterScore(20))
+
+    def testSorted(self):
+        """
+        Sorting must put the best score last.
+        """
+        scores = sorted([LowerIsBetterScore(10), LowerIsBetterScore(20)])
+        self.assertEqual([20, 10], [score.score for score in scores])
+
+    def testNoDict(self):
+        """
+        Instances must not have a __dict__ (they use __slots__).
+        """
+        self.assertFalse(hasattr(LowerIsBetterScore(10), '__dict__'))
+
     def testBetterThan(self):
         """
         betterThan must work as expected.
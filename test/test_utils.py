@@ -5,6 +5,11 @@ from six.moves import builtins
 from unittest import TestCase
 from six import assertRaisesRegex
 from collections import Counter
+from contextlib import contextmanager
+from tempfile import mkstemp
+from os import close, unlink
+
+from Bio import bgzf
 
 try:
     from unittest.mock import patch
@@ -15,7 +20,41 @@ from .mocking import mockOpen, File
 
 from dark.utils import (
     numericallySortFilenames, median, asHandle, parseRangeString, StringIO,
-    baseCountsToStr, nucleotidesToStr)
+    baseCountsToStr, nucleotidesToStr, openFile, isBGZF, iterHandles,
+    openFileForWriting)
+
+
+@contextmanager
+def dataFile(data, suffix=''):
+    """
+    Create a context manager to store (possibly compressed) data in a
+    temporary file and later remove it.
+
+    @param data: The C{str} data to store.
+    @param suffix: The C{str} file name suffix. If '.gz', '.bgz' or '.bz2',
+        the data will be compressed with gzip, BGZF, or bzip2 (respectively).
+    """
+    fd, filename = mkstemp(suffix=suffix)
+    close(fd)
+    data = data.encode('utf-8')
+    if suffix == '.gz':
+        with gzip.GzipFile(filename, 'wb') as fp:
+            fp.write(data)
+    elif suffix == '.bgz':
+        # Write small blocks, so there are many of them.
+        fp = bgzf.BgzfWriter(filename, 'wb')
+        for start in range(0, len(data), 100):
+            fp.write(data[start:start + 100])
+            fp.flush()
+        fp.close()
+    elif suffix == '.bz2':
+        with bz2.BZ2File(filename, 'wb') as fp:
+            fp.write(data)
+    else:
+        with open(filename, 'wb') as fp:
+            fp.write(data)
+    yield filename
+    unlink(filename)
 
 
 class TestNumericallySortFilenames(TestCase):
@@ -181,6 +220,251 @@ class TestAsHandle(TestCase):
                 self.assertEqual('xxx', fp.read())
 
 
+class TestOpenFile(TestCase):
+    """
+    Test the openFile function.
+    """
+    DATA = ''.join('line %d\n' % i for i in range(5000))
+
+    def _check(self, suffix, threads):
+        """
+        Check that data can be read back from a file.
+
+        @param suffix: The C{str} file name suffix (see C{dataFile}).
+        @param threads: The C{int} number of threads to pass to C{openFile}.
+        """
+        with dataFile(self.DATA, suffix) as filename:
+            fp = openFile(filename, threads=threads)
+            try:
+                self.assertEqual(self.DATA, fp.read())
+            finally:
+                fp.close()
+
+    def testPlain(self):
+        """
+        An uncompressed file must be read correctly, with and without
+        threads.
+        """
+        for threads in 0, 1, 4:
+            self._check('', threads)
+
+    def testGzip(self):
+        """
+        A gzip file must be read correctly, with and without threads.
+        """
+        for threads in 0, 1, 4:
+            self._check('.gz', threads)
+
+    def testBZ2(self):
+        """
+        A bzip2 file must be read correctly, with and without threads.
+        """
+        for threads in 0, 1, 4:
+            self._check('.bz2', threads)
+
+    def testBGZF(self):
+        """
+        A BGZF file must be read correctly, with and without threads.
+        """
+        for threads in 0, 1, 4:
+            self._check('.bgz', threads)
+
+    def testReadLinesWithThreads(self):
+        """
+        It must be possible to iterate the lines of a file read using
+        threads.
+        """
+        with dataFile(self.DATA, '.gz') as filename:
+            fp = openFile(filename, threads=1)
+            try:
+                self.assertEqual(self.DATA.splitlines(True), list(fp))
+            finally:
+                fp.close()
+
+    def testCloseBeforeEOF(self):
+        """
+        It must be possible to close a file being read with threads before
+        all its data has been read.
+        """
+        with dataFile(self.DATA * 10, '.bgz') as filename:
+            for threads in 1, 4:
+                fp = openFile(filename, threads=threads)
+                self.assertEqual('line 0\n', fp.readline())
+                fp.close()
+
+
+class TestIsBGZF(TestCase):
+    """
+    Test the isBGZF function.
+    """
+    def testGzip(self):
+        """
+        A regular gzip file is not in BGZF format.
+        """
+        with dataFile('hello', '.gz') as filename:
+            self.assertFalse(isBGZF(filename))
+
+    def testBGZF(self):
+        """
+        A file written by bgzf is in BGZF format.
+        """
+        with dataFile('hello', '.bgz') as filename:
+            self.assertTrue(isBGZF(filename))
+
+    def testPlain(self):
+        """
+        An uncompressed file is not in BGZF format.
+        """
+        with dataFile('hello') as filename:
+            self.assertFalse(isBGZF(filename))
+
+
+class TestOpenFileForWriting(TestCase):
+    """
+    Test the openFileForWriting function.
+    """
+    DATA = ''.join('line %d\n' % i for i in range(50000))
+
+    def _write(self, suffix, threads):
+        """
+        Write data to a file, in pieces of varying size.
+
+        @param suffix: The C{str} file name suffix.
+        @param threads: The C{int} number of threads to pass to
+            C{openFileForWriting}.
+        @return: The C{str} name of the file, which the caller must remove.
+        """
+        fd, filename = mkstemp(suffix=suffix)
+        close(fd)
+        fp = openFileForWriting(filename, threads=threads)
+        try:
+            fp.write(self.DATA[:10])
+            fp.write(self.DATA[10:100000])
+            fp.write(self.DATA[100000:])
+        finally:
+            fp.close()
+        return filename
+
+    def _check(self, suffix, threads):
+        """
+        Check that data written to a file can be read back.
+
+        @param suffix: The C{str} file name suffix.
+        @param threads: The C{int} number of threads to pass to
+            C{openFileForWriting}.
+        """
+        filename = self._write(suffix, threads)
+        try:
+            with openFile(filename) as fp:
+                self.assertEqual(self.DATA, fp.read())
+        finally:
+            unlink(filename)
+
+    def testPlain(self):
+        """
+        An uncompressed file must be written correctly, with and without
+        threads.
+        """
+        for threads in 0, 1, 4:
+            self._check('', threads)
+
+    def testGzip(self):
+        """
+        A gzip file must be written correctly, with and without threads.
+        """
+        for threads in 0, 1, 4:
+            self._check('.gz', threads)
+
+    def testBZ2(self):
+        """
+        A bzip2 file must be written correctly, with and without threads.
+        """
+        for threads in 0, 1, 4:
+            self._check('.bz2', threads)
+
+    def testBGZF(self):
+        """
+        A BGZF file must be written correctly, with and without threads, and
+        must be readable by Biopython's BGZF reader.
+        """
+        for threads in 0, 1, 4:
+            filename = self._write('.bgz', threads)
+            try:
+                self.assertTrue(isBGZF(filename))
+                fp = bgzf.BgzfReader(filename, 'rb')
+                try:
+                    data = self.DATA.encode('utf-8')
+                    self.assertEqual(data, fp.read(len(data) + 1))
+                finally:
+                    fp.close()
+                with openFile(filename, threads=4) as fp:
+                    self.assertEqual(self.DATA, fp.read())
+            finally:
+                unlink(filename)
+
+    def testGzipWithThreadsIsBGZF(self):
+        """
+        A gzip file written with more than one thread must be in BGZF
+        format, but one written with fewer threads must not be.
+        """
+        for threads, expected in (0, False), (1, False), (2, True):
+            filename = self._write('.gz', threads)
+            try:
+                self.assertEqual(expected, isBGZF(filename))
+            finally:
+                unlink(filename)
+
+
+class TestIterHandles(TestCase):
+    """
+    Test the iterHandles function.
+    """
+    def testNoFiles(self):
+        """
+        If no files are given, nothing must be yielded.
+        """
+        for threads in 0, 1:
+            self.assertEqual([], list(iterHandles([], threads=threads)))
+
+    def testFilesAreReadInOrder(self):
+        """
+        All files must be yielded, in order, whether or not threads are used.
+        """
+        with dataFile('one\n', '.gz') as filename1:
+            with dataFile('two\n') as filename2:
+                with dataFile('three\n', '.bz2') as filename3:
+                    filenames = [filename1, filename2, filename3]
+                    for threads in 0, 1:
+                        result = [
+                            (filename, fp.read()) for filename, fp in
+                            iterHandles(filenames, threads=threads)]
+                        self.assertEqual(
+                            [(filename1, 'one\n'), (filename2, 'two\n'),
+                             (filename3, 'three\n')], result)
+
+    def testHandlesAreNotClosed(self):
+        """
+        Handles that are passed in must be yielded and not closed.
+        """
+        fp = StringIO('data')
+        for threads in 0, 1:
+            result = list(iterHandles([fp], threads=threads))
+            self.assertEqual([(fp, fp)], result)
+            self.assertFalse(fp.closed)
+
+    def testOpenedFilesAreClosed(self):
+        """
+        Files opened by iterHandles (including the prefetched next file)
+        must be closed if the generator is closed early.
+        """
+        with dataFile('one\n') as filename1:
+            with dataFile('two\n') as filename2:
+                handles = iterHandles([filename1, filename2], threads=1)
+                _, fp = next(handles)
+                handles.close()
+                self.assertTrue(fp.closed)
+
+
 class TestParseRangeString(TestCase):
     """
     Check that the parseRangeString function works as expected.